@@ -19,21 +19,29 @@ import sys
 from oslo.config import cfg
 
 from cloudbaseinit.metadata import factory as metadata_factory
+from cloudbaseinit.metadata.services import cacheservice
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins import base as plugins_base
 from cloudbaseinit.plugins import factory as plugins_factory
+from cloudbaseinit.plugins import scheduler as plugins_scheduler
+from cloudbaseinit.plugins import statusstore
+from cloudbaseinit.utils import profiler as boot_profiler
+from cloudbaseinit.utils import startup
 
 opts = [
     cfg.BoolOpt('allow_reboot', default=True, help='Allows OS reboots '
                 'requested by plugins'),
-    cfg.BoolOpt('stop_service_on_exit', default=True, help='In case of '
-                'execution as a service, specifies if the service '
-                'must be gracefully stopped before exiting'),
+    cfg.BoolOpt('plugins_parallel_execution', default=False,
+                help='Executes concurrently the plugins which declare '
+                'non conflicting shared data dependencies'),
+    cfg.IntOpt('plugins_max_workers', default=4,
+               help='Max. number of plugins executed concurrently'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(opts)
+CONF.import_opt('stop_service_on_exit', 'cloudbaseinit.utils.startup')
 
 LOG = logging.getLogger(__name__)
 
@@ -41,19 +49,38 @@ LOG = logging.getLogger(__name__)
 class InitManager(object):
     _PLUGINS_CONFIG_SECTION = 'Plugins'
 
+    def __init__(self):
+        self._plugin_status_stores = {}
+
     def _get_plugins_section(self, instance_id):
         if not instance_id:
             return self._PLUGINS_CONFIG_SECTION
         else:
             return instance_id + "/" + self._PLUGINS_CONFIG_SECTION
 
+    def _get_plugin_status_store(self, osutils, instance_id):
+        section = self._get_plugins_section(instance_id)
+        store = self._plugin_status_stores.get(section)
+        if not store:
+            store = statusstore.PluginStatusStore(osutils, section)
+            self._plugin_status_stores[section] = store
+        return store
+
     def _get_plugin_status(self, osutils, instance_id, plugin_name):
-        return osutils.get_config_value(plugin_name,
-                                        self._get_plugins_section(instance_id))
+        store = self._get_plugin_status_store(osutils, instance_id)
+        return store.get_status(plugin_name)
 
     def _set_plugin_status(self, osutils, instance_id, plugin_name, status):
-        osutils.set_config_value(plugin_name, status,
-                                 self._get_plugins_section(instance_id))
+        store = self._get_plugin_status_store(osutils, instance_id)
+        store.set_status(plugin_name, status)
+
+    def _flush_plugin_statuses(self):
+        for store in self._plugin_status_stores.values():
+            try:
+                store.flush()
+            except Exception as ex:
+                LOG.error('Failed to save the plugins status: \'%s\'' % ex)
+                LOG.exception(ex)
 
     def _exec_plugin(self, osutils, service, plugin, instance_id, shared_data):
         plugin_name = plugin.get_name()
@@ -69,12 +96,31 @@ class InitManager(object):
                                                            shared_data)
                 self._set_plugin_status(osutils, instance_id, plugin_name,
                                         status)
+                if reboot_required:
+                    # Checkpoint: the statuses must be saved before the
+                    # reboot is requested
+                    self._flush_plugin_statuses()
                 return reboot_required
             except Exception as ex:
                 LOG.error('plugin \'%(plugin_name)s\' failed with error '
                           '\'%(ex)s\'', {'plugin_name': plugin_name, 'ex': ex})
                 LOG.exception(ex)
 
+    def _get_pending_plugins(self, osutils, instance_id, plugins):
+        # Filtering the plugins already executed before checking their OS
+        # requirements avoids importing their modules
+        pending_plugins = []
+        for plugin in plugins:
+            plugin_name = plugin.get_name()
+            status = self._get_plugin_status(osutils, instance_id,
+                                             plugin_name)
+            if status == plugins_base.PLUGIN_EXECUTION_DONE:
+                LOG.debug('Plugin \'%s\' execution already done, skipping',
+                          plugin_name)
+            else:
+                pending_plugins.append(plugin)
+        return pending_plugins
+
     def _check_plugin_os_requirements(self, osutils, plugin):
         supported = False
         plugin_name = plugin.get_name()
@@ -95,36 +141,116 @@ class InitManager(object):
                               'supported' % plugin_name)
         return supported
 
+    def _save_metadata_cache(self, osutils, service, instance_id):
+        try:
+            cacheservice.save_metadata_cache(osutils, service, instance_id)
+        except Exception as ex:
+            LOG.error('Failed to save the metadata cache: \'%s\'' % ex)
+            LOG.exception(ex)
+
+    def _clear_metadata_cache(self, osutils):
+        try:
+            cacheservice.clear_metadata_cache(osutils)
+        except Exception as ex:
+            LOG.error('Failed to clear the metadata cache: \'%s\'' % ex)
+            LOG.exception(ex)
+
+    def _are_plugins_done(self, osutils, instance_id, plugins):
+        for plugin in plugins:
+            status = self._get_plugin_status(osutils, instance_id,
+                                             plugin.get_name())
+            if status != plugins_base.PLUGIN_EXECUTION_DONE:
+                return False
+        return True
+
+    def _update_startup_marker(self, done, instance_id, service):
+        try:
+            if done:
+                class_path = cacheservice.get_service_class_path(service)
+                startup.write_marker(instance_id, class_path)
+            else:
+                startup.clear_marker()
+        except Exception as ex:
+            LOG.error('Failed to update the startup marker: \'%s\'' % ex)
+            LOG.exception(ex)
+
+    def _exec_plugin_profiled(self, profiler, osutils, service, plugin,
+                              instance_id, shared_data):
+        return profiler.run_plugin(plugin.get_name(), self._exec_plugin,
+                                   osutils, service, plugin, instance_id,
+                                   shared_data)
+
     def configure_host(self):
+        profiler = boot_profiler.BootProfiler()
+
         osutils = osutils_factory.get_os_utils()
-        osutils.wait_for_boot_completion()
+        with profiler.measure('wait_for_boot_completion'):
+            osutils.wait_for_boot_completion()
 
-        service = metadata_factory.get_metadata_service()
-        LOG.info('Metadata service loaded: \'%s\'' %
-                 service.get_name())
+        with profiler.measure('get_metadata_service'):
+            service = metadata_factory.get_metadata_service()
+        service_name = service.get_name()
+        LOG.info('Metadata service loaded: \'%s\'' % service_name)
 
         instance_id = service.get_instance_id()
         LOG.debug('Instance id: %s', instance_id)
 
-        plugins = plugins_factory.load_plugins()
+        with profiler.measure('load_plugins'):
+            plugins = plugins_factory.load_plugins()
+            plugins = self._get_pending_plugins(osutils, instance_id, plugins)
         plugins_shared_data = {}
 
         reboot_required = False
+        supported_plugins = []
         try:
-            for plugin in plugins:
-                if self._check_plugin_os_requirements(osutils, plugin):
-                    if self._exec_plugin(osutils, service, plugin,
-                                         instance_id, plugins_shared_data):
-                        reboot_required = True
-                        if CONF.allow_reboot:
-                            break
+            with profiler.measure('exec_plugins'):
+                if CONF.plugins_parallel_execution:
+                    supported_plugins = [
+                        p for p in plugins if
+                        self._check_plugin_os_requirements(osutils, p)]
+                    plugins = supported_plugins
+                    scheduler = plugins_scheduler.PluginScheduler(
+                        CONF.plugins_max_workers)
+                    reboot_required = scheduler.execute(
+                        plugins,
+                        lambda plugin: self._exec_plugin_profiled(
+                            profiler, osutils, service, plugin, instance_id,
+                            plugins_shared_data),
+                        CONF.allow_reboot)
+                else:
+                    for plugin in plugins:
+                        if self._check_plugin_os_requirements(osutils,
+                                                              plugin):
+                            supported_plugins.append(plugin)
+                            if self._exec_plugin_profiled(
+                                    profiler, osutils, service, plugin,
+                                    instance_id, plugins_shared_data):
+                                reboot_required = True
+                                if CONF.allow_reboot:
+                                    break
         finally:
+            self._flush_plugin_statuses()
+            profiler.add_metadata_stats(service_name, service.get_stats())
+            profiler.add_import_times(
+                plugins_factory.get_import_times(plugins))
             service.cleanup()
 
         if reboot_required and CONF.allow_reboot:
+            with profiler.measure('reboot'):
+                self._save_metadata_cache(osutils, service, instance_id)
+                self._update_startup_marker(False, instance_id, service)
+            profiler.save_report()
             try:
                 osutils.reboot()
             except Exception as ex:
                 LOG.error('reboot failed with error \'%s\'' % ex)
-        elif CONF.stop_service_on_exit:
-            osutils.terminate()
+        else:
+            with profiler.measure('exit'):
+                self._clear_metadata_cache(osutils)
+                self._update_startup_marker(
+                    self._are_plugins_done(osutils, instance_id,
+                                           supported_plugins),
+                    instance_id, service)
+            profiler.save_report()
+            if CONF.stop_service_on_exit:
+                osutils.terminate()
@@ -14,6 +14,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+import time
+
 from oslo.config import cfg
 
 from cloudbaseinit import exception
@@ -24,6 +27,8 @@ opts = [
     cfg.ListOpt(
         'metadata_services',
         default=[
+            'cloudbaseinit.metadata.services.cacheservice.'
+            'CachedMetadataService',
             'cloudbaseinit.metadata.services.httpservice.HttpService',
             'cloudbaseinit.metadata.services.configdrive.ConfigDriveService',
             'cloudbaseinit.metadata.services.ec2service.EC2Service',
@@ -32,7 +37,11 @@ opts = [
         help='List of enabled metadata service classes, '
         'to be tested fro availability in the provided order. '
         'The first available service will be used to retrieve '
-        'metadata')
+        'metadata'),
+    cfg.BoolOpt('metadata_services_parallel_discovery', default=False,
+                help='Probe all the enabled metadata services concurrently. '
+                'The first available service in the order provided in '
+                '"metadata_services" will be used to retrieve metadata'),
 ]
 
 CONF = cfg.CONF
@@ -40,15 +49,104 @@ CONF.register_opts(opts)
 LOG = logging.getLogger(__name__)
 
 
-def get_metadata_service():
-    # Return the first service that loads correctly
-    cl = classloader.ClassLoader()
-    for class_path in CONF.metadata_services:
-        service = cl.load_class(class_path)()
+class _ServiceProbe(object):
+    def __init__(self, class_path, service):
+        self.class_path = class_path
+        self.service = service
+        self.loaded = False
+        self.elapsed = None
+        self._discarded = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self):
+        start = time.time()
         try:
-            if service.load():
-                return service
+            self.loaded = bool(self.service.load())
         except Exception as ex:
-            LOG.error("Failed to load metadata service '%s'" % class_path)
+            LOG.error("Failed to load metadata service '%s'" %
+                      self.class_path)
             LOG.exception(ex)
-    raise exception.CloudbaseInitException("No available service found")
+        finally:
+            self.elapsed = time.time() - start
+            LOG.debug("Metadata service '%(class_path)s' probed in "
+                      "%(elapsed).3f seconds, available: %(loaded)s" %
+                      {'class_path': self.class_path,
+                       'elapsed': self.elapsed,
+                       'loaded': self.loaded})
+            with self._lock:
+                self._done.set()
+                discarded = self._discarded
+            if discarded:
+                self._cleanup()
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def wait(self):
+        # Event.wait() without a timeout is not interruptible on Python 2
+        while not self._done.wait(1):
+            pass
+        return self.loaded
+
+    def discard(self):
+        # Probes still running are cleaned up by their own thread
+        with self._lock:
+            self._discarded = True
+            done = self._done.is_set()
+        if done:
+            self._cleanup()
+
+    def _cleanup(self):
+        if self.loaded:
+            try:
+                self.service.cleanup()
+            except Exception as ex:
+                LOG.error("Failed to cleanup metadata service '%s'" %
+                          self.class_path)
+                LOG.exception(ex)
+
+
+def _load_services():
+    cl = classloader.ClassLoader()
+    for class_path in CONF.metadata_services:
+        yield (class_path, cl.load_class(class_path)())
+
+
+def _get_metadata_service_parallel():
+    probes = [_ServiceProbe(class_path, service)
+              for (class_path, service) in _load_services()]
+    for probe in probes:
+        probe.start()
+
+    selected = None
+    for probe in probes:
+        if selected:
+            probe.discard()
+        elif probe.wait():
+            selected = probe
+
+    if selected:
+        return selected.service
+
+
+def _get_metadata_service_serial():
+    # Return the first service that loads correctly
+    for (class_path, service) in _load_services():
+        probe = _ServiceProbe(class_path, service)
+        probe.run()
+        if probe.loaded:
+            return service
+
+
+def get_metadata_service():
+    if CONF.metadata_services_parallel_discovery:
+        service = _get_metadata_service_parallel()
+    else:
+        service = _get_metadata_service_serial()
+
+    if not service:
+        raise exception.CloudbaseInitException("No available service found")
+    return service
@@ -15,11 +15,12 @@
 #    under the License.
 
 import abc
-import time
+import threading
 
 from oslo.config import cfg
 
 from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import retry
 
 opts = [
     cfg.IntOpt('retry_count', default=5,
@@ -27,7 +28,20 @@ opts = [
                'case of transient errors'),
     cfg.FloatOpt('retry_count_interval', default=4,
                  help='Interval between attempts in case of transient errors, '
-                 'expressed in seconds'),
+                 'expressed in seconds. The interval is multiplied by '
+                 '"retry_backoff_factor" after each attempt'),
+    cfg.FloatOpt('retry_backoff_factor', default=2,
+                 help='Multiplier applied to the interval between attempts '
+                 'after each failed attempt'),
+    cfg.FloatOpt('retry_max_interval', default=16,
+                 help='Max. interval between attempts, expressed in seconds'),
+    cfg.BoolOpt('retry_jitter', default=True,
+                help='Randomize the interval between attempts, to avoid '
+                'multiple instances retrying at the same time'),
+    cfg.FloatOpt('retry_total_timeout', default=60,
+                 help='Max. time spent by a metadata service fetching '
+                 'metadata after which errors are no longer retried, '
+                 'expressed in seconds. Set to 0 for no limit'),
 ]
 
 CONF = cfg.CONF
@@ -43,41 +57,82 @@ class NotExistingMetadataException(Exception):
 class BaseMetadataService(object):
     def __init__(self):
         self._cache = {}
+        self._not_existing_cache = set()
+        self._prefetch = True
         self._enable_retry = False
+        self._retry_policy = self._get_retry_policy()
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'bytes': 0}
 
     def get_name(self):
         return self.__class__.__name__
 
     def load(self):
         self._cache = {}
+        self._not_existing_cache = set()
+        self._retry_policy = self._get_retry_policy()
 
     @abc.abstractmethod
     def _get_data(self, path):
         pass
 
-    def _exec_with_retry(self, action):
-        i = 0
-        while True:
-            try:
-                return action()
-            except NotExistingMetadataException:
-                raise
-            except Exception:
-                if self._enable_retry and i < CONF.retry_count:
-                    i += 1
-                    time.sleep(CONF.retry_count_interval)
-                else:
-                    raise
+    def set_prefetch(self, enabled):
+        """Enables or disables the metadata prefetched on load."""
+        self._prefetch = enabled
+
+    def _get_retry_policy(self):
+        return retry.RetryPolicy(CONF.retry_count,
+                                 CONF.retry_count_interval,
+                                 CONF.retry_backoff_factor,
+                                 CONF.retry_max_interval,
+                                 CONF.retry_jitter,
+                                 CONF.retry_total_timeout)
+
+    def get_retry_stats(self):
+        return self._retry_policy.stats
+
+    def get_stats(self):
+        """Returns the number of metadata requests and bytes received."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _get_data_with_stats(self, path):
+        with self._stats_lock:
+            self._stats['requests'] += 1
+        data = self._get_data(path)
+        if data:
+            with self._stats_lock:
+                self._stats['bytes'] += len(data)
+        return data
+
+    def _exec_with_retry(self, action, name=None):
+        if not self._enable_retry:
+            return action()
+        return self._retry_policy.execute(
+            action, name, fatal_exceptions=NotExistingMetadataException)
 
     def _get_cache_data(self, path):
         if path in self._cache:
             LOG.debug("Using cached copy of metadata: '%s'" % path)
             return self._cache[path]
+        elif path in self._not_existing_cache:
+            raise NotExistingMetadataException()
         else:
-            data = self._exec_with_retry(lambda: self._get_data(path))
+            try:
+                data = self._exec_with_retry(
+                    lambda: self._get_data_with_stats(path), path)
+            except NotExistingMetadataException:
+                self._not_existing_cache.add(path)
+                raise
             self._cache[path] = data
             return data
 
+    def get_cached_data(self):
+        return dict(self._cache)
+
+    def get_not_existing_data(self):
+        return sorted(self._not_existing_cache)
+
     def get_instance_id(self):
         pass
 
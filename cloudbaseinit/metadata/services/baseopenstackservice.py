@@ -15,6 +15,7 @@
 import json
 import posixpath
 
+from multiprocessing import pool
 from oslo.config import cfg
 
 from cloudbaseinit.metadata.services import base
@@ -24,6 +25,12 @@ from cloudbaseinit.utils import x509constants
 opts = [
     cfg.StrOpt('metadata_base_url', default='http://169.254.169.254/',
                help='The base URL where the service looks for metadata'),
+    cfg.BoolOpt('metadata_prefetch', default=True,
+                help='Fetch all the OpenStack metadata documents and the '
+                'content files they reference when the service is loaded'),
+    cfg.IntOpt('metadata_prefetch_workers', default=4,
+               help='Max. number of metadata documents fetched in parallel '
+               'by services supporting concurrent requests'),
 ]
 
 CONF = cfg.CONF
@@ -33,22 +40,93 @@ LOG = logging.getLogger(__name__)
 
 
 class BaseOpenStackService(base.BaseMetadataService):
+    # Services whose documents can be safely retrieved concurrently
+    _parallel_prefetch = False
 
-    def get_content(self, name):
-        path = posixpath.normpath(
+    def __init__(self):
+        super(BaseOpenStackService, self).__init__()
+        self._json_cache = {}
+
+    def load(self):
+        super(BaseOpenStackService, self).load()
+        self._json_cache = {}
+
+    def _get_content_path(self, name):
+        return posixpath.normpath(
             posixpath.join('openstack', 'content', name))
-        return self._get_cache_data(path)
+
+    def _get_version_path(self, version, name):
+        return posixpath.normpath(posixpath.join('openstack', version, name))
+
+    def get_content(self, name):
+        return self._get_cache_data(self._get_content_path(name))
 
     def get_user_data(self):
-        path = posixpath.normpath(
-            posixpath.join('openstack', 'latest', 'user_data'))
-        return self._get_cache_data(path)
+        return self._get_cache_data(
+            self._get_version_path('latest', 'user_data'))
+
+    def _get_json_data(self, path):
+        # Each document is parsed only once, the accessors share the result
+        if path not in self._json_cache:
+            data = self._get_cache_data(path)
+            self._json_cache[path] = json.loads(data.decode('utf8'))
+        return self._json_cache[path]
 
     def _get_meta_data(self, version='latest'):
-        path = posixpath.normpath(
-            posixpath.join('openstack', version, 'meta_data.json'))
-        data = self._get_cache_data(path)
-        return json.loads(data.decode('utf8'))
+        return self._get_json_data(
+            self._get_version_path(version, 'meta_data.json'))
+
+    def _get_referenced_content_paths(self, meta_data):
+        content_paths = []
+        network_config = meta_data.get('network_config') or {}
+        for item in [network_config] + list(meta_data.get('files') or []):
+            content_path = item.get('content_path')
+            if content_path:
+                path = self._get_content_path(
+                    posixpath.basename(content_path))
+                if path not in content_paths:
+                    content_paths.append(path)
+        return content_paths
+
+    def _prefetch_path(self, path):
+        try:
+            self._get_cache_data(path)
+        except base.NotExistingMetadataException:
+            LOG.debug("Metadata not present: '%s'" % path)
+        except Exception as ex:
+            # The accessors will try again when the data is requested
+            LOG.debug("Failed to prefetch metadata '%(path)s': %(ex)s" %
+                      {'path': path, 'ex': ex})
+
+    def _prefetch_paths(self, paths):
+        if self._parallel_prefetch and len(paths) > 1:
+            thread_pool = pool.ThreadPool(
+                min(len(paths), max(CONF.metadata_prefetch_workers, 1)))
+            try:
+                thread_pool.map(self._prefetch_path, paths)
+            finally:
+                thread_pool.close()
+                thread_pool.join()
+        else:
+            for path in paths:
+                self._prefetch_path(path)
+
+    def _prefetch_metadata(self):
+        if not CONF.metadata_prefetch or not self._prefetch:
+            return
+
+        LOG.debug('Prefetching metadata')
+        self._prefetch_paths([
+            self._get_version_path('latest', 'meta_data.json'),
+            self._get_version_path('latest', 'user_data'),
+            self._get_version_path('latest', 'network_data.json')])
+
+        try:
+            meta_data = self._get_meta_data()
+        except Exception:
+            return
+
+        self._prefetch_paths(self._get_referenced_content_paths(meta_data))
 
     def get_instance_id(self):
         return self._get_meta_data().get('uuid')
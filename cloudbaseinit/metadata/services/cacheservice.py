@@ -0,0 +1,335 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import hashlib
+import json
+import time
+
+from oslo.config import cfg
+
+from cloudbaseinit import exception
+from cloudbaseinit.metadata.services import base
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import classloader
+
+opts = [
+    cfg.IntOpt('metadata_cache_ttl', default=3600,
+               help='Max. age, expressed in seconds, of the metadata saved '
+               'before a reboot requested by a plugin for it to be used '
+               'during the next execution. Set to 0 to disable the cache'),
+    cfg.IntOpt('metadata_cache_max_document_size', default=64 * 1024,
+               help='Max. size, expressed in bytes, of a metadata document '
+               'saved in the cache. Larger documents, e.g. user data, are '
+               'retrieved again from the metadata service when needed'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+_METADATA_CACHE_SECTION = 'MetadataCache'
+_METADATA_CACHE_NAME = 'snapshot'
+# The instance id and the service of the snapshot, saved in the global
+# section as the snapshot is saved in the section of its instance
+_METADATA_CACHE_INDEX_NAME = 'instance'
+
+# Credentials which must not be saved in the cache
+_CREDENTIAL_KEYS = ('admin_pass',)
+
+
+def _get_checksum(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_service_class_path(service):
+    if isinstance(service, CachedMetadataService):
+        service = service.get_cached_service()
+    return '%s.%s' % (service.__class__.__module__,
+                      service.__class__.__name__)
+
+
+def _get_cache_section(instance_id):
+    if not instance_id:
+        return _METADATA_CACHE_SECTION
+    return instance_id + '/' + _METADATA_CACHE_SECTION
+
+
+def _load_service(class_path):
+    """Loads a service which retrieves only the requested documents."""
+    cl = classloader.ClassLoader()
+    service = cl.load_class(class_path)()
+    service.set_prefetch(False)
+    if not service.load():
+        raise exception.CloudbaseInitException(
+            'Metadata service not available: %s' % class_path)
+    return service
+
+
+def _strip_credentials(path, data):
+    if not path.endswith('.json'):
+        return data
+    try:
+        document = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return data
+    if not isinstance(document, dict):
+        return data
+
+    stripped = False
+    for values in (document, document.get('meta')):
+        if isinstance(values, dict):
+            for key in _CREDENTIAL_KEYS:
+                if values.pop(key, None) is not None:
+                    stripped = True
+    if not stripped:
+        return data
+    LOG.debug('Removing credentials from cached metadata: %s' % path)
+    return json.dumps(document).encode('utf-8')
+
+
+def save_metadata_cache(osutils, service, instance_id):
+    if CONF.metadata_cache_ttl <= 0:
+        return
+
+    index = get_metadata_cache_index(osutils)
+    if index and index.get('instance_id') != instance_id:
+        clear_metadata_cache(osutils)
+
+    documents = {}
+    for (path, data) in service.get_cached_data().items():
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if len(data) > CONF.metadata_cache_max_document_size:
+            LOG.debug('Metadata document too large to be cached: %s' % path)
+            continue
+        data = _strip_credentials(path, data)
+        documents[path] = {
+            'data': base64.b64encode(data).decode('ascii'),
+            'sha256': _get_checksum(data)}
+
+    snapshot = {'instance_id': instance_id,
+                'service': get_service_class_path(service),
+                'timestamp': time.time(),
+                'documents': documents,
+                'not_existing': service.get_not_existing_data()}
+
+    LOG.debug('Saving %d metadata documents to the cache' % len(documents))
+    osutils.set_config_value(_METADATA_CACHE_NAME, json.dumps(snapshot),
+                             _get_cache_section(instance_id))
+    index = {'instance_id': instance_id, 'service': snapshot['service']}
+    osutils.set_config_value(_METADATA_CACHE_INDEX_NAME, json.dumps(index),
+                             _METADATA_CACHE_SECTION)
+
+
+def get_metadata_cache_index(osutils):
+    """Returns the instance_id and service of the cached snapshot, or None.
+    """
+    value = osutils.get_config_value(_METADATA_CACHE_INDEX_NAME,
+                                     _METADATA_CACHE_SECTION)
+    if not value:
+        return None
+    try:
+        index = json.loads(value)
+        if not isinstance(index, dict) or not index.get('service'):
+            return None
+        return index
+    except ValueError as ex:
+        LOG.warning('Invalid metadata cache index: %s' % ex)
+        return None
+
+
+def clear_metadata_cache(osutils):
+    index = get_metadata_cache_index(osutils)
+    if index:
+        LOG.debug('Clearing the metadata cache')
+        osutils.set_config_value(_METADATA_CACHE_NAME, '',
+                                 _get_cache_section(index['instance_id']))
+        osutils.set_config_value(_METADATA_CACHE_INDEX_NAME, '',
+                                 _METADATA_CACHE_SECTION)
+
+
+def load_metadata_cache(osutils, instance_id):
+    value = osutils.get_config_value(_METADATA_CACHE_NAME,
+                                     _get_cache_section(instance_id))
+    if not value:
+        return None
+
+    try:
+        snapshot = json.loads(value)
+        if snapshot['instance_id'] != instance_id:
+            LOG.debug('Cached metadata instance id mismatch')
+            return None
+
+        age = time.time() - snapshot['timestamp']
+        if age < 0 or age > CONF.metadata_cache_ttl:
+            LOG.debug('Cached metadata is stale')
+            return None
+
+        documents = {}
+        for (path, document) in snapshot['documents'].items():
+            data = base64.b64decode(document['data'].encode('ascii'))
+            if _get_checksum(data) != document['sha256']:
+                LOG.warning('Cached metadata checksum mismatch: %s' % path)
+                return None
+            documents[path] = data
+        snapshot['documents'] = documents
+        snapshot['not_existing'] = set(snapshot.get('not_existing', []))
+
+        return snapshot
+    except (ValueError, KeyError, TypeError) as ex:
+        LOG.warning('Invalid metadata cache: %s' % ex)
+        return None
+
+
+class CachedMetadataService(base.BaseMetadataService):
+    """Serves the metadata saved before a reboot requested by a plugin.
+
+    The cache is used only if the instance id, retrieved from the service
+    which saved it without prefetching the other documents, didn't change.
+    The metadata is interpreted by an instance of the service class which
+    originally retrieved it. Documents which were known not to exist are
+    not requested again. Other documents missing from the cache and
+    password operations, as the credentials are not cached, are handled by
+    the service used to retrieve the instance id.
+    """
+
+    def __init__(self):
+        super(CachedMetadataService, self).__init__()
+        self._service_class_path = None
+        self._service = None
+        self._online_service = None
+        self._documents = {}
+        self._not_existing = set()
+
+    def get_name(self):
+        if self._service:
+            return '%s (cached)' % self._service.get_name()
+        return super(CachedMetadataService, self).get_name()
+
+    def get_cached_service(self):
+        return self._service
+
+    def load(self):
+        super(CachedMetadataService, self).load()
+        if CONF.metadata_cache_ttl <= 0:
+            return False
+
+        osutils = osutils_factory.get_os_utils()
+        index = get_metadata_cache_index(osutils)
+        if not index:
+            return False
+
+        try:
+            online_service = _load_service(index['service'])
+        except Exception as ex:
+            LOG.debug('Cannot verify the cached metadata instance id: %s' %
+                      ex)
+            return False
+
+        snapshot = None
+        try:
+            if online_service.get_instance_id() == index['instance_id']:
+                snapshot = load_metadata_cache(osutils, index['instance_id'])
+            else:
+                LOG.debug('Instance id changed, ignoring the cached '
+                          'metadata')
+        except Exception as ex:
+            LOG.debug('Cannot verify the cached metadata instance id: %s' %
+                      ex)
+        if not snapshot:
+            online_service.cleanup()
+            return False
+
+        self._online_service = online_service
+        self._service_class_path = snapshot['service']
+        self._documents = snapshot['documents']
+        self._not_existing = snapshot['not_existing']
+
+        cl = classloader.ClassLoader()
+        self._service = cl.load_class(self._service_class_path)()
+        # Metadata is read through the original service's accessors
+        self._service._get_data = self._get_data
+
+        LOG.debug('Using metadata cached by: %s' % self._service_class_path)
+        return True
+
+    def _get_online_service(self):
+        if not self._online_service:
+            LOG.debug('Loading metadata service: %s' %
+                      self._service_class_path)
+            self._online_service = _load_service(self._service_class_path)
+        return self._online_service
+
+    def _get_data(self, path):
+        if path in self._documents:
+            return self._documents[path]
+        if path in self._not_existing:
+            raise base.NotExistingMetadataException()
+        return self._get_online_service()._get_cache_data(path)
+
+    def get_cached_data(self):
+        return self._service.get_cached_data()
+
+    def get_not_existing_data(self):
+        return self._service.get_not_existing_data()
+
+    def get_stats(self):
+        # Only the requests sent to the online service hit the network,
+        # including the one retrieving the instance id
+        if self._online_service:
+            return self._online_service.get_stats()
+        return super(CachedMetadataService, self).get_stats()
+
+    def get_instance_id(self):
+        return self._service.get_instance_id()
+
+    def get_content(self, name):
+        return self._service.get_content(name)
+
+    def get_user_data(self):
+        return self._service.get_user_data()
+
+    def get_host_name(self):
+        return self._service.get_host_name()
+
+    def get_public_keys(self):
+        return self._service.get_public_keys()
+
+    def get_network_config(self):
+        return self._service.get_network_config()
+
+    def get_admin_password(self):
+        return self._get_online_service().get_admin_password()
+
+    @property
+    def can_post_password(self):
+        return self._service.can_post_password
+
+    @property
+    def is_password_set(self):
+        return self._get_online_service().is_password_set
+
+    def post_password(self, enc_password_b64):
+        return self._get_online_service().post_password(enc_password_b64)
+
+    def get_client_auth_certs(self):
+        return self._service.get_client_auth_certs()
+
+    def cleanup(self):
+        if self._online_service:
+            self._online_service.cleanup()
+            self._online_service = None
@@ -31,6 +31,10 @@ opts = [
                 help='Look for an ISO config drive in raw HDDs'),
     cfg.BoolOpt('config_drive_cdrom', default=True,
                 help='Look for a config drive in the attached cdrom drives'),
+    cfg.BoolOpt('config_drive_cdrom_in_place', default=True,
+                help='Read the metadata directly from the cdrom drive '
+                'instead of copying the whole config drive content in a '
+                'temporary folder'),
 ]
 
 CONF = cfg.CONF
@@ -43,20 +47,33 @@ class ConfigDriveService(baseopenstackservice.BaseOpenStackService):
     def __init__(self):
         super(ConfigDriveService, self).__init__()
         self._metadata_path = None
+        self._metadata_path_is_copy = False
 
     def load(self):
         super(ConfigDriveService, self).load()
 
         target_path = os.path.join(tempfile.gettempdir(), str(uuid.uuid4()))
+        in_place = CONF.config_drive_cdrom and CONF.config_drive_cdrom_in_place
 
         mgr = factory.get_config_drive_manager()
         found = mgr.get_config_drive_files(target_path,
                                            CONF.config_drive_raw_hhd,
-                                           CONF.config_drive_cdrom)
+                                           CONF.config_drive_cdrom and
+                                           not in_place)
         if found:
             self._metadata_path = target_path
+            self._metadata_path_is_copy = True
             LOG.debug('Metadata copied to folder: \'%s\'' %
                       self._metadata_path)
+        elif in_place:
+            self._metadata_path = mgr.get_config_drive_mount_point()
+            if self._metadata_path:
+                found = True
+                LOG.debug('Reading metadata from: \'%s\'' %
+                          self._metadata_path)
+
+        if found:
+            self._prefetch_metadata()
         return found
 
     def _get_data(self, path):
@@ -68,7 +85,8 @@ class ConfigDriveService(baseopenstackservice.BaseOpenStackService):
             raise base.NotExistingMetadataException()
 
     def cleanup(self):
-        if self._metadata_path:
+        if self._metadata_path and self._metadata_path_is_copy:
             LOG.debug('Deleting metadata folder: \'%s\'' % self._metadata_path)
             shutil.rmtree(self._metadata_path, True)
-            self._metadata_path = None
+        self._metadata_path = None
+        self._metadata_path_is_copy = False
@@ -20,6 +20,7 @@ from six.moves.urllib import error
 from six.moves.urllib import request
 
 from cloudbaseinit.metadata.services import base
+from cloudbaseinit.metadata.services import httpclient
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.utils import network
 
@@ -60,7 +61,7 @@ class EC2Service(base.BaseMetadataService):
 
     def _get_response(self, req):
         try:
-            return request.urlopen(req)
+            return httpclient.urlopen(req)
         except error.HTTPError as ex:
             if ex.code == 404:
                 raise base.NotExistingMetadataException()
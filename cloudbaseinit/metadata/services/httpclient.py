@@ -0,0 +1,214 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import socket
+import threading
+
+from oslo.config import cfg
+from six.moves import http_client
+from six.moves import queue
+from six.moves.urllib import error
+from six.moves.urllib import parse
+
+from cloudbaseinit.openstack.common import log as logging
+
+opts = [
+    cfg.FloatOpt('metadata_http_timeout', default=10,
+                 help='Timeout for each metadata HTTP request, expressed in '
+                 'seconds'),
+    cfg.IntOpt('metadata_http_max_connections', default=4,
+               help='Max. number of concurrent HTTP requests sent to a '
+               'metadata host. Idle connections are kept alive and reused'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+# Requests which can be safely sent again
+_IDEMPOTENT_METHODS = ('GET', 'HEAD')
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+# Same limit as urllib
+_MAX_REDIRECTS = 10
+
+
+class HTTPResponse(object):
+    def __init__(self, url, code, msg, headers, data):
+        self.url = url
+        self.code = code
+        self.msg = msg
+        self.headers = headers
+        self._data = data
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+    def read(self):
+        return self._data
+
+
+class HTTPConnectionPool(object):
+    """Keep-alive HTTP/1.1 connections to a single host."""
+
+    def __init__(self, scheme, host, port=None, max_connections=None,
+                 timeout=None):
+        if scheme == 'https':
+            self._connection_class = http_client.HTTPSConnection
+        else:
+            self._connection_class = http_client.HTTPConnection
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        if max_connections is None:
+            max_connections = CONF.metadata_http_max_connections
+        # Bounds the number of requests in flight and of open connections
+        self._semaphore = threading.BoundedSemaphore(max(max_connections, 1))
+        self._idle_connections = queue.LifoQueue()
+
+    def _get_timeout(self, timeout):
+        if timeout is not None:
+            return timeout
+        if self._timeout is not None:
+            return self._timeout
+        return CONF.metadata_http_timeout
+
+    def _get_connection(self, timeout):
+        try:
+            conn = self._idle_connections.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = self._connection_class(self._host, self._port)
+            reused = False
+
+        conn.timeout = timeout
+        if conn.sock:
+            conn.sock.settimeout(timeout)
+        return (conn, reused)
+
+    def _send_request(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        data = response.read()
+        return (response, data)
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        timeout = self._get_timeout(timeout)
+        headers = headers or {}
+
+        with self._semaphore:
+            (conn, reused) = self._get_connection(timeout)
+            try:
+                try:
+                    (response, data) = self._send_request(conn, method, path,
+                                                          body, headers)
+                except (http_client.HTTPException, socket.error):
+                    # A request which may have been processed, e.g. a POST
+                    # whose response was lost, is not sent again
+                    if not reused or method not in _IDEMPOTENT_METHODS:
+                        raise
+                    # The server closed the idle keep-alive connection
+                    LOG.debug('Idle connection to %s dropped, reconnecting' %
+                              self._host)
+                    conn.close()
+                    (response, data) = self._send_request(conn, method, path,
+                                                          body, headers)
+            except Exception:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle_connections.put(conn)
+
+        return (response, data)
+
+    def close(self):
+        while True:
+            try:
+                self._idle_connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(scheme, netloc):
+    with _pools_lock:
+        pool = _pools.get((scheme, netloc))
+        if not pool:
+            url = parse.urlsplit('%s://%s' % (scheme, netloc))
+            pool = HTTPConnectionPool(scheme, url.hostname, url.port)
+            _pools[(scheme, netloc)] = pool
+        return pool
+
+
+def close_connection_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def _request(url, method, body, headers, timeout):
+    split_url = parse.urlsplit(url)
+    path = split_url.path or '/'
+    if split_url.query:
+        path += '?' + split_url.query
+
+    pool = get_connection_pool(split_url.scheme, split_url.netloc)
+    return pool.request(method, path, body, headers, timeout)
+
+
+def urlopen(req, timeout=None):
+    """Sends a urllib Request through the shared connection pools.
+
+    Mimics urllib's urlopen: the redirects of GET and HEAD requests are
+    followed, an HTTPError is raised for the other status codes not in the
+    2xx range and the returned object exposes read(), getcode() and info().
+    """
+    url = req.get_full_url()
+    method = req.get_method()
+    body = req.data
+    headers = dict(req.header_items())
+    if body is not None and 'Content-type' not in headers:
+        headers['Content-type'] = 'application/x-www-form-urlencoded'
+
+    redirects = 0
+    while True:
+        (response, data) = _request(url, method, body, headers, timeout)
+        location = response.getheader('Location')
+        if (response.status not in _REDIRECT_CODES or not location or
+                method not in _IDEMPOTENT_METHODS or
+                redirects >= _MAX_REDIRECTS):
+            break
+        redirects += 1
+        url = parse.urljoin(url, location)
+        LOG.debug('Redirected to: %s' % url)
+
+    if not 200 <= response.status < 300:
+        raise error.HTTPError(url, response.status, response.reason,
+                              response.msg, io.BytesIO(data))
+    return HTTPResponse(url, response.status, response.reason, response.msg,
+                        data)
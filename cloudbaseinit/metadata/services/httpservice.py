@@ -22,6 +22,7 @@ from six.moves.urllib import request
 
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.metadata.services import baseopenstackservice
+from cloudbaseinit.metadata.services import httpclient
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.utils import network
 
@@ -40,6 +41,7 @@ LOG = logging.getLogger(__name__)
 
 class HttpService(baseopenstackservice.BaseOpenStackService):
     _POST_PASSWORD_MD_VER = '2013-04-04'
+    _parallel_prefetch = True
 
     def __init__(self):
         super(HttpService, self).__init__()
@@ -52,15 +54,17 @@ class HttpService(baseopenstackservice.BaseOpenStackService):
 
         try:
             self._get_meta_data()
-            return True
         except Exception:
             LOG.debug('Metadata not found at URL \'%s\'' %
                       CONF.metadata_base_url)
             return False
 
+        self._prefetch_metadata()
+        return True
+
     def _get_response(self, req):
         try:
-            return request.urlopen(req)
+            return httpclient.urlopen(req)
         except error.HTTPError as ex:
             if ex.code == 404:
                 raise base.NotExistingMetadataException()
@@ -101,7 +105,7 @@ class HttpService(baseopenstackservice.BaseOpenStackService):
         try:
             path = self._get_password_path()
             action = lambda: self._post_data(path, enc_password_b64)
-            return self._exec_with_retry(action)
+            return self._exec_with_retry(action, path)
         except error.HTTPError as ex:
             if ex.code == 409:
                 # Password already set
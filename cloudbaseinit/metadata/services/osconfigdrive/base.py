@@ -14,9 +14,20 @@
 
 import abc
 
+# Only the OpenStack metadata is read by ConfigDriveService
+CONFIG_DRIVE_PATHS = ['openstack/latest', 'openstack/content']
+
 
 class BaseConfigDriveManager(object):
     @abc.abstractmethod
     def get_config_drive_files(self, target_path, check_raw_hhd=True,
                                check_cdrom=True):
         pass
+
+    def get_config_drive_mount_point(self):
+        """Returns the path of a mounted config drive, if any.
+
+        The files of a mounted config drive can be read in place, without
+        copying them.
+        """
+        return None
@@ -0,0 +1,169 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from multiprocessing import pool
+from oslo.config import cfg
+
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import iso9660
+
+opts = [
+    cfg.IntOpt('config_drive_scan_max_workers', default=8,
+               help='Maximum number of raw HDDs probed concurrently when '
+               'looking for an ISO config drive'),
+    cfg.BoolOpt('config_drive_scan_cache', default=True,
+                help='Remember the raw HDDs which don\'t contain an ISO '
+                'config drive, identified by their serial number and size, '
+                'so they are not read again at the next executions'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+CACHE_SECTION = 'ConfigDriveScan'
+
+
+def has_iso9660_signature(disk):
+    data = disk.read_at(iso9660.VOLUME_DESCRIPTORS_OFFSET + 1,
+                        len(iso9660.ISO9660_ID))
+    return bytes(data) == iso9660.ISO9660_ID
+
+
+class NegativeCache(object):
+    """Ids of the disks which don't contain a config drive.
+
+    The ids are kept in the OS config store, so they are available at the
+    next executions.
+    """
+
+    def __init__(self, osutils):
+        self._osutils = osutils
+        self._lock = threading.Lock()
+        self._disk_ids = None
+        self._loaded_all = False
+        self._new_disk_ids = set()
+
+    def _load(self):
+        try:
+            self._disk_ids = set(
+                self._osutils.get_config_values(CACHE_SECTION))
+            self._loaded_all = True
+        except NotImplementedError:
+            self._disk_ids = set()
+
+    def __contains__(self, disk_id):
+        with self._lock:
+            if self._disk_ids is None:
+                self._load()
+            if disk_id in self._disk_ids:
+                return True
+            if not self._loaded_all:
+                return bool(self._osutils.get_config_value(disk_id,
+                                                           CACHE_SECTION))
+            return False
+
+    def add(self, disk_id):
+        with self._lock:
+            if self._disk_ids is None:
+                self._load()
+            if disk_id not in self._disk_ids:
+                self._disk_ids.add(disk_id)
+                self._new_disk_ids.add(disk_id)
+
+    def flush(self):
+        with self._lock:
+            if not self._new_disk_ids:
+                return
+            self._osutils.set_config_values(
+                dict((disk_id, 1) for disk_id in self._new_disk_ids),
+                CACHE_SECTION)
+            self._new_disk_ids = set()
+
+
+class ConfigDriveScanner(object):
+    """Looks for ISO9660 disks, probing them concurrently.
+
+    open_disk(path) returns an object providing read_at(offset, size),
+    get_id() and close(), or None if the disk can't contain a config drive.
+    get_id() returns a value identifying the disk across reboots, e.g. its
+    serial number, or None if not available. Disks which are found not to
+    contain an ISO9660 file system are added to the negative cache, if
+    provided, and skipped by the next scans.
+    """
+
+    def __init__(self, open_disk, negative_cache=None, max_workers=None):
+        self._open_disk = open_disk
+        self._negative_cache = negative_cache
+        self._max_workers = max_workers or CONF.config_drive_scan_max_workers
+
+    def _probe(self, path):
+        disk_id = None
+        try:
+            disk = self._open_disk(path)
+            if not disk:
+                return (path, disk_id, False)
+            try:
+                disk_id = disk.get_id()
+                if (disk_id and self._negative_cache is not None and
+                        disk_id in self._negative_cache):
+                    LOG.debug('Skipping disk without config drive: %s' %
+                              path)
+                    return (path, None, False)
+                return (path, disk_id, has_iso9660_signature(disk))
+            finally:
+                disk.close()
+        except Exception as ex:
+            LOG.debug('Failed to probe disk %(path)s: %(ex)s' %
+                      {'path': path, 'ex': ex})
+            # Errors are not cached
+            return (path, None, None)
+
+    def scan(self, paths):
+        """Yields the paths of the ISO9660 disks as soon as found.
+
+        The scan stops when the generator is closed, e.g. after finding the
+        config drive. Probes still running complete in the background.
+        """
+        paths = list(paths)
+        if not paths:
+            return
+
+        thread_pool = pool.ThreadPool(min(self._max_workers, len(paths)))
+        try:
+            for (path, disk_id, found) in thread_pool.imap_unordered(
+                    self._probe, paths):
+                if found:
+                    yield path
+                elif (found is False and disk_id and
+                        self._negative_cache is not None):
+                    self._negative_cache.add(disk_id)
+        finally:
+            thread_pool.close()
+            if self._negative_cache is not None:
+                try:
+                    self._negative_cache.flush()
+                except Exception as ex:
+                    LOG.error('Failed to save the config drive scan cache: '
+                              '%s' % ex)
+
+    def find(self, paths):
+        scan = self.scan(paths)
+        try:
+            return next(scan, None)
+        finally:
+            scan.close()
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
 import sys
 
 from cloudbaseinit.utils import classloader
@@ -24,6 +25,9 @@ def get_config_drive_manager():
     }
 
     class_path = class_paths.get(sys.platform)
+    if not class_path and os.name == 'posix':
+        class_path = ('cloudbaseinit.metadata.services.osconfigdrive.posix.'
+                      'PosixConfigDriveManager')
     if not class_path:
         raise NotImplementedError('ConfigDrive is not supported on '
                                   'this platform: %s' % sys.platform)
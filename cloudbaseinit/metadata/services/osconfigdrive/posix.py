@@ -0,0 +1,179 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import glob
+import os
+import re
+import shutil
+
+from oslo.config import cfg
+
+from cloudbaseinit import exception
+from cloudbaseinit.metadata.services.osconfigdrive import base
+from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.utils import iso9660
+from cloudbaseinit.utils import vfat
+
+opts = [
+    cfg.ListOpt('config_drive_image_paths', default=[],
+                help='ISO9660 or VFAT config drive image files, e.g. '
+                '"/var/lib/cloudbase-init/*.iso". Glob patterns are allowed. '
+                'The images are read before the block devices'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+CONFIG_DRIVE_LABEL = 'config-2'
+
+SYS_BLOCK_PATH = '/sys/class/block'
+DEV_PATH = '/dev'
+LABEL_LINKS_PATH = '/dev/disk/by-label'
+MOUNTS_PATH = '/proc/mounts'
+
+
+def open_config_drive_reader(device):
+    """Returns an ISO9660 or a VFAT reader for the device, or None."""
+    for reader_class in (iso9660.ISO9660Reader, vfat.VFATReader):
+        try:
+            return reader_class(device)
+        except exception.CloudbaseInitException:
+            pass
+
+
+def _unescape_mount_path(path):
+    # Spaces and other characters are escaped as octal values
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), path)
+
+
+class PosixConfigDriveManager(base.BaseConfigDriveManager):
+    """Reads config drives from block devices and image files.
+
+    The devices are read directly with the ISO9660 or the VFAT reader,
+    without mounting them. Block devices must have the config-2 label, the
+    configured image files are used regardless of their label.
+    """
+
+    def _get_labelled_device(self):
+        link_path = os.path.join(LABEL_LINKS_PATH, CONFIG_DRIVE_LABEL)
+        if os.path.exists(link_path):
+            return os.path.realpath(link_path)
+
+    def _get_block_devices(self):
+        # Provided by udev, avoids reading all the devices
+        device = self._get_labelled_device()
+        if device:
+            return [device]
+
+        try:
+            names = sorted(os.listdir(SYS_BLOCK_PATH))
+        except OSError:
+            return []
+        return [os.path.join(DEV_PATH, name) for name in names
+                if not name.startswith('ram')]
+
+    def _get_image_files(self):
+        paths = []
+        for pattern in CONF.config_drive_image_paths:
+            paths += sorted(glob.glob(pattern))
+        return paths
+
+    def _extract_files(self, path, target_path, check_label):
+        try:
+            with open(path, 'rb') as f:
+                reader = open_config_drive_reader(iso9660.FileBlockDevice(f))
+                if not reader:
+                    return False
+                label = reader.get_volume_label() or ''
+                if check_label and label.lower() != CONFIG_DRIVE_LABEL:
+                    return False
+
+                files_count = 0
+                for config_path in base.CONFIG_DRIVE_PATHS:
+                    files_count += reader.extract(
+                        config_path,
+                        os.path.join(target_path, *config_path.split('/')))
+        except (IOError, OSError, exception.CloudbaseInitException) as ex:
+            LOG.debug('Failed to read the config drive from %(path)s: '
+                      '%(ex)s' % {'path': path, 'ex': ex})
+            return False
+
+        LOG.debug('%(count)d files extracted from: %(path)s' %
+                  {'count': files_count, 'path': path})
+        return files_count > 0
+
+    def _get_conf_drive_from_devices(self, target_path):
+        for path in self._get_image_files():
+            if self._extract_files(path, target_path, check_label=False):
+                return True
+        for path in self._get_block_devices():
+            if self._extract_files(path, target_path, check_label=True):
+                return True
+        return False
+
+    def get_config_drive_mount_point(self):
+        device = self._get_labelled_device()
+        if not device:
+            return None
+
+        try:
+            with open(MOUNTS_PATH) as f:
+                mounts = [line.split() for line in f]
+        except (IOError, OSError):
+            return None
+
+        for mount in mounts:
+            if len(mount) > 1 and mount[0] == device:
+                mount_point = _unescape_mount_path(mount[1])
+                if os.path.exists(os.path.join(
+                        mount_point, 'openstack', 'latest', 'meta_data.json')):
+                    return mount_point
+
+    def _get_conf_drive_from_mount_point(self, target_path):
+        mount_point = self.get_config_drive_mount_point()
+        if not mount_point:
+            return False
+
+        for config_path in base.CONFIG_DRIVE_PATHS:
+            source_path = os.path.join(mount_point, *config_path.split('/'))
+            if os.path.isdir(source_path):
+                shutil.copytree(source_path, os.path.join(
+                    target_path, *config_path.split('/')))
+        return True
+
+    def get_config_drive_files(self, target_path, check_raw_hhd=True,
+                               check_cdrom=True):
+        """Extracts the config drive files in target_path.
+
+        check_raw_hhd enables reading the image files and the block
+        devices, including cdrom drives. check_cdrom enables copying the
+        files of a mounted config drive.
+        """
+        config_drive_found = False
+        if check_raw_hhd:
+            LOG.debug('Looking for Config Drive in image files and block '
+                      'devices')
+            config_drive_found = self._get_conf_drive_from_devices(
+                target_path)
+
+        if not config_drive_found and check_cdrom:
+            LOG.debug('Looking for a mounted Config Drive')
+            config_drive_found = self._get_conf_drive_from_mount_point(
+                target_path)
+
+        if not config_drive_found and os.path.exists(target_path):
+            shutil.rmtree(target_path, True)
+        return config_drive_found
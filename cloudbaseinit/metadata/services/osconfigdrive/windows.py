@@ -14,25 +14,23 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import ctypes
 import os
 import shutil
-import tempfile
-import uuid
 
-from ctypes import wintypes
 from oslo.config import cfg
 
 from cloudbaseinit import exception
 from cloudbaseinit.metadata.services.osconfigdrive import base
+from cloudbaseinit.metadata.services.osconfigdrive import diskscan
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import iso9660
 from cloudbaseinit.utils.windows import physical_disk
 
 opts = [
-    cfg.StrOpt('bsdtar_path', default='bsdtar.exe',
-               help='Path to "bsdtar", used to extract ISO ConfigDrive '
-                    'files'),
+    cfg.StrOpt('bsdtar_path', default=None,
+               help='Deprecated and ignored, ISO ConfigDrive files are '
+                    'extracted without "bsdtar"'),
 ]
 
 CONF = cfg.CONF
@@ -41,6 +39,36 @@ CONF.register_opts(opts)
 LOG = logging.getLogger(__name__)
 
 
+class _RawDisk(object):
+    """Provides the disk methods used by the config drive scanner."""
+
+    # Only the sectors containing the ISO9660 signature are read
+    PROBE_BUFFER_SIZE = 4096
+
+    def __init__(self, phys_disk):
+        self._phys_disk = phys_disk
+        self._reader = physical_disk.BufferedDiskReader(
+            phys_disk, buffer_size=self.PROBE_BUFFER_SIZE)
+
+    def get_id(self):
+        try:
+            serial_number = self._phys_disk.get_serial_number()
+        except exception.CloudbaseInitException:
+            return None
+        if serial_number:
+            geom = self._phys_disk.get_geometry()
+            disk_size = (geom.Cylinders * geom.TracksPerCylinder *
+                         geom.SectorsPerTrack * geom.BytesPerSector)
+            return '%s_%d' % (serial_number, disk_size)
+
+    def read_at(self, offset, size):
+        return self._reader.read_at(offset, size)
+
+    def close(self):
+        self._reader.close()
+        self._phys_disk.close()
+
+
 class WindowsConfigDriveManager(base.BaseConfigDriveManager):
 
     def _get_config_drive_cdrom_mount_point(self):
@@ -55,99 +83,66 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
                 return drive
         return None
 
-    def _c_char_array_to_c_ushort(self, buf, offset):
-        low = ctypes.cast(buf[offset],
-                          ctypes.POINTER(wintypes.WORD)).contents
-        high = ctypes.cast(buf[offset + 1],
-                           ctypes.POINTER(wintypes.WORD)).contents
-        return (high.value << 8) + low.value
-
-    def _get_iso_disk_size(self, phys_disk):
-        geom = phys_disk.get_geometry()
-
-        if geom.MediaType != physical_disk.Win32_DiskGeometry.FixedMedia:
-            return None
-
-        disk_size = geom.Cylinders * geom.TracksPerCylinder * \
-            geom.SectorsPerTrack * geom.BytesPerSector
-
-        boot_record_off = 0x8000
-        id_off = 1
-        volume_size_off = 80
-        block_size_off = 128
-        iso_id = 'CD001'
-
-        offset = boot_record_off / geom.BytesPerSector * geom.BytesPerSector
-        bytes_to_read = geom.BytesPerSector
-
-        if disk_size <= offset + bytes_to_read:
-            return None
-
-        phys_disk.seek(offset)
-        (buf, bytes_read) = phys_disk.read(bytes_to_read)
-
-        buf_off = boot_record_off - offset + id_off
-        if iso_id != buf[buf_off: buf_off + len(iso_id)]:
-            return None
-
-        buf_off = boot_record_off - offset + volume_size_off
-        num_blocks = self._c_char_array_to_c_ushort(buf, buf_off)
-
-        buf_off = boot_record_off - offset + block_size_off
-        block_size = self._c_char_array_to_c_ushort(buf, buf_off)
-
-        return num_blocks * block_size
-
-    def _write_iso_file(self, phys_disk, path, iso_file_size):
-        with open(path, 'wb') as f:
+    def _extract_config_drive_files(self, phys_disk, target_path):
+        # The files are read sequentially, mostly in large extents
+        disk_reader = physical_disk.BufferedDiskReader(phys_disk,
+                                                       read_ahead=True)
+        try:
+            reader = iso9660.ISO9660Reader(disk_reader)
+            files_count = 0
+            for path in base.CONFIG_DRIVE_PATHS:
+                files_count += reader.extract(
+                    path, os.path.join(target_path, *path.split('/')))
+        finally:
+            disk_reader.close()
+        LOG.debug('%d files extracted from the ISO9660 disk' % files_count)
+        return files_count > 0
+
+    def _open_raw_disk(self, path):
+        phys_disk = physical_disk.PhysicalDisk(path)
+        phys_disk.open()
+        is_fixed_media = False
+        try:
             geom = phys_disk.get_geometry()
-            offset = 0
-            # Get a multiple of the sector byte size
-            bytes_to_read = 4096 / geom.BytesPerSector * geom.BytesPerSector
-
-            while offset < iso_file_size:
-                phys_disk.seek(offset)
-                bytes_to_read = min(bytes_to_read, iso_file_size - offset)
-                (buf, bytes_read) = phys_disk.read(bytes_to_read)
-                f.write(buf)
-                offset += bytes_read
-
-    def _extract_iso_files(self, osutils, iso_file_path, target_path):
-        os.makedirs(target_path)
-
-        args = [CONF.bsdtar_path, '-xf', iso_file_path, '-C', target_path]
-        (out, err, exit_code) = osutils.execute_process(args, False)
-
-        if exit_code:
-            raise exception.CloudbaseInitException(
-                'Failed to execute "bsdtar" from path "%(bsdtar_path)s" with '
-                'exit code: %(exit_code)s\n%(out)s\n%(err)s' % {
-                    'bsdtar_path': CONF.bsdtar_path,
-                    'exit_code': exit_code,
-                    'out': out, 'err': err})
-
-    def _extract_iso_disk_file(self, osutils, iso_file_path):
-        iso_disk_found = False
-        for path in osutils.get_physical_disks():
-            phys_disk = physical_disk.PhysicalDisk(path)
-            try:
-                phys_disk.open()
-                iso_file_size = self._get_iso_disk_size(phys_disk)
-                if iso_file_size:
-                    LOG.debug('ISO9660 disk found on raw HDD: %s' % path)
-                    self._write_iso_file(phys_disk, iso_file_path,
-                                         iso_file_size)
-                    iso_disk_found = True
-                    break
-            except Exception:
-                # Ignore exception
-                pass
-            finally:
+            is_fixed_media = (geom.MediaType ==
+                              physical_disk.Win32_DiskGeometry.FixedMedia)
+        finally:
+            if not is_fixed_media:
                 phys_disk.close()
-        return iso_disk_found
+        if is_fixed_media:
+            return _RawDisk(phys_disk)
+
+    def _extract_iso_disk_files(self, osutils, target_path):
+        negative_cache = None
+        if CONF.config_drive_scan_cache:
+            negative_cache = diskscan.NegativeCache(osutils)
+        scanner = diskscan.ConfigDriveScanner(self._open_raw_disk,
+                                              negative_cache)
+
+        scan = scanner.scan(osutils.get_physical_disks())
+        try:
+            for path in scan:
+                LOG.debug('ISO9660 disk found on raw HDD: %s' % path)
+                phys_disk = physical_disk.PhysicalDisk(path)
+                try:
+                    phys_disk.open()
+                    if self._extract_config_drive_files(phys_disk,
+                                                        target_path):
+                        return True
+                except Exception as ex:
+                    LOG.debug('Failed to read the ISO9660 disk %(path)s: '
+                              '%(ex)s' % {'path': path, 'ex': ex})
+                finally:
+                    phys_disk.close()
+        finally:
+            scan.close()
+        return False
 
     def get_config_drive_files(self, target_path, check_raw_hhd=True,
                                check_cdrom=True):
+        if CONF.bsdtar_path:
+            LOG.warning('The "bsdtar_path" option is deprecated and ignored')
+
         config_drive_found = False
         if check_raw_hhd:
             LOG.debug('Looking for Config Drive in raw HDDs')
@@ -160,6 +155,9 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
                 target_path)
         return config_drive_found
 
+    def get_config_drive_mount_point(self):
+        return self._get_config_drive_cdrom_mount_point()
+
     def _get_conf_drive_from_cdrom_drive(self, target_path):
         cdrom_mount_point = self._get_config_drive_cdrom_mount_point()
         if cdrom_mount_point:
@@ -168,16 +166,9 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
         return False
 
     def _get_conf_drive_from_raw_hdd(self, target_path):
-        config_drive_found = False
-        iso_file_path = os.path.join(tempfile.gettempdir(),
-                                     str(uuid.uuid4()) + '.iso')
-        try:
-            osutils = osutils_factory.get_os_utils()
-
-            if self._extract_iso_disk_file(osutils, iso_file_path):
-                self._extract_iso_files(osutils, iso_file_path, target_path)
-                config_drive_found = True
-        finally:
-            if os.path.exists(iso_file_path):
-                os.remove(iso_file_path)
-        return config_drive_found
+        osutils = osutils_factory.get_os_utils()
+        if self._extract_iso_disk_files(osutils, target_path):
+            return True
+        if os.path.exists(target_path):
+            shutil.rmtree(target_path, True)
+        return False
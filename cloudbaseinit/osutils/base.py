@@ -15,8 +15,65 @@
 #    under the License.
 
 import base64
+import collections
 import os
 import subprocess
+import threading
+import time
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+PROCESS_OUTPUT_MAX_SIZE = 1024 * 1024
+_PIPE_READ_SIZE = 64 * 1024
+
+
+class _OutputBuffer(object):
+    """Keeps the last max_size bytes of a process output, if not None."""
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+        self._chunks = collections.deque()
+        self._size = 0
+        # The output of a killed process may be still read when returned
+        self._lock = threading.Lock()
+
+    def append(self, data):
+        with self._lock:
+            self._append(data)
+
+    def _append(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._max_size is None:
+            return
+        while self._size > self._max_size:
+            excess = self._size - self._max_size
+            chunk = self._chunks[0]
+            if len(chunk) <= excess:
+                self._chunks.popleft()
+                self._size -= len(chunk)
+            else:
+                self._chunks[0] = chunk[excess:]
+                self._size -= excess
+
+    def getvalue(self):
+        with self._lock:
+            return b''.join(self._chunks)
+
+
+def _read_pipe(pipe, output, logger, name):
+    try:
+        # readline with a size limit returns the long lines in pieces
+        for line in iter(lambda: pipe.readline(_PIPE_READ_SIZE), b''):
+            output.append(line)
+            if logger:
+                logger.debug('%(name)s: %(line)s' %
+                             {'name': name, 'line': line.decode(
+                                 'utf-8', 'replace').rstrip('\r\n')})
+    finally:
+        pipe.close()
 
 
 class BaseOSUtils(object):
@@ -37,12 +94,66 @@ class BaseOSUtils(object):
             '+', '')[:length]
 
     def execute_process(self, args, shell=True):
+        return self.execute_process_streaming(args, shell,
+                                              max_output_size=None)
+
+    def execute_process_streaming(self, args, shell=True, timeout=None,
+                                  logger=None,
+                                  max_output_size=PROCESS_OUTPUT_MAX_SIZE):
+        """Executes a process, reading its output while it runs.
+
+        stdout and stderr are read concurrently, each line is logged as soon
+        as it is read if a logger is provided and only the last
+        max_output_size bytes of each are returned. If the process does not
+        end within timeout seconds, it is killed.
+        Returns the (out, err, exit code) tuple.
+        """
         p = subprocess.Popen(args,
                              stdout=subprocess.PIPE,
                              stderr=subprocess.PIPE,
                              shell=shell)
-        (out, err) = p.communicate()
-        return (out, err, p.returncode)
+
+        outputs = []
+        threads = []
+        for (pipe, name) in ((p.stdout, 'stdout'), (p.stderr, 'stderr')):
+            output = _OutputBuffer(max_output_size)
+            thread = threading.Thread(target=_read_pipe,
+                                      args=(pipe, output, logger, name))
+            thread.daemon = True
+            thread.start()
+            outputs.append(output)
+            threads.append(thread)
+
+        deadline = None
+        if timeout:
+            deadline = time.time() + timeout
+        # The pipes are closed when the process ends
+        for thread in threads:
+            if deadline is None:
+                thread.join()
+            else:
+                thread.join(max(deadline - time.time(), 0))
+
+        while p.poll() is None:
+            if deadline is None:
+                p.wait()
+            elif time.time() >= deadline:
+                LOG.warning('Process did not end within %(timeout)s seconds, '
+                            'killing it: %(args)s' %
+                            {'timeout': timeout, 'args': args})
+                try:
+                    p.kill()
+                except OSError:
+                    # Ended meanwhile
+                    pass
+                p.wait()
+                # The pipes may be still open in child processes
+                for thread in threads:
+                    thread.join(1)
+            else:
+                time.sleep(0.05)
+
+        return (outputs[0].getvalue(), outputs[1].getvalue(), p.returncode)
 
     def sanitize_shell_input(self, value):
         raise NotImplementedError()
@@ -65,16 +176,38 @@ class BaseOSUtils(object):
     def get_network_adapters(self):
         raise NotImplementedError()
 
+    def get_network_adapters_mac_addresses(self):
+        """Returns the (name, MAC address) tuples of the adapters."""
+        raise NotImplementedError()
+
     def set_static_network_config(self, adapter_name, address, netmask,
                                   broadcast, gateway, dnsnameservers):
         raise NotImplementedError()
 
+    def set_static_network_configs(self, network_configs):
+        """Configures the adapters in a single pass.
+
+        network_configs is a list of (adapter name, interface) tuples, with
+        the interfaces having the addresses, gateway, dns_nameservers and
+        mtu attributes of a debiannetwork.NetworkInterface.
+        Returns True if a reboot is required.
+        """
+        raise NotImplementedError()
+
     def set_config_value(self, name, value, section=None):
         raise NotImplementedError()
 
     def get_config_value(self, name, section=None):
         raise NotImplementedError()
 
+    def get_config_values(self, section=None):
+        """Returns all the values of a section as a dict."""
+        raise NotImplementedError()
+
+    def set_config_values(self, values, section=None):
+        for (name, value) in values.items():
+            self.set_config_value(name, value, section)
+
     def wait_for_boot_completion(self):
         pass
 
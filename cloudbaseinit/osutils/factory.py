@@ -22,7 +22,7 @@ from cloudbaseinit.utils import classloader
 def get_os_utils():
     osutils_class_paths = {
         'nt': 'cloudbaseinit.osutils.windows.WindowsUtils',
-        'posix': 'cloudbaseinit.osutils.posix.PosixUtils'
+        'posix': 'cloudbaseinit.osutils.posix.PosixUtil'
     }
 
     cl = classloader.ClassLoader()
@@ -14,11 +14,68 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
 import os
+import tempfile
+import threading
+
+from oslo.config import cfg
 
 from cloudbaseinit.osutils import base
 
+opts = [
+    cfg.StrOpt('config_file_path',
+               default='/var/lib/cloudbase-init/config.json',
+               help='File where the execution status is stored on POSIX '
+               'systems'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
 
 class PosixUtil(base.BaseOSUtils):
+    _config_lock = threading.Lock()
+
+    def _read_config(self):
+        try:
+            with open(CONF.config_file_path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write_config(self, config):
+        config_dir = os.path.dirname(os.path.abspath(CONF.config_file_path))
+        if not os.path.isdir(config_dir):
+            os.makedirs(config_dir)
+
+        # Replace the file atomically, so that it's never left incomplete
+        (fd, tmp_path) = tempfile.mkstemp(dir=config_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(config, f, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, CONF.config_file_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def set_config_value(self, name, value, section=None):
+        self.set_config_values({name: value}, section)
+
+    def get_config_value(self, name, section=None):
+        return self.get_config_values(section).get(name)
+
+    def get_config_values(self, section=None):
+        with self._config_lock:
+            return dict(self._read_config().get(section or '', {}))
+
+    def set_config_values(self, values, section=None):
+        with self._config_lock:
+            config = self._read_config()
+            config.setdefault(section or '', {}).update(values)
+            self._write_config(config)
+
     def reboot(self):
         os.system('reboot')
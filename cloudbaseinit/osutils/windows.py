@@ -31,6 +31,7 @@ from win32com import client
 from cloudbaseinit import exception
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import base
+from cloudbaseinit.utils import routetable
 from cloudbaseinit.utils.windows import network
 
 LOG = logging.getLogger(__name__)
@@ -40,7 +41,6 @@ kernel32 = windll.kernel32
 netapi32 = windll.netapi32
 userenv = windll.userenv
 iphlpapi = windll.iphlpapi
-Ws2_32 = windll.Ws2_32
 setupapi = windll.setupapi
 msvcrt = ctypes.cdll.msvcrt
 
@@ -207,8 +207,6 @@ iphlpapi.GetIpForwardTable.argtypes = [
     wintypes.BOOL]
 iphlpapi.GetIpForwardTable.restype = wintypes.DWORD
 
-Ws2_32.inet_ntoa.restype = ctypes.c_char_p
-
 setupapi.SetupDiGetClassDevsW.argtypes = [ctypes.POINTER(GUID),
                                           wintypes.LPCWSTR,
                                           wintypes.HANDLE,
@@ -295,6 +293,8 @@ class WindowsUtils(base.BaseOSUtils):
     _FW_SCOPE_ALL = 0
     _FW_SCOPE_LOCAL_SUBNET = 1
 
+    _ipv4_route_table = None
+
     def _enable_shutdown_privilege(self):
         process = win32process.GetCurrentProcess()
         token = win32security.OpenProcessToken(
@@ -453,8 +453,7 @@ class WindowsUtils(base.BaseOSUtils):
         if not ret_val:
             raise exception.CloudbaseInitException("Cannot set host name")
 
-    def get_network_adapters(self):
-        l = []
+    def _query_network_adapters(self):
         conn = wmi.WMI(moniker='//./root/cimv2')
         # Get Ethernet adapters only
         wql = ('SELECT * FROM Win32_NetworkAdapter WHERE '
@@ -463,10 +462,14 @@ class WindowsUtils(base.BaseOSUtils):
         if self.check_os_version(6, 0):
             wql += ' AND PhysicalAdapter = True'
 
-        q = conn.query(wql)
-        for r in q:
-            l.append(r.Name)
-        return l
+        return conn.query(wql)
+
+    def get_network_adapters(self):
+        return [r.Name for r in self._query_network_adapters()]
+
+    def get_network_adapters_mac_addresses(self):
+        return [(r.Name, r.MACAddress)
+                for r in self._query_network_adapters()]
 
     def get_dhcp_hosts_in_use(self):
         dhcp_hosts = []
@@ -510,19 +513,21 @@ class WindowsUtils(base.BaseOSUtils):
             LOG.debug('Setting MTU for interface "%(mac_address)s" with '
                       'value "%(mtu)s"' %
                       {'mac_address': mac_address, 'mtu': mtu})
+            self._set_interface_mtu(iface_index, mtu)
 
-            base_dir = self._get_system_dir()
-            netsh_path = os.path.join(base_dir, 'netsh.exe')
+    def _set_interface_mtu(self, iface_index, mtu):
+        base_dir = self._get_system_dir()
+        netsh_path = os.path.join(base_dir, 'netsh.exe')
 
-            args = [netsh_path, "interface", "ipv4", "set", "subinterface",
-                    str(iface_index), "mtu=%s" % mtu,
-                    "store=persistent"]
-            (out, err, ret_val) = self.execute_process(args, False)
-            if ret_val:
-                raise exception.CloudbaseInitException(
-                    'Setting MTU for interface "%(mac_address)s" with '
-                    'value "%(mtu)s" failed' % {'mac_address': mac_address,
-                                                'mtu': mtu})
+        args = [netsh_path, "interface", "ipv4", "set", "subinterface",
+                str(iface_index), "mtu=%s" % mtu,
+                "store=persistent"]
+        (out, err, ret_val) = self.execute_process(args, False)
+        if ret_val:
+            raise exception.CloudbaseInitException(
+                'Setting MTU for interface "%(iface_index)s" with '
+                'value "%(mtu)s" failed' % {'iface_index': iface_index,
+                                            'mtu': mtu})
 
     def set_static_network_config(self, adapter_name, address, netmask,
                                   broadcast, gateway, dnsnameservers):
@@ -539,26 +544,86 @@ class WindowsUtils(base.BaseOSUtils):
         adapter_config = q[0].associators(
             wmi_result_class='Win32_NetworkAdapterConfiguration')[0]
 
+        return self._set_adapter_static_config(
+            adapter_config, [address], [netmask], gateway, dnsnameservers)
+
+    def _set_adapter_static_config(self, adapter_config, addresses, netmasks,
+                                   gateway, dnsnameservers):
+        try:
+            return self._set_adapter_static_config_values(
+                adapter_config, addresses, netmasks, gateway, dnsnameservers)
+        finally:
+            # The adapter routes change along with its addresses and gateway
+            self._invalidate_ipv4_route_table()
+
+    def _set_adapter_static_config_values(self, adapter_config, addresses,
+                                          netmasks, gateway, dnsnameservers):
         LOG.debug("Setting static IP address")
-        (ret_val,) = adapter_config.EnableStatic([address], [netmask])
+        (ret_val,) = adapter_config.EnableStatic(addresses, netmasks)
         if ret_val > 1:
             raise exception.CloudbaseInitException(
                 "Cannot set static IP address on network adapter")
         reboot_required = (ret_val == 1)
 
-        LOG.debug("Setting static gateways")
-        (ret_val,) = adapter_config.SetGateways([gateway], [1])
-        if ret_val > 1:
-            raise exception.CloudbaseInitException(
-                "Cannot set gateway on network adapter")
-        reboot_required = reboot_required or ret_val == 1
+        if gateway:
+            LOG.debug("Setting static gateways")
+            (ret_val,) = adapter_config.SetGateways([gateway], [1])
+            if ret_val > 1:
+                raise exception.CloudbaseInitException(
+                    "Cannot set gateway on network adapter")
+            reboot_required = reboot_required or ret_val == 1
+
+        if dnsnameservers:
+            LOG.debug("Setting static DNS servers")
+            (ret_val,) = adapter_config.SetDNSServerSearchOrder(
+                dnsnameservers)
+            if ret_val > 1:
+                raise exception.CloudbaseInitException(
+                    "Cannot set DNS on network adapter")
+            reboot_required = reboot_required or ret_val == 1
 
-        LOG.debug("Setting static DNS servers")
-        (ret_val,) = adapter_config.SetDNSServerSearchOrder(dnsnameservers)
-        if ret_val > 1:
-            raise exception.CloudbaseInitException(
-                "Cannot set DNS on network adapter")
-        reboot_required = reboot_required or ret_val == 1
+        return reboot_required
+
+    def set_static_network_configs(self, network_configs):
+        conn = wmi.WMI(moniker='//./root/cimv2')
+
+        # All the adapters and their configurations are retrieved with two
+        # queries, instead of a query and an associators call per adapter
+        adapters = dict((adapter.Name, adapter) for adapter in conn.query(
+            'SELECT * FROM Win32_NetworkAdapter WHERE '
+            'MACAddress IS NOT NULL'))
+        adapter_configs = dict(
+            (adapter_config.Index, adapter_config) for adapter_config in
+            conn.query('SELECT * FROM Win32_NetworkAdapterConfiguration'))
+
+        # No adapter is changed unless all of them are available
+        configs = []
+        for (adapter_name, interface) in network_configs:
+            adapter = adapters.get(adapter_name)
+            adapter_config = adapter and adapter_configs.get(adapter.Index)
+            if not adapter_config:
+                raise exception.CloudbaseInitException(
+                    'Network adapter not found: %s' % adapter_name)
+            configs.append((adapter_name, adapter, adapter_config, interface))
+
+        reboot_required = False
+        for (adapter_name, adapter, adapter_config, interface) in configs:
+            (addresses, netmasks) = zip(*interface.addresses)
+            reboot_required = self._set_adapter_static_config(
+                adapter_config, list(addresses), list(netmasks),
+                interface.gateway,
+                interface.dns_nameservers) or reboot_required
+
+            if not interface.mtu:
+                continue
+            if not self.check_os_version(6, 0):
+                LOG.warning('Setting the MTU is currently not supported on '
+                            'Windows XP and Windows Server 2003')
+                continue
+            LOG.debug('Setting MTU for adapter "%(name)s" with value '
+                      '"%(mtu)s"' %
+                      {'name': adapter_name, 'mtu': interface.mtu})
+            self._set_interface_mtu(adapter.InterfaceIndex, interface.mtu)
 
         return reboot_required
 
@@ -568,16 +633,19 @@ class WindowsUtils(base.BaseOSUtils):
             key_name += section.replace('/', '\\') + '\\'
         return key_name
 
+    def _get_config_value_type(self, value):
+        if (isinstance(value, six.integer_types) and
+                not isinstance(value, bool)):
+            return winreg.REG_DWORD
+        return winreg.REG_SZ
+
     def set_config_value(self, name, value, section=None):
         key_name = self._get_config_key_name(section)
 
         with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE,
                               key_name) as key:
-            if type(value) == int:
-                regtype = winreg.REG_DWORD
-            else:
-                regtype = winreg.REG_SZ
-            winreg.SetValueEx(key, name, 0, regtype, value)
+            winreg.SetValueEx(key, name, 0,
+                              self._get_config_value_type(value), value)
 
     def get_config_value(self, name, section=None):
         key_name = self._get_config_key_name(section)
@@ -590,6 +658,31 @@ class WindowsUtils(base.BaseOSUtils):
         except WindowsError:
             return None
 
+    def get_config_values(self, section=None):
+        key_name = self._get_config_key_name(section)
+
+        values = {}
+        try:
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
+                                key_name) as key:
+                (num_subkeys, num_values,
+                 last_modified) = winreg.QueryInfoKey(key)
+                for i in range(num_values):
+                    (name, value, regtype) = winreg.EnumValue(key, i)
+                    values[name] = value
+        except WindowsError:
+            pass
+        return values
+
+    def set_config_values(self, values, section=None):
+        key_name = self._get_config_key_name(section)
+
+        with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE,
+                              key_name) as key:
+            for (name, value) in values.items():
+                winreg.SetValueEx(key, name, 0,
+                                  self._get_config_value_type(value), value)
+
     def wait_for_boot_completion(self):
         try:
             with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
@@ -664,69 +757,59 @@ class WindowsUtils(base.BaseOSUtils):
         self.stop_service(self._service_name)
 
     def get_default_gateway(self):
-        default_routes = [r for r in self._get_ipv4_routing_table()
-                          if r[0] == '0.0.0.0'.encode()]
-        if default_routes:
-            return (default_routes[0][3], default_routes[0][2])
+        default_route = self._get_ipv4_route_table().get_default_route()
+        if default_route:
+            return (default_route[3], default_route[2])
         else:
             return (None, None)
 
-    def _get_ipv4_routing_table(self):
-        routing_table = []
-
+    def _get_ipv4_forward_table_data(self):
         heap = kernel32.GetProcessHeap()
 
-        size = wintypes.ULONG(ctypes.sizeof(Win32_MIB_IPFORWARDTABLE))
-        p = kernel32.HeapAlloc(heap, 0, size)
-        if not p:
-            raise exception.CloudbaseInitException(
-                'Unable to allocate memory for the IP forward table')
-        p_forward_table = ctypes.cast(
-            p, ctypes.POINTER(Win32_MIB_IPFORWARDTABLE))
+        # Room for a few routes, avoids calling GetIpForwardTable twice in
+        # the common case
+        size = wintypes.ULONG(ctypes.sizeof(Win32_MIB_IPFORWARDTABLE) +
+                              ctypes.sizeof(Win32_MIB_IPFORWARDROW) * 31)
+        while True:
+            p = kernel32.HeapAlloc(heap, 0, size)
+            if not p:
+                raise exception.CloudbaseInitException(
+                    'Unable to allocate memory for the IP forward table')
+            try:
+                err = iphlpapi.GetIpForwardTable(
+                    ctypes.cast(p, ctypes.POINTER(Win32_MIB_IPFORWARDTABLE)),
+                    ctypes.byref(size), 0)
+                if err == self.ERROR_NO_DATA:
+                    return None
+                elif err != self.ERROR_INSUFFICIENT_BUFFER:
+                    if err:
+                        raise exception.CloudbaseInitException(
+                            'Unable to get IP forward table. Error: %s' % err)
+                    return ctypes.string_at(p, size.value)
+            finally:
+                kernel32.HeapFree(heap, 0, p)
+            # The table can grow before the next call, size is updated
+
+    def _get_ipv4_route_table(self):
+        """Returns a cached snapshot of the IPv4 routing table."""
+        if self._ipv4_route_table is None:
+            data = self._get_ipv4_forward_table_data()
+            if data:
+                self._ipv4_route_table = (
+                    routetable.IPv4RouteTable.from_forward_table(data))
+            else:
+                self._ipv4_route_table = routetable.IPv4RouteTable()
+        return self._ipv4_route_table
 
-        try:
-            err = iphlpapi.GetIpForwardTable(p_forward_table,
-                                             ctypes.byref(size), 0)
-            if err == self.ERROR_INSUFFICIENT_BUFFER:
-                kernel32.HeapFree(heap, 0, p_forward_table)
-                p = kernel32.HeapAlloc(heap, 0, size)
-                if not p:
-                    raise exception.CloudbaseInitException(
-                        'Unable to allocate memory for the IP forward table')
-                p_forward_table = ctypes.cast(
-                    p, ctypes.POINTER(Win32_MIB_IPFORWARDTABLE))
-
-            err = iphlpapi.GetIpForwardTable(p_forward_table,
-                                             ctypes.byref(size), 0)
-            if err != self.ERROR_NO_DATA:
-                if err:
-                    raise exception.CloudbaseInitException(
-                        'Unable to get IP forward table. Error: %s' % err)
-
-                forward_table = p_forward_table.contents
-                table = ctypes.cast(
-                    ctypes.addressof(forward_table.table),
-                    ctypes.POINTER(Win32_MIB_IPFORWARDROW *
-                                   forward_table.dwNumEntries)).contents
-
-                i = 0
-                while i < forward_table.dwNumEntries:
-                    row = table[i]
-                    routing_table.append((
-                        Ws2_32.inet_ntoa(row.dwForwardDest),
-                        Ws2_32.inet_ntoa(row.dwForwardMask),
-                        Ws2_32.inet_ntoa(row.dwForwardNextHop),
-                        row.dwForwardIfIndex,
-                        row.dwForwardMetric1))
-                    i += 1
-
-            return routing_table
-        finally:
-            kernel32.HeapFree(heap, 0, p_forward_table)
+    def _invalidate_ipv4_route_table(self):
+        self._ipv4_route_table = None
 
     def check_static_route_exists(self, destination):
-        return len([r for r in self._get_ipv4_routing_table()
-                    if r[0] == destination]) > 0
+        # Routes can be changed in the meantime, e.g. by DHCP. A new snapshot
+        # is taken here and reused by the get_default_gateway call following
+        # it in the same metadata route check
+        self._invalidate_ipv4_route_table()
+        return self._get_ipv4_route_table().has_destination(destination)
 
     def add_static_route(self, destination, mask, next_hop, interface_index,
                          metric):
@@ -735,7 +818,11 @@ class WindowsUtils(base.BaseOSUtils):
 
         args = ['ROUTE', 'ADD', destination, 'MASK', mask,
                 next_hop]
-        (out, err, ret_val) = self.execute_process(args)
+        try:
+            (out, err, ret_val) = self.execute_process(args)
+        finally:
+            # The snapshot is stale even if the command failed
+            self._invalidate_ipv4_route_table()
         # Cannot use the return value to determine the outcome
         if ret_val or err:
             raise exception.CloudbaseInitException(
@@ -957,7 +1044,8 @@ class WindowsUtils(base.BaseOSUtils):
         else:
             return self.get_system32_dir()
 
-    def execute_powershell_script(self, script_path, sysnative=True):
+    def execute_powershell_script(self, script_path, sysnative=True,
+                                  timeout=None, logger=None):
         base_dir = self._get_system_dir(sysnative)
         powershell_path = os.path.join(base_dir,
                                        'WindowsPowerShell\\v1.0\\'
@@ -966,4 +1054,5 @@ class WindowsUtils(base.BaseOSUtils):
         args = [powershell_path, '-ExecutionPolicy', 'RemoteSigned',
                 '-NonInteractive', '-File', script_path]
 
-        return self.execute_process(args, False)
+        return self.execute_process_streaming(args, False, timeout=timeout,
+                                              logger=logger)
@@ -25,5 +25,11 @@ class BasePlugin(object):
     def get_os_requirements(self):
         return (None, None)
 
+    def get_shared_data_dependencies(self):
+        # Returns the shared_data keys required and provided by the plugin.
+        # Plugins not declaring them are never executed in parallel with
+        # other plugins
+        return (None, None)
+
     def execute(self, service, shared_data):
         pass
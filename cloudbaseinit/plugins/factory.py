@@ -14,8 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+import time
+
 from oslo.config import cfg
 
+from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.utils import classloader
 
 opts = [
@@ -47,10 +51,54 @@ opts = [
 CONF = cfg.CONF
 CONF.register_opts(opts)
 
+LOG = logging.getLogger(__name__)
+
+
+class LazyPlugin(object):
+    """Imports and instantiates a plugin class when first needed.
+
+    The plugin name is obtained from the class path, so that the execution
+    status of a plugin can be checked without importing its module.
+    """
+
+    def __init__(self, class_path):
+        self.class_path = class_path
+        self.module_name = class_path.rsplit('.', 1)[0]
+        self.import_time = None
+        self._plugin = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._plugin is not None
+
+    def get_plugin(self):
+        with self._lock:
+            if self._plugin is None:
+                start = time.time()
+                plugin_class = classloader.ClassLoader().load_class(
+                    self.class_path)
+                self.import_time = time.time() - start
+                LOG.debug('Module \'%(module)s\' imported in %(time).3f '
+                          'seconds' % {'module': self.module_name,
+                                       'time': self.import_time})
+                self._plugin = plugin_class()
+            return self._plugin
+
+    def get_name(self):
+        return self.class_path.rsplit('.', 1)[1]
+
+    def __getattr__(self, name):
+        # Invoked only for the attributes not defined in this class
+        return getattr(self.get_plugin(), name)
+
 
 def load_plugins():
-    plugins = []
-    cl = classloader.ClassLoader()
-    for class_path in CONF.plugins:
-        plugins.append(cl.load_class(class_path)())
-    return plugins
+    return [LazyPlugin(class_path) for class_path in CONF.plugins]
+
+
+def get_import_times(plugins):
+    """Returns the import time of the modules of the loaded plugins."""
+    return dict((plugin.module_name, plugin.import_time)
+                for plugin in plugins
+                if isinstance(plugin, LazyPlugin) and plugin.loaded)
@@ -0,0 +1,115 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sys
+import threading
+
+from multiprocessing import pool
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def _init_worker_thread():
+    if sys.platform == 'win32':
+        # WMI and the other COM based APIs used by the plugins require COM
+        # to be initialized in each thread
+        import pythoncom
+        pythoncom.CoInitialize()
+
+
+class PluginScheduler(object):
+    """Executes plugins concurrently according to their dependencies.
+
+    A plugin is executed after the preceding plugins which provide the
+    shared_data keys it requires or which use the keys it provides. Plugins
+    not declaring their shared_data dependencies act as barriers: they are
+    executed after all the preceding plugins and before all the following
+    ones. Once a plugin requests a reboot, no further plugins are started.
+    """
+
+    def __init__(self, max_workers):
+        self._max_workers = max(max_workers, 1)
+
+    def get_dependencies(self, plugins):
+        dependencies = []
+        last_barrier = None
+
+        for (i, plugin) in enumerate(plugins):
+            (required, provided) = plugin.get_shared_data_dependencies()
+            if required is None or provided is None:
+                deps = set(range(i))
+                last_barrier = i
+            else:
+                deps = set()
+                if last_barrier is not None:
+                    deps.add(last_barrier)
+                for j in range(last_barrier or 0, i):
+                    (prev_required,
+                     prev_provided) = plugins[j].get_shared_data_dependencies()
+                    if prev_required is None or prev_provided is None:
+                        continue
+                    if (set(required) & set(prev_provided) or
+                            set(provided) & (set(prev_required) |
+                                             set(prev_provided))):
+                        deps.add(j)
+            dependencies.append(deps)
+
+        return dependencies
+
+    def execute(self, plugins, exec_plugin, stop_on_reboot=True):
+        dependencies = self.get_dependencies(plugins)
+        pending = list(range(len(plugins)))
+        running = set()
+        completed = set()
+        state = {'reboot_required': False}
+        condition = threading.Condition()
+
+        def run_plugin(i):
+            reboot_required = False
+            try:
+                reboot_required = exec_plugin(plugins[i])
+            except Exception as ex:
+                LOG.exception(ex)
+            finally:
+                with condition:
+                    running.discard(i)
+                    completed.add(i)
+                    if reboot_required:
+                        state['reboot_required'] = True
+                    condition.notify()
+
+        thread_pool = pool.ThreadPool(self._max_workers, _init_worker_thread)
+        try:
+            with condition:
+                while pending or running:
+                    if state['reboot_required'] and stop_on_reboot:
+                        if pending:
+                            LOG.debug('Reboot required, skipping %d '
+                                      'plugins' % len(pending))
+                        pending = []
+                    for i in list(pending):
+                        if dependencies[i] <= completed:
+                            pending.remove(i)
+                            running.add(i)
+                            thread_pool.apply_async(run_plugin, (i,))
+                    if running:
+                        # A timeout keeps the wait interruptible on Python 2
+                        condition.wait(1)
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+
+        return state['reboot_required']
@@ -0,0 +1,67 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class PluginStatusStore(object):
+    """Keeps the plugins execution status of a config section in memory.
+
+    All the statuses are read with a single access to the OS config store
+    and the changes are written together when flush is called.
+    """
+
+    def __init__(self, osutils, section):
+        self._osutils = osutils
+        self._section = section
+        self._lock = threading.Lock()
+        self._statuses = None
+        self._loaded_all = False
+        self._changes = {}
+
+    def _load(self):
+        try:
+            self._statuses = self._osutils.get_config_values(self._section)
+            self._loaded_all = True
+        except NotImplementedError:
+            # Each status is read when first requested
+            self._statuses = {}
+
+    def get_status(self, plugin_name):
+        with self._lock:
+            if self._statuses is None:
+                self._load()
+            if plugin_name not in self._statuses and not self._loaded_all:
+                self._statuses[plugin_name] = self._osutils.get_config_value(
+                    plugin_name, self._section)
+            return self._statuses.get(plugin_name)
+
+    def set_status(self, plugin_name, status):
+        with self._lock:
+            if self._statuses is None:
+                self._load()
+            self._statuses[plugin_name] = status
+            self._changes[plugin_name] = status
+
+    def flush(self):
+        with self._lock:
+            if not self._changes:
+                return
+            LOG.debug('Saving the status of %d plugins' % len(self._changes))
+            self._osutils.set_config_values(self._changes, self._section)
+            self._changes = {}
@@ -78,3 +78,7 @@ class CreateUserPlugin(base.BasePlugin):
                 LOG.error('Cannot add user to group "%s"' % group_name)
 
         return (base.PLUGIN_EXECUTION_DONE, False)
+
+    def get_shared_data_dependencies(self):
+        return ([], [constants.SHARED_DATA_USERNAME,
+                     constants.SHARED_DATA_PASSWORD])
@@ -172,3 +172,6 @@ class ExtendVolumesPlugin(base.BasePlugin):
 
     def get_os_requirements(self):
         return ('win32', (5, 2))
+
+    def get_shared_data_dependencies(self):
+        return ([], [])
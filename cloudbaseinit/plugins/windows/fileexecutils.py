@@ -12,15 +12,31 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import os
 
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.plugins.windows import scriptcache
 
 LOG = logging.getLogger(__name__)
 
 
-def exec_file(file_path):
+class _ScriptOutputLogger(object):
+    """Logs the output lines of a script prefixed by its file name.
+
+    Scripts may be executed concurrently, e.g. by LocalScriptsPlugin.
+    """
+
+    def __init__(self, file_path):
+        self._file_name = os.path.basename(file_path)
+
+    def debug(self, msg):
+        LOG.debug('%(file_name)s %(msg)s' %
+                  {'file_name': self._file_name, 'msg': msg})
+
+
+def exec_file(file_path, script_key=None, timeout=None):
     shell = False
     powershell = False
 
@@ -45,16 +61,20 @@ def exec_file(file_path):
     osutils = osutils_factory.get_os_utils()
 
     try:
+        logger = _ScriptOutputLogger(file_path)
         if powershell:
-            (out, err,
-             ret_val) = osutils.execute_powershell_script(file_path)
+            execute = functools.partial(osutils.execute_powershell_script,
+                                        file_path, timeout=timeout,
+                                        logger=logger)
         else:
-            (out, err, ret_val) = osutils.execute_process(args, shell)
+            execute = functools.partial(osutils.execute_process_streaming,
+                                        args, shell, timeout=timeout,
+                                        logger=logger)
+        (out, err, ret_val) = scriptcache.execute(osutils, script_key,
+                                                  execute)
 
         LOG.info('Script "%(file_path)s" ended with exit code: %(ret_val)d' %
                  {"file_path": file_path, "ret_val": ret_val})
-        LOG.debug('User_data stdout:\n%s' % out)
-        LOG.debug('User_data stderr:\n%s' % err)
 
         return ret_val
     except Exception as ex:
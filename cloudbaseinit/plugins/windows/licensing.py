@@ -67,3 +67,6 @@ class WindowsLicensingPlugin(base.BasePlugin):
             LOG.debug("Activation result:\n%s" % activation_result)
 
         return (base.PLUGIN_EXECUTION_DONE, False)
+
+    def get_shared_data_dependencies(self):
+        return ([], [])
@@ -13,9 +13,15 @@
 #    under the License.
 
 import os
+import re
+import threading
+import time
+
+from multiprocessing import pool
 
 from oslo.config import cfg
 
+from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.plugins import base
 from cloudbaseinit.plugins.windows import fileexecutils
 
@@ -23,11 +29,35 @@ opts = [
     cfg.StrOpt('local_scripts_path', default=None,
                help='Path location containing scripts to be executed when '
                     'the plugin runs'),
+    cfg.BoolOpt('local_scripts_parallel', default=False,
+                help='Executes concurrently the local scripts having the same '
+                'numeric file name prefix, e.g. "10-" or "20-". The groups '
+                'are executed in the numeric order of their prefix, followed '
+                'by the scripts without a prefix. A failed script prevents '
+                'the execution of the scripts not yet started'),
+    cfg.IntOpt('local_scripts_max_workers', default=4,
+               help='Max. number of local scripts executed concurrently'),
+    cfg.IntOpt('local_scripts_timeout', default=0,
+               help='Max. duration, in seconds, of each local script, '
+               'after which it is killed. 0 means no timeout'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(opts)
 
+LOG = logging.getLogger(__name__)
+
+_GROUP_PREFIX_RE = re.compile(r'^(\d+)-')
+
+# Exit codes requesting a reboot or an execution on next boot
+_REBOOT_EXIT_CODES = (1001, 1002, 1003)
+
+
+def _get_group_prefix(file_path):
+    match = _GROUP_PREFIX_RE.match(os.path.basename(file_path))
+    if match:
+        return int(match.group(1))
+
 
 class LocalScriptsPlugin(base.BasePlugin):
 
@@ -35,9 +65,78 @@ class LocalScriptsPlugin(base.BasePlugin):
         return sorted([os.path.join(path, f) for f in os.listdir(path)
                        if os.path.isfile(os.path.join(path, f))])
 
+    def _get_groups(self, file_paths):
+        """Groups the files with the same numeric prefix, e.g. "10-".
+
+        The groups are sorted by the value of the prefix, so "100-" comes
+        after "20-". The files without a prefix follow, each in a group of
+        its own.
+        """
+        def sort_key(file_path):
+            prefix = _get_group_prefix(file_path)
+            return (prefix is None, prefix or 0, os.path.basename(file_path))
+
+        groups = []
+        last_prefix = None
+        for file_path in sorted(file_paths, key=sort_key):
+            prefix = _get_group_prefix(file_path)
+            if prefix is not None and prefix == last_prefix:
+                groups[-1].append(file_path)
+            else:
+                groups.append([file_path])
+            last_prefix = prefix
+        return groups
+
+    def _exec_file(self, file_path):
+        return fileexecutils.exec_file(
+            file_path, timeout=CONF.local_scripts_timeout or None)
+
+    def _exec_file_timed(self, file_path, failed):
+        if failed.is_set():
+            LOG.info('Skipping local script: %s' % file_path)
+            return
+
+        start = time.time()
+        ret_val = self._exec_file(file_path)
+        LOG.info('Local script "%(file_path)s" ended with exit code '
+                 '%(ret_val)s in %(duration).2f seconds' %
+                 {'file_path': file_path, 'ret_val': ret_val,
+                  'duration': time.time() - start})
+        # The reboot requests are not honored by this plugin and are not
+        # considered failures
+        if ret_val != 0 and ret_val not in _REBOOT_EXIT_CODES:
+            # Fail fast: the scripts not yet started are skipped
+            failed.set()
+
+    def _exec_groups(self, groups):
+        failed = threading.Event()
+        thread_pool = pool.ThreadPool(
+            max(min(CONF.local_scripts_max_workers,
+                    max(len(group) for group in groups)), 1))
+        try:
+            for group in groups:
+                async_results = [
+                    thread_pool.apply_async(self._exec_file_timed,
+                                            (file_path, failed))
+                    for file_path in group]
+                for async_result in async_results:
+                    async_result.get()
+                if failed.is_set():
+                    LOG.error('Local scripts failed, skipping the '
+                              'remaining groups')
+                    break
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+
     def execute(self, service, shared_data):
         if CONF.local_scripts_path:
-            for file_path in self._get_files_in_dir(CONF.local_scripts_path):
-                fileexecutils.exec_file(file_path)
+            file_paths = self._get_files_in_dir(CONF.local_scripts_path)
+            if CONF.local_scripts_parallel:
+                if file_paths:
+                    self._exec_groups(self._get_groups(file_paths))
+            else:
+                for file_path in file_paths:
+                    self._exec_file(file_path)
 
         return (base.PLUGIN_EXECUTION_DONE, False)
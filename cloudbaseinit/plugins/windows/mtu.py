@@ -38,11 +38,10 @@ class MTUPlugin(base.BasePlugin):
     def execute(self, service, shared_data):
         if CONF.mtu_use_dhcp_config:
             osutils = osutils_factory.get_os_utils()
-            dhcp_hosts = osutils.get_dhcp_hosts_in_use()
+            dhcp_options = dhcp.get_cached_dhcp_options(osutils,
+                                                        [dhcp.OPTION_MTU])
 
-            for (mac_address, dhcp_host) in dhcp_hosts:
-                options_data = dhcp.get_dhcp_options(dhcp_host,
-                                                     [dhcp.OPTION_MTU])
+            for (mac_address, dhcp_host, options_data) in dhcp_options:
                 if options_data:
                     mtu_option_data = options_data.get(dhcp.OPTION_MTU)
                     if mtu_option_data:
@@ -53,3 +52,6 @@ class MTUPlugin(base.BasePlugin):
                                   'via DHCP for interface "%s"' % mac_address)
 
         return (base.PLUGIN_EXECUTE_ON_NEXT_BOOT, False)
+
+    def get_shared_data_dependencies(self):
+        return ([], [])
@@ -14,14 +14,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import re
-
 from oslo.config import cfg
 
 from cloudbaseinit import exception
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins import base
+from cloudbaseinit.utils import debiannetwork
 
 LOG = logging.getLogger(__name__)
 
@@ -35,6 +34,59 @@ CONF = cfg.CONF
 CONF.register_opts(opts)
 
 
+def _normalize_mac_address(mac_address):
+    return mac_address.replace('-', ':').lower()
+
+
+def _get_network_configs(osutils, interfaces):
+    """Returns the (adapter name, interface) tuples of the interfaces.
+
+    The interfaces are assigned to the adapter having their hwaddress. The
+    other interfaces are assigned to the remaining adapters in order,
+    starting with the network_adapter option, if set.
+    """
+    adapters = osutils.get_network_adapters_mac_addresses()
+    adapter_names = []
+    if CONF.network_adapter:
+        adapter_names.append(CONF.network_adapter)
+    adapter_names += [name for (name, mac_address) in adapters
+                      if name not in adapter_names]
+    if not adapter_names:
+        raise exception.CloudbaseInitException(
+            "No network adapter available")
+
+    mac_adapter_names = dict(
+        (_normalize_mac_address(mac_address), name)
+        for (name, mac_address) in adapters if mac_address)
+    assigned_names = {}
+    for interface in interfaces:
+        if not interface.hwaddress:
+            continue
+        adapter_name = mac_adapter_names.get(
+            _normalize_mac_address(interface.hwaddress))
+        if adapter_name and adapter_name not in assigned_names.values():
+            assigned_names[interface.name] = adapter_name
+        else:
+            LOG.warning('No network adapter found with MAC address '
+                        '%(mac_address)s of interface %(interface)s' %
+                        {'mac_address': interface.hwaddress,
+                         'interface': interface.name})
+
+    free_names = [name for name in adapter_names
+                  if name not in assigned_names.values()]
+    network_configs = []
+    for interface in interfaces:
+        adapter_name = assigned_names.get(interface.name)
+        if not adapter_name:
+            if not free_names:
+                LOG.warning('No network adapter available for interface: '
+                            '%s' % interface.name)
+                continue
+            adapter_name = free_names.pop(0)
+        network_configs.append((adapter_name, interface))
+    return network_configs
+
+
 class NetworkConfigPlugin(base.BasePlugin):
     def execute(self, service, shared_data):
         network_config = service.get_network_config()
@@ -50,42 +102,30 @@ class NetworkConfigPlugin(base.BasePlugin):
 
         LOG.debug('network config content:\n%s' % debian_network_conf)
 
-        # TODO(alexpilotti): implement a proper grammar
         if debian_network_conf:
             debian_network_conf = debian_network_conf.decode(encoding='utf-8')
 
-        m = re.search(r'iface eth0 inet static\s+'
-                      r'address\s+(?P<address>[^\s]+)\s+'
-                      r'netmask\s+(?P<netmask>[^\s]+)\s+'
-                      r'broadcast\s+(?P<broadcast>[^\s]+)\s+'
-                      r'gateway\s+(?P<gateway>[^\s]+)\s+'
-                      r'dns\-nameservers\s+(?P<dnsnameservers>[^\r\n]+)\s+',
-                      debian_network_conf)
-        if not m:
+        interfaces = [
+            interface for interface in
+            debiannetwork.parse(debian_network_conf or '')
+            if interface.method == debiannetwork.METHOD_STATIC and
+            interface.addresses]
+        if not interfaces:
             raise exception.CloudbaseInitException(
                 "network_config format not recognized")
 
-        address = m.group('address')
-        netmask = m.group('netmask')
-        broadcast = m.group('broadcast')
-        gateway = m.group('gateway')
-        dnsnameservers = m.group('dnsnameservers').strip().split(' ')
-
         osutils = osutils_factory.get_os_utils()
 
-        network_adapter_name = CONF.network_adapter
-        if not network_adapter_name:
-            # Get the first available one
-            available_adapters = osutils.get_network_adapters()
-            if not len(available_adapters):
-                raise exception.CloudbaseInitException(
-                    "No network adapter available")
-            network_adapter_name = available_adapters[0]
-
-        LOG.info('Configuring network adapter: \'%s\'' % network_adapter_name)
-
-        reboot_required = osutils.set_static_network_config(
-            network_adapter_name, address, netmask, broadcast,
-            gateway, dnsnameservers)
+        network_configs = _get_network_configs(osutils, interfaces)
+        for (adapter_name, interface) in network_configs:
+            LOG.info('Configuring network adapter \'%(adapter_name)s\' with '
+                     'interface %(interface)s' %
+                     {'adapter_name': adapter_name,
+                      'interface': interface.name})
+            if interface.routes:
+                LOG.warning('Static routes are not applied for interface: '
+                            '%s' % interface.name)
+
+        reboot_required = osutils.set_static_network_configs(network_configs)
 
         return (base.PLUGIN_EXECUTION_DONE, reboot_required)
@@ -65,13 +65,12 @@ class NTPClientPlugin(base.BasePlugin):
     def execute(self, service, shared_data):
         if CONF.ntp_use_dhcp_config:
             osutils = osutils_factory.get_os_utils()
-            dhcp_hosts = osutils.get_dhcp_hosts_in_use()
+            dhcp_options = dhcp.get_cached_dhcp_options(
+                osutils, [dhcp.OPTION_NTP_SERVERS])
 
             ntp_option_data = None
 
-            for (mac_address, dhcp_host) in dhcp_hosts:
-                options_data = dhcp.get_dhcp_options(dhcp_host,
-                                                     [dhcp.OPTION_NTP_SERVERS])
+            for (mac_address, dhcp_host, options_data) in dhcp_options:
                 if options_data:
                     ntp_option_data = options_data.get(dhcp.OPTION_NTP_SERVERS)
                     if ntp_option_data:
@@ -90,3 +89,6 @@ class NTPClientPlugin(base.BasePlugin):
             LOG.info('NTP client configured. Server: %s' % ntp_host)
 
         return (base.PLUGIN_EXECUTION_DONE, False)
+
+    def get_shared_data_dependencies(self):
+        return ([], [])
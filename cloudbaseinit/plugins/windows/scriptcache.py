@@ -0,0 +1,139 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Execution results of the user data scripts which must run only once.
+
+A multipart user data part is declared as once-only with the header:
+
+    X-Cloudbase-Init-Once: true
+
+The results are keyed by the SHA-256 of the interpreter and of the script,
+so a changed script or a script run by another interpreter is executed
+again. Like the plugins status, they are saved in a section of the
+instance, so the scripts are executed again on the instances deployed from
+an image captured after their execution.
+"""
+
+import hashlib
+import json
+import time
+
+import six
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+ONCE_HEADER = 'X-Cloudbase-Init-Once'
+
+_SCRIPT_CACHE_SECTION = 'UserDataScriptCache'
+
+# Set by the user data plugin, which executes all the once-only scripts
+_instance_id = None
+
+
+def set_instance_id(instance_id):
+    global _instance_id
+    _instance_id = instance_id
+
+
+def _get_section():
+    if not _instance_id:
+        return _SCRIPT_CACHE_SECTION
+    return _instance_id + '/' + _SCRIPT_CACHE_SECTION
+
+
+def _to_bytes(value):
+    if value is None:
+        return b''
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def is_once(part):
+    value = part.get(ONCE_HEADER)
+    return bool(value) and value.strip().lower() in ('1', 'true', 'yes')
+
+
+def get_script_key(interpreter, script):
+    sha256 = hashlib.sha256(_to_bytes(interpreter))
+    sha256.update(b'\0')
+    sha256.update(_to_bytes(script))
+    return sha256.hexdigest()
+
+
+def get_result(osutils, key):
+    """Returns the saved execution result of the script, or None.
+
+    The result is a dict with the exit_code, duration, output_sha256 and
+    timestamp keys.
+    """
+    value = osutils.get_config_value(key, _get_section())
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError as ex:
+        LOG.warning('Invalid script cache entry %(key)s: %(ex)s' %
+                    {'key': key, 'ex': ex})
+        return None
+
+
+def _is_execute_on_next_boot(exit_code):
+    return 1001 <= exit_code <= 1003 and bool(exit_code & 2)
+
+
+def save_result(osutils, key, exit_code, duration, out, err):
+    if _is_execute_on_next_boot(exit_code):
+        # The script asked to be executed again
+        return
+
+    output_sha256 = hashlib.sha256(_to_bytes(out))
+    output_sha256.update(b'\0')
+    output_sha256.update(_to_bytes(err))
+    result = {'exit_code': exit_code,
+              'duration': round(duration, 3),
+              'output_sha256': output_sha256.hexdigest(),
+              'timestamp': time.time()}
+
+    LOG.debug('Saving the execution result of script %s' % key)
+    osutils.set_config_value(key, json.dumps(result), _get_section())
+
+
+def check_executed(osutils, key):
+    """Returns True if the script was already executed, logging its result.
+
+    The once-only scripts already executed are skipped, their exit code is
+    not returned again as a reboot may have already been requested with it.
+    """
+    result = get_result(osutils, key)
+    if result is None:
+        return False
+    LOG.info('Skipping script %(key)s, already executed with exit code: '
+             '%(exit_code)s' % {'key': key,
+                                'exit_code': result.get('exit_code')})
+    return True
+
+
+def execute(osutils, key, func):
+    """Executes the script with func, saving the result if key is not None.
+
+    func must return the (out, err, exit_code) tuple of the execution.
+    """
+    start = time.time()
+    (out, err, exit_code) = func()
+    if key:
+        save_result(osutils, key, exit_code, time.time() - start, out, err)
+    return (out, err, exit_code)
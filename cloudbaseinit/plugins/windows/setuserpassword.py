@@ -108,3 +108,7 @@ class SetUserPasswordPlugin(base.BasePlugin):
                     self._set_metadata_password(password, service)
 
         return (base.PLUGIN_EXECUTE_ON_NEXT_BOOT, False)
+
+    def get_shared_data_dependencies(self):
+        return ([constants.SHARED_DATA_USERNAME],
+                [constants.SHARED_DATA_PASSWORD])
@@ -22,6 +22,7 @@ from cloudbaseinit import exception
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins import base
+from cloudbaseinit.plugins import constants
 
 CONF = cfg.CONF
 CONF.import_opt('username', 'cloudbaseinit.plugins.windows.createuser')
@@ -56,3 +57,7 @@ class SetUserSSHPublicKeysPlugin(base.BasePlugin):
                 f.write(public_key)
 
         return (base.PLUGIN_EXECUTION_DONE, False)
+
+    def get_shared_data_dependencies(self):
+        # The user must have been created
+        return ([constants.SHARED_DATA_USERNAME], [])
@@ -14,23 +14,39 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import email
-import gzip
-import io
-import six
+import itertools
+
+from multiprocessing import pool
+
+from oslo.config import cfg
 
 from cloudbaseinit.metadata.services import base as metadata_services_base
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.plugins import base
+from cloudbaseinit.plugins.windows import scriptcache
 from cloudbaseinit.plugins.windows.userdataplugins import factory
 from cloudbaseinit.plugins.windows import userdatautils
+from cloudbaseinit.utils import mimestream
+
+opts = [
+    cfg.BoolOpt('user_data_parallel_parts', default=False,
+                help='Processes concurrently the multipart user data parts '
+                'which do not execute code, e.g. the Heat configuration '
+                'files. The other parts are processed in order, after all '
+                'the preceding parts'),
+    cfg.IntOpt('user_data_max_workers', default=4,
+               help='Max. number of user data parts processed concurrently'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
 
 LOG = logging.getLogger(__name__)
 
 
 class UserDataPlugin(base.BasePlugin):
     _PART_HANDLER_CONTENT_TYPE = "text/part-handler"
-    _GZIP_MAGIC_NUMBER = b'\x1f\x8b'
+    _MULTIPART_PREFIX = b'Content-Type: multipart'
 
     def execute(self, service, shared_data):
         try:
@@ -41,47 +57,97 @@ class UserDataPlugin(base.BasePlugin):
         if not user_data:
             return (base.PLUGIN_EXECUTION_DONE, False)
 
-        user_data = self._check_gzip_compression(user_data)
+        LOG.debug('User data size: %d' % len(user_data))
+        scriptcache.set_instance_id(service.get_instance_id())
+        return self._process_user_data(
+            mimestream.iter_decompressed(user_data))
+
+    def _process_user_data(self, chunks):
+        # The content type is checked on the first chunk, then the multipart
+        # user data is parsed and processed one part at a time
+        chunks = iter(chunks)
+        head = b''
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= len(self._MULTIPART_PREFIX):
+                break
+        chunks = itertools.chain([head], chunks)
+
+        if head.startswith(self._MULTIPART_PREFIX):
+            return self._process_multi_part(mimestream.iter_parts(chunks))
+        else:
+            user_data = b''.join(chunks).decode('utf-8')
+            LOG.debug('User data content:\n%s' % user_data)
+            return self._process_non_multi_part(user_data)
 
-        if not isinstance(user_data, six.text_type):
-            user_data = user_data.decode('utf-8')
+    def _process_multi_part(self, parts):
+        plugin_status = base.PLUGIN_EXECUTION_DONE
+        reboot = False
 
-        return self._process_user_data(user_data)
+        user_data_plugins = factory.load_plugins()
+        user_handlers = {}
 
-    def _check_gzip_compression(self, user_data):
-        if user_data[:2] == self._GZIP_MAGIC_NUMBER:
-            bio = io.BytesIO(user_data)
-            with gzip.GzipFile(fileobj=bio, mode='rb') as f:
-                user_data = f.read()
+        thread_pool = None
+        if CONF.user_data_parallel_parts:
+            thread_pool = pool.ThreadPool(max(CONF.user_data_max_workers, 1))
+        # Results of the parts being processed concurrently
+        async_results = []
 
-        return user_data
+        try:
+            for part in parts:
+                LOG.debug('User data part: %(content_type)s, %(filename)s' %
+                          {'content_type': part.get_content_type(),
+                           'filename': part.get_filename()})
+                if thread_pool and self._can_process_concurrently(
+                        part, user_data_plugins, user_handlers):
+                    async_results.append(thread_pool.apply_async(
+                        self._process_part,
+                        (part, user_data_plugins, user_handlers)))
+                    continue
+
+                # The other parts are barriers: they are processed after
+                # the preceding ones completed
+                (plugin_status, reboot) = self._wait_for_parts(
+                    async_results, plugin_status, reboot)
+                async_results = []
+                if reboot:
+                    break
 
-    def _parse_mime(self, user_data):
-        return email.message_from_string(user_data).walk()
+                (plugin_status, reboot) = self._process_part(
+                    part, user_data_plugins, user_handlers)
+                if reboot:
+                    break
 
-    def _process_user_data(self, user_data):
-        plugin_status = base.PLUGIN_EXECUTION_DONE
-        reboot = False
+            (plugin_status, reboot) = self._wait_for_parts(
+                async_results, plugin_status, reboot)
+        finally:
+            if thread_pool:
+                thread_pool.close()
+                thread_pool.join()
 
-        LOG.debug('User data content:\n%s' % user_data)
-        if user_data.startswith('Content-Type: multipart'):
-            user_data_plugins = factory.load_plugins()
-            user_handlers = {}
+        if not reboot:
+            for handler_func in list(set(user_handlers.values())):
+                self._end_part_process_event(handler_func)
 
-            for part in self._parse_mime(user_data):
-                (plugin_status, reboot) = self._process_part(part,
-                                                             user_data_plugins,
-                                                             user_handlers)
-                if reboot:
-                    break
+        return (plugin_status, reboot)
 
+    def _can_process_concurrently(self, part, user_data_plugins,
+                                  user_handlers):
+        content_type = part.get_content_type()
+        if content_type in user_handlers:
+            return False
+        user_data_plugin = user_data_plugins.get(content_type)
+        return bool(user_data_plugin and
+                    user_data_plugin.can_process_concurrently(part))
+
+    def _wait_for_parts(self, async_results, plugin_status, reboot):
+        # The results are applied in the parts order, as if the parts were
+        # processed sequentially up to the first one requiring a reboot
+        for async_result in async_results:
+            result = async_result.get()
             if not reboot:
-                for handler_func in list(set(user_handlers.values())):
-                    self._end_part_process_event(handler_func)
-
-            return (plugin_status, reboot)
-        else:
-            return self._process_non_multi_part(user_data)
+                (plugin_status, reboot) = result
+        return (plugin_status, reboot)
 
     def _process_part(self, part, user_data_plugins, user_handlers):
         ret_val = None
@@ -22,6 +22,14 @@ class BaseUserDataPlugin(object):
     def get_mime_type(self):
         return self._mime_type
 
+    def can_process_concurrently(self, part):
+        """Returns True if part can be processed along with other parts.
+
+        Only parts which don't execute code, e.g. which just write files,
+        should be processed concurrently.
+        """
+        return False
+
     @abc.abstractmethod
     def process(self, part):
         pass
@@ -22,6 +22,9 @@ class CloudBootHookPlugin(base.BaseUserDataPlugin):
     def __init__(self):
         super(CloudBootHookPlugin, self).__init__("text/cloud-boothook")
 
+    def can_process_concurrently(self, part):
+        return True
+
     def process(self, part):
         LOG.info("%s content is currently not supported" %
                  self.get_mime_type())
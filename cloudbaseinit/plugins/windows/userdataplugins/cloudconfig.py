@@ -23,6 +23,9 @@ class CloudConfigPlugin(base.BaseUserDataPlugin):
     def __init__(self):
         super(CloudConfigPlugin, self).__init__("text/cloud-config")
 
+    def can_process_concurrently(self, part):
+        return True
+
     def process(self, part):
         LOG.info("%s content is currently not supported" %
                  self.get_mime_type())
@@ -18,6 +18,7 @@ import os
 from oslo.config import cfg
 
 from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.plugins.windows import scriptcache
 from cloudbaseinit.plugins.windows.userdataplugins import base
 from cloudbaseinit.plugins.windows import userdatautils
 
@@ -41,7 +42,16 @@ class HeatPlugin(base.BaseUserDataPlugin):
     def _check_dir(self, file_name):
         dir_name = os.path.dirname(file_name)
         if not os.path.exists(dir_name):
-            os.makedirs(dir_name)
+            try:
+                os.makedirs(dir_name)
+            except OSError:
+                # Created meanwhile by a part processed concurrently
+                if not os.path.isdir(dir_name):
+                    raise
+
+    def can_process_concurrently(self, part):
+        # Only the Heat user data file is executed
+        return part.get_filename() != self._heat_user_data_filename
 
     def process(self, part):
         file_name = os.path.join(CONF.heat_config_dir, part.get_filename())
@@ -51,4 +61,5 @@ class HeatPlugin(base.BaseUserDataPlugin):
             f.write(part.get_payload().encode())
 
         if part.get_filename() == self._heat_user_data_filename:
-            return userdatautils.execute_user_data_script(part.get_payload())
+            return userdatautils.execute_user_data_script(
+                part.get_payload(), once=scriptcache.is_once(part))
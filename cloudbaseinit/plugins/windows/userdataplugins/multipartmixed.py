@@ -19,5 +19,8 @@ class MultipartMixedPlugin(base.BaseUserDataPlugin):
     def __init__(self):
         super(MultipartMixedPlugin, self).__init__("multipart/mixed")
 
+    def can_process_concurrently(self, part):
+        return True
+
     def process(self, part):
         pass
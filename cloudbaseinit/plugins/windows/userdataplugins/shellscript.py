@@ -17,7 +17,9 @@ import os
 import tempfile
 
 from cloudbaseinit.openstack.common import log as logging
+from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.windows import fileexecutils
+from cloudbaseinit.plugins.windows import scriptcache
 from cloudbaseinit.plugins.windows.userdataplugins import base
 
 LOG = logging.getLogger(__name__)
@@ -31,11 +33,20 @@ class ShellScriptPlugin(base.BaseUserDataPlugin):
         file_name = part.get_filename()
         target_path = os.path.join(tempfile.gettempdir(), file_name)
 
+        script_key = None
+        if scriptcache.is_once(part):
+            # The interpreter is chosen by exec_file based on the extension
+            script_key = scriptcache.get_script_key(
+                os.path.splitext(file_name)[1].lower(), part.get_payload())
+            if scriptcache.check_executed(osutils_factory.get_os_utils(),
+                                          script_key):
+                return 0
+
         try:
             with open(target_path, 'wb') as f:
                 f.write(part.get_payload().encode())
 
-            return fileexecutils.exec_file(target_path)
+            return fileexecutils.exec_file(target_path, script_key)
         except Exception as ex:
             LOG.warning('An error occurred during user_data execution: \'%s\''
                         % ex)
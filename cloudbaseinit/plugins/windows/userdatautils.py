@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import os
 import re
 import tempfile
@@ -19,11 +20,12 @@ import uuid
 
 from cloudbaseinit.openstack.common import log as logging
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.plugins.windows import scriptcache
 
 LOG = logging.getLogger(__name__)
 
 
-def execute_user_data_script(user_data):
+def execute_user_data_script(user_data, once=False):
     osutils = osutils_factory.get_os_utils()
 
     shell = False
@@ -53,20 +55,29 @@ def execute_user_data_script(user_data):
         LOG.warning('Unsupported user_data format')
         return 0
 
+    script_key = None
+    if once:
+        interpreter = os.path.splitext(target_path)[1]
+        if not sysnative:
+            interpreter += '_x86'
+        script_key = scriptcache.get_script_key(interpreter, user_data)
+        if scriptcache.check_executed(osutils, script_key):
+            return 0
+
     try:
         with open(target_path, 'wb') as f:
             f.write(user_data.encode())
 
         if powershell:
-            (out, err,
-             ret_val) = osutils.execute_powershell_script(target_path,
-                                                          sysnative)
+            execute = functools.partial(osutils.execute_powershell_script,
+                                        target_path, sysnative, logger=LOG)
         else:
-            (out, err, ret_val) = osutils.execute_process(args, shell)
+            execute = functools.partial(osutils.execute_process_streaming,
+                                        args, shell, logger=LOG)
+        (out, err, ret_val) = scriptcache.execute(osutils, script_key,
+                                                  execute)
 
         LOG.info('User_data script ended with return code: %d' % ret_val)
-        LOG.debug('User_data stdout:\n%s' % out)
-        LOG.debug('User_data stderr:\n%s' % err)
 
         return ret_val
     except Exception as ex:
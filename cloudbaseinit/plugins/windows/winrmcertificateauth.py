@@ -104,3 +104,8 @@ class ConfigWinRMCertificateAuthPlugin(base.BasePlugin):
                 security_utils.set_uac_remote_restrictions(enable=True)
 
         return (base.PLUGIN_EXECUTION_DONE, False)
+
+    def get_shared_data_dependencies(self):
+        return ([constants.SHARED_DATA_USERNAME,
+                 constants.SHARED_DATA_PASSWORD],
+                [constants.SHARED_DATA_PASSWORD])
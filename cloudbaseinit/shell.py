@@ -18,14 +18,23 @@ import sys
 
 from oslo.config import cfg
 
-from cloudbaseinit import init
 from cloudbaseinit.utils import log as logging
+from cloudbaseinit.utils import startup
 
 CONF = cfg.CONF
 
 
 def main():
     CONF(sys.argv[1:])
+
+    if startup.is_instance_configured():
+        startup.terminate()
+        return
+
+    # Imported only when there's something to do, as it imports and
+    # registers the options of all the plugins and services
+    from cloudbaseinit import init
+
     logging.setup('cloudbaseinit')
 
     init.InitManager().configure_host()
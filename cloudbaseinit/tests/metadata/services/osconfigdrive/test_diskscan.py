@@ -0,0 +1,193 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cloudbaseinit.metadata.services.osconfigdrive import diskscan
+from cloudbaseinit.tests.utils import test_iso9660
+
+
+class ImageFileDisk(object):
+    """A disk backed by an image file, identified by the file name."""
+
+    def __init__(self, path):
+        self._f = open(path, 'rb')
+        self._id = os.path.basename(path)
+
+    def get_id(self):
+        return self._id
+
+    def read_at(self, offset, size):
+        self._f.seek(offset)
+        return self._f.read(size)
+
+    def close(self):
+        self._f.close()
+
+
+class ConfigDriveScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._opened_paths = []
+        self._lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _create_image(self, name, data):
+        path = os.path.join(self._tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _create_iso_image(self, name):
+        return self._create_image(name, test_iso9660.build_iso_image(
+            {'openstack/latest/meta_data.json': b'{}'}))
+
+    def _open_disk(self, path):
+        with self._lock:
+            self._opened_paths.append(path)
+        return ImageFileDisk(path)
+
+    def _get_negative_cache(self, disk_ids=()):
+        mock_osutils = mock.MagicMock()
+        mock_osutils.get_config_values.return_value = dict(
+            (disk_id, 1) for disk_id in disk_ids)
+        return diskscan.NegativeCache(mock_osutils)
+
+    def test_has_iso9660_signature(self):
+        iso_disk = ImageFileDisk(self._create_iso_image('config.iso'))
+        empty_disk = ImageFileDisk(self._create_image('empty.img',
+                                                      b'\x00' * 65536))
+        small_disk = ImageFileDisk(self._create_image('small.img', b''))
+        try:
+            self.assertTrue(diskscan.has_iso9660_signature(iso_disk))
+            self.assertFalse(diskscan.has_iso9660_signature(empty_disk))
+            self.assertFalse(diskscan.has_iso9660_signature(small_disk))
+        finally:
+            iso_disk.close()
+            empty_disk.close()
+            small_disk.close()
+
+    def test_find(self):
+        paths = [self._create_image('disk%d.img' % i, b'\x00' * 65536)
+                 for i in range(4)]
+        iso_path = self._create_iso_image('config.iso')
+        negative_cache = self._get_negative_cache()
+        scanner = diskscan.ConfigDriveScanner(self._open_disk,
+                                              negative_cache, max_workers=3)
+
+        response = scanner.find(paths + [iso_path])
+
+        self.assertEqual(iso_path, response)
+        # The disks probed after the config drive is found are not cached
+        set_config_values = negative_cache._osutils.set_config_values
+        if set_config_values.called:
+            (values, section) = set_config_values.call_args[0]
+            self.assertTrue(set(values).issubset(
+                'disk%d.img' % i for i in range(4)))
+
+    def test_find_not_found(self):
+        paths = [self._create_image('disk%d.img' % i, b'\x00' * 65536)
+                 for i in range(4)]
+        negative_cache = self._get_negative_cache()
+        scanner = diskscan.ConfigDriveScanner(self._open_disk,
+                                              negative_cache, max_workers=3)
+
+        self.assertIsNone(scanner.find(paths))
+        self.assertIsNone(scanner.find([]))
+        self.assertEqual(sorted(paths), sorted(self._opened_paths))
+        negative_cache._osutils.set_config_values.assert_called_once_with(
+            dict(('disk%d.img' % i, 1) for i in range(4)),
+            diskscan.CACHE_SECTION)
+
+    def test_find_skips_cached_disks(self):
+        paths = [self._create_image('disk%d.img' % i, b'\x00' * 65536)
+                 for i in range(2)]
+        negative_cache = self._get_negative_cache(['disk0.img'])
+        mock_open_disk = mock.MagicMock(side_effect=ImageFileDisk)
+        scanner = diskscan.ConfigDriveScanner(mock_open_disk, negative_cache)
+
+        with mock.patch.object(diskscan, 'has_iso9660_signature',
+                               return_value=False) as mock_has_signature:
+            self.assertIsNone(scanner.find(paths))
+
+        self.assertEqual(1, mock_has_signature.call_count)
+        negative_cache._osutils.set_config_values.assert_called_once_with(
+            {'disk1.img': 1}, diskscan.CACHE_SECTION)
+
+    def test_find_errors_not_cached(self):
+        negative_cache = self._get_negative_cache()
+        mock_disk = mock.MagicMock()
+        mock_disk.get_id.return_value = 'fake id'
+        mock_disk.read_at.side_effect = IOError
+        scanner = diskscan.ConfigDriveScanner(
+            mock.MagicMock(side_effect=[mock_disk, None]), negative_cache)
+
+        self.assertIsNone(scanner.find(['disk0', 'disk1']))
+
+        mock_disk.close.assert_called_once_with()
+        self.assertFalse(negative_cache._osutils.set_config_values.called)
+
+    def test_scan(self):
+        iso_paths = [self._create_iso_image('config%d.iso' % i)
+                     for i in range(2)]
+        scanner = diskscan.ConfigDriveScanner(self._open_disk)
+
+        self.assertEqual(sorted(iso_paths), sorted(scanner.scan(iso_paths)))
+
+
+class NegativeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._mock_osutils = mock.MagicMock()
+        self._cache = diskscan.NegativeCache(self._mock_osutils)
+
+    def test_contains(self):
+        self._mock_osutils.get_config_values.return_value = {'id0': 1}
+
+        self.assertIn('id0', self._cache)
+        self.assertNotIn('id1', self._cache)
+        self._mock_osutils.get_config_values.assert_called_once_with(
+            diskscan.CACHE_SECTION)
+        self.assertFalse(self._mock_osutils.get_config_value.called)
+
+    def test_contains_not_implemented(self):
+        self._mock_osutils.get_config_values.side_effect = (
+            NotImplementedError)
+        self._mock_osutils.get_config_value.side_effect = [1, None]
+
+        self.assertIn('id0', self._cache)
+        self.assertNotIn('id1', self._cache)
+        self._mock_osutils.get_config_value.assert_has_calls(
+            [mock.call('id0', diskscan.CACHE_SECTION),
+             mock.call('id1', diskscan.CACHE_SECTION)])
+
+    def test_add_flush(self):
+        self._mock_osutils.get_config_values.return_value = {'id0': 1}
+
+        self._cache.add('id0')
+        self._cache.add('id1')
+        self._cache.flush()
+        self._cache.flush()
+
+        self.assertIn('id1', self._cache)
+        self._mock_osutils.set_config_values.assert_called_once_with(
+            {'id1': 1}, diskscan.CACHE_SECTION)
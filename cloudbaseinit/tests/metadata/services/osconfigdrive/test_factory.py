@@ -30,24 +30,31 @@ class ClassloaderTest(unittest.TestCase):
         sys.platform = self.original_platform
 
     @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
-    def _test_get_config_drive_manager(self, mock_load_class, platform):
+    def _test_get_config_drive_manager(self, mock_load_class, platform,
+                                       os_name='nt', class_path=None):
         sys.platform = platform
 
-        if platform is not "win32":
-            self.assertRaises(NotImplementedError,
-                              factory.get_config_drive_manager)
-
-        else:
+        with mock.patch('os.name', os_name):
+            if not class_path:
+                self.assertRaises(NotImplementedError,
+                                  factory.get_config_drive_manager)
+                return
             response = factory.get_config_drive_manager()
 
-            mock_load_class.assert_called_once_with(
-                'cloudbaseinit.metadata.services.osconfigdrive.'
-                'windows.WindowsConfigDriveManager')
-
-            self.assertIsNotNone(response)
+        mock_load_class.assert_called_once_with(class_path)
+        self.assertIsNotNone(response)
 
     def test_get_config_drive_manager(self):
-        self._test_get_config_drive_manager(platform="win32")
+        self._test_get_config_drive_manager(
+            platform="win32",
+            class_path='cloudbaseinit.metadata.services.osconfigdrive.'
+            'windows.WindowsConfigDriveManager')
+
+    def test_get_config_drive_manager_posix(self):
+        self._test_get_config_drive_manager(
+            platform="linux2", os_name='posix',
+            class_path='cloudbaseinit.metadata.services.osconfigdrive.'
+            'posix.PosixConfigDriveManager')
 
     def test_get_config_drive_manager_exception(self):
         self._test_get_config_drive_manager(platform="other")
@@ -0,0 +1,172 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from oslo.config import cfg
+
+from cloudbaseinit.metadata.services.osconfigdrive import posix
+from cloudbaseinit.tests.utils import test_iso9660
+from cloudbaseinit.tests.utils import test_vfat
+
+CONF = cfg.CONF
+
+_FILES = {'openstack/latest/meta_data.json': b'{"uuid": "fake"}',
+          'openstack/content/0000': b'fake content',
+          'ec2/latest/meta-data.json': b'{}'}
+
+
+class PosixConfigDriveManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._sys_block_path = os.path.join(self._tmp_dir, 'sys')
+        self._dev_path = os.path.join(self._tmp_dir, 'dev')
+        self._label_links_path = os.path.join(self._tmp_dir, 'by-label')
+        self._mounts_path = os.path.join(self._tmp_dir, 'mounts')
+        self._target_path = os.path.join(self._tmp_dir, 'target')
+        for path in (self._sys_block_path, self._dev_path,
+                     self._label_links_path):
+            os.makedirs(path)
+
+        self._paths_patcher = mock.patch.multiple(
+            posix, SYS_BLOCK_PATH=self._sys_block_path,
+            DEV_PATH=self._dev_path, LABEL_LINKS_PATH=self._label_links_path,
+            MOUNTS_PATH=self._mounts_path)
+        self._paths_patcher.start()
+
+        self._manager = posix.PosixConfigDriveManager()
+
+    def tearDown(self):
+        self._paths_patcher.stop()
+        shutil.rmtree(self._tmp_dir)
+
+    def _add_device(self, name, data):
+        os.makedirs(os.path.join(self._sys_block_path, name))
+        path = os.path.join(self._dev_path, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _add_label_link(self, device_path):
+        os.symlink(device_path, os.path.join(self._label_links_path,
+                                             posix.CONFIG_DRIVE_LABEL))
+
+    def _assert_files_extracted(self):
+        self.assertEqual(['openstack'], os.listdir(self._target_path))
+        with open(os.path.join(self._target_path, 'openstack', 'latest',
+                               'meta_data.json'), 'rb') as f:
+            self.assertEqual(_FILES['openstack/latest/meta_data.json'],
+                             f.read())
+
+    def test_get_config_drive_files_iso_device(self):
+        self._add_device('sda', b'\x00' * 65536)
+        self._add_device('sr0', test_iso9660.build_iso_image(_FILES))
+
+        response = self._manager.get_config_drive_files(self._target_path)
+
+        self.assertTrue(response)
+        self._assert_files_extracted()
+
+    def test_get_config_drive_files_vfat_device(self):
+        self._add_device('vda', test_vfat.build_vfat_image(_FILES))
+
+        response = self._manager.get_config_drive_files(self._target_path)
+
+        self.assertTrue(response)
+        self._assert_files_extracted()
+
+    def test_get_config_drive_files_other_label(self):
+        self._add_device('vda', test_vfat.build_vfat_image(
+            _FILES, label='other'))
+
+        response = self._manager.get_config_drive_files(self._target_path)
+
+        self.assertFalse(response)
+        self.assertFalse(os.path.exists(self._target_path))
+
+    def test_get_config_drive_files_label_link(self):
+        self._add_device('vda', test_vfat.build_vfat_image(_FILES))
+        path = self._add_device('vdb', test_iso9660.build_iso_image(_FILES))
+        self._add_label_link(path)
+
+        with mock.patch.object(self._manager, '_extract_files',
+                               return_value=True) as mock_extract_files:
+            response = self._manager.get_config_drive_files(
+                self._target_path)
+
+        self.assertTrue(response)
+        mock_extract_files.assert_called_once_with(
+            path, self._target_path, check_label=True)
+
+    def test_get_config_drive_files_image_files(self):
+        image_path = os.path.join(self._tmp_dir, 'config-drive.img')
+        with open(image_path, 'wb') as f:
+            f.write(test_vfat.build_vfat_image(_FILES, label='other'))
+        image_paths = [os.path.join(self._tmp_dir, '*.iso'),
+                       os.path.join(self._tmp_dir, '*.img')]
+
+        with mock.patch.object(CONF, 'config_drive_image_paths',
+                               image_paths):
+            response = self._manager.get_config_drive_files(
+                self._target_path, check_cdrom=False)
+
+        self.assertTrue(response)
+        self._assert_files_extracted()
+
+    def test_get_config_drive_files_not_found(self):
+        self._add_device('ram0', b'')
+        self._add_device('sda', b'\x00' * 65536)
+
+        response = self._manager.get_config_drive_files(self._target_path)
+
+        self.assertFalse(response)
+
+    def _mount_config_drive(self, mount_point):
+        os.makedirs(os.path.join(mount_point, 'openstack', 'latest'))
+        os.makedirs(os.path.join(mount_point, 'ec2'))
+        with open(os.path.join(mount_point, 'openstack', 'latest',
+                               'meta_data.json'), 'wb') as f:
+            f.write(_FILES['openstack/latest/meta_data.json'])
+
+        path = self._add_device('sr0', b'')
+        self._add_label_link(path)
+        with open(self._mounts_path, 'w') as f:
+            f.write('sysfs /sys sysfs rw 0 0\n'
+                    '%s %s iso9660 ro 0 0\n' %
+                    (os.path.realpath(path),
+                     mount_point.replace(' ', '\\040')))
+
+    def test_get_config_drive_mount_point(self):
+        mount_point = os.path.join(self._tmp_dir, 'config drive')
+        self._mount_config_drive(mount_point)
+
+        self.assertEqual(mount_point,
+                         self._manager.get_config_drive_mount_point())
+
+    def test_get_config_drive_mount_point_not_mounted(self):
+        self.assertIsNone(self._manager.get_config_drive_mount_point())
+
+    def test_get_config_drive_files_mount_point(self):
+        self._mount_config_drive(os.path.join(self._tmp_dir, 'mnt'))
+
+        response = self._manager.get_config_drive_files(
+            self._target_path, check_raw_hhd=False)
+
+        self.assertTrue(response)
+        self._assert_files_extracted()
@@ -17,13 +17,12 @@
 import importlib
 import mock
 import os
+import shutil
+import tempfile
 import unittest
 
-from oslo.config import cfg
-
-from cloudbaseinit import exception
-
-CONF = cfg.CONF
+from cloudbaseinit import exception as cbinit_exception
+from cloudbaseinit.tests.utils import test_iso9660
 
 
 class TestWindowsConfigDriveManager(unittest.TestCase):
@@ -75,190 +74,165 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
     def test_get_config_drive_cdrom_mount_point_exists_false(self):
         self._test_get_config_drive_cdrom_mount_point(exists=False)
 
-    def test_c_char_array_to_c_ushort(self):
-        mock_buf = mock.MagicMock()
-        contents = self._ctypes_mock.cast.return_value.contents
-
-        response = self._config_manager._c_char_array_to_c_ushort(mock_buf, 1)
-
-        self.assertEqual(2, self._ctypes_mock.cast.call_count)
-        self._ctypes_mock.POINTER.assert_called_with(
-            self._ctypes_mock.wintypes.WORD)
+    def _get_fake_phys_disk(self, image, sector_size=512):
+        fake_phys_disk = mock.MagicMock()
+        fake_phys_disk.get_geometry.return_value.BytesPerSector = sector_size
+        position = [0]
+
+        def seek(offset):
+            self.assertEqual(0, offset % sector_size)
+            position[0] = offset
+
+        def read_into(buf, offset=0, size=None):
+            if size is None:
+                size = len(buf) - offset
+            self.assertEqual(0, size % sector_size)
+            data = image[position[0]:position[0] + size]
+            buf[offset:offset + len(data)] = data
+            return len(data)
+
+        fake_phys_disk.seek.side_effect = seek
+        fake_phys_disk.read_into.side_effect = read_into
+        return fake_phys_disk
+
+    def test_extract_config_drive_files(self):
+        files = {'openstack/latest/meta_data.json': b'{}',
+                 'openstack/content/0000': b'fake content',
+                 'ec2/latest/meta-data.json': b'{}'}
+        image = test_iso9660.build_iso_image(files)
+        target_path = tempfile.mkdtemp()
+        try:
+            response = self._config_manager._extract_config_drive_files(
+                self._get_fake_phys_disk(image), target_path)
 
-        self._ctypes_mock.cast.assert_called_with(
-            mock_buf.__getitem__(), self._ctypes_mock.POINTER.return_value)
-
-        self.assertEqual(contents.value.__lshift__().__add__(), response)
-
-    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._c_char_array_to_c_ushort')
-    def _test_get_iso_disk_size(self, mock_c_char_array_to_c_ushort,
-                                media_type, value, iso_id):
+            self.assertTrue(response)
+            self.assertEqual(['openstack'], os.listdir(target_path))
+            with open(os.path.join(target_path, 'openstack', 'content',
+                                   '0000'), 'rb') as f:
+                self.assertEqual(b'fake content', f.read())
+        finally:
+            shutil.rmtree(target_path)
+
+    def _test_open_raw_disk(self, media_type):
+        mock_phys_disk = self.windows.physical_disk.PhysicalDisk.return_value
+        mock_phys_disk.get_geometry.return_value.MediaType = media_type
+        mock_phys_disk.get_geometry.return_value.BytesPerSector = 512
+
+        response = self._config_manager._open_raw_disk(
+            mock.sentinel.path)
+
+        self.windows.physical_disk.PhysicalDisk.assert_called_once_with(
+            mock.sentinel.path)
+        mock_phys_disk.open.assert_called_once_with()
+        if media_type == self.physical_disk.Win32_DiskGeometry.FixedMedia:
+            self.assertIsInstance(response, self.windows._RawDisk)
+            self.assertFalse(mock_phys_disk.close.called)
+        else:
+            self.assertIsNone(response)
+            mock_phys_disk.close.assert_called_once_with()
 
-        if media_type == "fixed":
-            media_type = self.physical_disk.Win32_DiskGeometry.FixedMedia
+    def test_open_raw_disk(self):
+        self._test_open_raw_disk(
+            media_type=self.physical_disk.Win32_DiskGeometry.FixedMedia)
 
-        boot_record_off = 0x8000
-        volume_size_off = 80
-        block_size_off = 128
+    def test_open_raw_disk_other_media_type(self):
+        self._test_open_raw_disk(media_type=mock.sentinel.other_media_type)
 
+    def _test_raw_disk_get_id(self, serial_number):
         mock_phys_disk = mock.MagicMock()
-        mock_buff = mock.MagicMock()
-        mock_geom = mock.MagicMock()
-
-        mock_phys_disk.get_geometry.return_value = mock_geom
-
-        mock_geom.MediaType = media_type
-        mock_geom.Cylinders = value
-        mock_geom.TracksPerCylinder = 2
-        mock_geom.SectorsPerTrack = 2
-        mock_geom.BytesPerSector = 2
-
-        mock_phys_disk.read.return_value = (mock_buff, 'fake value')
-
-        mock_buff.__getitem__.return_value = iso_id
-        mock_c_char_array_to_c_ushort.return_value = 100
-
-        disk_size = mock_geom.Cylinders * mock_geom.TracksPerCylinder * \
-            mock_geom.SectorsPerTrack * mock_geom.BytesPerSector
-
-        offset = boot_record_off / mock_geom.BytesPerSector * \
-            mock_geom.BytesPerSector
-
-        buf_off_volume = boot_record_off - offset + volume_size_off
-        buf_off_block = boot_record_off - offset + block_size_off
-
-        response = self._config_manager._get_iso_disk_size(mock_phys_disk)
-
-        mock_phys_disk.get_geometry.assert_called_once_with()
+        mock_phys_disk.get_geometry.return_value.BytesPerSector = 512
+        mock_phys_disk.get_geometry.return_value.Cylinders = 10
+        mock_phys_disk.get_geometry.return_value.TracksPerCylinder = 2
+        mock_phys_disk.get_geometry.return_value.SectorsPerTrack = 4
+        if isinstance(serial_number, Exception):
+            mock_phys_disk.get_serial_number.side_effect = serial_number
+        else:
+            mock_phys_disk.get_serial_number.return_value = serial_number
 
-        if media_type != self.physical_disk.Win32_DiskGeometry.FixedMedia:
-            self.assertIsNone(response)
+        response = self.windows._RawDisk(mock_phys_disk).get_id()
 
-        elif disk_size <= offset + mock_geom.BytesPerSector:
+        if serial_number and not isinstance(serial_number, Exception):
+            self.assertEqual('%s_%d' % (serial_number, 10 * 2 * 4 * 512),
+                             response)
+        else:
             self.assertIsNone(response)
 
-        else:
-            mock_phys_disk.seek.assert_called_once_with(offset)
-            mock_phys_disk.read.assert_called_once_with(
-                mock_geom.BytesPerSector)
-
-            if iso_id != 'CD001':
-                self.assertIsNone(response)
-            else:
-                mock_c_char_array_to_c_ushort.assert_has_calls(
-                    mock.call(mock_buff, buf_off_volume),
-                    mock.call(mock_buff, buf_off_block))
-                self.assertEqual(10000, response)
-
-    def test_test_get_iso_disk_size(self):
-        self._test_get_iso_disk_size(
-            media_type="fixed",
-            value=100, iso_id='CD001')
-
-    def test_test_get_iso_disk_size_other_media_type(self):
-        self._test_get_iso_disk_size(media_type="other", value=100,
-                                     iso_id='CD001')
-
-    def test_test_get_iso_disk_size_other_disk_size_too_small(self):
-        self._test_get_iso_disk_size(
-            media_type="fixed",
-            value=0, iso_id='CD001')
-
-    def test_test_get_iso_disk_size_other_id(self):
-        self._test_get_iso_disk_size(
-            media_type="fixed",
-            value=100, iso_id='other id')
-
-    def test_write_iso_file(self):
-        mock_buff = mock.MagicMock()
-        mock_geom = mock.MagicMock()
-        mock_geom.BytesPerSector = 2
+    def test_raw_disk_get_id(self):
+        self._test_raw_disk_get_id(serial_number='fake serial')
 
-        mock_phys_disk = mock.MagicMock()
-        mock_phys_disk.read.return_value = (mock_buff, 10)
+    def test_raw_disk_get_id_no_serial_number(self):
+        self._test_raw_disk_get_id(serial_number=None)
 
-        fake_path = os.path.join('fake', 'path')
+    def test_raw_disk_get_id_exception(self):
+        self._test_raw_disk_get_id(
+            serial_number=cbinit_exception.CloudbaseInitException())
 
-        mock_phys_disk.get_geometry.return_value = mock_geom
-        with mock.patch('six.moves.builtins.open', mock.mock_open(),
-                        create=True) as f:
-            self._config_manager._write_iso_file(mock_phys_disk, fake_path,
-                                                 10)
-            f().write.assert_called_once_with(mock_buff)
-        mock_phys_disk.seek.assert_called_once_with(0)
-        mock_phys_disk.read.assert_called_once_with(10)
-
-    @mock.patch('os.makedirs')
-    def _test_extract_iso_files(self, mock_makedirs, exit_code):
-        fake_path = os.path.join('fake', 'path')
-        fake_target_path = os.path.join(fake_path, 'target')
-        args = [CONF.bsdtar_path, '-xf', fake_path, '-C', fake_target_path]
-        mock_os_utils = mock.MagicMock()
-
-        mock_os_utils.execute_process.return_value = ('fake out', 'fake err',
-                                                      exit_code)
-        if exit_code:
-            self.assertRaises(exception.CloudbaseInitException,
-                              self._config_manager._extract_iso_files,
-                              mock_os_utils, fake_path, fake_target_path)
-        else:
-            self._config_manager._extract_iso_files(mock_os_utils, fake_path,
-                                                    fake_target_path)
+    def test_raw_disk_read_at(self):
+        image = test_iso9660.build_iso_image({'fake': b'fake'})
+        raw_disk = self.windows._RawDisk(self._get_fake_phys_disk(image))
 
-        mock_os_utils.execute_process.assert_called_once_with(args, False)
-        mock_makedirs.assert_called_once_with(fake_target_path)
-
-    def test_extract_iso_files(self):
-        self._test_extract_iso_files(exit_code=None)
-
-    def test_extract_iso_files_exception(self):
-        self._test_extract_iso_files(exit_code=1)
+        self.assertEqual(b'CD001', raw_disk.read_at(0x8001, 5))
+        raw_disk.close()
 
+    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.diskscan.'
+                'ConfigDriveScanner')
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._get_iso_disk_size')
-    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._write_iso_file')
-    def _test_extract_iso_disk_file(self, mock_write_iso_file,
-                                    mock_get_iso_disk_size, exception):
-
+                'WindowsConfigDriveManager._extract_config_drive_files')
+    def _test_extract_iso_disk_files(self, mock_extract_config_drive_files,
+                                     mock_scanner_class, found_paths,
+                                     extracted, exception=False,
+                                     scan_cache=True):
         mock_osutils = mock.MagicMock()
         fake_path = os.path.join('fake', 'path')
-        fake_path_physical = os.path.join(fake_path, 'physical')
-
-        mock_osutils.get_physical_disks.return_value = [fake_path_physical]
-        mock_get_iso_disk_size.return_value = 'fake iso size'
+        mock_scan = mock_scanner_class.return_value.scan.return_value
+        mock_scan.__iter__.return_value = iter(found_paths)
+        mock_extract_config_drive_files.side_effect = extracted
 
         mock_PhysDisk = self.windows.physical_disk.PhysicalDisk.return_value
-
         if exception:
-            mock_PhysDisk.open.side_effect = [Exception]
-
-        response = self._config_manager._extract_iso_disk_file(
-            osutils=mock_osutils, iso_file_path=fake_path)
-
+            mock_PhysDisk.open.side_effect = [Exception] * len(found_paths)
+
+        with mock.patch.object(self.windows.CONF, 'config_drive_scan_cache',
+                               scan_cache):
+            response = self._config_manager._extract_iso_disk_files(
+                osutils=mock_osutils, target_path=fake_path)
+
+        (open_disk, negative_cache) = mock_scanner_class.call_args[0]
+        self.assertEqual(self._config_manager._open_raw_disk, open_disk)
+        if scan_cache:
+            self.assertIsInstance(negative_cache,
+                                  self.windows.diskscan.NegativeCache)
+        else:
+            self.assertIsNone(negative_cache)
+        mock_scanner_class.return_value.scan.assert_called_once_with(
+            mock_osutils.get_physical_disks.return_value)
+        mock_scan.close.assert_called_once_with()
+
+        self.assertEqual(
+            [mock.call(path) for path in found_paths[:len(extracted)]],
+            self.windows.physical_disk.PhysicalDisk.call_args_list)
         if not exception:
-            mock_get_iso_disk_size.assert_called_once_with(
-                mock_PhysDisk)
-            mock_write_iso_file.assert_called_once_with(
-                mock_PhysDisk, fake_path, 'fake iso size')
-
-            self.windows.physical_disk.PhysicalDisk.assert_called_once_with(
-                fake_path_physical)
-            mock_osutils.get_physical_disks.assert_called_once_with()
+            self.assertEqual(
+                [mock.call(mock_PhysDisk, fake_path)] * len(extracted),
+                mock_extract_config_drive_files.call_args_list)
+        self.assertEqual(len(extracted), mock_PhysDisk.close.call_count)
+        self.assertEqual(not exception and any(extracted), response)
 
-            mock_PhysDisk.open.assert_called_once_with()
-            mock_PhysDisk.close.assert_called_once_with()
+    def test_extract_iso_disk_files_disk_found(self):
+        self._test_extract_iso_disk_files(found_paths=['disk0', 'disk1'],
+                                          extracted=[True])
 
-            self.assertTrue(response)
-        else:
-            self.assertFalse(response)
+    def test_extract_iso_disk_files_other_iso_disk(self):
+        self._test_extract_iso_disk_files(found_paths=['disk0', 'disk1'],
+                                          extracted=[False, True])
 
-    def test_extract_iso_disk_file_disk_found(self):
-        self._test_extract_iso_disk_file(exception=False)
+    def test_extract_iso_disk_files_disk_not_found(self):
+        self._test_extract_iso_disk_files(found_paths=[], extracted=[],
+                                          scan_cache=False)
 
-    def test_extract_iso_disk_file_disk_not_found(self):
-        self._test_extract_iso_disk_file(exception=True)
+    def test_extract_iso_disk_files_exception(self):
+        self._test_extract_iso_disk_files(found_paths=['disk0'],
+                                          extracted=[True], exception=True)
 
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
                 'WindowsConfigDriveManager._get_conf_drive_from_raw_hdd')
@@ -280,6 +254,31 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
             fake_path)
         self.assertTrue(response)
 
+    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
+                'WindowsConfigDriveManager._get_conf_drive_from_raw_hdd')
+    def test_get_config_drive_files_bsdtar_path(
+            self, mock_get_conf_drive_from_raw_hdd):
+        mock_get_conf_drive_from_raw_hdd.return_value = True
+
+        with mock.patch.object(self.windows.CONF, 'bsdtar_path',
+                               'bsdtar.exe'):
+            with mock.patch.object(self.windows.LOG,
+                                   'warning') as mock_warning:
+                response = self._config_manager.get_config_drive_files(
+                    target_path=mock.sentinel.target_path)
+
+        self.assertTrue(response)
+        self.assertEqual(1, mock_warning.call_count)
+
+    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
+                'WindowsConfigDriveManager.'
+                '_get_config_drive_cdrom_mount_point')
+    def test_get_config_drive_mount_point(self, mock_get_cdrom_mount_point):
+        response = self._config_manager.get_config_drive_mount_point()
+
+        mock_get_cdrom_mount_point.assert_called_once_with()
+        self.assertEqual(mock_get_cdrom_mount_point.return_value, response)
+
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
                 'WindowsConfigDriveManager.'
                 '_get_config_drive_cdrom_mount_point')
@@ -309,43 +308,30 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
         self._test_get_conf_drive_from_cdrom_drive(
             mount_point=None)
 
-    @mock.patch('os.remove')
+    @mock.patch('shutil.rmtree')
     @mock.patch('os.path.exists')
-    @mock.patch('tempfile.gettempdir')
-    @mock.patch('uuid.uuid4')
-    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._extract_iso_disk_file')
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._extract_iso_files')
+                'WindowsConfigDriveManager._extract_iso_disk_files')
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
     def _test_get_conf_drive_from_raw_hdd(self, mock_get_os_utils,
-                                          mock_extract_iso_files,
-                                          mock_extract_iso_disk_file,
-                                          mock_uuid4, mock_gettempdir,
-                                          mock_exists, mock_remove,
+                                          mock_extract_iso_disk_files,
+                                          mock_exists, mock_rmtree,
                                           found_drive):
         fake_target_path = os.path.join('fake', 'path')
-        fake_iso_path = os.path.join('fake_dir', 'fake_id' + '.iso')
-
-        mock_uuid4.return_value = 'fake_id'
-        mock_gettempdir.return_value = 'fake_dir'
-        mock_extract_iso_disk_file.return_value = found_drive
-        mock_exists.return_value = found_drive
+        mock_extract_iso_disk_files.return_value = found_drive
+        mock_exists.return_value = True
 
         response = self._config_manager._get_conf_drive_from_raw_hdd(
             fake_target_path)
 
         mock_get_os_utils.assert_called_once_with()
-        mock_gettempdir.assert_called_once_with()
-        mock_extract_iso_disk_file.assert_called_once_with(
-            mock_get_os_utils(), fake_iso_path)
+        mock_extract_iso_disk_files.assert_called_once_with(
+            mock_get_os_utils(), fake_target_path)
         if found_drive:
-            mock_extract_iso_files.assert_called_once_with(
-                mock_get_os_utils(), fake_iso_path, fake_target_path)
-            mock_exists.assert_called_once_with(fake_iso_path)
-            mock_remove.assert_called_once_with(fake_iso_path)
+            self.assertFalse(mock_rmtree.called)
             self.assertTrue(response)
         else:
+            mock_rmtree.assert_called_once_with(fake_target_path, True)
             self.assertFalse(response)
 
     def test_get_conf_drive_from_raw_hdd_found_drive(self):
@@ -57,6 +57,96 @@ class BaseOpenStackServiceTest(unittest.TestCase):
         mock_get_cache_data.assert_called_with(path)
         self.assertEqual({"fake": "data"}, response)
 
+    @mock.patch("cloudbaseinit.metadata.services.baseopenstackservice"
+                ".BaseOpenStackService._get_cache_data")
+    def test_get_meta_data_parsed_once(self, mock_get_cache_data):
+        mock_get_cache_data.return_value = b'{"fake": "data"}'
+        self._service._get_meta_data()
+        response = self._service._get_meta_data()
+        path = posixpath.join('openstack', 'latest', 'meta_data.json')
+        mock_get_cache_data.assert_called_once_with(path)
+        self.assertEqual({"fake": "data"}, response)
+
+    @mock.patch("cloudbaseinit.metadata.services.baseopenstackservice"
+                ".BaseOpenStackService._get_data")
+    def test_get_cache_data_not_existing(self, mock_get_data):
+        mock_get_data.side_effect = base.NotExistingMetadataException
+        for i in range(2):
+            self.assertRaises(base.NotExistingMetadataException,
+                              self._service._get_cache_data, 'fake path')
+        mock_get_data.assert_called_once_with('fake path')
+
+    @mock.patch("cloudbaseinit.metadata.services.baseopenstackservice"
+                ".BaseOpenStackService._get_data")
+    def test_get_stats(self, mock_get_data):
+        mock_get_data.side_effect = [b'fake data',
+                                     base.NotExistingMetadataException]
+        self._service._get_cache_data('fake path')
+        self._service._get_cache_data('fake path')
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._service._get_cache_data, 'fake path 2')
+        self.assertEqual({'requests': 2, 'bytes': 9},
+                         self._service.get_stats())
+
+    def test_get_referenced_content_paths(self):
+        meta_data = {'network_config': {'content_path': 'content/0000'},
+                     'files': [{'path': 'C:\\fake',
+                                'content_path': '/content/0001'},
+                               {'path': 'C:\\fake2',
+                                'content_path': '/content/0000'}]}
+        response = self._service._get_referenced_content_paths(meta_data)
+        self.assertEqual(['openstack/content/0000',
+                          'openstack/content/0001'], response)
+
+    @mock.patch("cloudbaseinit.metadata.services.baseopenstackservice"
+                ".BaseOpenStackService._get_data")
+    def _test_prefetch_metadata(self, mock_get_data, parallel):
+        data = {
+            'openstack/latest/meta_data.json':
+            b'{"uuid": "fake id", "files": [{"content_path": "/content/0"}]}',
+            'openstack/latest/user_data': b'fake user data',
+            'openstack/content/0': b'fake content',
+        }
+
+        def fake_get_data(path):
+            if path not in data:
+                raise base.NotExistingMetadataException()
+            return data[path]
+
+        mock_get_data.side_effect = fake_get_data
+        self._service._parallel_prefetch = parallel
+
+        self._service._prefetch_metadata()
+        self.assertEqual(4, mock_get_data.call_count)
+
+        self.assertEqual('fake id', self._service.get_instance_id())
+        self.assertEqual(b'fake user data', self._service.get_user_data())
+        self.assertEqual(b'fake content', self._service.get_content('0'))
+        self.assertEqual(4, mock_get_data.call_count)
+
+    def test_prefetch_metadata(self):
+        self._test_prefetch_metadata(parallel=False)
+
+    def test_prefetch_metadata_parallel(self):
+        self._test_prefetch_metadata(parallel=True)
+
+    @mock.patch("cloudbaseinit.metadata.services.baseopenstackservice"
+                ".BaseOpenStackService._prefetch_paths")
+    def test_prefetch_metadata_disabled(self, mock_prefetch_paths):
+        CONF.set_override('metadata_prefetch', False)
+        try:
+            self._service._prefetch_metadata()
+        finally:
+            CONF.clear_override('metadata_prefetch')
+        self.assertFalse(mock_prefetch_paths.called)
+
+    @mock.patch("cloudbaseinit.metadata.services.baseopenstackservice"
+                ".BaseOpenStackService._prefetch_paths")
+    def test_prefetch_metadata_service_disabled(self, mock_prefetch_paths):
+        self._service.set_prefetch(False)
+        self._service._prefetch_metadata()
+        self.assertFalse(mock_prefetch_paths.called)
+
     @mock.patch("cloudbaseinit.metadata.services.baseopenstackservice"
                 ".BaseOpenStackService._get_meta_data")
     def test_get_instance_id(self, mock_get_meta_data):
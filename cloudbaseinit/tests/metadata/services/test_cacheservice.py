@@ -0,0 +1,318 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import mock
+import unittest
+
+from oslo.config import cfg
+
+from cloudbaseinit import exception
+from cloudbaseinit.metadata.services import base
+from cloudbaseinit.metadata.services import baseopenstackservice
+from cloudbaseinit.metadata.services import cacheservice
+
+CONF = cfg.CONF
+
+
+class FakeConfigOSUtils(object):
+    def __init__(self):
+        self.config = {}
+
+    def set_config_value(self, name, value, section=None):
+        self.config[(section, name)] = value
+
+    def get_config_value(self, name, section=None):
+        return self.config.get((section, name))
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._osutils = FakeConfigOSUtils()
+        self._service = baseopenstackservice.BaseOpenStackService()
+        self._service._cache = {
+            'openstack/latest/meta_data.json':
+            b'{"uuid": "fake id", "hostname": "fake host"}'}
+
+    def _get_snapshot(self, instance_id='fake id'):
+        return json.loads(self._osutils.get_config_value(
+            cacheservice._METADATA_CACHE_NAME,
+            instance_id + '/' + cacheservice._METADATA_CACHE_SECTION))
+
+    def _set_snapshot(self, snapshot):
+        self._osutils.set_config_value(
+            cacheservice._METADATA_CACHE_NAME, json.dumps(snapshot),
+            'fake id/' + cacheservice._METADATA_CACHE_SECTION)
+
+    def test_save_and_load_metadata_cache(self):
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+        snapshot = cacheservice.load_metadata_cache(self._osutils,
+                                                    'fake id')
+
+        self.assertEqual('fake id', snapshot['instance_id'])
+        self.assertEqual('cloudbaseinit.metadata.services.'
+                         'baseopenstackservice.BaseOpenStackService',
+                         snapshot['service'])
+        self.assertEqual(self._service._cache, snapshot['documents'])
+        self.assertEqual(set(), snapshot['not_existing'])
+
+    def test_save_metadata_cache_index(self):
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+
+        self.assertEqual(
+            {'instance_id': 'fake id',
+             'service': 'cloudbaseinit.metadata.services.'
+             'baseopenstackservice.BaseOpenStackService'},
+            cacheservice.get_metadata_cache_index(self._osutils))
+        self.assertIsNone(cacheservice.load_metadata_cache(self._osutils,
+                                                           'other id'))
+
+    def test_save_metadata_cache_other_instance(self):
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'other id')
+
+        self.assertIsNone(cacheservice.load_metadata_cache(self._osutils,
+                                                           'fake id'))
+        self.assertEqual('other id', cacheservice.get_metadata_cache_index(
+            self._osutils)['instance_id'])
+
+    def test_save_metadata_cache_max_document_size(self):
+        self._service._cache['openstack/latest/user_data'] = b'x' * 101
+
+        with mock.patch.object(CONF, 'metadata_cache_max_document_size',
+                               100):
+            cacheservice.save_metadata_cache(self._osutils, self._service,
+                                             'fake id')
+        snapshot = cacheservice.load_metadata_cache(self._osutils,
+                                                    'fake id')
+
+        self.assertEqual(['openstack/latest/meta_data.json'],
+                         list(snapshot['documents']))
+        self.assertEqual(set(), snapshot['not_existing'])
+
+    def test_save_metadata_cache_not_existing(self):
+        self._service._not_existing_cache = set(['fake path'])
+
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+        snapshot = cacheservice.load_metadata_cache(self._osutils,
+                                                    'fake id')
+
+        self.assertEqual(set(['fake path']), snapshot['not_existing'])
+
+    def test_save_metadata_cache_credentials(self):
+        self._service._cache = {
+            'openstack/latest/meta_data.json':
+            b'{"uuid": "fake id", "admin_pass": "fake pass", '
+            b'"meta": {"admin_pass": "fake pass", "key": "value"}}',
+            'openstack/latest/user_data': b'admin_pass'}
+
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+        snapshot = cacheservice.load_metadata_cache(self._osutils,
+                                                    'fake id')
+
+        self.assertNotIn('fake pass', json.dumps(self._get_snapshot()))
+        documents = snapshot['documents']
+        self.assertEqual(
+            {'uuid': 'fake id', 'meta': {'key': 'value'}},
+            json.loads(documents['openstack/latest/meta_data.json'].decode(
+                'utf-8')))
+        self.assertEqual(b'admin_pass',
+                         documents['openstack/latest/user_data'])
+
+    def test_save_metadata_cache_disabled(self):
+        CONF.set_override('metadata_cache_ttl', 0)
+        try:
+            cacheservice.save_metadata_cache(self._osutils, self._service,
+                                             'fake id')
+        finally:
+            CONF.clear_override('metadata_cache_ttl')
+        self.assertEqual({}, self._osutils.config)
+
+    def test_load_metadata_cache_stale(self):
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+        snapshot = self._get_snapshot()
+        snapshot['timestamp'] -= CONF.metadata_cache_ttl + 1
+        self._set_snapshot(snapshot)
+
+        self.assertIsNone(cacheservice.load_metadata_cache(self._osutils,
+                                                           'fake id'))
+
+    def test_load_metadata_cache_checksum_mismatch(self):
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+        snapshot = self._get_snapshot()
+        for document in snapshot['documents'].values():
+            document['sha256'] = 'fake checksum'
+        self._set_snapshot(snapshot)
+
+        self.assertIsNone(cacheservice.load_metadata_cache(self._osutils,
+                                                           'fake id'))
+
+    def test_load_metadata_cache_invalid(self):
+        self._osutils.set_config_value(
+            cacheservice._METADATA_CACHE_NAME, 'fake data',
+            'fake id/' + cacheservice._METADATA_CACHE_SECTION)
+        self.assertIsNone(cacheservice.load_metadata_cache(self._osutils,
+                                                           'fake id'))
+
+    def test_clear_metadata_cache(self):
+        cacheservice.save_metadata_cache(self._osutils, self._service,
+                                         'fake id')
+        cacheservice.clear_metadata_cache(self._osutils)
+        self.assertIsNone(cacheservice.load_metadata_cache(self._osutils,
+                                                           'fake id'))
+        self.assertIsNone(
+            cacheservice.get_metadata_cache_index(self._osutils))
+
+
+class CachedMetadataServiceTest(unittest.TestCase):
+    def setUp(self):
+        self._osutils = FakeConfigOSUtils()
+        service = baseopenstackservice.BaseOpenStackService()
+        service._cache = {
+            'openstack/latest/meta_data.json':
+            b'{"uuid": "fake id", "hostname": "fake host"}'}
+        cacheservice.save_metadata_cache(self._osutils, service, 'fake id')
+        self._service = cacheservice.CachedMetadataService()
+
+        self._load_service_patcher = mock.patch(
+            'cloudbaseinit.metadata.services.cacheservice._load_service')
+        self._mock_load_service = self._load_service_patcher.start()
+        self._online_service = self._mock_load_service.return_value
+        self._online_service.get_instance_id.return_value = 'fake id'
+
+    def tearDown(self):
+        self._load_service_patcher.stop()
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_load(self, mock_get_os_utils):
+        mock_get_os_utils.return_value = self._osutils
+
+        self.assertTrue(self._service.load())
+        self.assertEqual('fake id', self._service.get_instance_id())
+        self.assertEqual('fake host', self._service.get_host_name())
+        self.assertEqual('BaseOpenStackService (cached)',
+                         self._service.get_name())
+        self._mock_load_service.assert_called_once_with(
+            'cloudbaseinit.metadata.services.baseopenstackservice.'
+            'BaseOpenStackService')
+        self.assertFalse(self._online_service.cleanup.called)
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_load_instance_id_changed(self, mock_get_os_utils):
+        mock_get_os_utils.return_value = self._osutils
+        self._online_service.get_instance_id.return_value = 'other id'
+
+        self.assertFalse(self._service.load())
+        self._online_service.cleanup.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_load_service_not_available(self, mock_get_os_utils):
+        mock_get_os_utils.return_value = self._osutils
+        self._mock_load_service.side_effect = Exception('fake error')
+
+        self.assertFalse(self._service.load())
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_get_data_not_existing(self, mock_get_os_utils):
+        mock_get_os_utils.return_value = self._osutils
+        service = baseopenstackservice.BaseOpenStackService()
+        service._cache = {
+            'openstack/latest/meta_data.json': b'{"uuid": "fake id"}'}
+        service._not_existing_cache = set(['openstack/latest/user_data'])
+        cacheservice.save_metadata_cache(self._osutils, service, 'fake id')
+
+        self._service.load()
+        with mock.patch.object(self._service,
+                               '_get_online_service') as mock_get_online:
+            self.assertRaises(base.NotExistingMetadataException,
+                              self._service.get_user_data)
+        self.assertFalse(mock_get_online.called)
+        self.assertEqual(['openstack/latest/user_data'],
+                         self._service.get_not_existing_data())
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_get_admin_password(self, mock_get_os_utils):
+        mock_get_os_utils.return_value = self._osutils
+        mock_online_service = mock.MagicMock()
+
+        self._service.load()
+        self._service._online_service = mock_online_service
+        response = self._service.get_admin_password()
+
+        self.assertEqual(mock_online_service.get_admin_password.return_value,
+                         response)
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_load_no_cache(self, mock_get_os_utils):
+        mock_get_os_utils.return_value = FakeConfigOSUtils()
+        self.assertFalse(self._service.load())
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_get_data_not_cached(self, mock_get_os_utils):
+        mock_get_os_utils.return_value = self._osutils
+        mock_online_service = mock.MagicMock()
+        mock_online_service._get_cache_data.return_value = b'fake user data'
+
+        self._service.load()
+        self._service._online_service = mock_online_service
+        response = self._service.get_user_data()
+
+        mock_online_service._get_cache_data.assert_called_once_with(
+            'openstack/latest/user_data')
+        self.assertEqual(b'fake user data', response)
+        self.assertIn('openstack/latest/user_data',
+                      self._service.get_cached_data())
+
+        self._service.cleanup()
+        mock_online_service.cleanup.assert_called_once_with()
+
+    def test_get_online_service(self):
+        self._service._service_class_path = 'fake.Service'
+
+        response = self._service._get_online_service()
+
+        self._mock_load_service.assert_called_once_with('fake.Service')
+        self.assertEqual(self._online_service, response)
+
+
+class LoadServiceTest(unittest.TestCase):
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def _test_load_service(self, mock_load_class, loaded):
+        mock_service = mock_load_class.return_value.return_value
+        mock_service.load.return_value = loaded
+
+        if not loaded:
+            self.assertRaises(exception.CloudbaseInitException,
+                              cacheservice._load_service, 'fake.Service')
+        else:
+            self.assertEqual(mock_service,
+                             cacheservice._load_service('fake.Service'))
+
+        mock_load_class.assert_called_once_with('fake.Service')
+        mock_service.set_prefetch.assert_called_once_with(False)
+        mock_service.load.assert_called_once_with()
+
+    def test_load_service(self):
+        self._test_load_service(loaded=True)
+
+    def test_load_service_not_available(self):
+        self._test_load_service(loaded=False)
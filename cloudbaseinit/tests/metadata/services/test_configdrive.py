@@ -49,26 +49,56 @@ class ConfigDriveServiceTest(unittest.TestCase):
     def tearDown(self):
         self._module_patcher.stop()
 
+    @mock.patch('cloudbaseinit.metadata.services.configdrive.'
+                'ConfigDriveService._prefetch_metadata')
     @mock.patch('tempfile.gettempdir')
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.factory.'
                 'get_config_drive_manager')
-    def test_load(self, mock_get_config_drive_manager,
-                  mock_gettempdir):
+    def _test_load(self, mock_get_config_drive_manager,
+                   mock_gettempdir, mock_prefetch_metadata, in_place,
+                   files_found=True, mount_point=None):
         mock_manager = mock.MagicMock()
-        mock_manager.get_config_drive_files.return_value = True
+        mock_manager.get_config_drive_files.return_value = files_found
+        mock_manager.get_config_drive_mount_point.return_value = mount_point
         mock_get_config_drive_manager.return_value = mock_manager
         mock_gettempdir.return_value = 'fake'
         uuid.uuid4 = mock.MagicMock(return_value='fake_id')
         fake_path = os.path.join('fake', str('fake_id'))
 
-        response = self._config_drive.load()
+        with mock.patch.object(CONF, 'config_drive_cdrom_in_place',
+                               in_place):
+            response = self._config_drive.load()
 
         mock_gettempdir.assert_called_once_with()
         mock_get_config_drive_manager.assert_called_once_with()
         mock_manager.get_config_drive_files.assert_called_once_with(
-            fake_path, CONF.config_drive_raw_hhd, CONF.config_drive_cdrom)
-        self.assertTrue(response)
-        self.assertEqual(fake_path, self._config_drive._metadata_path)
+            fake_path, CONF.config_drive_raw_hhd,
+            CONF.config_drive_cdrom and not in_place)
+        if files_found:
+            self.assertFalse(mock_manager.get_config_drive_mount_point.called)
+            self.assertEqual(fake_path, self._config_drive._metadata_path)
+            self.assertTrue(self._config_drive._metadata_path_is_copy)
+        else:
+            mock_manager.get_config_drive_mount_point.assert_called_once_with()
+            self.assertEqual(mount_point, self._config_drive._metadata_path)
+            self.assertFalse(self._config_drive._metadata_path_is_copy)
+
+        found = files_found or mount_point is not None
+        self.assertEqual(found, response)
+        self.assertEqual(found, mock_prefetch_metadata.called)
+
+    def test_load(self):
+        self._test_load(in_place=False)
+
+    def test_load_in_place_raw_hhd(self):
+        self._test_load(in_place=True)
+
+    def test_load_in_place_cdrom(self):
+        self._test_load(in_place=True, files_found=False,
+                        mount_point='fake mount point')
+
+    def test_load_in_place_not_found(self):
+        self._test_load(in_place=True, files_found=False)
 
     @mock.patch('os.path.normpath')
     @mock.patch('os.path.join')
@@ -82,8 +112,19 @@ class ConfigDriveServiceTest(unittest.TestCase):
                 self._config_drive._metadata_path, fake_path)
 
     @mock.patch('shutil.rmtree')
-    def test_cleanup(self, mock_rmtree):
+    def _test_cleanup(self, mock_rmtree, is_copy):
         fake_path = os.path.join('fake', 'path')
         self._config_drive._metadata_path = fake_path
+        self._config_drive._metadata_path_is_copy = is_copy
         self._config_drive.cleanup()
         self.assertEqual(None, self._config_drive._metadata_path)
+        if is_copy:
+            mock_rmtree.assert_called_once_with(fake_path, True)
+        else:
+            self.assertFalse(mock_rmtree.called)
+
+    def test_cleanup(self):
+        self._test_cleanup(is_copy=True)
+
+    def test_cleanup_in_place(self):
+        self._test_cleanup(is_copy=False)
@@ -53,7 +53,7 @@ class EC2ServiceTest(unittest.TestCase):
     def test_load_exception(self):
         self._test_load(side_effect=Exception)
 
-    @mock.patch('six.moves.urllib.request.urlopen')
+    @mock.patch('cloudbaseinit.metadata.services.httpclient.urlopen')
     def _test_get_response(self, mock_urlopen, ret_value):
         req = mock.MagicMock()
         mock_urlopen.side_effect = [ret_value]
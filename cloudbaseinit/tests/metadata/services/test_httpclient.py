@@ -0,0 +1,163 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import unittest
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves.urllib import error
+from six.moves.urllib import request
+
+from cloudbaseinit.metadata.services import httpclient
+
+
+class _FakeMetadataHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _send(self, code, data, location=None):
+        self.send_response(code)
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/missing':
+            self._send(404, b'')
+        elif self.path.startswith('/redirect/'):
+            self._send(302, b'fake redirect',
+                       self.path[len('/redirect'):])
+        elif self.path == '/loop':
+            self._send(301, b'', '/loop')
+        else:
+            self._send(200, self.path.encode())
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.server.posted.append(self.rfile.read(length))
+        if self.path.startswith('/redirect/'):
+            self._send(307, b'', self.path[len('/redirect'):])
+        else:
+            self._send(200, b'')
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakeMetadataServer(socketserver.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           _FakeMetadataHandler)
+        self.connections = 0
+        self.posted = []
+
+    def process_request(self, req, client_address):
+        self.connections += 1
+        socketserver.ThreadingMixIn.process_request(self, req,
+                                                    client_address)
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self._server = _FakeMetadataServer()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._url = 'http://127.0.0.1:%d/' % self._server.server_address[1]
+
+    def tearDown(self):
+        httpclient.close_connection_pools()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def test_urlopen_reuses_connection(self):
+        for i in range(3):
+            req = request.Request(self._url + 'openstack/%d' % i)
+            response = httpclient.urlopen(req)
+            self.assertEqual(200, response.getcode())
+            self.assertEqual(('/openstack/%d' % i).encode(), response.read())
+        self.assertEqual(1, self._server.connections)
+
+    def test_urlopen_not_found(self):
+        req = request.Request(self._url + 'missing')
+        try:
+            httpclient.urlopen(req)
+            self.fail('HTTPError not raised')
+        except error.HTTPError as ex:
+            self.assertEqual(404, ex.code)
+
+        response = httpclient.urlopen(request.Request(self._url + 'found'))
+        self.assertEqual(b'/found', response.read())
+        self.assertEqual(1, self._server.connections)
+
+    def test_urlopen_post(self):
+        req = request.Request(self._url + 'password', data=b'fake data')
+        response = httpclient.urlopen(req)
+        self.assertEqual(200, response.getcode())
+        self.assertEqual([b'fake data'], self._server.posted)
+
+    def test_urlopen_redirect(self):
+        req = request.Request(self._url + 'redirect/openstack/latest')
+        response = httpclient.urlopen(req)
+
+        self.assertEqual(200, response.getcode())
+        self.assertEqual(b'/openstack/latest', response.read())
+        self.assertEqual(self._url + 'openstack/latest', response.geturl())
+
+    def _test_urlopen_http_error(self, req, code):
+        try:
+            httpclient.urlopen(req)
+            self.fail('HTTPError not raised')
+        except error.HTTPError as ex:
+            self.assertEqual(code, ex.code)
+
+    def test_urlopen_redirect_loop(self):
+        self._test_urlopen_http_error(request.Request(self._url + 'loop'),
+                                      301)
+
+    def test_urlopen_redirect_post(self):
+        req = request.Request(self._url + 'redirect/password',
+                              data=b'fake data')
+        self._test_urlopen_http_error(req, 307)
+        self.assertEqual([b'fake data'], self._server.posted)
+
+    def _drop_idle_connection(self):
+        pool = httpclient.get_connection_pool(
+            'http', '127.0.0.1:%d' % self._server.server_address[1])
+        conn = pool._idle_connections.get_nowait()
+        # Simulate the server closing the idle connection
+        conn.sock.shutdown(2)
+        pool._idle_connections.put(conn)
+
+    def test_urlopen_post_dropped_connection(self):
+        httpclient.urlopen(request.Request(self._url + 'first'))
+        self._drop_idle_connection()
+
+        req = request.Request(self._url + 'password', data=b'fake data')
+        self.assertRaises(Exception, httpclient.urlopen, req)
+        self.assertEqual([], self._server.posted)
+
+    def test_urlopen_reconnects_dropped_connection(self):
+        httpclient.urlopen(request.Request(self._url + 'first'))
+        self._drop_idle_connection()
+
+        response = httpclient.urlopen(request.Request(self._url + 'second'))
+        self.assertEqual(b'/second', response.read())
+        self.assertEqual(2, self._server.connections)
@@ -33,18 +33,22 @@ class HttpServiceTest(unittest.TestCase):
         self._httpservice = httpservice.HttpService()
 
     @mock.patch('cloudbaseinit.utils.network.check_metadata_ip_route')
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._prefetch_metadata')
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
                 '._get_meta_data')
-    def _test_load(self, mock_get_meta_data, mock_check_metadata_ip_route,
-                   side_effect):
+    def _test_load(self, mock_get_meta_data, mock_prefetch_metadata,
+                   mock_check_metadata_ip_route, side_effect):
         mock_get_meta_data.side_effect = [side_effect]
         response = self._httpservice.load()
         mock_check_metadata_ip_route.assert_called_once_with(
             CONF.metadata_base_url)
         mock_get_meta_data.assert_called_once_with()
         if side_effect:
+            self.assertFalse(mock_prefetch_metadata.called)
             self.assertFalse(response)
         else:
+            mock_prefetch_metadata.assert_called_once_with()
             self.assertTrue(response)
 
     def test_load(self):
@@ -53,7 +57,7 @@ class HttpServiceTest(unittest.TestCase):
     def test_load_exception(self):
         self._test_load(side_effect=Exception)
 
-    @mock.patch('six.moves.urllib.request.urlopen')
+    @mock.patch('cloudbaseinit.metadata.services.httpclient.urlopen')
     def _test_get_response(self, mock_urlopen, side_effect):
         mock_req = mock.MagicMock
         if side_effect and side_effect.code is 404:
@@ -60,7 +60,7 @@ class MaaSHttpServiceTest(unittest.TestCase):
     def test_load_no_ip(self):
         self._test_load(ip=None)
 
-    @mock.patch('six.moves.urllib.request.urlopen')
+    @mock.patch('cloudbaseinit.metadata.services.httpclient.urlopen')
     def _test_get_response(self, mock_urlopen, ret_val):
         mock_request = mock.MagicMock()
         mock_urlopen.side_effect = [ret_val]
@@ -17,9 +17,13 @@
 import mock
 import unittest
 
+from oslo.config import cfg
+
 from cloudbaseinit import exception
 from cloudbaseinit.metadata import factory
 
+CONF = cfg.CONF
+
 
 class MetadataServiceFactoryTests(unittest.TestCase):
 
@@ -40,3 +44,68 @@ class MetadataServiceFactoryTests(unittest.TestCase):
     def test_get_metadata_service_exception(self):
         self._test_get_metadata_service(
             ret_value=exception.CloudbaseInitException)
+
+    def _get_fake_services(self, loaded):
+        services = []
+        for ret_value in loaded:
+            service = mock.MagicMock()
+            if isinstance(ret_value, type):
+                service.load.side_effect = ret_value
+            else:
+                service.load.return_value = ret_value
+            services.append(service)
+        return services
+
+    @mock.patch('cloudbaseinit.metadata.factory._ServiceProbe.start',
+                autospec=True)
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def _test_get_metadata_service_parallel(self, mock_load_class, mock_start,
+                                            loaded, expected_index):
+        mock_start.side_effect = factory._ServiceProbe.run
+        services = self._get_fake_services(loaded)
+        mock_load_class.side_effect = [mock.MagicMock(return_value=s)
+                                       for s in services]
+        CONF.set_override('metadata_services',
+                          ['fake.service%d' % i for i in range(len(loaded))])
+        CONF.set_override('metadata_services_parallel_discovery', True)
+        try:
+            if expected_index is None:
+                self.assertRaises(exception.CloudbaseInitException,
+                                  factory.get_metadata_service)
+            else:
+                response = factory.get_metadata_service()
+                self.assertEqual(services[expected_index], response)
+        finally:
+            CONF.clear_override('metadata_services')
+            CONF.clear_override('metadata_services_parallel_discovery')
+
+        for i, service in enumerate(services):
+            service.load.assert_called_once_with()
+            if loaded[i] is True and i != expected_index:
+                service.cleanup.assert_called_once_with()
+            else:
+                self.assertFalse(service.cleanup.called)
+
+    def test_get_metadata_service_parallel(self):
+        self._test_get_metadata_service_parallel(
+            loaded=[False, True, Exception, True], expected_index=1)
+
+    def test_get_metadata_service_parallel_first(self):
+        self._test_get_metadata_service_parallel(
+            loaded=[True, True], expected_index=0)
+
+    def test_get_metadata_service_parallel_none_available(self):
+        self._test_get_metadata_service_parallel(
+            loaded=[False, Exception], expected_index=None)
+
+    def test_service_probe_discard_before_completion(self):
+        service = mock.MagicMock()
+        service.load.return_value = True
+        probe = factory._ServiceProbe('fake.service', service)
+
+        probe.discard()
+        self.assertFalse(service.cleanup.called)
+        probe.run()
+
+        service.cleanup.assert_called_once_with()
+        self.assertTrue(probe.wait())
@@ -0,0 +1,91 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import sys
+import time
+import unittest
+
+from cloudbaseinit.osutils import base
+
+
+class OutputBufferTest(unittest.TestCase):
+
+    def test_append(self):
+        output = base._OutputBuffer(10)
+        for data in (b'0123', b'4567', b'89ab', b'cdefghijklmnop'):
+            output.append(data)
+
+        self.assertEqual(b'ghijklmnop', output.getvalue())
+
+    def test_append_unbounded(self):
+        output = base._OutputBuffer()
+        output.append(b'x' * 100)
+        output.append(b'y')
+
+        self.assertEqual(b'x' * 100 + b'y', output.getvalue())
+
+
+class BaseOSUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._osutils = base.BaseOSUtils()
+
+    def _get_python_args(self, code):
+        return [sys.executable, '-c', code]
+
+    def test_execute_process(self):
+        args = self._get_python_args(
+            'import sys; sys.stdout.write("out\\n"); '
+            'sys.stderr.write("err\\n"); sys.exit(3)')
+
+        (out, err, ret_val) = self._osutils.execute_process(args, False)
+
+        self.assertEqual(b'out', out.rstrip())
+        self.assertEqual(b'err', err.rstrip())
+        self.assertEqual(3, ret_val)
+
+    def test_execute_process_streaming(self):
+        logger = mock.Mock()
+        args = self._get_python_args(
+            'import sys\n'
+            'for i in range(1000): sys.stdout.write("line %d\\n" % i)\n'
+            'sys.stderr.write("err\\n")')
+
+        (out, err, ret_val) = self._osutils.execute_process_streaming(
+            args, False, logger=logger, max_output_size=20)
+
+        self.assertEqual(0, ret_val)
+        self.assertTrue(len(out) <= 20)
+        self.assertTrue(out.rstrip().endswith(b'line 999'))
+        self.assertEqual(b'err', err.rstrip())
+        logger.debug.assert_any_call('stdout: line 0')
+        logger.debug.assert_any_call('stdout: line 999')
+        logger.debug.assert_any_call('stderr: err')
+        self.assertEqual(1001, logger.debug.call_count)
+
+    def test_execute_process_streaming_timeout(self):
+        args = self._get_python_args(
+            'import sys, time\n'
+            'sys.stdout.write("started\\n")\n'
+            'sys.stdout.flush()\n'
+            'time.sleep(30)')
+        start = time.time()
+
+        (out, err, ret_val) = self._osutils.execute_process_streaming(
+            args, False, timeout=0.5)
+
+        self.assertTrue(time.time() - start < 10)
+        self.assertEqual(b'started', out.rstrip())
+        self.assertNotEqual(0, ret_val)
@@ -32,7 +32,7 @@ class OSUtilsFactory(unittest.TestCase):
                 'cloudbaseinit.osutils.windows.WindowsUtils')
         elif fake_name == 'posix':
             mock_load_class.assert_called_with(
-                'cloudbaseinit.osutils.posix.PosixUtils')
+                'cloudbaseinit.osutils.posix.PosixUtil')
 
     def test_get_os_utils_windows(self):
         self._test_get_os_utils(fake_name='nt')
@@ -23,6 +23,7 @@ import unittest
 from oslo.config import cfg
 
 from cloudbaseinit import exception
+from cloudbaseinit.tests.utils import test_routetable
 
 CONF = cfg.CONF
 
@@ -519,6 +520,11 @@ class WindowsUtilsTest(unittest.TestCase):
         conn.return_value.query.assert_called_with(wql)
         self.assertEqual([mock_response.Name], response)
 
+        response = self._winutils.get_network_adapters_mac_addresses()
+        conn.return_value.query.assert_called_with(wql)
+        self.assertEqual([(mock_response.Name, mock_response.MACAddress)],
+                         response)
+
     def test_get_network_adapters(self):
         self._test_get_network_adapters(False)
 
@@ -550,6 +556,7 @@ class WindowsUtilsTest(unittest.TestCase):
             adapter_config.SetGateways.return_value = ret_val2
             adapter_config.SetDNSServerSearchOrder.return_value = ret_val3
             adapter.__len__.return_value = 1
+            self._winutils._ipv4_route_table = mock.sentinel.route_table
 
             if ret_val1[0] > 1:
                 self.assertRaises(
@@ -596,6 +603,7 @@ class WindowsUtilsTest(unittest.TestCase):
                     'SELECT * FROM Win32_NetworkAdapter WHERE MACAddress IS '
                     'NOT NULL AND Name = \'%(adapter_name_san)s\'' %
                     {'adapter_name_san': adapter_name})
+            self.assertIsNone(self._winutils._ipv4_route_table)
 
     def test_set_static_network_config(self):
         adapter = mock.MagicMock()
@@ -644,6 +652,76 @@ class WindowsUtilsTest(unittest.TestCase):
                                              ret_val2=ret_val2,
                                              ret_val3=ret_val3)
 
+    def _get_network_interface(self, addresses, gateway=None,
+                               dns_nameservers=None, mtu=None):
+        interface = mock.Mock()
+        interface.addresses = addresses
+        interface.gateway = gateway
+        interface.dns_nameservers = dns_nameservers or []
+        interface.mtu = mtu
+        return interface
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._set_interface_mtu')
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '.check_os_version')
+    def test_set_static_network_configs(self, mock_check_os_version,
+                                        mock_set_interface_mtu):
+        conn = self._wmi_mock.WMI.return_value
+        adapters = [mock.Mock(Index=index, InterfaceIndex=index + 10)
+                    for index in range(3)]
+        for (index, adapter) in enumerate(adapters):
+            adapter.Name = 'adapter %d' % index
+        adapter_configs = [mock.Mock(Index=index) for index in range(3)]
+        for adapter_config in adapter_configs:
+            adapter_config.EnableStatic.return_value = (0,)
+            adapter_config.SetGateways.return_value = (0,)
+            adapter_config.SetDNSServerSearchOrder.return_value = (1,)
+        conn.query.side_effect = [adapters, list(reversed(adapter_configs))]
+        mock_check_os_version.return_value = True
+        dns_list = ['8.8.8.8']
+        self._winutils._ipv4_route_table = mock.sentinel.route_table
+
+        response = self._winutils.set_static_network_configs([
+            ('adapter 2', self._get_network_interface(
+                [('10.0.0.5', '255.255.255.0'), ('10.0.1.5', self._NETMASK)],
+                self._GATEWAY, dns_list, mtu=1450)),
+            ('adapter 0', self._get_network_interface(
+                [('10.0.2.5', self._NETMASK)])),
+        ])
+
+        self.assertTrue(response)
+        self.assertEqual(2, conn.query.call_count)
+        adapter_configs[2].EnableStatic.assert_called_once_with(
+            ['10.0.0.5', '10.0.1.5'], ['255.255.255.0', self._NETMASK])
+        adapter_configs[2].SetGateways.assert_called_once_with(
+            [self._GATEWAY], [1])
+        adapter_configs[2].SetDNSServerSearchOrder.assert_called_once_with(
+            dns_list)
+        adapter_configs[0].EnableStatic.assert_called_once_with(
+            ['10.0.2.5'], [self._NETMASK])
+        self.assertFalse(adapter_configs[0].SetGateways.called)
+        self.assertFalse(adapter_configs[0].SetDNSServerSearchOrder.called)
+        self.assertFalse(adapter_configs[1].EnableStatic.called)
+        mock_set_interface_mtu.assert_called_once_with(12, 1450)
+        self.assertIsNone(self._winutils._ipv4_route_table)
+
+    def test_set_static_network_configs_adapter_not_found(self):
+        conn = self._wmi_mock.WMI.return_value
+        adapter = mock.Mock(Index=0)
+        adapter.Name = 'adapter 0'
+        adapter_config = mock.Mock(Index=0)
+        conn.query.side_effect = [[adapter], [adapter_config]]
+
+        self.assertRaises(
+            exception.CloudbaseInitException,
+            self._winutils.set_static_network_configs,
+            [('adapter 0', self._get_network_interface(
+                [('10.0.2.5', self._NETMASK)])),
+             ('adapter 1', self._get_network_interface(
+                 [('10.0.3.5', self._NETMASK)]))])
+        self.assertFalse(adapter_config.EnableStatic.called)
+
     def _test_get_config_key_name(self, section):
         response = self._winutils._get_config_key_name(section)
         if section:
@@ -730,6 +808,51 @@ class WindowsUtilsTest(unittest.TestCase):
     def test_get_config_value_type_error(self):
         self._test_get_config_value(None)
 
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_get_config_values(self, mock_get_config_key_name):
+        key = self._winreg_mock.OpenKey.return_value.__enter__.return_value
+        self._winreg_mock.QueryInfoKey.return_value = (0, 2, 0)
+        self._winreg_mock.EnumValue.side_effect = [
+            ('name1', 1, self._winreg_mock.REG_DWORD),
+            ('name2', 'fake', self._winreg_mock.REG_SZ)]
+
+        response = self._winutils.get_config_values(self._SECTION)
+
+        mock_get_config_key_name.assert_called_once_with(self._SECTION)
+        self._winreg_mock.OpenKey.assert_called_once_with(
+            self._winreg_mock.HKEY_LOCAL_MACHINE,
+            mock_get_config_key_name.return_value)
+        self.assertEqual([mock.call(key, 0), mock.call(key, 1)],
+                         self._winreg_mock.EnumValue.call_args_list)
+        self.assertEqual({'name1': 1, 'name2': 'fake'}, response)
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_get_config_values_no_key(self, mock_get_config_key_name):
+        fake_windows_error = type('WindowsError', (Exception,), {})
+        self._winreg_mock.OpenKey.side_effect = [fake_windows_error]
+
+        with mock.patch.object(self.windows_utils, 'WindowsError',
+                               fake_windows_error, create=True):
+            response = self._winutils.get_config_values(self._SECTION)
+
+        self.assertEqual({}, response)
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_config_key_name')
+    def test_set_config_values(self, mock_get_config_key_name):
+        key = self._winreg_mock.CreateKey.return_value.__enter__.return_value
+
+        self._winutils.set_config_values({'name1': 1}, self._SECTION)
+
+        self._winreg_mock.CreateKey.assert_called_once_with(
+            self._winreg_mock.HKEY_LOCAL_MACHINE,
+            mock_get_config_key_name.return_value)
+        self._winreg_mock.SetValueEx.assert_called_once_with(
+            key, 'name1', 0, self._winreg_mock.REG_DWORD, 1)
+        self.assertFalse(self._winreg_mock.FlushKey.called)
+
     @mock.patch('time.sleep')
     def _test_wait_for_boot_completion(self, ret_val, mock_sleep):
         self._winreg_mock.QueryValueEx.side_effect = [ret_val]
@@ -863,48 +986,111 @@ class WindowsUtilsTest(unittest.TestCase):
         mock_sleep.assert_called_with(3)
 
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '._get_ipv4_routing_table')
-    def _test_get_default_gateway(self, mock_get_ipv4_routing_table,
+                '._get_ipv4_forward_table_data')
+    def _test_get_default_gateway(self, mock_get_forward_table_data,
                                   routing_table):
-        mock_get_ipv4_routing_table.return_value = [routing_table]
+        mock_get_forward_table_data.return_value = (
+            test_routetable.build_forward_table([routing_table]))
         response = self._winutils.get_default_gateway()
-        mock_get_ipv4_routing_table.assert_called_once_with()
-        if routing_table[0] == '0.0.0.0'.encode():
+        mock_get_forward_table_data.assert_called_once_with()
+        if routing_table[0] == '0.0.0.0':
             self.assertEqual((routing_table[3], routing_table[2]), response)
         else:
             self.assertEqual((None, None), response)
 
     def test_get_default_gateway(self):
-        routing_table = ['0.0.0.0', '1.1.1.1', self._GATEWAY, '8.8.8.8']
+        routing_table = ('0.0.0.0', '0.0.0.0', self._GATEWAY, 12, 10)
         self._test_get_default_gateway(routing_table=routing_table)
 
     def test_get_default_gateway_error(self):
-        routing_table = ['1.1.1.1', '1.1.1.1', self._GATEWAY, '8.8.8.8']
+        routing_table = ('1.1.1.1', '255.255.255.255', self._GATEWAY, 12, 10)
         self._test_get_default_gateway(routing_table=routing_table)
 
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '._get_ipv4_routing_table')
-    def _test_check_static_route_exists(self, mock_get_ipv4_routing_table,
+                '._get_ipv4_forward_table_data')
+    def _test_check_static_route_exists(self, mock_get_forward_table_data,
                                         routing_table):
-        mock_get_ipv4_routing_table.return_value = [routing_table]
+        mock_get_forward_table_data.return_value = (
+            test_routetable.build_forward_table([routing_table]))
+        self._winutils._ipv4_route_table = mock.sentinel.route_table
 
         response = self._winutils.check_static_route_exists(self._DESTINATION)
 
-        mock_get_ipv4_routing_table.assert_called_once_with()
+        mock_get_forward_table_data.assert_called_once_with()
         if routing_table[0] == self._DESTINATION:
             self.assertTrue(response)
         else:
             self.assertFalse(response)
 
     def test_check_static_route_exists_true(self):
-        routing_table = [self._DESTINATION, '1.1.1.1', self._GATEWAY,
-                         '8.8.8.8']
+        routing_table = (self._DESTINATION, '255.255.255.255', self._GATEWAY,
+                         12, 10)
         self._test_check_static_route_exists(routing_table=routing_table)
 
     def test_check_static_route_exists_false(self):
-        routing_table = ['0.0.0.0', '1.1.1.1', self._GATEWAY, '8.8.8.8']
+        routing_table = ('0.0.0.0', '0.0.0.0', self._GATEWAY, 12, 10)
         self._test_check_static_route_exists(routing_table=routing_table)
 
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_ipv4_forward_table_data')
+    def test_get_ipv4_route_table_cached(self, mock_get_forward_table_data):
+        mock_get_forward_table_data.return_value = (
+            test_routetable.build_forward_table(
+                [('0.0.0.0', '0.0.0.0', self._GATEWAY, 12, 10)]))
+
+        self.assertFalse(
+            self._winutils.check_static_route_exists(self._DESTINATION))
+        self.assertEqual((12, self._GATEWAY),
+                         self._winutils.get_default_gateway())
+        mock_get_forward_table_data.assert_called_once_with()
+
+        self._winutils._invalidate_ipv4_route_table()
+        self._winutils.get_default_gateway()
+        self.assertEqual(2, mock_get_forward_table_data.call_count)
+
+    @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
+                '._get_ipv4_forward_table_data')
+    def test_get_ipv4_route_table_no_data(self, mock_get_forward_table_data):
+        mock_get_forward_table_data.return_value = None
+
+        self.assertEqual((None, None), self._winutils.get_default_gateway())
+
+    def _test_get_ipv4_forward_table_data(self, errors):
+        heap_alloc = self._windll_mock.kernel32.HeapAlloc
+        self._windll_mock.iphlpapi.GetIpForwardTable.side_effect = errors
+        self._ctypes_mock.string_at.return_value = mock.sentinel.data
+
+        if errors[-1] not in (0, self._winutils.ERROR_NO_DATA):
+            self.assertRaises(exception.CloudbaseInitException,
+                              self._winutils._get_ipv4_forward_table_data)
+        else:
+            response = self._winutils._get_ipv4_forward_table_data()
+            if errors[-1]:
+                self.assertIsNone(response)
+            else:
+                self.assertEqual(mock.sentinel.data, response)
+                self._ctypes_mock.string_at.assert_called_once_with(
+                    heap_alloc.return_value,
+                    self._wintypes_mock.ULONG.return_value.value)
+
+        self.assertEqual(len(errors), heap_alloc.call_count)
+        self.assertEqual(len(errors),
+                         self._windll_mock.kernel32.HeapFree.call_count)
+
+    def test_get_ipv4_forward_table_data(self):
+        self._test_get_ipv4_forward_table_data([0])
+
+    def test_get_ipv4_forward_table_data_insufficient_buffer(self):
+        self._test_get_ipv4_forward_table_data(
+            [self._winutils.ERROR_INSUFFICIENT_BUFFER, 0])
+
+    def test_get_ipv4_forward_table_data_no_data(self):
+        self._test_get_ipv4_forward_table_data(
+            [self._winutils.ERROR_NO_DATA])
+
+    def test_get_ipv4_forward_table_data_error(self):
+        self._test_get_ipv4_forward_table_data([5])
+
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils.execute_process')
     def _test_add_static_route(self, mock_execute_process, err):
         next_hop = '10.10.10.10'
@@ -913,6 +1099,7 @@ class WindowsUtilsTest(unittest.TestCase):
         args = ['ROUTE', 'ADD', self._DESTINATION, 'MASK', self._NETMASK,
                 next_hop]
         mock_execute_process.return_value = (None, err, None)
+        self._winutils._ipv4_route_table = mock.sentinel.route_table
 
         if err:
             self.assertRaises(exception.CloudbaseInitException,
@@ -924,6 +1111,7 @@ class WindowsUtilsTest(unittest.TestCase):
             self._winutils.add_static_route(self._DESTINATION, self._NETMASK,
                                             next_hop, interface_index, metric)
             mock_execute_process.assert_called_with(args)
+        self.assertIsNone(self._winutils._ipv4_route_table)
 
     def test_add_static_route(self):
         self._test_add_static_route(err=404)
@@ -1263,8 +1451,8 @@ class WindowsUtilsTest(unittest.TestCase):
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
                 '.get_system32_dir')
     @mock.patch('cloudbaseinit.osutils.windows.WindowsUtils'
-                '.execute_process')
-    def _test_execute_powershell_script(self, mock_execute_process,
+                '.execute_process_streaming')
+    def _test_execute_powershell_script(self, mock_execute_process_streaming,
                                         mock_get_system32_dir,
                                         mock_get_sysnative_dir,
                                         mock_check_sysnative_dir_exists,
@@ -1285,8 +1473,10 @@ class WindowsUtilsTest(unittest.TestCase):
         else:
             mock_get_system32_dir.assert_called_once_with()
 
-        mock_execute_process.assert_called_with(args, False)
-        self.assertEqual(mock_execute_process.return_value, response)
+        mock_execute_process_streaming.assert_called_with(
+            args, False, timeout=None, logger=None)
+        self.assertEqual(mock_execute_process_streaming.return_value,
+                         response)
 
     def test_execute_powershell_script_sysnative(self):
         self._test_execute_powershell_script(ret_val=True)
@@ -28,9 +28,24 @@ class PluginFactoryTests(unittest.TestCase):
 
     @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
     def test_load_plugins(self, mock_load_class):
-        expected = []
-        for path in CONF.plugins:
-            expected.append(mock.call(path))
         response = factory.load_plugins()
-        self.assertEqual(expected, mock_load_class.call_args_list)
-        self.assertTrue(response is not None)
+        self.assertEqual(CONF.plugins, [p.class_path for p in response])
+        self.assertFalse(mock_load_class.called)
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_lazy_plugin(self, mock_load_class):
+        plugin = factory.LazyPlugin('fake.module.FakePlugin')
+
+        self.assertEqual('FakePlugin', plugin.get_name())
+        self.assertFalse(plugin.loaded)
+        self.assertEqual({}, factory.get_import_times([plugin]))
+
+        for i in range(2):
+            response = plugin.execute('fake service', {})
+
+        mock_load_class.assert_called_once_with('fake.module.FakePlugin')
+        fake_plugin = mock_load_class.return_value.return_value
+        self.assertEqual(fake_plugin.execute.return_value, response)
+        self.assertTrue(plugin.loaded)
+        self.assertEqual(['fake.module'],
+                         list(factory.get_import_times([plugin]).keys()))
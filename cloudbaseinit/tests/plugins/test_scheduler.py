@@ -0,0 +1,121 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import unittest
+
+import mock
+
+from cloudbaseinit.plugins import scheduler
+
+
+class PluginSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self._scheduler = scheduler.PluginScheduler(4)
+
+    def _get_plugin(self, name, required=None, provided=None):
+        plugin = mock.MagicMock()
+        plugin.get_name.return_value = name
+        plugin.get_shared_data_dependencies.return_value = (required,
+                                                            provided)
+        return plugin
+
+    def test_get_dependencies(self):
+        plugins = [self._get_plugin('a', [], []),
+                   self._get_plugin('b', [], ['user']),
+                   self._get_plugin('c', ['user'], ['password']),
+                   self._get_plugin('d', [], []),
+                   self._get_plugin('e'),
+                   self._get_plugin('f', ['password'], []),
+                   self._get_plugin('g', [], [])]
+
+        response = self._scheduler.get_dependencies(plugins)
+
+        self.assertEqual([set(), set(), set([1]), set(),
+                          set([0, 1, 2, 3]), set([4]), set([4])], response)
+
+    def test_get_dependencies_provided_key_waits_for_users(self):
+        plugins = [self._get_plugin('a', ['password'], []),
+                   self._get_plugin('b', [], ['password'])]
+
+        response = self._scheduler.get_dependencies(plugins)
+
+        self.assertEqual([set(), set([0])], response)
+
+    def test_execute_order(self):
+        plugins = [self._get_plugin('a', [], ['user']),
+                   self._get_plugin('b', [], []),
+                   self._get_plugin('c', ['user'], []),
+                   self._get_plugin('d')]
+        executed = []
+        lock = threading.Lock()
+
+        def exec_plugin(plugin):
+            with lock:
+                executed.append(plugin.get_name())
+
+        response = self._scheduler.execute(plugins, exec_plugin)
+
+        self.assertFalse(response)
+        self.assertEqual(4, len(executed))
+        self.assertTrue(executed.index('a') < executed.index('c'))
+        self.assertEqual('d', executed[-1])
+
+    def test_execute_concurrently(self):
+        plugins = [self._get_plugin('a', [], []),
+                   self._get_plugin('b', [], [])]
+        barrier = threading.Event()
+        executed = []
+
+        def exec_plugin(plugin):
+            if plugin.get_name() == 'a':
+                # Completes only if 'b' is executed at the same time
+                self.assertTrue(barrier.wait(5))
+            else:
+                barrier.set()
+            executed.append(plugin.get_name())
+
+        self._scheduler.execute(plugins, exec_plugin)
+
+        self.assertEqual(['b', 'a'], executed)
+
+    def _test_execute_reboot(self, stop_on_reboot):
+        plugins = [self._get_plugin('a', [], []),
+                   self._get_plugin('b'),
+                   self._get_plugin('c', [], [])]
+        exec_plugin = mock.Mock(side_effect=[True, None, None])
+
+        response = self._scheduler.execute(plugins, exec_plugin,
+                                           stop_on_reboot)
+
+        self.assertTrue(response)
+        if stop_on_reboot:
+            exec_plugin.assert_called_once_with(plugins[0])
+        else:
+            self.assertEqual(3, exec_plugin.call_count)
+
+    def test_execute_reboot(self):
+        self._test_execute_reboot(stop_on_reboot=True)
+
+    def test_execute_reboot_not_allowed(self):
+        self._test_execute_reboot(stop_on_reboot=False)
+
+    def test_execute_plugin_exception(self):
+        plugins = [self._get_plugin('a'), self._get_plugin('b')]
+        exec_plugin = mock.Mock(side_effect=[Exception('fake'), None])
+
+        response = self._scheduler.execute(plugins, exec_plugin)
+
+        self.assertFalse(response)
+        self.assertEqual(2, exec_plugin.call_count)
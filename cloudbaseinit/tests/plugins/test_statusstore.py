@@ -0,0 +1,96 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from oslo.config import cfg
+
+from cloudbaseinit.osutils import posix
+from cloudbaseinit.plugins import statusstore
+
+CONF = cfg.CONF
+
+
+class PluginStatusStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._config_file_path = os.path.join(self._tmp_dir, 'cloudbase-init',
+                                              'config.json')
+        self._config_patcher = mock.patch.object(CONF, 'config_file_path',
+                                                 self._config_file_path)
+        self._config_patcher.start()
+        self._osutils = posix.PosixUtil()
+
+    def tearDown(self):
+        self._config_patcher.stop()
+        shutil.rmtree(self._tmp_dir)
+
+    def test_flush(self):
+        store = statusstore.PluginStatusStore(self._osutils, 'fake section')
+        self.assertIsNone(store.get_status('fake plugin'))
+        store.set_status('fake plugin', 1)
+        store.set_status('fake plugin 2', 2)
+        self.assertFalse(os.path.exists(self._config_file_path))
+
+        store.flush()
+
+        self.assertEqual({'fake plugin': 1, 'fake plugin 2': 2},
+                         self._osutils.get_config_values('fake section'))
+        store = statusstore.PluginStatusStore(self._osutils, 'fake section')
+        self.assertEqual(2, store.get_status('fake plugin 2'))
+
+    @mock.patch('cloudbaseinit.osutils.posix.PosixUtil.get_config_values')
+    def test_get_status_single_read(self, mock_get_config_values):
+        mock_get_config_values.return_value = {'fake plugin': 1}
+        store = statusstore.PluginStatusStore(self._osutils, 'fake section')
+
+        self.assertEqual(1, store.get_status('fake plugin'))
+        self.assertIsNone(store.get_status('fake plugin 2'))
+
+        mock_get_config_values.assert_called_once_with('fake section')
+
+    def test_get_status_not_batched(self):
+        osutils = mock.MagicMock()
+        osutils.get_config_values.side_effect = NotImplementedError()
+        osutils.get_config_value.return_value = 1
+        store = statusstore.PluginStatusStore(osutils, 'fake section')
+
+        for i in range(2):
+            self.assertEqual(1, store.get_status('fake plugin'))
+
+        osutils.get_config_value.assert_called_once_with('fake plugin',
+                                                         'fake section')
+
+    @mock.patch('cloudbaseinit.osutils.posix.PosixUtil.set_config_values')
+    def test_flush_no_changes(self, mock_set_config_values):
+        store = statusstore.PluginStatusStore(self._osutils, 'fake section')
+        store.get_status('fake plugin')
+        store.flush()
+        self.assertFalse(mock_set_config_values.called)
+
+    def test_posix_config_sections(self):
+        self._osutils.set_config_value('fake name', 'fake value')
+        self._osutils.set_config_value('fake name', 1, 'fake section')
+
+        self.assertEqual('fake value',
+                         self._osutils.get_config_value('fake name'))
+        self.assertEqual(1, self._osutils.get_config_value('fake name',
+                                                           'fake section'))
+        # No temporary files are left behind
+        self.assertEqual(['config.json'], os.listdir(
+            os.path.dirname(self._config_file_path)))
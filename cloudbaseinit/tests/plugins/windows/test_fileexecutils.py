@@ -13,6 +13,7 @@
 #    under the License.
 
 import mock
+import os
 import unittest
 
 from cloudbaseinit.plugins.windows import fileexecutils
@@ -27,25 +28,25 @@ class TestFileExecutilsPlugin(unittest.TestCase):
         mock_part.get_filename.return_value = filename
         mock_get_os_utils.return_value = mock_osutils
         if exception:
-            mock_osutils.execute_process.side_effect = [Exception]
+            mock_osutils.execute_process_streaming.side_effect = [Exception]
         with mock.patch("cloudbaseinit.plugins.windows.userdataplugins."
                         "shellscript.open", mock.mock_open(), create=True):
             response = fileexecutils.exec_file(filename)
         if filename.endswith(".cmd"):
-            mock_osutils.execute_process.assert_called_once_with(
-                [filename], True)
+            mock_osutils.execute_process_streaming.assert_called_once_with(
+                [filename], True, timeout=None, logger=mock.ANY)
         elif filename.endswith(".sh"):
-            mock_osutils.execute_process.assert_called_once_with(
-                ['bash.exe', filename], False)
+            mock_osutils.execute_process_streaming.assert_called_once_with(
+                ['bash.exe', filename], False, timeout=None, logger=mock.ANY)
         elif filename.endswith(".py"):
-            mock_osutils.execute_process.assert_called_once_with(
-                ['python.exe', filename], False)
+            mock_osutils.execute_process_streaming.assert_called_once_with(
+                ['python.exe', filename], False, timeout=None, logger=mock.ANY)
         elif filename.endswith(".exe"):
-            mock_osutils.execute_process.assert_called_once_with(
-                [filename], False)
+            mock_osutils.execute_process_streaming.assert_called_once_with(
+                [filename], False, timeout=None, logger=mock.ANY)
         elif filename.endswith(".ps1"):
             mock_osutils.execute_powershell_script.assert_called_once_with(
-                filename)
+                filename, timeout=None, logger=mock.ANY)
         else:
             self.assertEqual(0, response)
 
@@ -69,3 +70,12 @@ class TestFileExecutilsPlugin(unittest.TestCase):
 
     def test_process_exception(self):
         self._test_exec_file(filename='fake.exe', exception=True)
+
+    @mock.patch('cloudbaseinit.plugins.windows.fileexecutils.LOG')
+    def test_script_output_logger(self, mock_log):
+        logger = fileexecutils._ScriptOutputLogger(
+            os.path.join('fake', 'dir', 'fake.cmd'))
+
+        logger.debug('stdout: fake line')
+
+        mock_log.debug.assert_called_once_with('fake.cmd stdout: fake line')
@@ -14,6 +14,8 @@
 
 import mock
 import os
+import threading
+import time
 import unittest
 
 from cloudbaseinit.plugins import base
@@ -54,5 +56,72 @@ class LocalScriptsPluginTests(unittest.TestCase):
         response = self._localscripts.execute(mock_service, shared_data=None)
 
         mock_get_files_in_dir.assert_called_once_with(CONF.local_scripts_path)
-        mock_exec_file.assert_called_once_with(fake_path)
+        mock_exec_file.assert_called_once_with(fake_path, timeout=None)
         self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+
+    def test_get_groups(self):
+        file_names = ['10-a.cmd', '10-b.ps1', '100-c.cmd', '20-d.cmd',
+                      '_e.cmd', 'f.cmd', '20-g.cmd', '010-h.cmd']
+
+        groups = self._localscripts._get_groups(
+            [os.path.join('fake', f) for f in file_names])
+
+        self.assertEqual([['010-h.cmd', '10-a.cmd', '10-b.ps1'],
+                          ['20-d.cmd', '20-g.cmd'], ['100-c.cmd'],
+                          ['_e.cmd'], ['f.cmd']],
+                         [[os.path.basename(f) for f in group]
+                          for group in groups])
+
+    @mock.patch('cloudbaseinit.plugins.windows.localscripts'
+                '.LocalScriptsPlugin._get_files_in_dir')
+    @mock.patch('cloudbaseinit.plugins.windows.fileexecutils.exec_file')
+    def _test_execute_parallel(self, mock_exec_file, mock_get_files_in_dir,
+                               ret_vals):
+        file_names = ['10-a.cmd', '10-b.cmd', '20-c.cmd', '30-d.cmd']
+        started = []
+        running = []
+        max_running = [0]
+        lock = threading.Lock()
+
+        def exec_file(file_path, timeout):
+            with lock:
+                started.append(os.path.basename(file_path))
+                running.append(file_path)
+                max_running[0] = max(max_running[0], len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(file_path)
+            return ret_vals.get(os.path.basename(file_path), 0)
+
+        mock_exec_file.side_effect = exec_file
+        mock_get_files_in_dir.return_value = [
+            os.path.join('fake', f) for f in file_names]
+
+        with mock.patch.multiple(CONF, local_scripts_path='fake',
+                                 local_scripts_parallel=True,
+                                 local_scripts_timeout=60):
+            response = self._localscripts.execute(mock.MagicMock(), None)
+
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        mock_exec_file.assert_any_call(os.path.join('fake', '10-a.cmd'),
+                                       timeout=60)
+        return (started, max_running[0])
+
+    def test_execute_parallel(self):
+        (started, max_running) = self._test_execute_parallel(ret_vals={})
+
+        self.assertEqual(set(['10-a.cmd', '10-b.cmd']), set(started[:2]))
+        self.assertEqual(['20-c.cmd', '30-d.cmd'], started[2:])
+        self.assertEqual(2, max_running)
+
+    def test_execute_parallel_fail_fast(self):
+        (started, max_running) = self._test_execute_parallel(
+            ret_vals={'20-c.cmd': 1})
+
+        self.assertEqual(['20-c.cmd'], started[2:])
+
+    def test_execute_parallel_reboot_exit_code(self):
+        (started, max_running) = self._test_execute_parallel(
+            ret_vals={'20-c.cmd': 1001})
+
+        self.assertEqual(['20-c.cmd', '30-d.cmd'], started[2:])
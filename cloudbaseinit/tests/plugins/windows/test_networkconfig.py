@@ -15,7 +15,6 @@
 #    under the License.
 
 import mock
-import re
 import unittest
 
 from oslo.config import cfg
@@ -27,6 +26,42 @@ from cloudbaseinit.tests.metadata import fake_json_response
 
 CONF = cfg.CONF
 
+_NETWORK_CONFIG = b"""
+auto lo
+iface lo inet loopback
+
+auto eth0
+iface eth0 inet static
+    address 10.0.0.5
+    netmask 255.255.255.0
+    broadcast 10.0.0.255
+    gateway 10.0.0.1
+    dns-nameservers 8.8.8.8 8.8.4.4
+
+iface eth1 inet static
+    address 10.0.1.5/24
+    mtu 1450
+
+iface eth2 inet dhcp
+"""
+
+_NETWORK_CONFIG_HWADDRESS = b"""
+iface eth0 inet static
+    address 10.0.0.5/24
+    hwaddress ether fa:16:3e:00:00:01
+
+iface eth1 inet static
+    address 10.0.1.5/24
+    hwaddress ether fa:16:3e:00:00:02
+
+iface eth2 inet static
+    address 10.0.2.5/24
+    hwaddress ether fa:16:3e:00:00:99
+
+iface eth3 inet static
+    address 10.0.3.5/24
+"""
+
 
 class NetworkConfigPluginPluginTests(unittest.TestCase):
 
@@ -36,50 +71,86 @@ class NetworkConfigPluginPluginTests(unittest.TestCase):
             '2013-04-04')
 
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
-    def _test_execute(self, mock_get_os_utils, search_result, no_adapters):
-        CONF.set_override('network_adapter', 'fake adapter')
+    def _test_execute(self, mock_get_os_utils, content=_NETWORK_CONFIG,
+                      network_adapter=None, adapters=None):
         mock_service = mock.MagicMock()
         mock_osutils = mock.MagicMock()
-        re.search = mock.MagicMock(return_value=search_result)
         fake_shared_data = 'fake shared data'
         network_config = self.fake_data['network_config']
         mock_service.get_network_config.return_value = network_config
-        mock_service.get_content.return_value = search_result
+        mock_service.get_content.return_value = content
         mock_get_os_utils.return_value = mock_osutils
-        mock_osutils.set_static_network_config.return_value = False
-        if search_result is None:
-            self.assertRaises(exception.CloudbaseInitException,
-                              self._network_plugin.execute,
-                              mock_service, fake_shared_data)
-        elif no_adapters:
-            CONF.set_override('network_adapter', None)
-            mock_osutils.get_network_adapters.return_value = []
-            self.assertRaises(exception.CloudbaseInitException,
-                              self._network_plugin.execute,
-                              mock_service, fake_shared_data)
-
-        else:
+        mock_osutils.get_network_adapters_mac_addresses.return_value = [
+            (name, 'FA:16:3E:00:00:%02X' % index)
+            for (index, name) in enumerate(adapters or [])]
+        mock_osutils.set_static_network_configs.return_value = False
+
+        with mock.patch.object(CONF, 'network_adapter', network_adapter):
             response = self._network_plugin.execute(mock_service,
                                                     fake_shared_data)
 
-            mock_service.get_network_config.assert_called_once_with()
-            mock_service.get_content.assert_called_once_with(
-                network_config['content_path'])
-            mock_osutils.set_static_network_config.assert_called_once_with(
-                'fake adapter', search_result.group('address'),
-                search_result.group('netmask'),
-                search_result.group('broadcast'),
-                search_result.group('gateway'),
-                search_result.group('dnsnameservers').strip().split(' '))
-            self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        mock_service.get_network_config.assert_called_once_with()
+        mock_service.get_content.assert_called_once_with(
+            network_config['content_path'])
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        self.assertEqual(1, mock_osutils.set_static_network_configs.call_count)
+        (network_configs,) = (
+            mock_osutils.set_static_network_configs.call_args[0])
+        return [(adapter_name, interface.name)
+                for (adapter_name, interface) in network_configs]
 
     def test_execute(self):
-        m = mock.MagicMock()
-        self._test_execute(search_result=m, no_adapters=False)
+        network_configs = self._test_execute(
+            adapters=['adapter 1', 'adapter 2', 'adapter 3'])
+
+        self.assertEqual([('adapter 1', 'eth0'), ('adapter 2', 'eth1')],
+                         network_configs)
+
+    def test_execute_network_adapter(self):
+        network_configs = self._test_execute(
+            network_adapter='adapter 2', adapters=['adapter 1', 'adapter 2'])
+
+        self.assertEqual([('adapter 2', 'eth0'), ('adapter 1', 'eth1')],
+                         network_configs)
+
+    def test_execute_fewer_adapters(self):
+        network_configs = self._test_execute(adapters=['adapter 1'])
+
+        self.assertEqual([('adapter 1', 'eth0')], network_configs)
+
+    def test_execute_hwaddress(self):
+        network_configs = self._test_execute(
+            content=_NETWORK_CONFIG_HWADDRESS,
+            adapters=['adapter 0', 'adapter 1', 'adapter 2', 'adapter 3'])
+
+        self.assertEqual([('adapter 1', 'eth0'), ('adapter 2', 'eth1'),
+                          ('adapter 0', 'eth2'), ('adapter 3', 'eth3')],
+                         network_configs)
+
+    def test_execute_hwaddress_network_adapter(self):
+        network_configs = self._test_execute(
+            content=_NETWORK_CONFIG_HWADDRESS, network_adapter='adapter 3',
+            adapters=['adapter 0', 'adapter 1', 'adapter 2', 'adapter 3'])
+
+        self.assertEqual([('adapter 1', 'eth0'), ('adapter 2', 'eth1'),
+                          ('adapter 3', 'eth2'), ('adapter 0', 'eth3')],
+                         network_configs)
+
+    def test_execute_no_network_config(self):
+        mock_service = mock.MagicMock()
+        mock_service.get_network_config.return_value = None
+
+        response = self._network_plugin.execute(mock_service, None)
+
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        self.assertFalse(mock_service.get_content.called)
 
     def test_execute_no_debian(self):
-        self._test_execute(search_result=None, no_adapters=False)
+        self.assertRaises(exception.CloudbaseInitException,
+                          self._test_execute,
+                          content=b'iface eth0 inet dhcp\n',
+                          adapters=['adapter 1'])
 
     def test_execute_no_adapters(self):
-        m = mock.MagicMock()
-        self._test_execute(search_result=m, no_adapters=True)
+        self.assertRaises(exception.CloudbaseInitException,
+                          self._test_execute, adapters=[])
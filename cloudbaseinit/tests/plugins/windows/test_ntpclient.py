@@ -80,30 +80,29 @@ class NTPClientPluginTests(unittest.TestCase):
                                             fail_service_start=True)
 
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
-    @mock.patch('cloudbaseinit.utils.dhcp.get_dhcp_options')
+    @mock.patch('cloudbaseinit.utils.dhcp.get_cached_dhcp_options')
     @mock.patch('socket.inet_ntoa')
     @mock.patch('cloudbaseinit.plugins.windows.ntpclient.NTPClientPlugin.'
                 '_check_w32time_svc_status')
     def _test_execute(self, mock_check_w32time_svc_status, mock_inet_ntoa,
-                      mock_get_dhcp_options, mock_get_os_utils, ntp_data):
+                      mock_get_cached_dhcp_options, mock_get_os_utils,
+                      ntp_data):
         CONF.set_override('ntp_use_dhcp_config', True)
         mock_service = mock.MagicMock()
         mock_osutils = mock.MagicMock()
         mock_options_data = mock.MagicMock()
 
         mock_get_os_utils.return_value = mock_osutils
-        mock_osutils.get_dhcp_hosts_in_use.return_value = [('fake mac address',
-                                                            'fake dhcp host')]
-        mock_get_dhcp_options.return_value = mock_options_data
+        mock_get_cached_dhcp_options.return_value = [
+            ('fake mac address', 'fake dhcp host', mock_options_data)]
         mock_options_data.get.return_value = ntp_data
         mock_inet_ntoa.return_value = 'fake host'
 
         response = self._ntpclient.execute(service=mock_service,
                                            shared_data='fake data')
 
-        mock_osutils.get_dhcp_hosts_in_use.assert_called_once_with()
-        mock_get_dhcp_options.assert_called_once_with(
-            'fake dhcp host', [dhcp.OPTION_NTP_SERVERS])
+        mock_get_cached_dhcp_options.assert_called_once_with(
+            mock_osutils, [dhcp.OPTION_NTP_SERVERS])
         mock_options_data.get.assert_called_once_with(dhcp.OPTION_NTP_SERVERS)
         if ntp_data:
             mock_inet_ntoa.assert_called_once_with(ntp_data[:4])
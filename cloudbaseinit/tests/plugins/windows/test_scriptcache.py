@@ -0,0 +1,109 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import email
+import json
+import mock
+import unittest
+
+from cloudbaseinit.plugins.windows import scriptcache
+
+
+class ScriptCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._osutils = mock.MagicMock()
+        self._config = {}
+        self._osutils.get_config_value.side_effect = (
+            lambda name, section: self._config.get((section, name)))
+        self._osutils.set_config_value.side_effect = (
+            lambda name, value, section: self._config.update(
+                {(section, name): value}))
+        scriptcache.set_instance_id('fake id')
+
+    def tearDown(self):
+        scriptcache.set_instance_id(None)
+
+    def test_is_once(self):
+        for (value, expected) in (('true', True), (' Yes', True),
+                                  ('1', True), ('false', False)):
+            part = email.message_from_string(
+                'X-Cloudbase-Init-Once: %s\n\nfake' % value)
+            self.assertEqual(expected, scriptcache.is_once(part))
+        self.assertFalse(scriptcache.is_once(
+            email.message_from_string('\nfake')))
+
+    def test_get_script_key(self):
+        key = scriptcache.get_script_key('.ps1', u'#ps1\n')
+
+        self.assertEqual(64, len(key))
+        self.assertEqual(key, scriptcache.get_script_key('.ps1', b'#ps1\n'))
+        self.assertNotEqual(key, scriptcache.get_script_key('.ps1_x86',
+                                                            '#ps1\n'))
+        self.assertNotEqual(key, scriptcache.get_script_key('.ps1',
+                                                            '#ps1\n\n'))
+
+    def test_instance_section(self):
+        scriptcache.save_result(self._osutils, 'fake key', 0, 1, b'', b'')
+
+        self.assertIn(('fake id/UserDataScriptCache', 'fake key'),
+                      self._config)
+        self.assertTrue(scriptcache.check_executed(self._osutils,
+                                                   'fake key'))
+        scriptcache.set_instance_id('other id')
+        self.assertFalse(scriptcache.check_executed(self._osutils,
+                                                    'fake key'))
+
+    @mock.patch('time.time')
+    def test_execute(self, mock_time):
+        mock_time.side_effect = [10, 12.5, 13]
+        func = mock.Mock(return_value=(b'out', b'', 1001))
+
+        response = scriptcache.execute(self._osutils, 'fake key', func)
+
+        self.assertEqual((b'out', b'', 1001), response)
+        result = scriptcache.get_result(self._osutils, 'fake key')
+        self.assertEqual(1001, result['exit_code'])
+        self.assertEqual(2.5, result['duration'])
+        self.assertEqual(13, result['timestamp'])
+        self.assertEqual(64, len(result['output_sha256']))
+        self.assertTrue(scriptcache.check_executed(self._osutils,
+                                                   'fake key'))
+
+    def test_execute_no_key(self):
+        func = mock.Mock(return_value=(b'out', b'', 0))
+
+        scriptcache.execute(self._osutils, None, func)
+
+        self.assertFalse(self._osutils.set_config_value.called)
+
+    def test_execute_on_next_boot(self):
+        for exit_code in (1002, 1003):
+            func = mock.Mock(return_value=(b'', b'', exit_code))
+            scriptcache.execute(self._osutils, 'fake key', func)
+
+        self.assertFalse(scriptcache.check_executed(self._osutils,
+                                                    'fake key'))
+
+    def test_get_result_invalid(self):
+        self._config[('fake id/UserDataScriptCache', 'fake key')] = '{'
+
+        self.assertIsNone(scriptcache.get_result(self._osutils, 'fake key'))
+
+    def test_get_result(self):
+        self._config[('fake id/UserDataScriptCache', 'fake key')] = json.dumps(
+            {'exit_code': 0})
+
+        self.assertEqual({'exit_code': 0},
+                         scriptcache.get_result(self._osutils, 'fake key'))
@@ -14,7 +14,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import gzip
+import io
 import mock
+import time
 import unittest
 
 from oslo.config import cfg
@@ -23,6 +26,7 @@ from cloudbaseinit.metadata.services import base as metadata_services_base
 from cloudbaseinit.plugins import base
 from cloudbaseinit.plugins.windows import userdata
 from cloudbaseinit.tests.metadata import fake_json_response
+from cloudbaseinit.utils import mimestream
 
 CONF = cfg.CONF
 
@@ -34,12 +38,12 @@ class UserDataPluginTest(unittest.TestCase):
         self.fake_data = fake_json_response.get_fake_metadata_json(
             '2013-04-04')
 
+    @mock.patch('cloudbaseinit.utils.mimestream.iter_decompressed')
     @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
                 '._process_user_data')
-    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
-                '._check_gzip_compression')
-    def _test_execute(self, mock_check_gzip_compression,
-                      mock_process_user_data, ret_val):
+    @mock.patch('cloudbaseinit.plugins.windows.scriptcache.set_instance_id')
+    def _test_execute(self, mock_set_instance_id, mock_process_user_data,
+                      mock_iter_decompressed, ret_val):
         mock_service = mock.MagicMock()
         mock_service.get_user_data.side_effect = [ret_val]
 
@@ -52,13 +56,15 @@ class UserDataPluginTest(unittest.TestCase):
         elif ret_val is None:
             self.assertEqual(response, (base.PLUGIN_EXECUTION_DONE, False))
         else:
-            mock_check_gzip_compression.assert_called_once_with(ret_val)
+            mock_iter_decompressed.assert_called_once_with(ret_val)
+            mock_set_instance_id.assert_called_once_with(
+                mock_service.get_instance_id.return_value)
             mock_process_user_data.assert_called_once_with(
-                mock_check_gzip_compression.return_value.decode.return_value)
+                mock_iter_decompressed.return_value)
             self.assertEqual(response, mock_process_user_data.return_value)
 
     def test_execute(self):
-        self._test_execute(ret_val=mock.sentinel.fake_data)
+        self._test_execute(ret_val=b'fake data')
 
     def test_execute_no_data(self):
         self._test_execute(ret_val=None)
@@ -70,68 +76,157 @@ class UserDataPluginTest(unittest.TestCase):
     def test_execute_not_user_data(self):
         self._test_execute(ret_val=None)
 
-    @mock.patch('io.BytesIO')
-    @mock.patch('gzip.GzipFile')
-    def test_check_gzip_compression(self, mock_GzipFile, mock_BytesIO):
-        fake_userdata = b'\x1f\x8b'
-        fake_userdata += self._userdata._GZIP_MAGIC_NUMBER
+    @mock.patch('cloudbaseinit.utils.mimestream.iter_parts')
+    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
+                '._process_multi_part')
+    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
+                '._process_non_multi_part')
+    def _test_process_user_data(self, mock_process_non_multi_part,
+                                mock_process_multi_part, mock_iter_parts,
+                                chunks):
+        response = self._userdata._process_user_data(chunks)
+
+        if b''.join(chunks).startswith(b'Content-Type: multipart'):
+            self.assertEqual(b''.join(chunks),
+                             b''.join(mock_iter_parts.call_args[0][0]))
+            mock_process_multi_part.assert_called_once_with(
+                mock_iter_parts.return_value)
+            self.assertEqual(mock_process_multi_part.return_value, response)
+        else:
+            mock_process_non_multi_part.assert_called_once_with(
+                b''.join(chunks).decode('utf-8'))
+            self.assertEqual(mock_process_non_multi_part.return_value,
+                             response)
 
-        response = self._userdata._check_gzip_compression(fake_userdata)
+    def test_process_user_data_multipart(self):
+        self._test_process_user_data(
+            chunks=[b'Content-Type: ', b'multipart/mixed', b'\n\nfake'])
 
-        mock_BytesIO.assert_called_once_with(fake_userdata)
-        mock_GzipFile.assert_called_once_with(
-            fileobj=mock_BytesIO.return_value, mode='rb')
-        data = mock_GzipFile().__enter__().read.return_value
-        self.assertEqual(data, response)
+    def test_process_user_data_non_multipart(self):
+        self._test_process_user_data(
+            chunks=[b'Content-Type: non-multipart\n', b'fake'])
 
-    @mock.patch('email.message_from_string')
-    def test_parse_mime(self, mock_message_from_string):
-        fake_user_data = 'fake data'
-        response = self._userdata._parse_mime(user_data=fake_user_data)
-        mock_message_from_string.assert_called_once_with(fake_user_data)
-        self.assertEqual(response, mock_message_from_string().walk())
+    def test_process_user_data_short(self):
+        self._test_process_user_data(chunks=[b'#ps1'])
 
     @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.factory.'
                 'load_plugins')
-    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
-                '._parse_mime')
     @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
                 '._process_part')
     @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
                 '._end_part_process_event')
-    @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
-                '._process_non_multi_part')
-    def _test_process_user_data(self, mock_process_non_multi_part,
-                                mock_end_part_process_event,
-                                mock_process_part, mock_parse_mime,
-                                mock_load_plugins, user_data, reboot):
-        mock_part = mock.MagicMock()
-        mock_parse_mime.return_value = [mock_part]
+    def _test_process_multi_part(self, mock_end_part_process_event,
+                                 mock_process_part, mock_load_plugins,
+                                 reboot):
+        mock_parts = [mock.MagicMock(), mock.MagicMock()]
         mock_process_part.return_value = (base.PLUGIN_EXECUTION_DONE, reboot)
 
-        response = self._userdata._process_user_data(user_data=user_data)
-        if user_data.startswith('Content-Type: multipart'):
-            mock_load_plugins.assert_called_once_with()
-            mock_parse_mime.assert_called_once_with(user_data)
-            mock_process_part.assert_called_once_with(mock_part,
-                                                      mock_load_plugins(), {})
-            self.assertEqual((base.PLUGIN_EXECUTION_DONE, reboot), response)
+        response = self._userdata._process_multi_part(iter(mock_parts))
+
+        mock_load_plugins.assert_called_once_with()
+        if reboot:
+            mock_process_part.assert_called_once_with(
+                mock_parts[0], mock_load_plugins(), {})
         else:
-            mock_process_non_multi_part.assert_called_once_with(user_data)
-            self.assertEqual(mock_process_non_multi_part.return_value,
-                             response)
+            self.assertEqual(2, mock_process_part.call_count)
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, reboot), response)
 
-    def test_process_user_data_multipart_reboot_true(self):
-        self._test_process_user_data(user_data='Content-Type: multipart',
-                                     reboot=True)
+    def test_process_multi_part_reboot_true(self):
+        self._test_process_multi_part(reboot=True)
 
-    def test_process_user_data_multipart_reboot_false(self):
-        self._test_process_user_data(user_data='Content-Type: multipart',
-                                     reboot=False)
+    def test_process_multi_part_reboot_false(self):
+        self._test_process_multi_part(reboot=False)
 
-    def test_process_user_data_non_multipart(self):
-        self._test_process_user_data(user_data='Content-Type: non-multipart',
-                                     reboot=False)
+    def _get_parts(self, *content_types):
+        parts = []
+        for (i, content_type) in enumerate(content_types):
+            part = mock.MagicMock()
+            part.get_content_type.return_value = content_type
+            part.get_filename.return_value = 'part%d' % i
+            parts.append(part)
+        return parts
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.factory.'
+                'load_plugins')
+    def _test_process_multi_part_parallel(self, mock_load_plugins,
+                                          file_ret_val=None):
+        processed = []
+
+        def process_file(part):
+            time.sleep(0.01)
+            processed.append(part.get_filename())
+            return file_ret_val
+
+        def process_script(part):
+            processed.append(part.get_filename())
+
+        file_plugin = mock.MagicMock()
+        file_plugin.can_process_concurrently.return_value = True
+        file_plugin.process.side_effect = process_file
+        script_plugin = mock.MagicMock()
+        script_plugin.can_process_concurrently.return_value = False
+        script_plugin.process.side_effect = process_script
+        mock_load_plugins.return_value = {'text/file': file_plugin,
+                                          'text/script': script_plugin}
+        parts = self._get_parts('text/file', 'text/file', 'text/script',
+                                'text/file')
+
+        with mock.patch.object(CONF, 'user_data_parallel_parts', True):
+            response = self._userdata._process_multi_part(iter(parts))
+        return (response, processed)
+
+    def test_process_multi_part_parallel(self):
+        (response, processed) = self._test_process_multi_part_parallel()
+
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        self.assertEqual(set(['part0', 'part1']), set(processed[:2]))
+        self.assertEqual(['part2', 'part3'], processed[2:])
+
+    def test_process_multi_part_parallel_reboot(self):
+        (response, processed) = self._test_process_multi_part_parallel(
+            file_ret_val=1001)
+
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, True), response)
+        self.assertEqual(set(['part0', 'part1']), set(processed))
+
+    def test_can_process_concurrently(self):
+        plugin = mock.MagicMock()
+        plugin.can_process_concurrently.return_value = True
+        (part, other_part, handled_part) = self._get_parts(
+            'text/file', 'text/other', 'text/handled')
+        user_data_plugins = {'text/file': plugin, 'text/handled': plugin}
+        user_handlers = {'text/handled': mock.sentinel.handler_func}
+
+        self.assertTrue(self._userdata._can_process_concurrently(
+            part, user_data_plugins, user_handlers))
+        self.assertFalse(self._userdata._can_process_concurrently(
+            other_part, user_data_plugins, user_handlers))
+        self.assertFalse(self._userdata._can_process_concurrently(
+            handled_part, user_data_plugins, user_handlers))
+        plugin.can_process_concurrently.assert_called_once_with(part)
+
+    @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.factory.'
+                'load_plugins')
+    def test_process_user_data_gzip_multipart(self, mock_load_plugins):
+        user_data = (b'Content-Type: multipart/mixed; boundary="b"\n\n'
+                     b'--b\nContent-Type: text/x-shellscript\n\necho 1\n'
+                     b'--b\nContent-Type: text/x-cfninitdata\n\necho 2\n'
+                     b'--b--\n')
+        bio = io.BytesIO()
+        with gzip.GzipFile(fileobj=bio, mode='wb') as f:
+            f.write(user_data)
+        mock_plugin = mock.MagicMock()
+        mock_plugin.process.return_value = None
+        mock_load_plugins.return_value = {'text/x-shellscript': mock_plugin,
+                                          'text/x-cfninitdata': mock_plugin}
+
+        response = self._userdata._process_user_data(
+            mimestream.iter_decompressed(bio.getvalue(), chunk_size=7))
+
+        self.assertEqual((base.PLUGIN_EXECUTION_DONE, False), response)
+        self.assertEqual(['echo 1', 'echo 2'],
+                         [call[0][0].get_payload() for call in
+                          mock_plugin.process.call_args_list])
 
     @mock.patch('cloudbaseinit.plugins.windows.userdata.UserDataPlugin'
                 '._add_part_handlers')
@@ -18,6 +18,7 @@ import unittest
 
 from oslo.config import cfg
 
+from cloudbaseinit.plugins.windows import scriptcache
 from cloudbaseinit.plugins.windows import userdatautils
 from cloudbaseinit.tests.metadata import fake_json_response
 
@@ -94,12 +95,13 @@ class UserDataUtilsTest(unittest.TestCase):
         mock_gettempdir.assert_called_once_with()
         self.assertEqual(number_of_calls, mock_re_search.call_count)
         if args:
-            mock_osutils.execute_process.assert_called_with(args, shell)
+            mock_osutils.execute_process_streaming.assert_called_with(
+                args, shell, logger=userdatautils.LOG)
             mock_os_remove.assert_called_once_with(path + extension)
             self.assertEqual(None, response)
         elif powershell:
             mock_osutils.execute_powershell_script.assert_called_with(
-                path + extension, sysnative)
+                path + extension, sysnative, logger=userdatautils.LOG)
             mock_os_remove.assert_called_once_with(path + extension)
             self.assertEqual(None, response)
         else:
@@ -127,3 +129,20 @@ class UserDataUtilsTest(unittest.TestCase):
 
     def test_handle_unsupported_format(self):
         self._test_execute_user_data_script(fake_user_data='unsupported')
+
+    @mock.patch('cloudbaseinit.plugins.windows.scriptcache.check_executed')
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_execute_user_data_script_once_executed(self, mock_get_os_utils,
+                                                    mock_check_executed):
+        mock_check_executed.return_value = True
+        user_data = '#ps1_x86\nfake'
+
+        response = userdatautils.execute_user_data_script(user_data,
+                                                          once=True)
+
+        mock_check_executed.assert_called_once_with(
+            mock_get_os_utils.return_value,
+            scriptcache.get_script_key('.ps1_x86', user_data))
+        self.assertEqual(0, response)
+        self.assertFalse(
+            mock_get_os_utils.return_value.execute_powershell_script.called)
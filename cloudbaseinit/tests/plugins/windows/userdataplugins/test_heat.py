@@ -46,6 +46,30 @@ class HeatUserDataHandlerTests(unittest.TestCase):
         mock_exists.assert_called_once_with(fake_dir)
         mock_makedirs.assert_called_once_with(fake_dir)
 
+    @mock.patch('os.path.isdir')
+    @mock.patch('os.path.exists')
+    @mock.patch('os.makedirs')
+    def test_check_heat_config_dir_created_meanwhile(self, mock_makedirs,
+                                                     mock_exists,
+                                                     mock_isdir):
+        mock_exists.return_value = False
+        mock_makedirs.side_effect = OSError
+        mock_isdir.return_value = True
+
+        self._heat._check_dir(file_name='fake_dir/fake_file')
+
+        mock_makedirs.assert_called_once_with('fake_dir')
+        mock_isdir.assert_called_once_with('fake_dir')
+
+    def test_can_process_concurrently(self):
+        mock_part = mock.MagicMock()
+        mock_part.get_filename.return_value = 'other data'
+        self.assertTrue(self._heat.can_process_concurrently(mock_part))
+
+        mock_part.get_filename.return_value = (
+            self._heat._heat_user_data_filename)
+        self.assertFalse(self._heat.can_process_concurrently(mock_part))
+
     @mock.patch('cloudbaseinit.plugins.windows.userdatautils'
                 '.execute_user_data_script')
     @mock.patch('cloudbaseinit.plugins.windows.userdataplugins.heat'
@@ -66,7 +90,7 @@ class HeatUserDataHandlerTests(unittest.TestCase):
         mock_part.get_filename.assert_called_with()
         if filename == self._heat._heat_user_data_filename:
             mock_execute_user_data_script.assert_called_with(
-                mock_part.get_payload())
+                mock_part.get_payload(), once=False)
             self.assertEqual(mock_execute_user_data_script.return_value,
                              response)
         else:
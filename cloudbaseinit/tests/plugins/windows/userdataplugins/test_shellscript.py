@@ -12,10 +12,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import email
 import mock
 import os
 import unittest
 
+from cloudbaseinit.plugins.windows import scriptcache
 from cloudbaseinit.plugins.windows.userdataplugins import shellscript
 
 
@@ -45,7 +47,7 @@ class ShellScriptPluginTests(unittest.TestCase):
             response = self._shellscript.process(mock_part)
 
         mock_part.get_filename.assert_called_once_with()
-        mock_exec_file.assert_called_once_with(fake_target)
+        mock_exec_file.assert_called_once_with(fake_target, None)
         mock_part.get_payload.assert_called_once_with()
         mock_gettempdir.assert_called_once_with()
         if not exception:
@@ -56,3 +58,33 @@ class ShellScriptPluginTests(unittest.TestCase):
 
     def test_process_exception(self):
         self._test_process(exception=True)
+
+    @mock.patch('cloudbaseinit.plugins.windows.scriptcache.check_executed')
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    @mock.patch('cloudbaseinit.plugins.windows.fileexecutils.exec_file')
+    def _test_process_once(self, mock_exec_file, mock_get_os_utils,
+                           mock_check_executed, executed):
+        part = email.message_from_string(
+            'X-Cloudbase-Init-Once: true\n\n#!/bin/sh\n')
+        part.set_param('filename', 'script.sh', 'Content-Disposition')
+        mock_check_executed.return_value = executed
+        key = scriptcache.get_script_key('.sh', '#!/bin/sh\n')
+
+        with mock.patch("cloudbaseinit.plugins.windows.userdataplugins."
+                        "shellscript.open", mock.mock_open(), create=True):
+            response = self._shellscript.process(part)
+
+        mock_check_executed.assert_called_once_with(
+            mock_get_os_utils.return_value, key)
+        if executed:
+            self.assertEqual(0, response)
+            self.assertFalse(mock_exec_file.called)
+        else:
+            mock_exec_file.assert_called_once_with(mock.ANY, key)
+            self.assertEqual(mock_exec_file.return_value, response)
+
+    def test_process_once(self):
+        self._test_process_once(executed=False)
+
+    def test_process_once_executed(self):
+        self._test_process_once(executed=True)
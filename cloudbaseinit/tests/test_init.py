@@ -63,21 +63,33 @@ class InitManagerTest(unittest.TestCase):
 
     @mock.patch('cloudbaseinit.init.InitManager._get_plugins_section')
     def test_get_plugin_status(self, mock_get_plugins_section):
-        self.osutils.get_config_value.return_value = 1
-        response = self._init._get_plugin_status(self.osutils, 'fake id',
-                                                 'fake plugin')
-        mock_get_plugins_section.assert_called_once_with('fake id')
-        self.osutils.get_config_value.assert_called_once_with(
-            'fake plugin', mock_get_plugins_section())
-        self.assertTrue(response == 1)
+        self.osutils.get_config_values.return_value = {'fake plugin': 1}
+        for i in range(2):
+            response = self._init._get_plugin_status(self.osutils, 'fake id',
+                                                     'fake plugin')
+            self.assertEqual(1, response)
+        mock_get_plugins_section.assert_called_with('fake id')
+        self.osutils.get_config_values.assert_called_once_with(
+            mock_get_plugins_section())
+        self.assertFalse(self.osutils.get_config_value.called)
 
     @mock.patch('cloudbaseinit.init.InitManager._get_plugins_section')
     def test_set_plugin_status(self, mock_get_plugins_section):
+        self.osutils.get_config_values.return_value = {}
         self._init._set_plugin_status(self.osutils, 'fake id',
                                       'fake plugin', 'status')
-        mock_get_plugins_section.assert_called_once_with('fake id')
-        self.osutils.set_config_value.assert_called_once_with(
-            'fake plugin', 'status', mock_get_plugins_section())
+        self._init._set_plugin_status(self.osutils, 'fake id',
+                                      'fake plugin 2', 'status 2')
+        mock_get_plugins_section.assert_called_with('fake id')
+        self.assertFalse(self.osutils.set_config_values.called)
+        self.assertEqual('status', self._init._get_plugin_status(
+            self.osutils, 'fake id', 'fake plugin'))
+
+        self._init._flush_plugin_statuses()
+
+        self.osutils.set_config_values.assert_called_once_with(
+            {'fake plugin': 'status', 'fake plugin 2': 'status 2'},
+            mock_get_plugins_section())
 
     @mock.patch('cloudbaseinit.init.InitManager._get_plugin_status')
     @mock.patch('cloudbaseinit.init.InitManager._set_plugin_status')
@@ -105,6 +117,51 @@ class InitManagerTest(unittest.TestCase):
                                                            fake_name, status)
             self.assertTrue(response)
 
+    def test_exec_plugin_saves_status_on_reboot(self):
+        self.osutils.get_config_values.return_value = {}
+        plugins = [mock.MagicMock(), mock.MagicMock()]
+        plugins[0].get_name.return_value = 'fake plugin'
+        plugins[0].execute.return_value = (base.PLUGIN_EXECUTION_DONE, False)
+        plugins[1].get_name.return_value = 'fake plugin 2'
+        plugins[1].execute.return_value = (base.PLUGIN_EXECUTION_DONE, True)
+
+        self._init._exec_plugin(self.osutils, 'fake service', plugins[0],
+                                'fake id', {})
+        self.assertFalse(self.osutils.set_config_values.called)
+        self._init._exec_plugin(self.osutils, 'fake service', plugins[1],
+                                'fake id', {})
+
+        self.osutils.set_config_values.assert_called_once_with(
+            {'fake plugin': base.PLUGIN_EXECUTION_DONE,
+             'fake plugin 2': base.PLUGIN_EXECUTION_DONE},
+            self._init._get_plugins_section('fake id'))
+
+    @mock.patch('cloudbaseinit.plugins.factory.load_plugins')
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    @mock.patch('cloudbaseinit.metadata.factory.get_metadata_service')
+    def test_configure_host_saves_status_on_error(
+            self, mock_get_metadata_service, mock_get_os_utils,
+            mock_load_plugins):
+        self.osutils.get_config_values.return_value = {}
+        mock_get_os_utils.return_value = self.osutils
+        mock_get_metadata_service.return_value.get_instance_id.return_value = (
+            'fake id')
+        plugins = [mock.MagicMock(), mock.MagicMock()]
+        plugins[0].get_name.return_value = 'fake plugin'
+        plugins[0].get_os_requirements.return_value = (None, None)
+        plugins[0].execute.return_value = (base.PLUGIN_EXECUTION_DONE, False)
+        plugins[1].get_name.return_value = 'fake plugin 2'
+        plugins[1].get_os_requirements.return_value = (None, None)
+        # e.g. the service being stopped
+        plugins[1].execute.side_effect = KeyboardInterrupt()
+        mock_load_plugins.return_value = plugins
+
+        self.assertRaises(KeyboardInterrupt, self._init.configure_host)
+
+        self.osutils.set_config_values.assert_called_once_with(
+            {'fake plugin': base.PLUGIN_EXECUTION_DONE},
+            self._init._get_plugins_section('fake id'))
+
     def test_exec_plugin_execution_done(self):
         self._test_exec_plugin(base.PLUGIN_EXECUTION_DONE)
 
@@ -127,12 +184,56 @@ class InitManagerTest(unittest.TestCase):
         else:
             self.assertFalse(response)
 
+    @mock.patch('cloudbaseinit.init.InitManager._get_plugin_status')
+    def test_get_pending_plugins(self, mock_get_plugin_status):
+        fake_plugins = [mock.MagicMock(), mock.MagicMock()]
+        mock_get_plugin_status.side_effect = [
+            base.PLUGIN_EXECUTION_DONE, base.PLUGIN_EXECUTE_ON_NEXT_BOOT]
+
+        response = self._init._get_pending_plugins(self.osutils, 'fake id',
+                                                   fake_plugins)
+
+        self.assertEqual([fake_plugins[1]], response)
+        for plugin in fake_plugins:
+            self.assertFalse(plugin.get_os_requirements.called)
+
+    @mock.patch('cloudbaseinit.init.InitManager._get_plugin_status')
+    def test_are_plugins_done(self, mock_get_plugin_status):
+        mock_get_plugin_status.side_effect = [
+            base.PLUGIN_EXECUTION_DONE, base.PLUGIN_EXECUTE_ON_NEXT_BOOT]
+        self.assertFalse(self._init._are_plugins_done(
+            self.osutils, 'fake id', [self.plugin, self.plugin]))
+
+    @mock.patch('cloudbaseinit.utils.startup.clear_marker')
+    @mock.patch('cloudbaseinit.utils.startup.write_marker')
+    def _test_update_startup_marker(self, done, mock_write_marker,
+                                    mock_clear_marker):
+        fake_service = mock.MagicMock()
+
+        self._init._update_startup_marker(done, 'fake id', fake_service)
+
+        if done:
+            mock_write_marker.assert_called_once_with(
+                'fake id', '%s.MagicMock' % mock.MagicMock.__module__)
+            self.assertFalse(mock_clear_marker.called)
+        else:
+            mock_clear_marker.assert_called_once_with()
+            self.assertFalse(mock_write_marker.called)
+
+    def test_update_startup_marker_done(self):
+        self._test_update_startup_marker(True)
+
+    def test_update_startup_marker_not_done(self):
+        self._test_update_startup_marker(False)
+
     def test_check_plugin_os_requirements(self):
         self._test_check_plugin_os_requirements(('win32', (5, 2)))
 
     def test_check_plugin_os_requirements_other_requirenments(self):
         self._test_check_plugin_os_requirements(('linux', (5, 2)))
 
+    @mock.patch('cloudbaseinit.metadata.services.cacheservice'
+                '.save_metadata_cache')
     @mock.patch('cloudbaseinit.init.InitManager'
                 '._check_plugin_os_requirements')
     @mock.patch('cloudbaseinit.init.InitManager._exec_plugin')
@@ -142,7 +243,8 @@ class InitManagerTest(unittest.TestCase):
     def test_configure_host(self, mock_get_metadata_service,
                             mock_get_os_utils, mock_load_plugins,
                             mock_exec_plugin,
-                            mock_check_os_requirements):
+                            mock_check_os_requirements,
+                            mock_save_metadata_cache):
         fake_service = mock.MagicMock()
         fake_plugin = mock.MagicMock()
         mock_load_plugins.return_value = [fake_plugin]
@@ -161,4 +263,46 @@ class InitManagerTest(unittest.TestCase):
         mock_exec_plugin.assert_called_once_with(self.osutils, fake_service,
                                                  fake_plugin, 'fake id', {})
         fake_service.cleanup.assert_called_once_with()
+        mock_save_metadata_cache.assert_called_once_with(
+            self.osutils, fake_service, 'fake id')
         self.osutils.reboot.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.metadata.services.cacheservice'
+                '.clear_metadata_cache')
+    @mock.patch('cloudbaseinit.plugins.scheduler.PluginScheduler')
+    @mock.patch('cloudbaseinit.init.InitManager'
+                '._check_plugin_os_requirements')
+    @mock.patch('cloudbaseinit.init.InitManager._exec_plugin')
+    @mock.patch('cloudbaseinit.plugins.factory.load_plugins')
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    @mock.patch('cloudbaseinit.metadata.factory.get_metadata_service')
+    def test_configure_host_parallel(self, mock_get_metadata_service,
+                                     mock_get_os_utils, mock_load_plugins,
+                                     mock_exec_plugin,
+                                     mock_check_os_requirements,
+                                     mock_PluginScheduler,
+                                     mock_clear_metadata_cache):
+        fake_service = mock.MagicMock()
+        fake_plugins = [mock.MagicMock(), mock.MagicMock()]
+        mock_load_plugins.return_value = fake_plugins
+        mock_get_os_utils.return_value = self.osutils
+        mock_get_metadata_service.return_value = fake_service
+        fake_service.get_instance_id.return_value = 'fake id'
+        mock_check_os_requirements.side_effect = [True, False]
+        mock_scheduler = mock_PluginScheduler.return_value
+        mock_scheduler.execute.return_value = False
+
+        with mock.patch.object(CONF, 'plugins_parallel_execution', True):
+            self._init.configure_host()
+
+        mock_PluginScheduler.assert_called_once_with(CONF.plugins_max_workers)
+        (plugins, exec_plugin,
+         stop_on_reboot) = mock_scheduler.execute.call_args[0]
+        self.assertEqual([fake_plugins[0]], plugins)
+        self.assertEqual(CONF.allow_reboot, stop_on_reboot)
+        exec_plugin(fake_plugins[0])
+        mock_exec_plugin.assert_called_once_with(
+            self.osutils, fake_service, fake_plugins[0], 'fake id', {})
+        fake_service.cleanup.assert_called_once_with()
+        mock_clear_metadata_cache.assert_called_once_with(self.osutils)
+        self.assertFalse(self.osutils.reboot.called)
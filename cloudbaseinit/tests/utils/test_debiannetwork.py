@@ -0,0 +1,125 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from cloudbaseinit import exception
+from cloudbaseinit.utils import debiannetwork
+
+_CONTENT = """# The loopback network interface
+auto lo eth0
+iface lo inet loopback
+
+# The primary network interface
+iface eth0 inet static
+    address 10.0.0.5
+    netmask 255.255.255.0
+    broadcast 10.0.0.255
+    gateway 10.0.0.1
+    hwaddress ether 00:15:5d:64:98:39
+    dns-nameservers 8.8.8.8 \\
+        8.8.4.4
+    dns-search example.com
+    mtu 1450
+    up route add -net 192.168.0.0 netmask 255.255.0.0 gw 10.0.0.254
+    post-up ip route add 172.16.0.0/12 via 10.0.0.253
+    pre-up /bin/true
+
+iface eth0 inet static
+    address 10.0.1.5/24
+
+iface eth0 inet6 static
+    address 2001:db8::5
+    netmask 64
+    gateway 2001:db8::1
+
+mapping eth1
+    script /usr/local/sbin/map-scheme
+    map HOME eth1-home
+
+allow-hotplug eth1
+iface eth1 inet dhcp
+"""
+
+
+class DebianNetworkTest(unittest.TestCase):
+
+    def test_tokenize(self):
+        content = 'auto lo\n  # comment\n\niface eth0 \\\n inet dhcp\n'
+
+        self.assertEqual([(1, ['auto', 'lo']),
+                          (4, ['iface', 'eth0', 'inet', 'dhcp'])],
+                         list(debiannetwork.tokenize(content)))
+
+    def test_parse(self):
+        (lo, eth0, eth1) = debiannetwork.parse(_CONTENT)
+
+        self.assertEqual(('lo', True, 'loopback'),
+                         (lo.name, lo.auto, lo.method))
+        self.assertEqual([], lo.addresses)
+
+        self.assertEqual(('eth0', True, 'static', 'static'),
+                         (eth0.name, eth0.auto, eth0.method, eth0.method6))
+        self.assertEqual([('10.0.0.5', '255.255.255.0'),
+                          ('10.0.1.5', '255.255.255.0')], eth0.addresses)
+        self.assertEqual([('2001:db8::5', 64)], eth0.addresses6)
+        self.assertEqual('10.0.0.255', eth0.broadcast)
+        self.assertEqual('10.0.0.1', eth0.gateway)
+        self.assertEqual('2001:db8::1', eth0.gateway6)
+        self.assertEqual('00:15:5d:64:98:39', eth0.hwaddress)
+        self.assertEqual(['8.8.8.8', '8.8.4.4'], eth0.dns_nameservers)
+        self.assertEqual(['example.com'], eth0.dns_search)
+        self.assertEqual(1450, eth0.mtu)
+        self.assertEqual([('192.168.0.0', '255.255.0.0', '10.0.0.254'),
+                          ('172.16.0.0', '255.240.0.0', '10.0.0.253')],
+                         eth0.routes)
+        self.assertEqual(['/bin/true'], eth0.options['pre-up'])
+
+        self.assertEqual(('eth1', False, 'dhcp'),
+                         (eth1.name, eth1.auto, eth1.method))
+        self.assertNotIn('script', eth1.options)
+
+    def test_parse_default_route(self):
+        (eth0,) = debiannetwork.parse(
+            'iface eth0 inet manual\n'
+            '    up ip route add default via 10.0.0.1\n'
+            '    up route add -host 10.0.0.10 gw 10.0.0.2\n')
+
+        self.assertEqual([('0.0.0.0', '0.0.0.0', '10.0.0.1'),
+                          ('10.0.0.10', '255.255.255.255', '10.0.0.2')],
+                         eth0.routes)
+
+    def _test_parse_invalid(self, content, line_number):
+        with self.assertRaises(exception.CloudbaseInitException) as cm:
+            debiannetwork.parse(content)
+        self.assertIn('line %d:' % line_number, str(cm.exception))
+
+    def test_parse_option_outside_stanza(self):
+        self._test_parse_invalid('auto eth0\naddress 10.0.0.5\n', 2)
+
+    def test_parse_incomplete_iface(self):
+        self._test_parse_invalid('\niface eth0 inet\n', 2)
+
+    def test_parse_invalid_address(self):
+        self._test_parse_invalid(
+            'iface eth0 inet static\n    address 10.0.0.300\n', 1)
+
+    def test_parse_invalid_netmask(self):
+        self._test_parse_invalid(
+            'iface eth0 inet static\n    address 10.0.0.5\n'
+            '    netmask 255.0.255.0\n', 1)
+
+    def test_parse_invalid_mtu(self):
+        self._test_parse_invalid(
+            'auto eth0\niface eth0 inet manual\n    mtu big\n', 2)
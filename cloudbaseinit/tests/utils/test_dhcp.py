@@ -16,8 +16,11 @@ import mock
 import netifaces
 import socket
 import struct
+import threading
+import time
 import unittest
 
+from cloudbaseinit import exception
 from cloudbaseinit.utils import dhcp
 
 
@@ -51,54 +54,13 @@ class DHCPUtilsTests(unittest.TestCase):
         data += fake_mac_address_b
         data += b'\x37' + struct.pack('b', len([100]))
         data += struct.pack('b', 100)
-        data += dhcp._OPTION_END
+        data += b'\xff'
 
         response = dhcp._get_dhcp_request_data(
             id_req=9999, mac_address=fake_mac_address,
             requested_options=[100], vendor_id='fake id')
         self.assertEqual(data, response)
 
-    @mock.patch('struct.unpack')
-    def _test_parse_dhcp_reply(self, mock_unpack, message_type,
-                               id_reply, equals_cookie):
-        fake_data = 236 * b"1"
-        if equals_cookie:
-            fake_data += dhcp._DHCP_COOKIE + b'11'
-        else:
-            fake_data += b'111111'
-        fake_data += b'fake'
-        fake_data += dhcp._OPTION_END
-
-        mock_unpack.side_effect = [(message_type, None), (id_reply, None),
-                                   (100, None), (4, None)]
-
-        response = dhcp._parse_dhcp_reply(data=fake_data, id_req=9999)
-
-        if message_type != 2:
-            self.assertEqual((False, {}), response)
-        elif id_reply != 9999:
-            self.assertEqual((False, {}), response)
-        elif fake_data[236:240] != dhcp._DHCP_COOKIE:
-            self.assertEqual((False, {}), response)
-        else:
-            self.assertEqual((True, {100: b'fake'}), response)
-
-    def test_parse_dhcp_reply(self):
-        self._test_parse_dhcp_reply(message_type=2, id_reply=9999,
-                                    equals_cookie=True)
-
-    def test_parse_dhcp_reply_other_message_type(self):
-        self._test_parse_dhcp_reply(message_type=3, id_reply=9999,
-                                    equals_cookie=True)
-
-    def test_parse_dhcp_reply_other_reply(self):
-        self._test_parse_dhcp_reply(message_type=3, id_reply=111,
-                                    equals_cookie=True)
-
-    def test_parse_dhcp_reply_other_than_cookie(self):
-        self._test_parse_dhcp_reply(message_type=3, id_reply=111,
-                                    equals_cookie=False)
-
     @mock.patch('netifaces.ifaddresses')
     @mock.patch('netifaces.interfaces')
     def test_get_mac_address_by_local_ip(self, mock_interfaces,
@@ -117,39 +79,434 @@ class DHCPUtilsTests(unittest.TestCase):
         self.assertEqual(fake_addresses[netifaces.AF_LINK][0]['addr'],
                          response)
 
-    @mock.patch('random.randint')
-    @mock.patch('socket.socket')
+    def test_get_local_ip_addr(self):
+        self.assertEqual('127.0.0.1', dhcp._get_local_ip_addr('127.0.0.1'))
+
+    @mock.patch('cloudbaseinit.utils.dhcp.DhcpClient')
+    @mock.patch('cloudbaseinit.utils.dhcp._get_local_ip_addr')
     @mock.patch('cloudbaseinit.utils.dhcp._get_mac_address_by_local_ip')
-    @mock.patch('cloudbaseinit.utils.dhcp._get_dhcp_request_data')
-    @mock.patch('cloudbaseinit.utils.dhcp._parse_dhcp_reply')
-    def test_get_dhcp_options(self, mock_parse_dhcp_reply,
-                              mock_get_dhcp_request_data,
-                              mock_get_mac_address_by_local_ip, mock_socket,
-                              mock_randint):
-        mock_randint.return_value = 'fake int'
-        mock_socket().getsockname.return_value = ['fake local ip']
-        mock_get_mac_address_by_local_ip.return_value = 'fake mac'
-        mock_get_dhcp_request_data.return_value = 'fake data'
-        mock_parse_dhcp_reply.return_value = (True, 'fake replied options')
+    def _test_get_dhcp_options(self, mock_get_mac_address_by_local_ip,
+                               mock_get_local_ip_addr, mock_dhcp_client,
+                               mac_address=None):
+        mock_get_options = mock_dhcp_client.return_value.get_options
+        mock_get_options.return_value = ['fake replied options']
 
         response = dhcp.get_dhcp_options(
-            dhcp_host='fake host', requested_options=['fake option'])
-
-        mock_randint.assert_called_once_with(0, 2 ** 32 - 1)
-        mock_socket.assert_called_with(socket.AF_INET, socket.SOCK_DGRAM)
-        mock_socket().bind.assert_called_once_with(('', 68))
-        mock_socket().settimeout.assert_called_once_with(5)
-        mock_socket().connect.assert_called_once_with(('fake host', 67))
-        mock_socket().getsockname.assert_called_once_with()
-        mock_get_mac_address_by_local_ip.assert_called_once_with(
-            'fake local ip')
-        mock_get_dhcp_request_data.assert_called_once_with('fake int',
-                                                           'fake mac',
-                                                           ['fake option'],
-                                                           'cloudbase-init')
-        mock_socket().send.assert_called_once_with('fake data')
-        mock_socket().recv.assert_called_once_with(1024)
-        mock_parse_dhcp_reply.assert_called_once_with(mock_socket().recv(),
-                                                      'fake int')
-        mock_socket().close.assert_called_once_with()
+            dhcp_host='fake host', requested_options=['fake option'],
+            mac_address=mac_address)
+
+        if mac_address:
+            self.assertFalse(mock_get_local_ip_addr.called)
+        else:
+            mock_get_local_ip_addr.assert_called_once_with('fake host')
+            mock_get_mac_address_by_local_ip.assert_called_once_with(
+                mock_get_local_ip_addr.return_value)
+            mac_address = mock_get_mac_address_by_local_ip.return_value
+        mock_dhcp_client.assert_called_once_with('cloudbase-init', 10, 3)
+        mock_get_options.assert_called_once_with(
+            [(mac_address, 'fake host')], ['fake option'], 5.0)
         self.assertEqual('fake replied options', response)
+
+    def test_get_dhcp_options(self):
+        self._test_get_dhcp_options()
+
+    def test_get_dhcp_options_mac_address(self):
+        self._test_get_dhcp_options(mac_address='fake mac')
+
+
+class DhcpPacketTests(unittest.TestCase):
+
+    _MAC_ADDRESS = '00:15:5d:64:98:39'
+
+    def _get_packet(self):
+        packet = dhcp.DhcpPacket.from_mac_address(self._MAC_ADDRESS,
+                                                  op=dhcp.BOOTREPLY, xid=42)
+        packet.yiaddr = '10.0.0.5'
+        packet.siaddr = '10.0.0.1'
+        packet.set_option_int(dhcp.OPTION_MESSAGE_TYPE, dhcp.DHCPOFFER)
+        packet.set_option_int(dhcp.OPTION_MTU, 1450, size=2)
+        packet.set_option_addresses(dhcp.OPTION_NTP_SERVERS,
+                                    ['10.0.0.10', '10.0.0.11'])
+        packet.set_option(dhcp.OPTION_VENDOR_CLASS_ID, b'')
+        return packet
+
+    def test_pack_and_parse(self):
+        packet = self._get_packet()
+        data = packet.to_bytes()
+
+        self.assertEqual(packet.get_size(), len(data))
+        parsed = dhcp.DhcpPacket.parse(data)
+        self.assertEqual(dhcp.BOOTREPLY, parsed.op)
+        self.assertEqual(42, parsed.xid)
+        self.assertEqual(b'\x00\x15\x5d\x64\x98\x39', parsed.chaddr)
+        self.assertEqual('10.0.0.5', parsed.yiaddr)
+        self.assertEqual('10.0.0.1', parsed.siaddr)
+        self.assertEqual('0.0.0.0', parsed.ciaddr)
+        self.assertEqual(dhcp.DHCPOFFER,
+                         parsed.get_option_int(dhcp.OPTION_MESSAGE_TYPE))
+        self.assertEqual(1450, parsed.get_option_int(dhcp.OPTION_MTU))
+        self.assertEqual(['10.0.0.10', '10.0.0.11'],
+                         parsed.get_option_addresses(dhcp.OPTION_NTP_SERVERS))
+        self.assertEqual(b'', parsed.get_option(dhcp.OPTION_VENDOR_CLASS_ID))
+        self.assertEqual(packet.get_options(), parsed.get_options())
+        self.assertEqual(data, parsed.to_bytes())
+
+    def test_pack_into(self):
+        packet = self._get_packet()
+        buf = bytearray(b'\xaa' * 1024)
+
+        size = packet.pack_into(memoryview(buf), 10)
+
+        self.assertEqual(packet.get_size(), size)
+        self.assertEqual(packet.to_bytes(), bytes(buf[10:10 + size]))
+        self.assertEqual(b'\xaa' * 10, bytes(buf[:10]))
+
+    def test_long_option(self):
+        packet = dhcp.DhcpPacket()
+        addresses = ['10.0.%d.%d' % (i // 256, i % 256) for i in range(100)]
+        packet.set_option_addresses(dhcp.OPTION_NTP_SERVERS, addresses)
+        data = packet.to_bytes()
+
+        # 400 bytes are split in a 255 and a 145 bytes TLV
+        self.assertEqual(struct.pack('!BB', dhcp.OPTION_NTP_SERVERS, 255),
+                         data[240:242])
+        self.assertEqual(struct.pack('!BB', dhcp.OPTION_NTP_SERVERS, 145),
+                         data[497:499])
+        self.assertEqual(
+            addresses, dhcp.DhcpPacket.parse(data).get_option_addresses(
+                dhcp.OPTION_NTP_SERVERS))
+
+    def test_parse_pad_and_truncated_options(self):
+        data = dhcp.DhcpPacket().to_bytes()[:-1]
+        data += b'\x00\x00' + struct.pack('!BB', dhcp.OPTION_MTU, 2)
+        data += b'\x05\xdc' + struct.pack('!B', dhcp.OPTION_NTP_SERVERS)
+
+        packet = dhcp.DhcpPacket.parse(data)
+
+        self.assertEqual({dhcp.OPTION_MTU: b'\x05\xdc'},
+                         packet.get_options())
+
+    def test_parse_invalid(self):
+        self.assertRaises(exception.CloudbaseInitException,
+                          dhcp.DhcpPacket.parse, b'\x00' * 300)
+        self.assertRaises(exception.CloudbaseInitException,
+                          dhcp.DhcpPacket.parse, b'\x00' * 200)
+
+    def test_set_option_invalid(self):
+        packet = dhcp.DhcpPacket()
+        self.assertRaises(exception.CloudbaseInitException,
+                          packet.set_option, dhcp.OPTION_END, b'')
+        self.assertRaises(exception.CloudbaseInitException,
+                          packet.set_option, dhcp.OPTION_PAD, b'')
+
+    def test_remove_option(self):
+        packet = self._get_packet()
+        packet.remove_option(dhcp.OPTION_MTU)
+        packet.remove_option(dhcp.OPTION_MTU)
+
+        self.assertIsNone(packet.get_option(dhcp.OPTION_MTU))
+        self.assertNotIn(
+            dhcp.OPTION_MTU,
+            dhcp.DhcpPacket.parse(packet.to_bytes()).get_options())
+
+    def test_get_option_int_invalid(self):
+        packet = dhcp.DhcpPacket()
+        packet.set_option(dhcp.OPTION_MTU, b'\x00\x00\x00')
+
+        self.assertRaises(exception.CloudbaseInitException,
+                          packet.get_option_int, dhcp.OPTION_MTU)
+        self.assertEqual(1, packet.get_option_int(100, 1))
+
+    def test_get_option_addresses_invalid(self):
+        packet = dhcp.DhcpPacket()
+        packet.set_option(dhcp.OPTION_NTP_SERVERS, b'\x00\x00\x00')
+
+        self.assertRaises(exception.CloudbaseInitException,
+                          packet.get_option_addresses,
+                          dhcp.OPTION_NTP_SERVERS)
+        self.assertEqual([], packet.get_option_addresses(100))
+
+
+class FakeDhcpResponder(object):
+    """Replies to DHCP requests on a local UDP port.
+
+    The reply options are set per client MAC address, only the requested
+    ones are sent.
+    """
+
+    def __init__(self, options_by_mac, delay=0, address='127.0.0.1',
+                 port=0):
+        self.requests = []
+        self._options_by_mac = options_by_mac
+        self._delay = delay
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((address, port))
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _reply(self, request, address):
+        reply = dhcp.DhcpPacket(op=dhcp.BOOTREPLY, xid=request.xid,
+                                chaddr=request.chaddr)
+        reply.set_option_int(dhcp.OPTION_MESSAGE_TYPE, dhcp.DHCPOFFER)
+        options = self._options_by_mac.get(request.chaddr, {})
+        for code in bytearray(request.get_option(
+                dhcp.OPTION_PARAMETER_REQUEST_LIST, b'')):
+            if code in options:
+                reply.set_option(code, options[code])
+        self._socket.sendto(reply.to_bytes(), address)
+
+    def _serve(self):
+        while True:
+            try:
+                (data, address) = self._socket.recvfrom(4096)
+            except socket.error:
+                break
+            request = dhcp.DhcpPacket.parse(data)
+            self.requests.append(request)
+            if self._delay:
+                threading.Timer(self._delay, self._reply,
+                                (request, address)).start()
+            else:
+                self._reply(request, address)
+
+    def close(self):
+        self._socket.close()
+
+
+class DhcpOptionsCacheTests(unittest.TestCase):
+
+    _MAC_ADDRESSES = ['00:15:5d:64:98:39', '00:15:5d:64:98:3a']
+
+    def setUp(self):
+        self._osutils = mock.MagicMock()
+        self._osutils.get_dhcp_hosts_in_use.return_value = [
+            (mac_address, '127.0.0.1') for mac_address in self._MAC_ADDRESSES]
+        self._cache = dhcp.DhcpOptionsCache()
+
+    def _start_responder(self, delay=0):
+        options_by_mac = {}
+        for i, mac_address in enumerate(self._MAC_ADDRESSES):
+            chaddr = dhcp.DhcpPacket.from_mac_address(mac_address).chaddr
+            options_by_mac[chaddr] = {dhcp.OPTION_MTU: struct.pack('!H',
+                                                                   1400 + i),
+                                      dhcp.OPTION_NTP_SERVERS: b'\x0a' * 4,
+                                      100: b'fake'}
+        responder = FakeDhcpResponder(options_by_mac, delay)
+        self.addCleanup(responder.close)
+
+        # Unprivileged ports, the client port is chosen by the OS
+        patcher = mock.patch.multiple(dhcp, DHCP_SERVER_PORT=responder.port,
+                                      DHCP_CLIENT_PORT=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return responder
+
+    def test_get_options(self):
+        responder = self._start_responder()
+
+        results = self._cache.get_options(self._osutils, [dhcp.OPTION_MTU])
+
+        self.assertEqual(self._MAC_ADDRESSES, [r[0] for r in results])
+        self.assertEqual(['127.0.0.1'] * 2, [r[1] for r in results])
+        for i, (mac_address, dhcp_host, options) in enumerate(results):
+            self.assertEqual({dhcp.OPTION_MESSAGE_TYPE: b'\x02',
+                              dhcp.OPTION_MTU: struct.pack('!H', 1400 + i),
+                              dhcp.OPTION_NTP_SERVERS: b'\x0a' * 4},
+                             options)
+        self.assertEqual(2, len(responder.requests))
+        self.assertEqual(
+            bytes(bytearray(sorted(dhcp.DEFAULT_REQUESTED_OPTIONS))),
+            responder.requests[0].get_option(
+                dhcp.OPTION_PARAMETER_REQUEST_LIST))
+
+    def test_get_options_cached(self):
+        responder = self._start_responder()
+
+        results = self._cache.get_options(self._osutils, [dhcp.OPTION_MTU])
+        cached_results = self._cache.get_options(
+            self._osutils, [dhcp.OPTION_NTP_SERVERS])
+
+        self.assertEqual(results, cached_results)
+        self.assertEqual(2, len(responder.requests))
+        self._osutils.get_dhcp_hosts_in_use.assert_called_once_with()
+
+    def test_get_options_new_option(self):
+        responder = self._start_responder()
+
+        self._cache.get_options(self._osutils, [dhcp.OPTION_MTU])
+        results = self._cache.get_options(self._osutils, [100])
+
+        self.assertEqual(4, len(responder.requests))
+        self.assertEqual(b'fake', results[0][2][100])
+        self.assertIn(dhcp.OPTION_MTU, results[0][2])
+
+    def test_get_options_concurrent(self):
+        self._start_responder(delay=0.5)
+
+        start = time.time()
+        results = self._cache.get_options(self._osutils, [dhcp.OPTION_MTU])
+
+        self.assertTrue(all(r[2] for r in results))
+        self.assertLess(time.time() - start, 0.9)
+
+    def test_clear(self):
+        responder = self._start_responder()
+
+        self._cache.get_options(self._osutils, [dhcp.OPTION_MTU])
+        self._cache.clear()
+        self._cache.get_options(self._osutils, [dhcp.OPTION_MTU])
+
+        self.assertEqual(4, len(responder.requests))
+
+    @mock.patch('cloudbaseinit.utils.dhcp.DhcpClient')
+    def test_get_options_failed(self, mock_dhcp_client):
+        mock_get_options = mock_dhcp_client.return_value.get_options
+        mock_get_options.side_effect = Exception('fake error')
+        self._osutils.get_dhcp_hosts_in_use.return_value = [
+            (self._MAC_ADDRESSES[0], 'fake host')]
+
+        results = self._cache.get_options(self._osutils, [dhcp.OPTION_MTU])
+
+        self.assertEqual([(self._MAC_ADDRESSES[0], 'fake host', None)],
+                         results)
+        mock_get_options.assert_called_once_with(
+            [(self._MAC_ADDRESSES[0], 'fake host')],
+            sorted(dhcp.DEFAULT_REQUESTED_OPTIONS))
+
+    def test_get_options_no_dhcp_hosts(self):
+        self._osutils.get_dhcp_hosts_in_use.return_value = []
+
+        self.assertEqual([], self._cache.get_options(self._osutils,
+                                                     [dhcp.OPTION_MTU]))
+
+    @mock.patch('cloudbaseinit.utils.dhcp._dhcp_options_cache')
+    def test_get_cached_dhcp_options(self, mock_cache):
+        response = dhcp.get_cached_dhcp_options(self._osutils,
+                                                [dhcp.OPTION_MTU])
+
+        mock_cache.get_options.assert_called_once_with(self._osutils,
+                                                       [dhcp.OPTION_MTU])
+        self.assertEqual(mock_cache.get_options.return_value, response)
+
+
+class DhcpClientTests(unittest.TestCase):
+
+    _MAC_ADDRESSES = ['00:15:5d:64:98:39', '00:15:5d:64:98:3a',
+                      '00:15:5d:64:98:3b']
+
+    def setUp(self):
+        self._client = dhcp.DhcpClient()
+        self._chaddrs = [dhcp.DhcpPacket.from_mac_address(m).chaddr
+                         for m in self._MAC_ADDRESSES]
+        patcher = mock.patch.object(dhcp, 'DHCP_CLIENT_PORT', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _start_responder(self, address, port=0, delay=0, options_by_mac=None):
+        if options_by_mac is None:
+            options_by_mac = dict(
+                (chaddr, {dhcp.OPTION_MTU: struct.pack('!H', 1400 + i)})
+                for i, chaddr in enumerate(self._chaddrs))
+        responder = FakeDhcpResponder(options_by_mac, delay, address, port)
+        self.addCleanup(responder.close)
+        return responder
+
+    def _start_responders(self, delay=0):
+        # Two DHCP servers with the same port on different addresses
+        responder = self._start_responder('127.0.0.1', delay=delay)
+        self._start_responder('127.0.0.2', responder.port, delay)
+        patcher = mock.patch.object(dhcp, 'DHCP_SERVER_PORT', responder.port)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return responder
+
+    def _get_expected_options(self, i):
+        return {dhcp.OPTION_MESSAGE_TYPE: b'\x02',
+                dhcp.OPTION_MTU: struct.pack('!H', 1400 + i)}
+
+    def test_get_options(self):
+        self._start_responders(delay=0.4)
+        interfaces = [(self._MAC_ADDRESSES[0], '127.0.0.1'),
+                      (self._MAC_ADDRESSES[1], '127.0.0.2'),
+                      (self._MAC_ADDRESSES[2], '127.0.0.1')]
+
+        start = time.time()
+        results = self._client.get_options(interfaces, [dhcp.OPTION_MTU])
+
+        # The replies are received concurrently
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual([self._get_expected_options(i) for i in range(3)],
+                         results)
+
+    def test_get_options_timeout(self):
+        responder = self._start_responders()
+        # No replies from 127.0.0.3
+        self._start_responder('127.0.0.3', responder.port, delay=0,
+                              options_by_mac={}).close()
+        interfaces = [(self._MAC_ADDRESSES[0], '127.0.0.3'),
+                      (self._MAC_ADDRESSES[1], '127.0.0.2')]
+
+        start = time.time()
+        results = self._client.get_options(interfaces, [dhcp.OPTION_MTU],
+                                           timeout=0.3)
+
+        self.assertGreaterEqual(time.time() - start, 0.3)
+        self.assertEqual([None, self._get_expected_options(1)], results)
+
+    def test_get_options_no_interfaces(self):
+        self.assertEqual([], self._client.get_options([], [dhcp.OPTION_MTU]))
+
+    def _test_handle_reply(self, data, pending, expected_results):
+        results = [None, None]
+
+        self._client._handle_reply(data, pending, results)
+
+        self.assertEqual(expected_results, results)
+
+    def _get_reply_data(self, op=dhcp.BOOTREPLY, xid=9999, chaddr=None):
+        packet = dhcp.DhcpPacket(op=op, xid=xid,
+                                 chaddr=chaddr or self._chaddrs[1])
+        packet.set_option(100, b'fake')
+        return packet.to_bytes()
+
+    def test_handle_reply(self):
+        pending = {1: (0, self._chaddrs[0]), 9999: (1, self._chaddrs[1])}
+        self._test_handle_reply(self._get_reply_data(), pending,
+                                [None, {100: b'fake'}])
+        self.assertEqual({1: (0, self._chaddrs[0])}, pending)
+
+    def test_handle_reply_other_op(self):
+        self._test_handle_reply(self._get_reply_data(op=dhcp.BOOTREQUEST),
+                                {9999: (1, self._chaddrs[1])}, [None, None])
+
+    def test_handle_reply_other_xid(self):
+        self._test_handle_reply(self._get_reply_data(xid=111),
+                                {9999: (1, self._chaddrs[1])}, [None, None])
+
+    def test_handle_reply_other_mac_address(self):
+        self._test_handle_reply(
+            self._get_reply_data(chaddr=self._chaddrs[0]),
+            {9999: (1, self._chaddrs[1])}, [None, None])
+
+    def test_handle_reply_invalid(self):
+        data = bytearray(self._get_reply_data())
+        data[236:240] = b'1111'
+        self._test_handle_reply(bytes(data), {9999: (1, self._chaddrs[1])},
+                                [None, None])
+        self._test_handle_reply(b'\x02' * 100,
+                                {9999: (1, self._chaddrs[1])}, [None, None])
+
+    @mock.patch('socket.socket')
+    def test_get_options_send_failed(self, mock_socket):
+        mock_socket.return_value.sendto.side_effect = socket.error(
+            'fake error')
+
+        results = self._client.get_options(
+            [(self._MAC_ADDRESSES[0], 'fake host')], [dhcp.OPTION_MTU])
+
+        self.assertEqual([None], results)
+        mock_socket.return_value.bind.assert_called_once_with(('', 0))
+        mock_socket.return_value.setblocking.assert_called_once_with(False)
+        mock_socket.return_value.close.assert_called_once_with()
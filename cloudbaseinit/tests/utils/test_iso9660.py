@@ -0,0 +1,261 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from cloudbaseinit import exception
+from cloudbaseinit.utils import iso9660
+
+_BLOCK_SIZE = 2048
+
+
+def _get_record(file_id, extent, size, is_dir, system_use=b''):
+    pad = b'\x00' if len(file_id) % 2 == 0 else b''
+    length = 33 + len(file_id) + len(pad) + len(system_use)
+    tail_pad = b'\x00' * (length % 2)
+    return (struct.pack('<BBI', length + len(tail_pad), 0, extent) +
+            struct.pack('>I', extent) + struct.pack('<I', size) +
+            struct.pack('>I', size) + b'\x00' * 7 +
+            struct.pack('<BBB', 2 if is_dir else 0, 0, 0) +
+            struct.pack('<H', 1) + struct.pack('>H', 1) +
+            struct.pack('<B', len(file_id)) + file_id + pad + system_use +
+            tail_pad)
+
+
+def _get_names(name, is_dir, joliet, rock_ridge):
+    if joliet:
+        if not is_dir:
+            name += ';1'
+        return (name.encode('utf-16-be'), b'')
+    file_id = name.upper().encode('ascii')
+    if not is_dir:
+        file_id += b';1'
+    system_use = b''
+    if rock_ridge:
+        encoded_name = name.encode('utf-8')
+        system_use = (b'NM' + struct.pack('<BBB', 5 + len(encoded_name), 1,
+                                          0) + encoded_name)
+    return (file_id, system_use)
+
+
+def _pack_records(records):
+    # Directory records don't span across blocks
+    data = b''
+    for record in records:
+        remaining = _BLOCK_SIZE - len(data) % _BLOCK_SIZE
+        if len(record) > remaining:
+            data += b'\x00' * remaining
+        data += record
+    return data
+
+
+def _get_blocks(size):
+    return max((size + _BLOCK_SIZE - 1) // _BLOCK_SIZE, 1)
+
+
+class _FakeDir(object):
+    def __init__(self):
+        self.children = {}
+        self.extent = 0
+        self.size = 0
+
+
+class FakeISOImageBuilder(object):
+    """Builds ISO9660 images with a Joliet or Rock Ridge hierarchy."""
+
+    def __init__(self, files, joliet=True, rock_ridge=False):
+        self._files = files
+        self._hierarchies = [(False, rock_ridge)]
+        if joliet:
+            self._hierarchies.append((True, False))
+        # Volume descriptors are stored from block 16
+        self._next_extent = 16 + len(self._hierarchies) + 1
+        self._file_extents = {}
+
+    def _allocate(self, size):
+        extent = self._next_extent
+        self._next_extent += _get_blocks(size)
+        return extent
+
+    def _build_tree(self):
+        root = _FakeDir()
+        for path in self._files:
+            node = root
+            parts = path.split('/')
+            for part in parts[:-1]:
+                node = node.children.setdefault(part, _FakeDir())
+            node.children[parts[-1]] = path
+        return root
+
+    def _get_dir_data(self, node, parent, flags):
+        records = [_get_record(b'\x00', node.extent, node.size, True),
+                   _get_record(b'\x01', parent.extent, parent.size, True)]
+        for name in sorted(node.children):
+            child = node.children[name]
+            is_dir = isinstance(child, _FakeDir)
+            (file_id, system_use) = _get_names(name, is_dir, *flags)
+            if is_dir:
+                (extent, size) = (child.extent, child.size)
+            else:
+                (extent, size) = (self._file_extents[child],
+                                  len(self._files[child]))
+            records.append(_get_record(file_id, extent, size, is_dir,
+                                       system_use))
+        return _pack_records(records)
+
+    def _allocate_dirs(self, node, flags):
+        # The record sizes don't depend on the extents
+        node.size = _get_blocks(len(self._get_dir_data(
+            node, node, flags))) * _BLOCK_SIZE
+        node.extent = self._allocate(node.size)
+        for child in node.children.values():
+            if isinstance(child, _FakeDir):
+                self._allocate_dirs(child, flags)
+
+    def _write_dirs(self, image, node, parent, flags):
+        data = self._get_dir_data(node, parent, flags)
+        offset = node.extent * _BLOCK_SIZE
+        image[offset:offset + len(data)] = data
+        for child in node.children.values():
+            if isinstance(child, _FakeDir):
+                self._write_dirs(image, child, node, flags)
+
+    def _get_volume_descriptor(self, root, joliet):
+        vd = bytearray(_BLOCK_SIZE)
+        vd[0:7] = struct.pack('<B5sB', 2 if joliet else 1, b'CD001', 1)
+        vd[40:48] = b'config-2'
+        vd[80:88] = (struct.pack('<I', self._next_extent) +
+                     struct.pack('>I', self._next_extent))
+        if joliet:
+            vd[88:91] = b'%/E'
+        vd[128:132] = (struct.pack('<H', _BLOCK_SIZE) +
+                       struct.pack('>H', _BLOCK_SIZE))
+        root_record = _get_record(b'\x00', root.extent, root.size, True)
+        vd[156:156 + len(root_record)] = root_record
+        return vd
+
+    def build(self):
+        for path in sorted(self._files):
+            self._file_extents[path] = self._allocate(len(self._files[path]))
+
+        roots = []
+        for flags in self._hierarchies:
+            root = self._build_tree()
+            self._allocate_dirs(root, flags)
+            roots.append(root)
+
+        image = bytearray(self._next_extent * _BLOCK_SIZE)
+        for (path, extent) in self._file_extents.items():
+            data = self._files[path]
+            image[extent * _BLOCK_SIZE:extent * _BLOCK_SIZE + len(data)] = data
+
+        for (i, (root, flags)) in enumerate(zip(roots, self._hierarchies)):
+            self._write_dirs(image, root, root, flags)
+            offset = (16 + i) * _BLOCK_SIZE
+            image[offset:offset + _BLOCK_SIZE] = self._get_volume_descriptor(
+                root, flags[0])
+
+        offset = (16 + len(roots)) * _BLOCK_SIZE
+        image[offset:offset + 7] = struct.pack('<B5sB', 255, b'CD001', 1)
+        return bytes(image)
+
+
+def build_iso_image(files, joliet=True, rock_ridge=False):
+    return FakeISOImageBuilder(files, joliet, rock_ridge).build()
+
+
+class ISO9660ReaderTests(unittest.TestCase):
+    _FILES = {
+        'openstack/latest/meta_data.json': b'{"uuid": "fake id"}',
+        'openstack/latest/user_data': b'x' * 5000,
+        'openstack/content/0000': b'fake content',
+        'ec2/latest/meta-data.json': b'{}',
+    }
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _get_reader(self, **kwargs):
+        image = build_iso_image(self._FILES, **kwargs)
+        return iso9660.ISO9660Reader(
+            iso9660.FileBlockDevice(io.BytesIO(image)))
+
+    def _test_read_file(self, **kwargs):
+        reader = self._get_reader(**kwargs)
+        for (path, data) in self._FILES.items():
+            self.assertEqual(data, reader.read_file(path))
+        self.assertEqual(['meta_data.json', 'user_data'],
+                         sorted(reader.list_dir('openstack/latest')))
+
+    def test_read_file_joliet(self):
+        self._test_read_file(joliet=True)
+
+    def test_read_file_rock_ridge(self):
+        self._test_read_file(joliet=False, rock_ridge=True)
+
+    def test_read_file_iso_names(self):
+        self._test_read_file(joliet=False, rock_ridge=False)
+
+    def test_read_file_not_found(self):
+        reader = self._get_reader()
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, 'openstack/latest/fake')
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, 'openstack/latest')
+
+    def test_get_volume_size(self):
+        image = build_iso_image(self._FILES)
+        reader = iso9660.ISO9660Reader(
+            iso9660.FileBlockDevice(io.BytesIO(image)))
+        self.assertEqual(len(image), reader.get_volume_size())
+
+    def test_get_volume_label(self):
+        self.assertEqual('config-2', self._get_reader().get_volume_label())
+
+    def test_extract(self):
+        reader = self._get_reader()
+
+        count = reader.extract('openstack', self._tmp_dir)
+
+        self.assertEqual(3, count)
+        with open(os.path.join(self._tmp_dir, 'latest', 'user_data'),
+                  'rb') as f:
+            self.assertEqual(self._FILES['openstack/latest/user_data'],
+                             f.read())
+        self.assertEqual(['content', 'latest'],
+                         sorted(os.listdir(self._tmp_dir)))
+
+    def test_extract_not_existing(self):
+        reader = self._get_reader()
+        self.assertEqual(0, reader.extract('fake', self._tmp_dir))
+
+    def test_not_iso9660(self):
+        device = iso9660.FileBlockDevice(io.BytesIO(b'\x00' * 40960))
+        self.assertRaises(exception.CloudbaseInitException,
+                          iso9660.ISO9660Reader, device)
+
+    def test_truncated_image(self):
+        image = build_iso_image(self._FILES)
+        device = iso9660.FileBlockDevice(io.BytesIO(image[:20 * 2048]))
+        reader = iso9660.ISO9660Reader(device)
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, 'openstack/latest/user_data')
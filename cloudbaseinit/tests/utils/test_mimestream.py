@@ -0,0 +1,125 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import email
+import gzip
+import io
+import unittest
+
+from cloudbaseinit.utils import mimestream
+
+_MULTIPART = (
+    b'Content-Type: multipart/mixed; boundary="===abc=="\n'
+    b'MIME-Version: 1.0\n'
+    b'\n'
+    b'preamble\n'
+    b'--===abc==\n'
+    b'Content-Type: text/x-shellscript; charset="us-ascii"\n'
+    b'Content-Disposition: attachment; filename="script.sh"\n'
+    b'\n'
+    b'#!/bin/sh\n'
+    b'echo h\xc3\xa9llo\n'
+    b'--===abc==  \r\n'
+    b'Content-Type: text/x-cfninitdata\n'
+    b'Content-Disposition: attachment; filename="cfn-userdata"\n'
+    b'\n'
+    b'#ps1\r\n'
+    b'--===abc==-not-a-delimiter\r\n'
+    b'\r\n'
+    b'--===abc==\n'
+    b'Content-Type: multipart/mixed; boundary="inner"\n'
+    b'\n'
+    b'--inner\n'
+    b'Content-Type: text/plain\n'
+    b'\n'
+    b'inner\n'
+    b'--inner--\n'
+    b'--===abc==--\n'
+    b'epilogue\n')
+
+
+def _get_parts_description(parts):
+    return [(part.get_content_type(), part.get_filename(),
+             None if part.is_multipart() else part.get_payload())
+            for part in parts]
+
+
+class MimeStreamTest(unittest.TestCase):
+
+    def _gzip(self, data):
+        bio = io.BytesIO()
+        with gzip.GzipFile(fileobj=bio, mode='wb') as f:
+            f.write(data)
+        return bio.getvalue()
+
+    def test_iter_decompressed(self):
+        data = b'x' * 1000
+
+        self.assertEqual([data[:300], data[300:600], data[600:900],
+                          data[900:]],
+                         list(mimestream.iter_decompressed(data, 300)))
+
+    def test_iter_decompressed_text(self):
+        self.assertEqual([b'h\xc3\xa9'],
+                         list(mimestream.iter_decompressed(u'h\xe9')))
+
+    def test_iter_decompressed_gzip(self):
+        data = b''.join(str(i).encode() + b'\n' for i in range(10000))
+        chunks = list(mimestream.iter_decompressed(self._gzip(data), 512))
+
+        self.assertEqual(data, b''.join(chunks))
+        self.assertTrue(all(len(chunk) <= 512 for chunk in chunks))
+
+    def test_iter_decompressed_gzip_members(self):
+        data = self._gzip(b'first\n') + self._gzip(b'second\n')
+
+        self.assertEqual(b'first\nsecond\n',
+                         b''.join(mimestream.iter_decompressed(data, 5)))
+
+    def _test_iter_parts(self, data):
+        message = email.message_from_string(data.decode('utf-8'))
+        expected = _get_parts_description(message.walk())
+        for chunk_size in (1, 2, 3, 7, 64, len(data)):
+            parts = _get_parts_description(mimestream.iter_parts(
+                mimestream.iter_decompressed(data, chunk_size)))
+            self.assertEqual(expected[1:], parts[1:])
+            self.assertEqual(expected[0][:2], parts[0][:2])
+
+    def test_iter_parts(self):
+        self._test_iter_parts(_MULTIPART)
+
+    def test_iter_parts_no_close_delimiter(self):
+        self._test_iter_parts(
+            b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+            b'--b\r\nContent-Type: text/plain\r\n\r\nno close\r\n')
+
+    def test_iter_parts_no_boundary(self):
+        self._test_iter_parts(
+            b'Content-Type: multipart/mixed\n\nno boundary\n')
+
+    def test_iter_parts_no_body(self):
+        self._test_iter_parts(b'Content-Type: multipart/mixed')
+
+    def test_iter_parts_completed_parts(self):
+        parser = mimestream.MultipartStreamParser()
+        (head, first, rest) = _MULTIPART.partition(b'--===abc==  \r\n')
+
+        self.assertEqual(['multipart/mixed'],
+                         [p.get_content_type() for p in parser.feed(head)])
+        self.assertEqual(['text/x-shellscript'],
+                         [p.get_content_type() for p in parser.feed(first)])
+        self.assertEqual(['text/x-cfninitdata', 'multipart/mixed',
+                          'text/plain'],
+                         [p.get_content_type() for p in parser.feed(rest)])
+        self.assertEqual([], parser.close())
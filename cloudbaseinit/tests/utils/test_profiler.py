@@ -0,0 +1,97 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from oslo.config import cfg
+
+from cloudbaseinit.utils import profiler
+
+CONF = cfg.CONF
+
+
+class BootProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self._profiler = profiler.BootProfiler()
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def test_measure(self):
+        with self._profiler.measure('fake phase'):
+            pass
+        try:
+            with self._profiler.measure('fake plugin', plugin=True):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        report = self._profiler.get_report()
+
+        self.assertEqual(['fake phase'],
+                         [p['name'] for p in report['phases']])
+        self.assertEqual(['fake plugin'],
+                         [p['name'] for p in report['plugins']])
+        for key in ['start', 'wall_time', 'cpu_time']:
+            self.assertIn(key, report['phases'][0])
+
+    def test_run_plugin(self):
+        func = mock.Mock(return_value=True)
+
+        response = self._profiler.run_plugin('fake plugin', func, 1, a=2)
+
+        self.assertTrue(response)
+        func.assert_called_once_with(1, a=2)
+        self.assertEqual(1, len(self._profiler.get_report()['plugins']))
+
+    def test_run_plugin_profiled(self):
+        func = mock.Mock(return_value=True)
+
+        with mock.patch.object(CONF, 'profile_plugin', 'fake_plugin'):
+            with mock.patch.object(CONF, 'profile_dump_dir', self._tmp_dir):
+                response = self._profiler.run_plugin('fake_plugin', func)
+
+        self.assertTrue(response)
+        self.assertTrue(os.path.exists(
+            os.path.join(self._tmp_dir, 'fake_plugin.prof')))
+
+    def test_save_report(self):
+        path = os.path.join(self._tmp_dir, 'report.json')
+        self._profiler.add_metadata_stats('fake service',
+                                          {'requests': 1, 'bytes': 2})
+
+        with mock.patch.object(CONF, 'timing_report_path', path):
+            self._profiler.save_report()
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual({'fake service': {'requests': 1, 'bytes': 2}},
+                         report['metadata'])
+
+    @mock.patch('cloudbaseinit.utils.profiler.LOG')
+    def test_save_report_log(self, mock_log):
+        with mock.patch.object(CONF, 'timing_report_log', True):
+            self._profiler.save_report()
+        self.assertTrue(mock_log.info.called)
+
+    @mock.patch('cloudbaseinit.utils.profiler.BootProfiler.get_report')
+    def test_save_report_disabled(self, mock_get_report):
+        self._profiler.save_report()
+        self.assertFalse(mock_get_report.called)
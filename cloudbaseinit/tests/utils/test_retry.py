@@ -0,0 +1,113 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import mock
+import socket
+import unittest
+
+from six.moves.urllib import error
+
+from cloudbaseinit.utils import retry
+
+
+class RetryTest(unittest.TestCase):
+
+    def test_is_retryable_error(self):
+        retryable = [
+            socket.timeout(),
+            socket.error(errno.ECONNREFUSED, 'fake refused'),
+            socket.error(errno.ENETDOWN, 'fake network down'),
+            socket.error(errno.EADDRNOTAVAIL, 'fake address not available'),
+            error.URLError(socket.error(errno.ENETDOWN, 'fake down')),
+            error.HTTPError('fake url', 503, 'fake error', {}, None),
+            error.URLError(socket.timeout()),
+            Exception()]
+        fatal = [
+            socket.gaierror(-2, 'fake resolution error'),
+            error.URLError(socket.gaierror(-2, 'fake resolution error')),
+            socket.error(errno.EACCES, 'fake access denied'),
+            error.HTTPError('fake url', 409, 'fake error', {}, None)]
+
+        for ex in retryable:
+            self.assertTrue(retry.is_retryable_error(ex))
+        for ex in fatal:
+            self.assertFalse(retry.is_retryable_error(ex))
+
+    @mock.patch('random.uniform')
+    def test_get_delay(self, mock_uniform):
+        policy = retry.RetryPolicy(5, 1, backoff_factor=2, max_interval=5)
+
+        delays = [policy.get_delay(i) for i in range(4)]
+
+        self.assertEqual([mock_uniform.return_value] * 4, delays)
+        self.assertEqual([mock.call(0, 1), mock.call(0, 2), mock.call(0, 4),
+                          mock.call(0, 5)], mock_uniform.call_args_list)
+
+    def test_get_delay_no_jitter(self):
+        policy = retry.RetryPolicy(5, 1, backoff_factor=3, jitter=False)
+        self.assertEqual([1, 3, 9], [policy.get_delay(i) for i in range(3)])
+
+    @mock.patch('time.sleep')
+    def test_execute(self, mock_sleep):
+        action = mock.MagicMock()
+        action.side_effect = [socket.timeout(), socket.timeout(), 'fake data']
+        policy = retry.RetryPolicy(5, 1, jitter=False)
+
+        response = policy.execute(action, 'fake path')
+
+        self.assertEqual('fake data', response)
+        self.assertEqual([mock.call(1), mock.call(2)],
+                         mock_sleep.call_args_list)
+        self.assertEqual(3, policy.stats['fake path'].attempts)
+
+    @mock.patch('time.sleep')
+    def test_execute_max_retries(self, mock_sleep):
+        action = mock.MagicMock(side_effect=socket.timeout())
+        policy = retry.RetryPolicy(2, 0)
+
+        self.assertRaises(socket.timeout, policy.execute, action, 'fake')
+        self.assertEqual(3, action.call_count)
+        self.assertEqual(3, policy.stats['fake'].attempts)
+
+    @mock.patch('time.sleep')
+    def test_execute_fatal_error(self, mock_sleep):
+        action = mock.MagicMock(side_effect=socket.gaierror())
+        policy = retry.RetryPolicy(5, 0)
+
+        self.assertRaises(socket.gaierror, policy.execute, action)
+        action.assert_called_once_with()
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch('time.sleep')
+    def test_execute_fatal_exceptions(self, mock_sleep):
+        action = mock.MagicMock(side_effect=ValueError())
+        policy = retry.RetryPolicy(5, 0)
+
+        self.assertRaises(ValueError, policy.execute, action,
+                          fatal_exceptions=ValueError)
+        action.assert_called_once_with()
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.time')
+    def test_execute_time_budget(self, mock_time, mock_sleep):
+        mock_time.side_effect = [0, 6, 6, 6, 12, 12]
+        action = mock.MagicMock(side_effect=socket.timeout())
+        policy = retry.RetryPolicy(5, 4, jitter=False, time_budget=10)
+
+        self.assertRaises(socket.timeout, policy.execute, action, 'fake')
+
+        self.assertEqual(2, action.call_count)
+        mock_sleep.assert_called_once_with(4)
+        self.assertEqual(12, policy.stats['fake'].elapsed)
@@ -0,0 +1,96 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+import struct
+import unittest
+
+from cloudbaseinit import exception
+from cloudbaseinit.utils import routetable
+
+
+def build_forward_table(routes):
+    """Builds a MIB_IPFORWARDTABLE from (destination, mask, next hop,
+    interface index, metric) tuples.
+    """
+    data = struct.pack('<I', len(routes))
+    for (destination, mask, next_hop, interface_index, metric) in routes:
+        data += (socket.inet_aton(destination) + socket.inet_aton(mask) +
+                 struct.pack('<I', 0) + socket.inet_aton(next_hop) +
+                 struct.pack('<10I', interface_index, 3, 2, 0, 0, metric,
+                             0xFFFFFFFF, 0xFFFFFFFF, 0xFFFFFFFF,
+                             0xFFFFFFFF))
+    return data
+
+
+class IPv4RouteTableTest(unittest.TestCase):
+
+    _ROUTES = [
+        ('0.0.0.0', '0.0.0.0', '10.0.0.1', 12, 266),
+        ('0.0.0.0', '0.0.0.0', '10.0.1.1', 13, 10),
+        ('10.0.0.0', '255.255.255.0', '0.0.0.0', 12, 266),
+        ('10.0.0.0', '255.0.0.0', '10.0.1.254', 13, 20),
+        ('169.254.169.254', '255.255.255.255', '10.0.0.1', 12, 5),
+    ]
+
+    def setUp(self):
+        self._route_table = routetable.IPv4RouteTable.from_forward_table(
+            build_forward_table(self._ROUTES))
+
+    def test_from_forward_table(self):
+        self.assertEqual(len(self._ROUTES), len(self._route_table))
+        self.assertEqual(self._ROUTES, self._route_table.get_routes())
+
+    def test_from_forward_table_empty(self):
+        route_table = routetable.IPv4RouteTable.from_forward_table(
+            build_forward_table([]))
+
+        self.assertEqual(0, len(route_table))
+        self.assertIsNone(route_table.get_default_route())
+        self.assertIsNone(route_table.lookup('10.0.0.1'))
+
+    def test_from_forward_table_truncated(self):
+        data = build_forward_table(self._ROUTES)
+        self.assertRaises(exception.CloudbaseInitException,
+                          routetable.IPv4RouteTable.from_forward_table,
+                          data[:-1])
+        self.assertRaises(exception.CloudbaseInitException,
+                          routetable.IPv4RouteTable.from_forward_table,
+                          data[:3])
+
+    def test_get_default_route(self):
+        self.assertEqual(self._ROUTES[1],
+                         self._route_table.get_default_route())
+
+    def test_has_destination(self):
+        self.assertTrue(self._route_table.has_destination('169.254.169.254'))
+        self.assertTrue(self._route_table.has_destination(b'10.0.0.0'))
+        self.assertFalse(self._route_table.has_destination('10.0.0.1'))
+
+    def test_lookup(self):
+        self.assertEqual(self._ROUTES[4],
+                         self._route_table.lookup('169.254.169.254'))
+        self.assertEqual(self._ROUTES[2],
+                         self._route_table.lookup('10.0.0.20'))
+        self.assertEqual(self._ROUTES[3],
+                         self._route_table.lookup('10.20.0.1'))
+        self.assertEqual(self._ROUTES[1],
+                         self._route_table.lookup('8.8.8.8'))
+
+    def test_lookup_no_default_route(self):
+        route_table = routetable.IPv4RouteTable.from_forward_table(
+            build_forward_table(self._ROUTES[2:]))
+
+        self.assertIsNone(route_table.lookup('8.8.8.8'))
+        self.assertIsNone(route_table.get_default_route())
@@ -0,0 +1,125 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from oslo.config import cfg
+
+from cloudbaseinit.utils import startup
+
+CONF = cfg.CONF
+CONF.import_opt('plugins', 'cloudbaseinit.plugins.factory')
+
+
+class StartupTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._marker_path = os.path.join(self._tmp_dir, 'marker.json')
+        self._config_patcher = mock.patch.object(
+            CONF, 'startup_marker_path', self._marker_path)
+        self._config_patcher.start()
+
+    def tearDown(self):
+        self._config_patcher.stop()
+        shutil.rmtree(self._tmp_dir)
+
+    def test_write_marker(self):
+        startup.write_marker('fake id', 'fake.Service')
+
+        self.assertEqual({'instance_id': 'fake id',
+                          'service': 'fake.Service',
+                          'plugins': CONF.plugins}, startup.read_marker())
+
+    def test_clear_marker(self):
+        startup.write_marker('fake id', 'fake.Service')
+        startup.clear_marker()
+        startup.clear_marker()
+        self.assertFalse(os.path.exists(self._marker_path))
+        self.assertIsNone(startup.read_marker())
+
+    def test_read_marker_invalid(self):
+        with open(self._marker_path, 'w') as f:
+            f.write('{"instance_id": ')
+        self.assertIsNone(startup.read_marker())
+
+    def test_read_marker_disabled(self):
+        startup.write_marker('fake id', 'fake.Service')
+        with mock.patch.object(CONF, 'startup_marker_path', None):
+            self.assertIsNone(startup.read_marker())
+
+    @mock.patch('cloudbaseinit.utils.startup._load_class')
+    def _test_is_instance_configured(self, mock_load_class, instance_id,
+                                     plugins=None, loaded=True):
+        startup.write_marker('fake id', 'fake.Service')
+        service = mock_load_class.return_value.return_value
+        service.load.return_value = loaded
+        service.get_instance_id.return_value = instance_id
+
+        with mock.patch.object(CONF, 'plugins', plugins or CONF.plugins):
+            response = startup.is_instance_configured()
+
+        if plugins is None:
+            mock_load_class.assert_called_once_with('fake.Service')
+            self.assertEqual([mock.call.set_prefetch(False), mock.call.load()],
+                             service.mock_calls[:2])
+            service.cleanup.assert_called_once_with()
+        return response
+
+    def test_is_instance_configured(self):
+        self.assertTrue(self._test_is_instance_configured(
+            instance_id='fake id'))
+
+    def test_is_instance_configured_new_instance(self):
+        self.assertFalse(self._test_is_instance_configured(
+            instance_id='fake id 2'))
+
+    def test_is_instance_configured_service_not_loaded(self):
+        self.assertFalse(self._test_is_instance_configured(
+            instance_id='fake id', loaded=False))
+
+    def test_is_instance_configured_plugins_changed(self):
+        self.assertFalse(self._test_is_instance_configured(
+            instance_id='fake id', plugins=['fake.Plugin']))
+
+    @mock.patch('cloudbaseinit.utils.network.check_metadata_ip_route')
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_data')
+    def test_probe_instance_id_no_prefetch(self, mock_get_data,
+                                           mock_check_metadata_ip_route):
+        mock_get_data.return_value = b'{"uuid": "fake id"}'
+
+        response = startup._probe_instance_id(
+            'cloudbaseinit.metadata.services.httpservice.HttpService')
+
+        self.assertEqual('fake id', response)
+        mock_get_data.assert_called_once_with(
+            'openstack/latest/meta_data.json')
+
+    def test_is_instance_configured_no_marker(self):
+        self.assertFalse(startup.is_instance_configured())
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_terminate(self, mock_get_os_utils):
+        startup.terminate()
+        mock_get_os_utils.return_value.terminate.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_terminate_no_stop(self, mock_get_os_utils):
+        with mock.patch.object(CONF, 'stop_service_on_exit', False):
+            startup.terminate()
+        self.assertFalse(mock_get_os_utils.called)
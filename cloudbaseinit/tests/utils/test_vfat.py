@@ -0,0 +1,350 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from cloudbaseinit import exception
+from cloudbaseinit.utils import iso9660
+from cloudbaseinit.utils import vfat
+
+_SECTOR_SIZE = 512
+_MIN_CLUSTERS = {12: 16, 16: 4085, 32: 65525}
+
+
+class _Node(object):
+    def __init__(self, name, data=None):
+        self.name = name
+        self.data = data
+        self.children = []
+        self.clusters = []
+
+    @property
+    def is_dir(self):
+        return self.data is None
+
+
+class FakeVFATImageBuilder(object):
+    """Builds FAT12, FAT16 and FAT32 images.
+
+    Names which are not valid upper case 8.3 names get long name entries,
+    unless long_names is False, in which case the names must fit in 8.3 and
+    the lower case flags are used. With reverse_chains, the clusters of each
+    file or directory are chained in descending order.
+    """
+
+    def __init__(self, files, label='config-2', fat_bits=16,
+                 sectors_per_cluster=1, long_names=True,
+                 reverse_chains=False):
+        self._fat_bits = fat_bits
+        self._sectors_per_cluster = sectors_per_cluster
+        self._cluster_size = sectors_per_cluster * _SECTOR_SIZE
+        self._label = label.upper().encode('ascii').ljust(11)
+        self._long_names = long_names
+        self._reverse_chains = reverse_chains
+        self._next_cluster = 2
+        self._chains = []
+
+        self._root = _Node(None)
+        for (path, data) in sorted(files.items()):
+            self._add_file(path.split('/'), data)
+
+    def _add_file(self, path_parts, data):
+        node = self._root
+        for name in path_parts[:-1]:
+            for child in node.children:
+                if child.name == name:
+                    node = child
+                    break
+            else:
+                child = _Node(name)
+                node.children.append(child)
+                node = child
+        node.children.append(_Node(path_parts[-1], data))
+
+    def _is_short_name(self, name):
+        (base, dot, ext) = name.partition('.')
+        return (0 < len(base) <= 8 and len(ext) <= 3 and
+                (dot or not ext) and name == name.upper())
+
+    def _get_short_name(self, name, index):
+        (base, dot, ext) = name.rpartition('.')
+        if not dot:
+            (base, ext) = (ext, '')
+        flags = 0
+        if self._long_names and not self._is_short_name(name):
+            base = ('%s~%d' % (base.upper().replace('.', '')[:6], index))
+        else:
+            if base.islower():
+                flags |= vfat._LOWERCASE_BASE
+            if ext.islower():
+                flags |= vfat._LOWERCASE_EXT
+        return ((base.upper().encode('ascii')[:8].ljust(8) +
+                 ext.upper().encode('ascii')[:3].ljust(3)), flags)
+
+    def _get_long_name_entries(self, name, short_name):
+        checksum = vfat._get_short_name_checksum(short_name)
+        encoded = name.encode('utf-16-le')
+        if len(encoded) % 26:
+            encoded += b'\x00\x00'
+            encoded += b'\xff' * ((26 - len(encoded) % 26) % 26)
+        parts = [encoded[i:i + 26] for i in range(0, len(encoded), 26)]
+        entries = []
+        for (i, part) in enumerate(parts):
+            order = i + 1
+            if i == len(parts) - 1:
+                order |= vfat._LAST_LONG_ENTRY
+            entries.insert(0, struct.pack('<B10sBBB12sH4s', order, part[:10],
+                                          vfat._ATTR_LONG_NAME, 0, checksum,
+                                          part[10:22], 0, part[22:26]))
+        return entries
+
+    def _pack_entry(self, short_name, attr, flags, cluster, size):
+        return struct.pack('<11sBB7xH4xHI', short_name, attr, flags,
+                           cluster >> 16, cluster & 0xFFFF, size)
+
+    def _get_entries_count(self, node):
+        # The root has the volume label, the other directories . and ..
+        count = 1 if node is self._root else 2
+        for child in node.children:
+            count += 1
+            if self._long_names and not self._is_short_name(child.name):
+                count += (len(child.name) + 12) // 13
+        return count
+
+    def _allocate(self, node, size):
+        count = max((size + self._cluster_size - 1) // self._cluster_size, 1)
+        node.clusters = list(range(self._next_cluster,
+                                   self._next_cluster + count))
+        if self._reverse_chains:
+            node.clusters.reverse()
+        self._next_cluster += count
+        self._chains.append(node.clusters)
+
+    def _allocate_tree(self, node):
+        if node.is_dir:
+            if node is not self._root or self._fat_bits == 32:
+                self._allocate(node, self._get_entries_count(node) *
+                               vfat.DIR_ENTRY_SIZE)
+            for child in node.children:
+                self._allocate_tree(child)
+        elif node.data:
+            self._allocate(node, len(node.data))
+
+    def _get_dir_data(self, node, parent):
+        entries = []
+        if node is self._root:
+            entries.append(self._pack_entry(self._label, vfat._ATTR_VOLUME_ID,
+                                            0, 0, 0))
+        else:
+            entries.append(self._pack_entry(b'.'.ljust(11),
+                                            vfat._ATTR_DIRECTORY, 0,
+                                            node.clusters[0], 0))
+            parent_cluster = 0
+            if parent is not self._root or self._fat_bits == 32:
+                parent_cluster = parent.clusters[0] if parent.clusters else 0
+            entries.append(self._pack_entry(b'..'.ljust(11),
+                                            vfat._ATTR_DIRECTORY, 0,
+                                            parent_cluster, 0))
+        for (i, child) in enumerate(node.children):
+            (short_name, flags) = self._get_short_name(child.name, i + 1)
+            if self._long_names and not self._is_short_name(child.name):
+                entries += self._get_long_name_entries(child.name,
+                                                       short_name)
+            if child.is_dir:
+                entries.append(self._pack_entry(
+                    short_name, vfat._ATTR_DIRECTORY, flags,
+                    child.clusters[0], 0))
+            else:
+                cluster = child.clusters[0] if child.clusters else 0
+                entries.append(self._pack_entry(
+                    short_name, 0, flags, cluster, len(child.data)))
+        return b''.join(entries)
+
+    def _write_tree(self, image, node, parent, data_offset, root_offset):
+        if node.is_dir:
+            data = self._get_dir_data(node, parent)
+            for child in node.children:
+                self._write_tree(image, child, node, data_offset, root_offset)
+        else:
+            data = node.data
+
+        if node is self._root and self._fat_bits != 32:
+            image[root_offset:root_offset + len(data)] = data
+            return
+
+        for (i, cluster) in enumerate(node.clusters):
+            chunk = data[i * self._cluster_size:(i + 1) * self._cluster_size]
+            offset = data_offset + (cluster - 2) * self._cluster_size
+            image[offset:offset + len(chunk)] = chunk
+
+    def _set_fat_entry(self, fat, cluster, value):
+        if self._fat_bits == 12:
+            offset = cluster + cluster // 2
+            (current,) = struct.unpack_from('<H', fat, offset)
+            if cluster & 1:
+                value = (current & 0x000F) | (value << 4)
+            else:
+                value = (current & 0xF000) | value
+            struct.pack_into('<H', fat, offset, value)
+        elif self._fat_bits == 16:
+            struct.pack_into('<H', fat, cluster * 2, value)
+        else:
+            struct.pack_into('<I', fat, cluster * 4, value)
+
+    def build(self):
+        self._allocate_tree(self._root)
+        clusters_count = max(self._next_cluster - 2,
+                             _MIN_CLUSTERS[self._fat_bits])
+        end_of_chain = (1 << min(self._fat_bits, 28)) - 1
+
+        fat = bytearray(((clusters_count + 2) * self._fat_bits // 8 + 2 +
+                         _SECTOR_SIZE - 1) // _SECTOR_SIZE * _SECTOR_SIZE)
+        for chain in self._chains:
+            for (cluster, next_cluster) in zip(chain, chain[1:]):
+                self._set_fat_entry(fat, cluster, next_cluster)
+            self._set_fat_entry(fat, chain[-1], end_of_chain)
+
+        if self._fat_bits == 32:
+            reserved_sectors = 32
+            root_entries = 0
+        else:
+            reserved_sectors = 1
+            root_entries = 512
+        fat_sectors = len(fat) // _SECTOR_SIZE
+        root_offset = (reserved_sectors + 2 * fat_sectors) * _SECTOR_SIZE
+        data_offset = root_offset + root_entries * vfat.DIR_ENTRY_SIZE
+        total_sectors = (data_offset // _SECTOR_SIZE +
+                         clusters_count * self._sectors_per_cluster)
+
+        image = bytearray(total_sectors * _SECTOR_SIZE)
+        struct.pack_into('<3s8sHBHBHHBHHHII', image, 0, b'\xeb\x3c\x90',
+                         b'MSWIN4.1', _SECTOR_SIZE, self._sectors_per_cluster,
+                         reserved_sectors, 2, root_entries,
+                         total_sectors if total_sectors < 0x10000 else 0,
+                         0xF8, 0 if self._fat_bits == 32 else fat_sectors,
+                         32, 64, 0,
+                         total_sectors if total_sectors >= 0x10000 else 0)
+        if self._fat_bits == 32:
+            struct.pack_into('<IHHI', image, 36, fat_sectors, 0, 0, 2)
+            struct.pack_into('<BBBI11s8s', image, 64, 0x80, 0, 0x29, 1,
+                             self._label, b'FAT32   ')
+        else:
+            struct.pack_into('<BBBI11s8s', image, 36, 0x80, 0, 0x29, 1,
+                             self._label,
+                             ('FAT%d' % self._fat_bits).encode().ljust(8))
+        image[510:512] = b'\x55\xaa'
+
+        for i in range(2):
+            offset = (reserved_sectors + i * fat_sectors) * _SECTOR_SIZE
+            image[offset:offset + len(fat)] = fat
+
+        self._write_tree(image, self._root, None, data_offset, root_offset)
+        return bytes(image)
+
+
+def build_vfat_image(files, **kwargs):
+    return FakeVFATImageBuilder(files, **kwargs).build()
+
+
+class VFATReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self._files = {
+            'openstack/latest/meta_data.json': b'{"uuid": "fake"}',
+            'openstack/latest/user_data': os.urandom(5000),
+            'openstack/content/0000': b'fake content',
+            'openstack/empty': b'',
+            'ec2/latest/meta-data.json': b'{}',
+        }
+
+    def _get_reader(self, image):
+        return vfat.VFATReader(iso9660.FileBlockDevice(io.BytesIO(image)))
+
+    def _test_read_files(self, **kwargs):
+        reader = self._get_reader(build_vfat_image(self._files, **kwargs))
+
+        for (path, data) in self._files.items():
+            self.assertEqual(data, reader.read_file(path))
+        self.assertEqual(['ec2', 'openstack'], sorted(reader.list_dir('/')))
+        self.assertEqual(['content', 'empty', 'latest'],
+                         sorted(reader.list_dir('openstack')))
+        self.assertEqual('CONFIG-2', reader.get_volume_label())
+        return reader
+
+    def test_read_files_fat12(self):
+        reader = self._test_read_files(fat_bits=12)
+        self.assertEqual('FAT12', reader.get_fat_type())
+
+    def test_read_files_fat16(self):
+        reader = self._test_read_files(fat_bits=16, sectors_per_cluster=4)
+        self.assertEqual('FAT16', reader.get_fat_type())
+
+    def test_read_files_fat32(self):
+        reader = self._test_read_files(fat_bits=32)
+        self.assertEqual('FAT32', reader.get_fat_type())
+
+    def test_read_files_reverse_chains(self):
+        self._test_read_files(fat_bits=12, reverse_chains=True)
+
+    def test_read_files_short_names(self):
+        self._files = {'dir/file.txt': b'fake data',
+                       'dir/FILE2.TXT': b'fake data 2',
+                       'dir/NOEXT': b'fake data 3'}
+        reader = self._get_reader(build_vfat_image(self._files,
+                                                   long_names=False))
+
+        self.assertEqual(['FILE2.TXT', 'NOEXT', 'file.txt'],
+                         sorted(reader.list_dir('dir')))
+        self.assertEqual(b'fake data', reader.read_file('DIR/FILE.TXT'))
+
+    def test_read_file_not_found(self):
+        reader = self._get_reader(build_vfat_image(self._files))
+
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, 'openstack/latest/fake')
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.read_file, 'openstack/latest')
+        self.assertRaises(exception.CloudbaseInitException,
+                          reader.list_dir, 'openstack/empty')
+
+    def test_invalid_image(self):
+        self.assertRaises(exception.CloudbaseInitException,
+                          self._get_reader, b'\x00' * 4096)
+        self.assertRaises(exception.CloudbaseInitException,
+                          self._get_reader, b'')
+
+    def test_no_label(self):
+        image = bytearray(build_vfat_image(self._files, label='NO NAME'))
+
+        self.assertIsNone(self._get_reader(bytes(image)).get_volume_label())
+
+    def test_extract(self):
+        reader = self._get_reader(build_vfat_image(self._files))
+        target_path = tempfile.mkdtemp()
+        try:
+            response = reader.extract('openstack/latest',
+                                      os.path.join(target_path, 'latest'))
+
+            self.assertEqual(2, response)
+            self.assertEqual(['meta_data.json', 'user_data'],
+                             sorted(os.listdir(os.path.join(target_path,
+                                                            'latest'))))
+            self.assertEqual(0, reader.extract('fake', target_path))
+        finally:
+            shutil.rmtree(target_path)
@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import ctypes
+import ctypes.wintypes
 import importlib
 import mock
 import unittest
@@ -143,6 +145,51 @@ class WindowsPhysicalDiskUtilsTests(unittest.TestCase):
     def test_get_geometry_no_geom_exception(self):
         self._test_get_geometry(_geom=None, ret_val=None)
 
+    def _test_get_serial_number(self, ret_val, serial_number_offset=4,
+                                raw=b'\x00' * 4 + b' fake serial\x00\x00'):
+        mock_DeviceIoControl = self.physical_disk.kernel32.DeviceIoControl
+        mock_DeviceIoControl.return_value = ret_val
+        mock_buf = self._ctypes_mock.create_string_buffer.return_value
+        mock_buf.raw = raw
+        descriptor = self._ctypes_mock.cast.return_value.contents
+        descriptor.SerialNumberOffset = serial_number_offset
+        self._ctypes_mock.wintypes.DWORD.return_value.value = len(raw)
+
+        if not ret_val:
+            self.assertRaises(cbinit_exception.CloudbaseInitException,
+                              self._phys_disk_class.get_serial_number)
+            return
+
+        response = self._phys_disk_class.get_serial_number()
+
+        self._ctypes_mock.create_string_buffer.assert_called_once_with(
+            self._phys_disk_class.STORAGE_DESCRIPTOR_BUFFER_SIZE)
+        mock_DeviceIoControl.assert_called_once_with(
+            self._phys_disk_class._handle,
+            self._phys_disk_class.IOCTL_STORAGE_QUERY_PROPERTY,
+            self._ctypes_mock.byref.return_value,
+            self._ctypes_mock.sizeof.return_value, mock_buf,
+            self._ctypes_mock.sizeof.return_value,
+            self._ctypes_mock.byref.return_value, 0)
+        if serial_number_offset and raw.strip(b'\x00 '):
+            self.assertEqual('fake serial', response)
+        else:
+            self.assertIsNone(response)
+
+    def test_get_serial_number(self):
+        self._test_get_serial_number(ret_val=mock.sentinel.ret_val)
+
+    def test_get_serial_number_no_offset(self):
+        self._test_get_serial_number(ret_val=mock.sentinel.ret_val,
+                                     serial_number_offset=0)
+
+    def test_get_serial_number_empty(self):
+        self._test_get_serial_number(ret_val=mock.sentinel.ret_val,
+                                     raw=b'\x00' * 8)
+
+    def test_get_serial_number_exception(self):
+        self._test_get_serial_number(ret_val=None)
+
     def _test_seek(self, exception):
         expect_DWORD = [mock.call(0), mock.call(1)]
         if exception:
@@ -201,3 +248,186 @@ class WindowsPhysicalDiskUtilsTests(unittest.TestCase):
 
     def test_read_exception(self):
         self._test_read(ret_val=None)
+
+    def _test_read_into(self, ret_val):
+        buf = bytearray(512)
+        self.physical_disk.kernel32.ReadFile.return_value = ret_val
+        c_buf = self._ctypes_mock.c_char.__mul__.return_value.from_buffer
+
+        if not ret_val:
+            self.assertRaises(cbinit_exception.CloudbaseInitException,
+                              self._phys_disk_class.read_into, buf)
+        else:
+            response = self._phys_disk_class.read_into(buf)
+
+            self._ctypes_mock.c_char.__mul__.assert_called_once_with(512)
+            c_buf.assert_called_once_with(buf, 0)
+            self.physical_disk.kernel32.ReadFile.assert_called_once_with(
+                self._phys_disk_class._handle, c_buf.return_value, 512,
+                self._ctypes_mock.byref.return_value, 0)
+            self.assertEqual(
+                self._ctypes_mock.wintypes.DWORD.return_value.value,
+                response)
+
+    def test_read_into(self):
+        self._test_read_into(ret_val=mock.sentinel.ret_val)
+
+    def test_read_into_exception(self):
+        self._test_read_into(ret_val=None)
+
+
+class BufferedDiskReaderTests(unittest.TestCase):
+
+    def setUp(self):
+        self._ctypes_mock = mock.MagicMock()
+
+        self._module_patcher = mock.patch.dict(
+            'sys.modules',
+            {'ctypes': self._ctypes_mock})
+
+        self._module_patcher.start()
+
+        self.physical_disk = importlib.import_module(
+            "cloudbaseinit.utils.windows.physical_disk")
+
+        self._image = bytes(bytearray(range(256))) * 41
+        self._read_offsets = []
+
+    def tearDown(self):
+        self._module_patcher.stop()
+
+    def _get_fake_phys_disk(self, sector_size=512):
+        fake_phys_disk = mock.MagicMock()
+        fake_phys_disk.get_geometry.return_value.BytesPerSector = sector_size
+        position = [0]
+
+        def seek(offset):
+            self.assertEqual(0, offset % sector_size)
+            position[0] = offset
+
+        def read_into(buf, offset=0, size=None):
+            # ctypes from_buffer requires a bytearray on Python 2
+            self.assertIsInstance(buf, bytearray)
+            if size is None:
+                size = len(buf) - offset
+            self.assertEqual(0, size % sector_size)
+            self._read_offsets.append(position[0])
+            data = self._image[position[0]:position[0] + size]
+            buf[offset:offset + len(data)] = data
+            return len(data)
+
+        fake_phys_disk.seek.side_effect = seek
+        fake_phys_disk.read_into.side_effect = read_into
+        return fake_phys_disk
+
+    def _get_reader(self, buffer_size=2048, read_ahead=False):
+        return self.physical_disk.BufferedDiskReader(
+            self._get_fake_phys_disk(), buffer_size=buffer_size,
+            read_ahead=read_ahead)
+
+    def test_buffer_size_aligned(self):
+        reader = self._get_reader(buffer_size=1000)
+        reader.read_at(0, 1)
+
+        self.assertEqual(512, reader._buffer_size)
+
+    def test_view_at(self):
+        reader = self._get_reader()
+
+        view = reader.view_at(2000, 100)
+
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(self._image[2000:2048], view.tobytes())
+        self.assertEqual(self._image[2048:2148],
+                         reader.view_at(2048, 100).tobytes())
+        self.assertEqual(0, len(reader.view_at(len(self._image), 10)))
+
+    def test_read_at(self):
+        reader = self._get_reader()
+
+        self.assertEqual(self._image[500:530], reader.read_at(500, 30))
+        self.assertEqual(self._image[1000:5000], reader.read_at(1000, 4000))
+        self.assertEqual(self._image[10000:], reader.read_at(10000, 1000))
+        self.assertEqual([0, 2048, 4096, 8192, 10240], self._read_offsets)
+
+    def test_read_at_buffered(self):
+        reader = self._get_reader()
+
+        reader.read_at(0, 10)
+        reader.read_at(100, 1000)
+
+        self.assertEqual([0], self._read_offsets)
+
+    def test_read_at_direct(self):
+        reader = self._get_reader()
+
+        data = reader.read_at(0, 5000)
+
+        self.assertIsInstance(data, bytearray)
+        self.assertEqual(self._image[:5000], data)
+        self.assertEqual([0, 4096], self._read_offsets)
+
+    def test_read_at_direct_physical_disk(self):
+        phys_disk = self.physical_disk.PhysicalDisk(mock.sentinel.fake_path)
+        fake_kernel32 = mock.MagicMock()
+        fake_kernel32.SetFilePointer.return_value = 0
+        position = [0]
+
+        def set_file_pointer(handle, low, high, move_method):
+            position[0] = low.value
+            return 0
+
+        def read_file(handle, c_buf, size, bytes_read, overlapped):
+            data = self._image[position[0]:position[0] + size]
+            c_buf[:len(data)] = data
+            bytes_read._obj.value = len(data)
+            return 1
+
+        fake_kernel32.SetFilePointer.side_effect = set_file_pointer
+        fake_kernel32.ReadFile.side_effect = read_file
+
+        with mock.patch.multiple(self.physical_disk, ctypes=ctypes,
+                                 wintypes=ctypes.wintypes,
+                                 kernel32=fake_kernel32):
+            with mock.patch.object(phys_disk, 'get_geometry') as mock_geom:
+                mock_geom.return_value.BytesPerSector = 512
+                reader = self.physical_disk.BufferedDiskReader(
+                    phys_disk, buffer_size=2048)
+                data = reader.read_at(2048, 5000)
+
+        self.assertEqual(self._image[2048:7048], data)
+        read_sizes = [c[0][2] for c in fake_kernel32.ReadFile.call_args_list]
+        self.assertEqual([4096, 2048], read_sizes)
+
+    def test_read_ahead(self):
+        reader = self._get_reader(read_ahead=True)
+
+        data = b''.join(iter(lambda: reader.read(1000), b''))
+        reader.close()
+
+        self.assertEqual(self._image, data)
+        self.assertEqual([0, 2048, 4096, 6144, 8192, 10240],
+                         self._read_offsets)
+
+    def test_read_ahead_error(self):
+        fake_phys_disk = self._get_fake_phys_disk()
+        reader = self.physical_disk.BufferedDiskReader(
+            fake_phys_disk, buffer_size=2048, read_ahead=True)
+        reader.view_at(0, 1)
+        reader.close()
+        fake_phys_disk.read_into.side_effect = (
+            cbinit_exception.CloudbaseInitException)
+
+        self.assertEqual(self._image[2048:2049], reader.read_at(2048, 1))
+        self.assertRaises(cbinit_exception.CloudbaseInitException,
+                          reader.view_at, 4096, 1)
+
+    def test_file_interface(self):
+        reader = self._get_reader()
+
+        self.assertTrue(reader.readable())
+        self.assertEqual(3000, reader.seek(3000))
+        self.assertEqual(self._image[3000:3010], reader.read(10))
+        self.assertEqual(3010, reader.tell())
+        self.assertEqual(3020, reader.seek(10, 1))
+        self.assertEqual(self._image[3020:], reader.read())
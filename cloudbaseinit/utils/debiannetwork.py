@@ -0,0 +1,305 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Parser for the Debian network interfaces format, see interfaces(5)."""
+
+import socket
+import struct
+
+from cloudbaseinit import exception
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+FAMILY_INET = 'inet'
+FAMILY_INET6 = 'inet6'
+
+METHOD_STATIC = 'static'
+
+_STANZA_KEYWORDS = ('iface', 'auto', 'mapping', 'source',
+                    'source-directory', 'source-dir')
+_ROUTE_COMMANDS = ('up', 'post-up')
+
+
+class NetworkInterface(object):
+    """The configuration of an interface, from all its iface stanzas.
+
+    addresses contains the IPv4 (address, netmask) tuples and addresses6
+    the IPv6 (address, prefix length) tuples. routes contains the IPv4
+    (destination, netmask, gateway) tuples of the route commands run when
+    the interface is brought up. The other options are available in
+    options, as lists of values.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.auto = False
+        self.method = None
+        self.method6 = None
+        self.hwaddress = None
+        self.addresses = []
+        self.addresses6 = []
+        self.broadcast = None
+        self.gateway = None
+        self.gateway6 = None
+        self.mtu = None
+        self.dns_nameservers = []
+        self.dns_search = []
+        self.routes = []
+        self.options = {}
+
+
+def _prefix_length_to_netmask(prefix_length):
+    return socket.inet_ntoa(struct.pack(
+        '!I', (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF))
+
+
+def _netmask_to_prefix_length(netmask):
+    value = struct.unpack('!I', socket.inet_aton(netmask))[0]
+    prefix_length = bin(value).count('1')
+    if value != (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF:
+        raise ValueError('Non contiguous netmask: %s' % netmask)
+    return prefix_length
+
+
+def _parse_ipv4_netmask(value):
+    if '.' in value:
+        _netmask_to_prefix_length(value)
+        return value
+    prefix_length = int(value)
+    if not 0 <= prefix_length <= 32:
+        raise ValueError('Invalid prefix length: %s' % value)
+    return _prefix_length_to_netmask(prefix_length)
+
+
+def _parse_ipv4_network(value):
+    """Returns the (address, netmask) tuple of address[/prefix length]."""
+    (address, sep, prefix_length) = value.partition('/')
+    socket.inet_aton(address)
+    if sep:
+        return (address, _parse_ipv4_netmask(prefix_length))
+    return (address, None)
+
+
+def tokenize(content):
+    """Yields the (line number, tokens) tuples of the logical lines.
+
+    Lines ending with a backslash are continued on the next line. Empty
+    lines and the lines starting with a '#' are skipped, comments at the
+    end of a line are not supported by the format.
+    """
+    tokens = []
+    first_line_number = None
+    for (line_number, line) in enumerate(content.splitlines(), 1):
+        if not tokens and line.lstrip()[:1] == '#':
+            continue
+        line = line.rstrip()
+        continued = line.endswith('\\')
+        if continued:
+            line = line[:-1]
+        if first_line_number is None:
+            first_line_number = line_number
+        tokens += line.split()
+        if not continued:
+            if tokens:
+                yield (first_line_number, tokens)
+            tokens = []
+            first_line_number = None
+    if tokens:
+        yield (first_line_number, tokens)
+
+
+def _parse_route_command(tokens):
+    """Returns the IPv4 route added by a route or an ip command, or None.
+
+    e.g.: "route add -net 10.0.0.0 netmask 255.0.0.0 gw 10.0.0.1" or
+    "ip route add 10.0.0.0/8 via 10.0.0.1".
+    """
+    if tokens[:2] == ['route', 'add']:
+        args = [t for t in tokens[2:] if t not in ('-net', '-host')]
+        gateway_keywords = ('gw', 'gateway')
+    elif tokens[:3] == ['ip', 'route', 'add']:
+        args = tokens[3:]
+        gateway_keywords = ('via',)
+    else:
+        return None
+    if not args:
+        return None
+
+    if args[0] == 'default':
+        (destination, netmask) = ('0.0.0.0', '0.0.0.0')
+    else:
+        (destination, netmask) = _parse_ipv4_network(args[0])
+    gateway = None
+    for (keyword, value) in zip(args[1:], args[2:]):
+        if keyword == 'netmask':
+            netmask = _parse_ipv4_netmask(value)
+        elif keyword in gateway_keywords:
+            gateway = value
+    return (destination, netmask or '255.255.255.255', gateway)
+
+
+def _pop_last(options, name):
+    values = options.pop(name, None)
+    if values:
+        return values[-1]
+
+
+class _Parser(object):
+
+    def __init__(self):
+        self._interfaces = []
+        self._interfaces_by_name = {}
+        self._auto = set()
+        # (line number, interface, family) of the current iface stanza
+        self._stanza = None
+        self._stanza_options = None
+
+    def _get_interface(self, name):
+        interface = self._interfaces_by_name.get(name)
+        if not interface:
+            interface = NetworkInterface(name)
+            self._interfaces.append(interface)
+            self._interfaces_by_name[name] = interface
+        return interface
+
+    def _error(self, line_number, message):
+        raise exception.CloudbaseInitException(
+            'Invalid network interfaces config at line %(line)d: '
+            '%(message)s' % {'line': line_number, 'message': message})
+
+    def _apply_inet_options(self, interface, options):
+        address = _pop_last(options, 'address')
+        netmask = _pop_last(options, 'netmask')
+        if address:
+            (address, prefix_netmask) = _parse_ipv4_network(address)
+            if netmask:
+                netmask = _parse_ipv4_netmask(netmask)
+            interface.addresses.append(
+                (address, netmask or prefix_netmask or '255.255.255.255'))
+        gateway = _pop_last(options, 'gateway')
+        if gateway:
+            socket.inet_aton(gateway)
+            interface.gateway = gateway
+        broadcast = _pop_last(options, 'broadcast')
+        if broadcast:
+            socket.inet_aton(broadcast)
+            interface.broadcast = broadcast
+        for command in _ROUTE_COMMANDS:
+            for value in options.get(command, []):
+                route = _parse_route_command(value.split())
+                if route:
+                    interface.routes.append(route)
+
+    def _apply_inet6_options(self, interface, options):
+        address = _pop_last(options, 'address')
+        netmask = _pop_last(options, 'netmask')
+        if address:
+            (address, sep, prefix_length) = address.partition('/')
+            interface.addresses6.append(
+                (address, int(netmask or prefix_length or 128)))
+        gateway = _pop_last(options, 'gateway')
+        if gateway:
+            interface.gateway6 = gateway
+
+    def _end_stanza(self):
+        if self._stanza is None:
+            return
+        (line_number, interface, family) = self._stanza
+        options = self._stanza_options
+        self._stanza = None
+        self._stanza_options = None
+        if interface is None:
+            # mapping stanza
+            return
+
+        try:
+            if family == FAMILY_INET:
+                self._apply_inet_options(interface, options)
+            elif family == FAMILY_INET6:
+                self._apply_inet6_options(interface, options)
+
+            mtu = _pop_last(options, 'mtu')
+            if mtu:
+                interface.mtu = int(mtu)
+            hwaddress = _pop_last(options, 'hwaddress')
+            if hwaddress:
+                # hwaddress [ether] mac_address
+                interface.hwaddress = hwaddress.split()[-1]
+            for value in options.pop('dns-nameservers', []):
+                interface.dns_nameservers += value.split()
+            for value in options.pop('dns-search', []):
+                interface.dns_search += value.split()
+        except (ValueError, socket.error) as ex:
+            self._error(line_number, 'iface %(name)s: %(ex)s' %
+                        {'name': interface.name, 'ex': ex})
+
+        for (name, values) in options.items():
+            interface.options.setdefault(name, []).extend(values)
+
+    def _start_stanza(self, line_number, tokens):
+        keyword = tokens[0]
+        if keyword == 'iface':
+            if len(tokens) < 4:
+                self._error(line_number, 'iface requires a name, an address '
+                            'family and a method')
+            (name, family, method) = tokens[1:4]
+            interface = self._get_interface(name)
+            if family == FAMILY_INET6:
+                interface.method6 = method
+            else:
+                interface.method = method
+            self._stanza = (line_number, interface, family)
+            self._stanza_options = {}
+        elif keyword in ('auto', 'allow-auto'):
+            self._auto.update(tokens[1:])
+        elif keyword == 'mapping':
+            # The mapping options are accepted and ignored
+            LOG.debug('Ignoring network interfaces mapping: %s' %
+                      ' '.join(tokens[1:]))
+            self._stanza = (line_number, None, None)
+            self._stanza_options = {}
+        elif keyword.startswith('source'):
+            LOG.debug('Ignoring network interfaces %(keyword)s: %(path)s' %
+                      {'keyword': keyword, 'path': ' '.join(tokens[1:])})
+        # Other allow-* stanzas, e.g. allow-hotplug, are not applicable
+
+    def parse(self, content):
+        for (line_number, tokens) in tokenize(content):
+            keyword = tokens[0]
+            if keyword in _STANZA_KEYWORDS or keyword.startswith('allow-'):
+                self._end_stanza()
+                self._start_stanza(line_number, tokens)
+            elif self._stanza is None:
+                self._error(line_number, 'option outside of a stanza: %s' %
+                            keyword)
+            elif len(tokens) < 2:
+                self._error(line_number, 'option without a value: %s' %
+                            keyword)
+            else:
+                self._stanza_options.setdefault(keyword, []).append(
+                    ' '.join(tokens[1:]))
+        self._end_stanza()
+
+        for interface in self._interfaces:
+            interface.auto = interface.name in self._auto
+        return self._interfaces
+
+
+def parse(content):
+    """Returns the NetworkInterface list, in the order of the content.
+
+    Raises a CloudbaseInitException if the content is not valid.
+    """
+    return _Parser().parse(content)
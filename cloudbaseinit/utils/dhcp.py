@@ -12,86 +12,262 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import datetime
+import errno
 import netifaces
 import random
+import select
 import socket
 import struct
+import threading
 import time
 
+from cloudbaseinit import exception
 from cloudbaseinit.openstack.common import log as logging
 
 _DHCP_COOKIE = b'\x63\x82\x53\x63'
+# op, htype, hlen, hops, xid, secs, flags, ciaddr, yiaddr, siaddr, giaddr,
+# chaddr, sname and file (left empty) and the magic cookie, see RFC 2131
+_HEADER = struct.Struct('!BBBBIHH4s4s4s4s16s192x4s')
+_OPTION_HEADER = struct.Struct('!BB')
+_MAX_OPTION_LENGTH = 255
+_ZERO_ADDRESS = b'\x00' * 4
 _OPTION_END = b'\xff'
 
-OPTION_MTU = 26
-OPTION_NTP_SERVERS = 42
-
-LOG = logging.getLogger(__name__)
-
-
-def _get_dhcp_request_data(id_req, mac_address, requested_options,
-                           vendor_id):
-
-    mac_address_b = bytearray.fromhex(mac_address.replace(':', ''))
-    # See: http://www.ietf.org/rfc/rfc2131.txt
-    data = b'\x01'
-    data += b'\x01'
-    data += b'\x06'
-    data += b'\x00'
-    data += struct.pack('!L', id_req)
-    data += b'\x00\x00'
-    data += b'\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += mac_address_b
-    data += b'\x00' * 10
-    data += b'\x00' * 64
-    data += b'\x00' * 128
-    data += _DHCP_COOKIE
-    data += b'\x35\x01\x01'
-
-    if vendor_id:
-        vendor_id_b = vendor_id.encode('ascii')
-        data += b'\x3c' + struct.pack('b', len(vendor_id_b)) + vendor_id_b
+BOOTREQUEST = 1
+BOOTREPLY = 2
 
-    data += b'\x3d\x07\x01' + mac_address_b
-    data += b'\x37' + struct.pack('b', len(requested_options))
+HTYPE_ETHERNET = 1
 
-    for option in requested_options:
-        data += struct.pack('b', option)
+DHCPDISCOVER = 1
+DHCPOFFER = 2
+DHCPREQUEST = 3
+DHCPACK = 5
 
-    data += _OPTION_END
-    return data
+OPTION_PAD = 0
+OPTION_MTU = 26
+OPTION_NTP_SERVERS = 42
+OPTION_MESSAGE_TYPE = 53
+OPTION_SERVER_ID = 54
+OPTION_PARAMETER_REQUEST_LIST = 55
+OPTION_VENDOR_CLASS_ID = 60
+OPTION_CLIENT_ID = 61
+OPTION_END = 255
 
+DHCP_SERVER_PORT = 67
+DHCP_CLIENT_PORT = 68
 
-def _parse_dhcp_reply(data, id_req):
-    message_type = struct.unpack('b', data[0:1])[0]
+# Requested by the plugins, queried together by the DHCP options cache
+DEFAULT_REQUESTED_OPTIONS = [OPTION_MTU, OPTION_NTP_SERVERS]
 
-    if message_type != 2:
-        return (False, {})
+_MAX_PACKET_SIZE = 4096
+# Non-blocking reads with nothing to read and ICMP port unreachable
+# errors reported for previously sent datagrams (WSAECONNRESET on Windows)
+_RECV_IGNORED_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED,
+                        errno.ECONNRESET, 10035, 10054)
 
-    id_reply = struct.unpack('!L', data[4:8])[0]
-    if id_reply != id_req:
-        return (False, {})
+LOG = logging.getLogger(__name__)
 
-    if data[236:240] != _DHCP_COOKIE:
-        return (False, {})
 
-    options = {}
+def _get_hardware_address(mac_address):
+    return bytes(bytearray.fromhex(mac_address.replace(':', '')))
+
+
+def _address_property(name):
+    # Addresses are kept packed, they are converted only when accessed
+    def get_address(self):
+        return socket.inet_ntoa(getattr(self, name))
+
+    def set_address(self, address):
+        setattr(self, name, socket.inet_aton(address))
+
+    return property(get_address, set_address)
+
+
+class DhcpPacket(object):
+    """A DHCP packet, with its options encoded as TLVs (RFC 2132).
+
+    Options longer than 255 bytes are split in multiple TLVs when encoded
+    and the TLVs with the same code are concatenated when decoded, as
+    described in RFC 3396. Options are encoded in the order they are set.
+    """
+
+    ciaddr = _address_property('_ciaddr')
+    yiaddr = _address_property('_yiaddr')
+    siaddr = _address_property('_siaddr')
+    giaddr = _address_property('_giaddr')
+
+    def __init__(self, op=BOOTREQUEST, xid=0, chaddr=b'',
+                 htype=HTYPE_ETHERNET):
+        self.op = op
+        self.htype = htype
+        self.hops = 0
+        self.xid = xid
+        self.secs = 0
+        self.flags = 0
+        self._ciaddr = _ZERO_ADDRESS
+        self._yiaddr = _ZERO_ADDRESS
+        self._siaddr = _ZERO_ADDRESS
+        self._giaddr = _ZERO_ADDRESS
+        self.chaddr = chaddr
+        self._options = {}
+        self._options_order = []
+        # Encoded TLVs, reused until the options change
+        self._encoded_options = None
+
+    @classmethod
+    def from_mac_address(cls, mac_address, **kwargs):
+        return cls(chaddr=_get_hardware_address(mac_address), **kwargs)
+
+    def get_options(self):
+        return dict(self._options)
+
+    def get_option(self, code, default=None):
+        return self._options.get(code, default)
+
+    def set_option(self, code, value):
+        if not 0 < code < OPTION_END:
+            raise exception.CloudbaseInitException(
+                'Invalid DHCP option code: %s' % code)
+        if code not in self._options:
+            self._options_order.append(code)
+        self._options[code] = bytes(value)
+        self._encoded_options = None
+
+    def remove_option(self, code):
+        if self._options.pop(code, None) is not None:
+            self._options_order.remove(code)
+            self._encoded_options = None
+
+    def get_option_int(self, code, default=None):
+        """Returns an unsigned 8, 16 or 32 bit option value."""
+        value = self._options.get(code)
+        if value is None:
+            return default
+        fmt = {1: '!B', 2: '!H', 4: '!I'}.get(len(value))
+        if not fmt:
+            raise exception.CloudbaseInitException(
+                'Invalid integer DHCP option %(code)s length: %(length)s' %
+                {'code': code, 'length': len(value)})
+        return struct.unpack(fmt, value)[0]
+
+    def set_option_int(self, code, value, size=1):
+        fmt = {1: '!B', 2: '!H', 4: '!I'}[size]
+        self.set_option(code, struct.pack(fmt, value))
+
+    def get_option_addresses(self, code):
+        """Returns the IPv4 addresses list of an option, e.g. NTP servers."""
+        value = self._options.get(code)
+        if not value:
+            return []
+        if len(value) % 4:
+            raise exception.CloudbaseInitException(
+                'Invalid addresses DHCP option %(code)s length: %(length)s' %
+                {'code': code, 'length': len(value)})
+        return [socket.inet_ntoa(value[i:i + 4])
+                for i in range(0, len(value), 4)]
+
+    def set_option_addresses(self, code, addresses):
+        self.set_option(code, b''.join(socket.inet_aton(address)
+                                       for address in addresses))
+
+    def _encode_options(self):
+        if self._encoded_options is None:
+            tlvs = []
+            for code in self._options_order:
+                value = self._options[code]
+                # Empty options are encoded too
+                for start in range(0, len(value) or 1, _MAX_OPTION_LENGTH):
+                    part = value[start:start + _MAX_OPTION_LENGTH]
+                    tlvs.append(_OPTION_HEADER.pack(code, len(part)) + part)
+            tlvs.append(_OPTION_END)
+            self._encoded_options = b''.join(tlvs)
+        return self._encoded_options
+
+    def get_size(self):
+        return _HEADER.size + len(self._encode_options())
+
+    def pack_into(self, buf, offset=0):
+        """Encodes the packet in a writable buffer, returns its size."""
+        _HEADER.pack_into(buf, offset, self.op, self.htype, len(self.chaddr),
+                          self.hops, self.xid, self.secs, self.flags,
+                          self._ciaddr, self._yiaddr, self._siaddr,
+                          self._giaddr, self.chaddr, _DHCP_COOKIE)
+        options = self._encode_options()
+        i = offset + _HEADER.size
+        buf[i:i + len(options)] = options
+        return _HEADER.size + len(options)
+
+    def to_bytes(self):
+        return _HEADER.pack(self.op, self.htype, len(self.chaddr), self.hops,
+                            self.xid, self.secs, self.flags, self._ciaddr,
+                            self._yiaddr, self._siaddr, self._giaddr,
+                            self.chaddr, _DHCP_COOKIE) + self._encode_options()
+
+    @classmethod
+    def parse(cls, data):
+        """Decodes a packet from a bytes like object.
+
+        Raises a CloudbaseInitException if the data is not a DHCP packet.
+        """
+        view = memoryview(data)
+        if len(view) < _HEADER.size:
+            raise exception.CloudbaseInitException(
+                'DHCP packet too short: %d' % len(view))
+        (op, htype, hlen, hops, xid, secs, flags, ciaddr, yiaddr, siaddr,
+         giaddr, chaddr, cookie) = _HEADER.unpack_from(view, 0)
+        if cookie != _DHCP_COOKIE:
+            raise exception.CloudbaseInitException(
+                'DHCP magic cookie not found')
+
+        packet = cls(op=op, xid=xid, chaddr=chaddr[:min(hlen, 16)],
+                     htype=htype)
+        packet.hops = hops
+        packet.secs = secs
+        packet.flags = flags
+        packet._ciaddr = ciaddr
+        packet._yiaddr = yiaddr
+        packet._siaddr = siaddr
+        packet._giaddr = giaddr
+
+        # A single copy of the options area, indexing a bytearray returns
+        # integers on Python 2 and 3
+        tlvs = bytearray(view[_HEADER.size:])
+        options = packet._options
+        options_order = packet._options_order
+        tlvs_len = len(tlvs)
+        i = 0
+        while i < tlvs_len:
+            code = tlvs[i]
+            if code == OPTION_END:
+                break
+            if code == OPTION_PAD:
+                i += 1
+                continue
+            if i + 1 >= tlvs_len:
+                break
+            end = i + 2 + tlvs[i + 1]
+            value = bytes(tlvs[i + 2:end])
+            if code in options:
+                options[code] += value
+            else:
+                options_order.append(code)
+                options[code] = value
+            i = end
+        return packet
 
-    i = 240
-    data_len = len(data)
-    while i < data_len and data[i:i + 1] != _OPTION_END:
-        id_option = struct.unpack('b', data[i:i + 1])[0]
-        option_data_len = struct.unpack('b', data[i + 1:i + 2])[0]
-        i += 2
-        options[id_option] = data[i: i + option_data_len]
-        i += option_data_len
 
-    return (True, options)
+def _get_dhcp_request_data(id_req, mac_address, requested_options,
+                           vendor_id):
+    # See: http://www.ietf.org/rfc/rfc2131.txt
+    packet = DhcpPacket.from_mac_address(mac_address, xid=id_req)
+    packet.set_option_int(OPTION_MESSAGE_TYPE, DHCPDISCOVER)
+    if vendor_id:
+        packet.set_option(OPTION_VENDOR_CLASS_ID, vendor_id.encode('ascii'))
+    packet.set_option(OPTION_CLIENT_ID,
+                      struct.pack('!B', HTYPE_ETHERNET) + packet.chaddr)
+    packet.set_option(OPTION_PARAMETER_REQUEST_LIST,
+                      bytes(bytearray(requested_options)))
+    return packet.to_bytes()
 
 
 def _get_mac_address_by_local_ip(ip_addr):
@@ -102,15 +278,26 @@ def _get_mac_address_by_local_ip(ip_addr):
                 return addrs[netifaces.AF_LINK][0]['addr']
 
 
+def _get_local_ip_addr(dhcp_host):
+    # Connecting an UDP socket doesn't send any packet, it selects the
+    # address of the interface used to reach the DHCP server
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((dhcp_host, DHCP_SERVER_PORT))
+        return s.getsockname()[0]
+    finally:
+        s.close()
+
+
 def _bind_dhcp_client_socket(s, max_bind_attempts, bind_retry_interval):
     bind_attempts = 1
     while True:
         try:
-            s.bind(('', 68))
+            s.bind(('', DHCP_CLIENT_PORT))
             break
         except socket.error as ex:
             if (bind_attempts >= max_bind_attempts or
-                    ex.errno not in [48, 10048]):
+                    ex.errno not in [48, 98, 10048]):
                 raise
             bind_attempts += 1
             LOG.exception(ex)
@@ -119,37 +306,164 @@ def _bind_dhcp_client_socket(s, max_bind_attempts, bind_retry_interval):
             time.sleep(bind_retry_interval)
 
 
+class DhcpClient(object):
+    """Queries multiple DHCP servers concurrently over a single socket.
+
+    The requests for all the interfaces are sent at once from a
+    non-blocking socket bound to the DHCP client port. The replies are
+    matched to the requests by transaction id and MAC address until all
+    of them are received or the timeout expires, so the total time is
+    bounded by the slowest server.
+    """
+
+    def __init__(self, vendor_id='cloudbase-init', max_bind_attempts=10,
+                 bind_retry_interval=3):
+        self._vendor_id = vendor_id
+        self._max_bind_attempts = max_bind_attempts
+        self._bind_retry_interval = bind_retry_interval
+
+    def _create_socket(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            _bind_dhcp_client_socket(s, self._max_bind_attempts,
+                                     self._bind_retry_interval)
+            s.setblocking(False)
+        except Exception:
+            s.close()
+            raise
+        return s
+
+    def _send_requests(self, s, interfaces, requested_options):
+        pending = {}
+        for i, (mac_address, dhcp_host) in enumerate(interfaces):
+            xid = random.randint(0, 2 ** 32 - 1)
+            while xid in pending:
+                xid = random.randint(0, 2 ** 32 - 1)
+            data = _get_dhcp_request_data(xid, mac_address,
+                                          requested_options, self._vendor_id)
+            try:
+                s.sendto(data, (dhcp_host, DHCP_SERVER_PORT))
+            except socket.error as ex:
+                LOG.debug('Failed to send the DHCP request to %(dhcp_host)s: '
+                          '%(ex)s' % {'dhcp_host': dhcp_host, 'ex': ex})
+                continue
+            pending[xid] = (i, _get_hardware_address(mac_address))
+        return pending
+
+    def _handle_reply(self, data, pending, results):
+        try:
+            packet = DhcpPacket.parse(data)
+        except exception.CloudbaseInitException as ex:
+            LOG.debug('Invalid DHCP reply: %s' % ex)
+            return
+
+        request = pending.get(packet.xid)
+        if (packet.op != BOOTREPLY or not request or
+                packet.chaddr != request[1]):
+            return
+        del pending[packet.xid]
+        results[request[0]] = packet.get_options()
+
+    def get_options(self, interfaces, requested_options, timeout=5.0):
+        """Queries the (mac_address, dhcp_host) interfaces.
+
+        Returns the options of each interface in the same order, None for
+        the interfaces whose DHCP server did not reply before the timeout.
+        """
+        results = [None] * len(interfaces)
+        if not interfaces:
+            return results
+
+        s = self._create_socket()
+        try:
+            deadline = time.time() + timeout
+            pending = self._send_requests(s, interfaces, requested_options)
+            buf = bytearray(_MAX_PACKET_SIZE)
+            view = memoryview(buf)
+            while pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                (readable, writable, errors) = select.select(
+                    [s], [], [], remaining)
+                if not readable:
+                    continue
+                try:
+                    size = s.recv_into(buf)
+                except socket.error as ex:
+                    if ex.errno in _RECV_IGNORED_ERRORS:
+                        continue
+                    raise
+                self._handle_reply(view[:size], pending, results)
+        finally:
+            s.close()
+
+        return results
+
+
 def get_dhcp_options(dhcp_host, requested_options=[], timeout=5.0,
                      vendor_id='cloudbase-init', max_bind_attempts=10,
-                     bind_retry_interval=3):
-    id_req = random.randint(0, 2 ** 32 - 1)
-    options = None
+                     bind_retry_interval=3, mac_address=None):
+    if not mac_address:
+        mac_address = _get_mac_address_by_local_ip(
+            _get_local_ip_addr(dhcp_host))
+
+    client = DhcpClient(vendor_id, max_bind_attempts, bind_retry_interval)
+    return client.get_options([(mac_address, dhcp_host)], requested_options,
+                              timeout)[0]
 
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        _bind_dhcp_client_socket(s, max_bind_attempts, bind_retry_interval)
-
-        s.settimeout(timeout)
-        s.connect((dhcp_host, 67))
-
-        local_ip_addr = s.getsockname()[0]
-        mac_address = _get_mac_address_by_local_ip(local_ip_addr)
-
-        data = _get_dhcp_request_data(id_req, mac_address, requested_options,
-                                      vendor_id)
-        s.send(data)
-
-        start = datetime.datetime.now()
-        now = start
-        replied = False
-        while (not replied and
-                now - start < datetime.timedelta(seconds=timeout)):
-            data = s.recv(1024)
-            (replied, options) = _parse_dhcp_reply(data, id_req)
-            now = datetime.datetime.now()
-    except socket.timeout:
-        pass
-    finally:
-        s.close()
 
-    return options
+class DhcpOptionsCache(object):
+    """Queries the DHCP servers in use once and caches their options.
+
+    All the DHCP enabled interfaces are queried at once with DhcpClient,
+    with the union of the options requested so far and of
+    DEFAULT_REQUESTED_OPTIONS. The servers are queried again only when
+    options not included in a previous query are requested.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requested_options = set(DEFAULT_REQUESTED_OPTIONS)
+        self._queried_options = None
+        self._results = None
+
+    def _query(self, osutils, requested_options):
+        dhcp_hosts = osutils.get_dhcp_hosts_in_use()
+        try:
+            options = DhcpClient().get_options(dhcp_hosts, requested_options)
+        except Exception as ex:
+            LOG.error('Failed to get the DHCP options: %s' % ex)
+            LOG.exception(ex)
+            options = [None] * len(dhcp_hosts)
+        return [(mac_address, dhcp_host, options[i])
+                for i, (mac_address, dhcp_host) in enumerate(dhcp_hosts)]
+
+    def get_options(self, osutils, requested_options):
+        """Returns a (mac_address, dhcp_host, options) tuple per interface.
+
+        options is None if the DHCP server did not reply.
+        """
+        with self._lock:
+            self._requested_options.update(requested_options)
+            if (self._results is None or
+                    not self._queried_options.issuperset(requested_options)):
+                queried_options = sorted(self._requested_options)
+                self._results = self._query(osutils, queried_options)
+                self._queried_options = set(queried_options)
+            return list(self._results)
+
+    def clear(self):
+        with self._lock:
+            self._queried_options = None
+            self._results = None
+
+
+_dhcp_options_cache = DhcpOptionsCache()
+
+
+def get_cached_dhcp_options(osutils, requested_options):
+    """Returns the options of all the DHCP servers in use, see
+    DhcpOptionsCache.get_options.
+    """
+    return _dhcp_options_cache.get_options(osutils, requested_options)
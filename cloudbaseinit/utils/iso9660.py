@@ -0,0 +1,234 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import posixpath
+import struct
+
+from cloudbaseinit import exception
+
+SECTOR_SIZE = 2048
+VOLUME_DESCRIPTORS_OFFSET = 16 * SECTOR_SIZE
+ISO9660_ID = b'CD001'
+
+_VD_PRIMARY = 1
+_VD_SUPPLEMENTARY = 2
+_VD_TERMINATOR = 255
+# Limits the number of descriptors read on invalid images
+_MAX_VOLUME_DESCRIPTORS = 32
+
+_JOLIET_ESCAPE_SEQUENCES = [b'%/@', b'%/C', b'%/E']
+
+_FLAG_DIRECTORY = 2
+
+
+class FileBlockDevice(object):
+    """Reads an ISO image from a file object, e.g. an image file."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def read_at(self, offset, size):
+        self._f.seek(offset)
+        return self._f.read(size)
+
+
+class DirectoryRecord(object):
+    def __init__(self, name, extent, size, is_dir):
+        self.name = name
+        self.extent = extent
+        self.size = size
+        self.is_dir = is_dir
+
+
+def _get_iso_name(file_id):
+    # Removes the version and the trailing dot of names without extension
+    name = file_id.decode('ascii', 'replace').split(';')[0]
+    if name.endswith('.'):
+        name = name[:-1]
+    return name.lower()
+
+
+def _get_rock_ridge_name(system_use):
+    name = b''
+    offset = 0
+    while offset + 4 <= len(system_use):
+        (signature, length) = struct.unpack_from('<2sB', system_use, offset)
+        if length < 4:
+            break
+        if signature == b'NM':
+            flags = bytearray(system_use[offset + 4:offset + 5])[0]
+            name += system_use[offset + 5:offset + length]
+            if not flags & 1:
+                # No continuation entry
+                return name.decode('utf-8', 'replace')
+        offset += length
+    if name:
+        return name.decode('utf-8', 'replace')
+
+
+class ISO9660Reader(object):
+    """Reads files from ISO9660 images, including Joliet and Rock Ridge.
+
+    The device needs to provide a read_at(offset, size) method. Only the
+    volume descriptors, the directories in the requested paths and the
+    requested files are read.
+    """
+
+    def __init__(self, device):
+        self._device = device
+        self._joliet = False
+        self._block_size = None
+        self._volume_size = None
+        self._volume_label = None
+        self._root = None
+        self._load_volume_descriptors()
+
+    def _read(self, offset, size):
+        data = self._device.read_at(offset, size)
+        if len(data) < size:
+            raise exception.CloudbaseInitException(
+                'Unexpected end of the ISO image at offset: %d' % offset)
+        return data
+
+    def _load_volume_descriptors(self):
+        primary = None
+        joliet = None
+
+        for i in range(_MAX_VOLUME_DESCRIPTORS):
+            vd = self._read(VOLUME_DESCRIPTORS_OFFSET + i * SECTOR_SIZE,
+                            SECTOR_SIZE)
+            (vd_type, vd_id) = struct.unpack_from('<B5s', vd)
+            if vd_id != ISO9660_ID:
+                break
+            if vd_type == _VD_TERMINATOR:
+                break
+            elif vd_type == _VD_PRIMARY and not primary:
+                primary = vd
+            elif (vd_type == _VD_SUPPLEMENTARY and not joliet and
+                    vd[88:91] in _JOLIET_ESCAPE_SEQUENCES):
+                joliet = vd
+
+        if not primary:
+            raise exception.CloudbaseInitException(
+                'ISO9660 primary volume descriptor not found')
+
+        (volume_blocks,) = struct.unpack_from('<I', primary, 80)
+        (self._block_size,) = struct.unpack_from('<H', primary, 128)
+        self._volume_size = volume_blocks * self._block_size
+        # The volume identifier is padded with spaces
+        self._volume_label = primary[40:72].decode(
+            'ascii', 'replace').rstrip(' \x00') or None
+
+        self._joliet = joliet is not None
+        self._root = self._parse_record(joliet or primary, 156)
+
+    def get_volume_size(self):
+        return self._volume_size
+
+    def get_volume_label(self):
+        return self._volume_label
+
+    def _parse_record(self, data, offset):
+        (length, ext_attr_length, extent, size, flags,
+         name_length) = struct.unpack_from('<BBI4xI11xB6xB', data, offset)
+        file_id = data[offset + 33:offset + 33 + name_length]
+
+        if file_id in (b'\x00', b'\x01'):
+            name = None
+        elif self._joliet:
+            name = file_id.decode('utf-16-be', 'replace').split(';')[0]
+        else:
+            # The file identifier is padded to an even offset
+            su_offset = offset + 33 + name_length + (1 - name_length % 2)
+            name = _get_rock_ridge_name(data[su_offset:offset + length])
+            if not name:
+                name = _get_iso_name(file_id)
+
+        return DirectoryRecord(name, extent + ext_attr_length, size,
+                               bool(flags & _FLAG_DIRECTORY))
+
+    def _read_extent(self, record):
+        return self._read(record.extent * self._block_size, record.size)
+
+    def _list_records(self, dir_record):
+        data = self._read_extent(dir_record)
+        records = []
+        offset = 0
+        while offset < len(data):
+            length = bytearray(data[offset:offset + 1])[0]
+            if not length:
+                # Records don't span across sectors, skip to the next one
+                offset = (offset // self._block_size + 1) * self._block_size
+                continue
+            record = self._parse_record(data, offset)
+            if record.name:
+                records.append(record)
+            offset += length
+        return records
+
+    def _find_record(self, path):
+        record = self._root
+        for name in [n for n in path.split('/') if n]:
+            if not record.is_dir:
+                return None
+            for child in self._list_records(record):
+                if child.name == name:
+                    record = child
+                    break
+            else:
+                return None
+        return record
+
+    def list_dir(self, path):
+        record = self._find_record(path)
+        if not record or not record.is_dir:
+            raise exception.CloudbaseInitException(
+                'Directory not found in the ISO image: %s' % path)
+        return [r.name for r in self._list_records(record)]
+
+    def read_file(self, path):
+        record = self._find_record(path)
+        if not record or record.is_dir:
+            raise exception.CloudbaseInitException(
+                'File not found in the ISO image: %s' % path)
+        return self._read_extent(record)
+
+    def _extract_record(self, record, target_path):
+        if record.is_dir:
+            if not os.path.isdir(target_path):
+                os.makedirs(target_path)
+            count = 0
+            for child in self._list_records(record):
+                if (child.name in ('.', '..') or '/' in child.name or
+                        '\\' in child.name):
+                    # Don't write outside of the target path
+                    continue
+                count += self._extract_record(
+                    child, os.path.join(target_path, child.name))
+            return count
+        else:
+            with open(target_path, 'wb') as f:
+                f.write(self._read_extent(record))
+            return 1
+
+    def extract(self, path, target_path):
+        """Extracts a file or a directory tree, returns the files count.
+
+        Nothing is extracted if the path doesn't exist in the image.
+        """
+        record = self._find_record(posixpath.normpath(path))
+        if not record:
+            return 0
+        return self._extract_record(record, target_path)
@@ -0,0 +1,221 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Incremental decompression and MIME multipart parsing of user data."""
+
+import codecs
+import email
+from email import feedparser
+import re
+import zlib
+
+import six
+
+GZIP_MAGIC_NUMBER = b'\x1f\x8b'
+CHUNK_SIZE = 64 * 1024
+
+_HEADERS_END_RE = re.compile(b'\n\r?\n')
+
+
+def iter_decompressed(data, chunk_size=CHUNK_SIZE):
+    """Yields the content of data in chunks, gunzipping it if needed.
+
+    The decompressed chunks are at most chunk_size bytes long, the whole
+    decompressed content is never held in memory.
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+
+    if data[:2] != GZIP_MAGIC_NUMBER:
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+        return
+
+    # 16 + MAX_WBITS: gzip header and trailer
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for offset in range(0, len(data), chunk_size):
+        compressed = data[offset:offset + chunk_size]
+        while compressed:
+            chunk = decompressor.decompress(compressed, chunk_size)
+            if chunk:
+                yield chunk
+            compressed = decompressor.unconsumed_tail
+            if not compressed and decompressor.unused_data:
+                # Concatenated gzip members, like GzipFile supports
+                compressed = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+
+
+def _split_eol(data):
+    if data.endswith(b'\r\n'):
+        return (data[:-2], b'\r\n')
+    if data.endswith(b'\n'):
+        return (data[:-1], b'\n')
+    if data.endswith(b'\r'):
+        # The line feed may be in the next chunk
+        return (data[:-1], b'\r')
+    return (data, b'')
+
+
+class MultipartStreamParser(object):
+    """Push parser splitting a MIME multipart message in its parts.
+
+    The parts are returned by feed and close as soon as their closing
+    delimiter is read, as email.message.Message objects, in the same order
+    as the walk method of the whole parsed message: the multipart message
+    (with its headers only) first, then each part and its nested parts.
+    Only the part being read is buffered, so the memory used is bounded by
+    the largest part instead of by the whole message.
+    """
+
+    def __init__(self):
+        self._message = None
+        # Header bytes, or the start of a line that may be a delimiter
+        self._buffer = b''
+        self._delimiter = None
+        self._delimiter_re = None
+        self._mid_line = False
+        self._part_parser = None
+        self._part_decoder = None
+        # The line ending preceding a delimiter belongs to the delimiter
+        self._pending_eol = b''
+        self._done = False
+
+    def feed(self, data):
+        """Returns the list of the parts completed by data."""
+        parts = []
+        if self._message is None:
+            data = self._parse_headers(self._buffer + data, parts)
+            if not data:
+                return parts
+        if not self._done:
+            self._parse_body(data, parts)
+        return parts
+
+    def close(self):
+        """Returns the list of the remaining parts."""
+        parts = []
+        if self._message is None:
+            if self._buffer:
+                parts.append(email.message_from_string(
+                    self._buffer.decode('utf-8')))
+            return parts
+
+        if self._buffer and self._delimiter_re and not self._done:
+            match = self._delimiter_re.match(self._buffer)
+            if match:
+                self._pending_eol = b''
+                self._end_part(parts, match.group(1))
+            else:
+                self._feed_part(self._buffer)
+        self._buffer = b''
+
+        # The line ending at the end of the last part is dropped as well
+        self._end_part(parts, True)
+        return parts
+
+    def _parse_headers(self, data, parts):
+        match = _HEADERS_END_RE.search(data)
+        if not match:
+            self._buffer = data
+            return None
+        self._buffer = b''
+
+        headers = data[:match.end()].decode('utf-8')
+        self._message = email.message_from_string(headers)
+        boundary = self._message.get_boundary()
+        if not boundary:
+            # Without a boundary the body is not split in parts, the whole
+            # message is parsed at once
+            self._start_part()
+            self._part_parser.feed(headers)
+            return data[match.end():]
+        parts.append(self._message)
+
+        self._delimiter = b'--' + boundary.encode('utf-8')
+        self._delimiter_re = re.compile(
+            b'^' + re.escape(self._delimiter) + b'(--)?[ \t]*\r?$', re.M)
+        return data[match.end():]
+
+    def _parse_body(self, data, parts):
+        if not self._delimiter_re:
+            self._part_parser.feed(self._part_decoder.decode(data))
+            return
+
+        if self._buffer:
+            data = self._buffer + data
+            self._buffer = b''
+        elif self._mid_line:
+            end = data.find(b'\n') + 1
+            if not end:
+                self._feed_part(data)
+                return
+            self._feed_part(data[:end])
+            data = data[end:]
+            self._mid_line = False
+
+        end = data.rfind(b'\n') + 1
+        tail = data[end:]
+        position = 0
+        for match in self._delimiter_re.finditer(data, 0, end):
+            self._feed_part(data[position:match.start()])
+            self._pending_eol = b''
+            self._end_part(parts, match.group(1))
+            if self._done:
+                return
+            position = match.end() + 1
+        self._feed_part(data[position:end])
+
+        if (self._delimiter.startswith(tail) or
+                tail.startswith(self._delimiter)):
+            self._buffer = tail
+        else:
+            self._feed_part(tail)
+            self._mid_line = True
+
+    def _feed_part(self, data):
+        if not self._part_parser:
+            # Preamble
+            return
+        (data, eol) = _split_eol(self._pending_eol + data)
+        self._pending_eol = eol
+        if data:
+            self._part_parser.feed(self._part_decoder.decode(data))
+
+    def _end_part(self, parts, last):
+        if self._part_parser:
+            self._part_parser.feed(self._part_decoder.decode(b'', True))
+            parts.extend(self._part_parser.close().walk())
+            self._part_parser = None
+        if last:
+            self._done = True
+        else:
+            self._start_part()
+
+    def _start_part(self):
+        self._part_parser = feedparser.FeedParser()
+        self._part_decoder = codecs.getincrementaldecoder('utf-8')()
+
+
+def iter_parts(chunks):
+    """Yields the parts of the MIME multipart message read from chunks."""
+    parser = MultipartStreamParser()
+    for chunk in chunks:
+        for part in parser.feed(chunk):
+            yield part
+    for part in parser.close():
+        yield part
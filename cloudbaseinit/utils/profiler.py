@@ -0,0 +1,145 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+from oslo.config import cfg
+
+from cloudbaseinit.openstack.common import log as logging
+
+opts = [
+    cfg.StrOpt('timing_report_path', default=None,
+               help='Path of the file where a JSON report with the time '
+               'spent in each phase of the execution and in each plugin is '
+               'written. The report is overwritten at each execution'),
+    cfg.BoolOpt('timing_report_log', default=False,
+                help='Writes the JSON timing report to the log, including '
+                'the serial port log if enabled'),
+    cfg.StrOpt('profile_plugin', default=None,
+               help='Name of a plugin, e.g. "SetUserPasswordPlugin", whose '
+               'execution is profiled with cProfile'),
+    cfg.StrOpt('profile_dump_dir', default=None,
+               help='Directory where the cProfile stats of the plugin set '
+               'in "profile_plugin" are dumped. Defaults to the directory of '
+               '"timing_report_path" or, if not set, the temp directory'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+LOG = logging.getLogger(__name__)
+
+# Process wide CPU time. Python 2 has only time.clock, which measures CPU
+# time on POSIX but wall time on Windows
+_get_cpu_time = getattr(time, 'process_time', None) or time.clock
+
+
+class BootProfiler(object):
+    """Records the wall and CPU time spent in each phase of the execution.
+
+    CPU time is measured for the whole process, so it includes the time
+    consumed by other threads, e.g. when plugins are executed in parallel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        self._start_cpu_time = _get_cpu_time()
+        self._phases = []
+        self._plugins = []
+        self._metadata = {}
+        self._imports = {}
+
+    @contextlib.contextmanager
+    def measure(self, name, plugin=False):
+        start = time.time()
+        start_cpu = _get_cpu_time()
+        try:
+            yield
+        finally:
+            timing = {'name': name,
+                      'start': round(start - self._start_time, 6),
+                      'wall_time': round(time.time() - start, 6),
+                      'cpu_time': round(_get_cpu_time() - start_cpu, 6)}
+            with self._lock:
+                if plugin:
+                    self._plugins.append(timing)
+                else:
+                    self._phases.append(timing)
+
+    def add_metadata_stats(self, service_name, stats):
+        with self._lock:
+            self._metadata[service_name] = dict(stats)
+
+    def add_import_times(self, import_times):
+        with self._lock:
+            self._imports.update(import_times)
+
+    def run_plugin(self, plugin_name, func, *args, **kwargs):
+        """Executes a plugin, profiling it if requested in the config."""
+        with self.measure(plugin_name, plugin=True):
+            if CONF.profile_plugin != plugin_name:
+                return func(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                self._dump_profile(plugin_name, profile)
+
+    def _dump_profile(self, plugin_name, profile):
+        dump_dir = CONF.profile_dump_dir
+        if not dump_dir and CONF.timing_report_path:
+            dump_dir = os.path.dirname(CONF.timing_report_path)
+        if not dump_dir:
+            dump_dir = os.environ.get('TEMP', '/tmp')
+
+        path = os.path.join(dump_dir, '%s.prof' % plugin_name)
+        try:
+            profile.dump_stats(path)
+            LOG.info('Plugin \'%(plugin_name)s\' profile saved in: '
+                     '%(path)s' % {'plugin_name': plugin_name, 'path': path})
+        except (IOError, OSError) as ex:
+            LOG.error('Failed to save the profile of plugin \'%(plugin_name)s'
+                      '\': %(ex)s' % {'plugin_name': plugin_name, 'ex': ex})
+
+    def get_report(self):
+        with self._lock:
+            return {'timestamp': self._start_time,
+                    'wall_time': round(time.time() - self._start_time, 6),
+                    'cpu_time': round(_get_cpu_time() -
+                                      self._start_cpu_time, 6),
+                    'phases': list(self._phases),
+                    'plugins': list(self._plugins),
+                    'metadata': dict(self._metadata),
+                    'imports': dict(self._imports)}
+
+    def save_report(self):
+        if not CONF.timing_report_path and not CONF.timing_report_log:
+            return
+
+        report = json.dumps(self.get_report(), sort_keys=True)
+        if CONF.timing_report_log:
+            LOG.info('Timing report: %s' % report)
+        if CONF.timing_report_path:
+            try:
+                with open(CONF.timing_report_path, 'w') as f:
+                    f.write(report)
+            except (IOError, OSError) as ex:
+                LOG.error('Failed to save the timing report: %s' % ex)
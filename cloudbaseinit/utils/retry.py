@@ -0,0 +1,140 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import random
+import socket
+import threading
+import time
+
+from six.moves import http_client
+from six.moves.urllib import error
+
+from cloudbaseinit.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# The network related errors include the ones raised while the network
+# adapter is still being configured during boot, e.g. by DHCP
+_RETRYABLE_ERRNOS = set([
+    getattr(errno, name) for name in
+    ['ECONNREFUSED', 'ECONNRESET', 'ECONNABORTED', 'ETIMEDOUT',
+     'EHOSTUNREACH', 'ENETUNREACH', 'ENETDOWN', 'ENETRESET', 'EHOSTDOWN',
+     'EADDRNOTAVAIL', 'ENOBUFS', 'WSAECONNREFUSED', 'WSAECONNRESET',
+     'WSAECONNABORTED', 'WSAETIMEDOUT', 'WSAEHOSTUNREACH', 'WSAENETUNREACH',
+     'WSAENETDOWN', 'WSAENETRESET', 'WSAEHOSTDOWN', 'WSAEADDRNOTAVAIL',
+     'WSAENOBUFS']
+    if hasattr(errno, name)])
+
+
+def is_retryable_error(ex):
+    """Tells if the error is likely transient.
+
+    Timeouts, server errors (HTTP 5xx), refused, reset or unreachable
+    connections and a network not yet available are retryable. Name
+    resolution failures, client errors (HTTP 4xx) and the other socket
+    errors are not. Other errors are considered retryable.
+    """
+    if isinstance(ex, error.HTTPError):
+        return ex.code >= 500
+    if isinstance(ex, error.URLError) and isinstance(ex.reason, Exception):
+        return is_retryable_error(ex.reason)
+    if isinstance(ex, socket.timeout):
+        return True
+    if isinstance(ex, socket.gaierror):
+        return False
+    if isinstance(ex, (socket.error, IOError)) and ex.errno:
+        return ex.errno in _RETRYABLE_ERRNOS
+    if isinstance(ex, http_client.HTTPException):
+        return True
+    return True
+
+
+class RetryStats(object):
+    def __init__(self):
+        self.attempts = 0
+        self.elapsed = 0.0
+
+
+class RetryPolicy(object):
+    """Exponential backoff with jitter and a total time budget.
+
+    The delay before retry n (starting from 0) is interval * factor ** n,
+    capped to max_interval. With jitter enabled the actual delay is a random
+    value between 0 and the computed one, so that clients failing at the
+    same time don't retry in lockstep. Once the time spent executing actions
+    exceeds the budget, errors are no longer retried.
+    """
+
+    def __init__(self, max_retries, interval, backoff_factor=2,
+                 max_interval=None, jitter=True, time_budget=None,
+                 is_retryable=is_retryable_error):
+        self._max_retries = max_retries
+        self._interval = interval
+        self._backoff_factor = backoff_factor
+        self._max_interval = max_interval
+        self._jitter = jitter
+        self._time_budget = time_budget
+        self._is_retryable = is_retryable
+        self._time_consumed = 0.0
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def get_delay(self, retry):
+        delay = self._interval * self._backoff_factor ** retry
+        if self._max_interval:
+            delay = min(delay, self._max_interval)
+        if self._jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def _get_remaining_time(self, pending_time):
+        if not self._time_budget:
+            return None
+        return max(self._time_budget - self._time_consumed - pending_time, 0)
+
+    def _update_stats(self, name, elapsed):
+        with self._lock:
+            self._time_consumed += elapsed
+            stats = self.stats.setdefault(name, RetryStats())
+            stats.attempts += 1
+            stats.elapsed += elapsed
+
+    def execute(self, action, name=None, fatal_exceptions=()):
+        retry = 0
+        while True:
+            start = time.time()
+            try:
+                return action()
+            except fatal_exceptions:
+                raise
+            except Exception as ex:
+                remaining_time = self._get_remaining_time(time.time() - start)
+                if retry >= self._max_retries or not self._is_retryable(ex):
+                    raise
+                if remaining_time is not None and remaining_time <= 0:
+                    LOG.debug('Retry time budget exhausted')
+                    raise
+
+                delay = self.get_delay(retry)
+                if remaining_time is not None:
+                    delay = min(delay, remaining_time)
+                retry += 1
+                LOG.debug('Attempt %(attempt)d of "%(name)s" failed: '
+                          '%(ex)s. Retrying in %(delay).2f seconds' %
+                          {'attempt': retry, 'name': name, 'ex': ex,
+                           'delay': delay})
+                time.sleep(delay)
+            finally:
+                self._update_stats(name, time.time() - start)
@@ -0,0 +1,145 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import array
+import socket
+import struct
+
+import six
+
+from cloudbaseinit import exception
+
+# MIB_IPFORWARDTABLE: dwNumEntries, followed by the MIB_IPFORWARDROW items
+TABLE_HEADER_SIZE = 4
+# MIB_IPFORWARDROW: 14 DWORDs, addresses are in network byte order
+ROW_SIZE = 56
+
+_ROW_ADDRESSES_FORMAT = '>II4xI'
+_ROW_IF_INDEX_OFFSET = 16
+_ROW_METRIC_OFFSET = 36
+
+
+def _address_to_int(address):
+    if isinstance(address, six.binary_type):
+        address = address.decode('ascii')
+    return struct.unpack('>I', socket.inet_aton(address))[0]
+
+
+def _int_to_address(value):
+    return socket.inet_ntoa(struct.pack('>I', value))
+
+
+class IPv4RouteTable(object):
+    """Snapshot of the IPv4 routing table.
+
+    The routes are stored in compact arrays, with the addresses as host
+    order integers. The destinations are indexed by mask on the first query,
+    for longest prefix matches. The snapshot is never updated: a new one is
+    needed after the routing table changes.
+    """
+
+    def __init__(self):
+        self._destinations = array.array('I')
+        self._masks = array.array('I')
+        self._next_hops = array.array('I')
+        self._interface_indexes = array.array('I')
+        self._metrics = array.array('I')
+        self._index = None
+        self._masks_by_length = None
+
+    @classmethod
+    def from_forward_table(cls, data):
+        """Parses the raw bytes of a MIB_IPFORWARDTABLE structure."""
+        if len(data) < TABLE_HEADER_SIZE:
+            raise exception.CloudbaseInitException(
+                'Invalid IP forward table size: %d' % len(data))
+        (num_entries,) = struct.unpack_from('<I', data, 0)
+        if len(data) < TABLE_HEADER_SIZE + num_entries * ROW_SIZE:
+            raise exception.CloudbaseInitException(
+                'Truncated IP forward table, entries: %d' % num_entries)
+
+        route_table = cls()
+        for offset in range(TABLE_HEADER_SIZE,
+                            TABLE_HEADER_SIZE + num_entries * ROW_SIZE,
+                            ROW_SIZE):
+            (destination, mask, next_hop) = struct.unpack_from(
+                _ROW_ADDRESSES_FORMAT, data, offset)
+            (interface_index,) = struct.unpack_from(
+                '<I', data, offset + _ROW_IF_INDEX_OFFSET)
+            (metric,) = struct.unpack_from(
+                '<I', data, offset + _ROW_METRIC_OFFSET)
+            route_table._append(destination, mask, next_hop,
+                                interface_index, metric)
+        return route_table
+
+    def _append(self, destination, mask, next_hop, interface_index, metric):
+        self._destinations.append(destination)
+        self._masks.append(mask)
+        self._next_hops.append(next_hop)
+        self._interface_indexes.append(interface_index)
+        self._metrics.append(metric)
+
+    def __len__(self):
+        return len(self._destinations)
+
+    def _get_index(self):
+        if self._index is None:
+            # mask -> {destination: route positions, sorted by metric}
+            index = {}
+            for i in range(len(self._destinations)):
+                mask = self._masks[i]
+                routes = index.setdefault(mask, {}).setdefault(
+                    self._destinations[i] & mask, [])
+                routes.append(i)
+            for routes_by_destination in index.values():
+                for routes in routes_by_destination.values():
+                    routes.sort(key=lambda i: self._metrics[i])
+            self._masks_by_length = sorted(
+                index, key=lambda m: bin(m).count('1'), reverse=True)
+            self._index = index
+        return self._index
+
+    def _get_route(self, i):
+        return (_int_to_address(self._destinations[i]),
+                _int_to_address(self._masks[i]),
+                _int_to_address(self._next_hops[i]),
+                self._interface_indexes[i],
+                self._metrics[i])
+
+    def get_routes(self):
+        """Returns the (destination, mask, next hop, interface index,
+        metric) tuples of all the routes.
+        """
+        return [self._get_route(i) for i in range(len(self))]
+
+    def has_destination(self, destination):
+        return _address_to_int(destination) in self._destinations
+
+    def lookup(self, address):
+        """Returns the longest prefix match route for address, or None.
+
+        Routes with the same prefix are chosen by the lowest metric.
+        """
+        address = _address_to_int(address)
+        index = self._get_index()
+        for mask in self._masks_by_length:
+            routes = index[mask].get(address & mask)
+            if routes:
+                return self._get_route(routes[0])
+
+    def get_default_route(self):
+        """Returns the default route with the lowest metric, or None."""
+        routes = self._get_index().get(0, {}).get(0)
+        if routes:
+            return self._get_route(routes[0])
@@ -0,0 +1,119 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Detects at startup if there's nothing left to do for the instance.
+
+This module is imported before the rest of the application, so it must
+not import modules with costly imports, e.g. the metadata services, the
+plugins or the OS utils.
+"""
+
+import json
+import os
+
+from oslo.config import cfg
+
+opts = [
+    cfg.BoolOpt('stop_service_on_exit', default=True, help='In case of '
+                'execution as a service, specifies if the service '
+                'must be gracefully stopped before exiting'),
+    cfg.StrOpt('startup_marker_path', default=None,
+               help='File written once all the plugins have been executed '
+               'for an instance. If the file exists at startup and the '
+               'instance id returned by the metadata service which was used '
+               'didn\'t change, the execution ends without loading the '
+               'plugins. Set to None (default) to disable'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+
+def _load_class(class_path):
+    # Avoids importing the class loader's dependencies
+    (module_name, class_name) = class_path.rsplit('.', 1)
+    module = __import__(module_name, fromlist=[class_name])
+    return getattr(module, class_name)
+
+
+def write_marker(instance_id, service_class_path):
+    if not CONF.startup_marker_path:
+        return
+
+    marker = {'instance_id': instance_id,
+              'service': service_class_path,
+              'plugins': CONF.plugins}
+    with open(CONF.startup_marker_path, 'w') as f:
+        json.dump(marker, f)
+
+
+def clear_marker():
+    if CONF.startup_marker_path and os.path.exists(CONF.startup_marker_path):
+        os.remove(CONF.startup_marker_path)
+
+
+def read_marker():
+    if not CONF.startup_marker_path:
+        return None
+
+    try:
+        with open(CONF.startup_marker_path) as f:
+            marker = json.load(f)
+        if (not isinstance(marker, dict) or
+                not marker.get('instance_id') or not marker.get('service')):
+            return None
+        return marker
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _probe_instance_id(service_class_path):
+    service = _load_class(service_class_path)()
+    # Only the documents needed for the instance id are retrieved
+    service.set_prefetch(False)
+    try:
+        if service.load():
+            return service.get_instance_id()
+    finally:
+        service.cleanup()
+
+
+def is_instance_configured():
+    """Tells if all the plugins have been executed for the instance.
+
+    The instance id is obtained from the metadata service recorded in the
+    marker, skipping the discovery of the other services. Errors result in
+    the regular execution.
+    """
+    marker = read_marker()
+    if not marker:
+        return False
+
+    # Reading the plugins list registers the plugins options
+    CONF.import_opt('plugins', 'cloudbaseinit.plugins.factory')
+    if marker.get('plugins') != CONF.plugins:
+        return False
+
+    try:
+        instance_id = _probe_instance_id(marker['service'])
+    except Exception:
+        return False
+    return instance_id == marker['instance_id']
+
+
+def terminate():
+    if CONF.stop_service_on_exit:
+        # Imported only when needed, see the module docstring
+        from cloudbaseinit.osutils import factory as osutils_factory
+        osutils_factory.get_os_utils().terminate()
@@ -0,0 +1,342 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import posixpath
+import struct
+
+from cloudbaseinit import exception
+
+BOOT_SECTOR_SIZE = 512
+DIR_ENTRY_SIZE = 32
+
+_ATTR_VOLUME_ID = 0x08
+_ATTR_DIRECTORY = 0x10
+_ATTR_LONG_NAME = 0x0F
+
+_LAST_LONG_ENTRY = 0x40
+_DELETED_ENTRY = 0xE5
+# The first character of a short name is 0xE5, not a deleted entry
+_KANJI_ENTRY = 0x05
+
+_LOWERCASE_BASE = 0x08
+_LOWERCASE_EXT = 0x10
+
+_NO_LABEL = 'NO NAME'
+
+
+class DirectoryEntry(object):
+    def __init__(self, name, cluster, size, is_dir):
+        self.name = name
+        self.cluster = cluster
+        self.size = size
+        self.is_dir = is_dir
+
+
+def _get_short_name(raw_name, flags):
+    if bytearray(raw_name[:1])[0] == _KANJI_ENTRY:
+        raw_name = b'\xe5' + raw_name[1:]
+    base = raw_name[:8].decode('latin-1').rstrip()
+    ext = raw_name[8:].decode('latin-1').rstrip()
+    if flags & _LOWERCASE_BASE:
+        base = base.lower()
+    if flags & _LOWERCASE_EXT:
+        ext = ext.lower()
+    if ext:
+        return '%s.%s' % (base, ext)
+    return base
+
+
+def _get_short_name_checksum(raw_name):
+    checksum = 0
+    for c in bytearray(raw_name):
+        checksum = (((checksum & 1) << 7) + (checksum >> 1) + c) & 0xFF
+    return checksum
+
+
+def _get_long_name_part(data, offset):
+    part = (data[offset + 1:offset + 11] + data[offset + 14:offset + 26] +
+            data[offset + 28:offset + 32])
+    return part.decode('utf-16-le', 'replace')
+
+
+class VFATReader(object):
+    """Reads files from FAT12, FAT16 and FAT32 images, with long names.
+
+    The device needs to provide a read_at(offset, size) method. Like for
+    ISO9660Reader, only the metadata and the requested files are read.
+    Names are matched case insensitively.
+    """
+
+    def __init__(self, device):
+        self._device = device
+        self._fat = None
+        self._label = None
+        self._load_boot_sector()
+
+    def _read(self, offset, size):
+        data = self._device.read_at(offset, size)
+        if len(data) < size:
+            raise exception.CloudbaseInitException(
+                'Unexpected end of the FAT image at offset: %d' % offset)
+        return data
+
+    def _load_boot_sector(self):
+        boot_sector = self._read(0, BOOT_SECTOR_SIZE)
+        (bytes_per_sector, sectors_per_cluster, reserved_sectors, num_fats,
+         root_entries, total_sectors_16, fat_size_16,
+         total_sectors_32) = struct.unpack_from('<HBHBHH1xH8xI',
+                                                boot_sector, 11)
+
+        if (boot_sector[510:512] != b'\x55\xaa' or
+                bytes_per_sector not in (512, 1024, 2048, 4096) or
+                not sectors_per_cluster or
+                sectors_per_cluster & (sectors_per_cluster - 1) or
+                not num_fats or not reserved_sectors):
+            raise exception.CloudbaseInitException(
+                'FAT boot sector not found')
+
+        fat_size = fat_size_16
+        if not fat_size:
+            (fat_size,) = struct.unpack_from('<I', boot_sector, 36)
+        total_sectors = total_sectors_16 or total_sectors_32
+
+        root_dir_sectors = ((root_entries * DIR_ENTRY_SIZE +
+                             bytes_per_sector - 1) // bytes_per_sector)
+        root_dir_sector = reserved_sectors + num_fats * fat_size
+        data_sector = root_dir_sector + root_dir_sectors
+        if not fat_size or total_sectors <= data_sector:
+            raise exception.CloudbaseInitException(
+                'Invalid FAT boot sector')
+
+        self._sector_size = bytes_per_sector
+        self._cluster_size = sectors_per_cluster * bytes_per_sector
+        self._clusters_count = ((total_sectors - data_sector) //
+                                sectors_per_cluster)
+        self._fat_offset = reserved_sectors * bytes_per_sector
+        self._fat_size = fat_size * bytes_per_sector
+        self._data_offset = data_sector * bytes_per_sector
+
+        # The FAT type is determined only by the number of clusters
+        if self._clusters_count < 4085:
+            self._fat_bits = 12
+            label_offset = 43
+        elif self._clusters_count < 65525:
+            self._fat_bits = 16
+            label_offset = 43
+        else:
+            self._fat_bits = 32
+            label_offset = 71
+
+        if self._fat_bits == 32:
+            (root_cluster,) = struct.unpack_from('<I', boot_sector, 44)
+            self._root = DirectoryEntry(None, root_cluster, None, True)
+        else:
+            self._root = DirectoryEntry(None, None, None, True)
+            self._root_offset = root_dir_sector * bytes_per_sector
+            self._root_size = root_entries * DIR_ENTRY_SIZE
+
+        # Extended boot signature
+        if bytearray(boot_sector[label_offset - 5:label_offset - 4])[0] in (
+                0x28, 0x29):
+            self._label = boot_sector[label_offset:label_offset + 11]
+
+    def get_fat_type(self):
+        return 'FAT%d' % self._fat_bits
+
+    def get_volume_label(self):
+        """Returns the label, as set in the root directory if present."""
+        label = self._label
+        for (raw_name, attr, flags, name, cluster,
+             size) in self._iter_entries(self._read_dir(self._root)):
+            if attr & _ATTR_VOLUME_ID:
+                label = raw_name
+                break
+        if label:
+            label = label.decode('latin-1').rstrip()
+            if label and label != _NO_LABEL:
+                return label
+
+    def _load_fat(self):
+        # The FAT is read once, it's small for config drive sized volumes
+        if self._fat is None:
+            self._fat = self._read(self._fat_offset, self._fat_size)
+        return self._fat
+
+    def _get_next_cluster(self, cluster):
+        fat = self._load_fat()
+        if self._fat_bits == 12:
+            (value,) = struct.unpack_from('<H', fat, cluster + cluster // 2)
+            if cluster & 1:
+                value >>= 4
+            else:
+                value &= 0xFFF
+            end = 0xFF7
+        elif self._fat_bits == 16:
+            (value,) = struct.unpack_from('<H', fat, cluster * 2)
+            end = 0xFFF7
+        else:
+            (value,) = struct.unpack_from('<I', fat, cluster * 4)
+            value &= 0x0FFFFFFF
+            end = 0x0FFFFFF7
+        if value < 2 or value >= end:
+            # End of chain, free or bad cluster
+            return None
+        return value
+
+    def _get_cluster_runs(self, cluster):
+        """Yields the (first cluster, count) runs of a cluster chain."""
+        run_start = cluster
+        run_length = 0
+        # Limits the length of corrupted or circular chains
+        for i in range(self._clusters_count):
+            if cluster is None or not 2 <= cluster < self._clusters_count + 2:
+                break
+            if cluster != run_start + run_length:
+                yield (run_start, run_length)
+                run_start = cluster
+                run_length = 0
+            run_length += 1
+            cluster = self._get_next_cluster(cluster)
+        if run_length:
+            yield (run_start, run_length)
+
+    def _read_chain(self, cluster, size=None):
+        chunks = []
+        remaining = size
+        for (run_start, run_length) in self._get_cluster_runs(cluster):
+            run_size = run_length * self._cluster_size
+            if remaining is not None:
+                run_size = min(run_size, remaining)
+            # Contiguous clusters are read with a single request
+            chunks.append(self._read(
+                self._data_offset + (run_start - 2) * self._cluster_size,
+                run_size))
+            if remaining is not None:
+                remaining -= run_size
+                if not remaining:
+                    break
+        if remaining:
+            raise exception.CloudbaseInitException(
+                'Unexpected end of the cluster chain: %d' % cluster)
+        return b''.join(chunks)
+
+    def _read_dir(self, dir_entry):
+        if dir_entry.cluster is None:
+            # FAT12 and FAT16 root directory
+            return self._read(self._root_offset, self._root_size)
+        return self._read_chain(dir_entry.cluster)
+
+    def _iter_entries(self, data):
+        long_name_parts = []
+        checksum = None
+        for offset in range(0, len(data) - DIR_ENTRY_SIZE + 1,
+                            DIR_ENTRY_SIZE):
+            (raw_name, attr, flags, cluster_high, cluster_low,
+             size) = struct.unpack_from('<11sBB7xH4xHI', data, offset)
+            first = bytearray(raw_name[:1])[0]
+            if not first:
+                break
+            if first == _DELETED_ENTRY:
+                long_name_parts = []
+                continue
+
+            if attr & _ATTR_LONG_NAME == _ATTR_LONG_NAME:
+                if first & _LAST_LONG_ENTRY:
+                    long_name_parts = []
+                    checksum = bytearray(data[offset + 13:offset + 14])[0]
+                long_name_parts.insert(0, _get_long_name_part(data, offset))
+                continue
+
+            name = None
+            if (long_name_parts and
+                    checksum == _get_short_name_checksum(raw_name)):
+                name = ''.join(long_name_parts).split('\x00', 1)[0]
+            long_name_parts = []
+            if not name:
+                name = _get_short_name(raw_name, flags)
+
+            cluster = (cluster_high << 16) + cluster_low
+            if self._fat_bits != 32:
+                cluster = cluster_low
+            yield (raw_name, attr, flags, name, cluster, size)
+
+    def _list_entries(self, dir_entry):
+        entries = []
+        for (raw_name, attr, flags, name, cluster,
+             size) in self._iter_entries(self._read_dir(dir_entry)):
+            if attr & _ATTR_VOLUME_ID or name in ('.', '..'):
+                continue
+            entries.append(DirectoryEntry(name, cluster, size,
+                                          bool(attr & _ATTR_DIRECTORY)))
+        return entries
+
+    def _find_entry(self, path):
+        entry = self._root
+        for name in [n for n in path.split('/') if n]:
+            if not entry.is_dir:
+                return None
+            for child in self._list_entries(entry):
+                if child.name.lower() == name.lower():
+                    entry = child
+                    break
+            else:
+                return None
+        return entry
+
+    def _read_entry_file(self, entry):
+        if not entry.size:
+            return b''
+        return self._read_chain(entry.cluster, entry.size)
+
+    def list_dir(self, path):
+        entry = self._find_entry(path)
+        if not entry or not entry.is_dir:
+            raise exception.CloudbaseInitException(
+                'Directory not found in the FAT image: %s' % path)
+        return [e.name for e in self._list_entries(entry)]
+
+    def read_file(self, path):
+        entry = self._find_entry(path)
+        if not entry or entry.is_dir:
+            raise exception.CloudbaseInitException(
+                'File not found in the FAT image: %s' % path)
+        return self._read_entry_file(entry)
+
+    def _extract_entry(self, entry, target_path):
+        if entry.is_dir:
+            if not os.path.isdir(target_path):
+                os.makedirs(target_path)
+            count = 0
+            for child in self._list_entries(entry):
+                if '/' in child.name or '\\' in child.name:
+                    # Don't write outside of the target path
+                    continue
+                count += self._extract_entry(
+                    child, os.path.join(target_path, child.name))
+            return count
+        else:
+            with open(target_path, 'wb') as f:
+                f.write(self._read_entry_file(entry))
+            return 1
+
+    def extract(self, path, target_path):
+        """Extracts a file or a directory tree, returns the files count.
+
+        Nothing is extracted if the path doesn't exist in the image.
+        """
+        entry = self._find_entry(posixpath.normpath(path))
+        if not entry:
+            return 0
+        return self._extract_entry(entry, target_path)
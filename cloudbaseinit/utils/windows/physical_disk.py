@@ -15,6 +15,8 @@
 #    under the License.
 
 import ctypes
+import io
+import threading
 
 from ctypes import windll
 from ctypes import wintypes
@@ -36,6 +38,32 @@ class Win32_DiskGeometry(ctypes.Structure):
     ]
 
 
+class Win32_STORAGE_PROPERTY_QUERY(ctypes.Structure):
+    _fields_ = [
+        ('PropertyId', wintypes.DWORD),
+        ('QueryType', wintypes.DWORD),
+        ('AdditionalParameters', wintypes.BYTE * 1),
+    ]
+
+
+class Win32_STORAGE_DEVICE_DESCRIPTOR(ctypes.Structure):
+    _fields_ = [
+        ('Version', wintypes.DWORD),
+        ('Size', wintypes.DWORD),
+        ('DeviceType', wintypes.BYTE),
+        ('DeviceTypeModifier', wintypes.BYTE),
+        ('RemovableMedia', wintypes.BOOLEAN),
+        ('CommandQueueing', wintypes.BOOLEAN),
+        ('VendorIdOffset', wintypes.DWORD),
+        ('ProductIdOffset', wintypes.DWORD),
+        ('ProductRevisionOffset', wintypes.DWORD),
+        ('SerialNumberOffset', wintypes.DWORD),
+        ('BusType', wintypes.DWORD),
+        ('RawPropertiesLength', wintypes.DWORD),
+        ('RawDeviceProperties', wintypes.BYTE * 1),
+    ]
+
+
 class PhysicalDisk(object):
     GENERIC_READ = 0x80000000
     FILE_SHARE_READ = 1
@@ -43,6 +71,8 @@ class PhysicalDisk(object):
     FILE_ATTRIBUTE_READONLY = 1
     INVALID_HANDLE_VALUE = -1
     IOCTL_DISK_GET_DRIVE_GEOMETRY = 0x70000
+    IOCTL_STORAGE_QUERY_PROPERTY = 0x2D1400
+    STORAGE_DESCRIPTOR_BUFFER_SIZE = 1024
     FILE_BEGIN = 0
     INVALID_SET_FILE_POINTER = 0xFFFFFFFF
 
@@ -91,6 +121,33 @@ class PhysicalDisk(object):
             self._geom = geom
         return self._geom
 
+    def get_serial_number(self):
+        # StorageDeviceProperty and PropertyStandardQuery are both 0
+        query = Win32_STORAGE_PROPERTY_QUERY()
+        buf = ctypes.create_string_buffer(self.STORAGE_DESCRIPTOR_BUFFER_SIZE)
+        bytes_returned = wintypes.DWORD()
+        ret_val = kernel32.DeviceIoControl(
+            self._handle,
+            self.IOCTL_STORAGE_QUERY_PROPERTY,
+            ctypes.byref(query),
+            ctypes.sizeof(query),
+            buf,
+            ctypes.sizeof(buf),
+            ctypes.byref(bytes_returned),
+            0)
+        if not ret_val:
+            raise exception.CloudbaseInitException(
+                "Cannot get the disk serial number")
+
+        descriptor = ctypes.cast(
+            buf, ctypes.POINTER(Win32_STORAGE_DEVICE_DESCRIPTOR)).contents
+        offset = descriptor.SerialNumberOffset
+        if not offset or offset >= bytes_returned.value:
+            return None
+        serial_number = buf.raw[offset:bytes_returned.value].split(
+            b'\x00', 1)[0].strip()
+        return serial_number.decode('ascii', 'replace') or None
+
     def seek(self, offset):
         high = wintypes.DWORD(offset >> 32)
         low = wintypes.DWORD(offset & 0xFFFFFFFF)
@@ -109,3 +166,165 @@ class PhysicalDisk(object):
         if not ret_val:
             raise exception.CloudbaseInitException("Read exception")
         return (buf, bytes_read.value)
+
+    def read_into(self, buf, offset=0, size=None):
+        """Reads up to size bytes into a bytearray, starting at offset.
+
+        The size, by default the rest of the buffer, must be a multiple of
+        the sector size. Memoryviews are not accepted by ctypes on Python 2.
+        """
+        if size is None:
+            size = len(buf) - offset
+        c_buf = (ctypes.c_char * size).from_buffer(buf, offset)
+        bytes_read = wintypes.DWORD()
+        ret_val = kernel32.ReadFile(self._handle, c_buf, size,
+                                    ctypes.byref(bytes_read), 0)
+        if not ret_val:
+            raise exception.CloudbaseInitException("Read exception")
+        return bytes_read.value
+
+
+class _Block(object):
+    def __init__(self, size):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.offset = None
+        self.length = 0
+        self.error = None
+
+
+class BufferedDiskReader(io.RawIOBase):
+    """Reads a physical disk in large sector aligned blocks.
+
+    The blocks are read into preallocated buffers and exposed as memoryview
+    slices without copying them. The slices are valid only until the next
+    read. With read-ahead enabled, the block following the one being read
+    is fetched in a background thread. The read_at method allows using the
+    reader as an ISO9660 block device.
+    """
+
+    DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, phys_disk, buffer_size=DEFAULT_BUFFER_SIZE,
+                 read_ahead=False):
+        super(BufferedDiskReader, self).__init__()
+        sector_size = phys_disk.get_geometry().BytesPerSector
+        self._buffer_size = max(buffer_size // sector_size, 1) * sector_size
+        self._phys_disk = phys_disk
+        self._disk_lock = threading.Lock()
+        self._position = 0
+        self._block = _Block(self._buffer_size)
+        self._spare_block = None
+        if read_ahead:
+            self._spare_block = _Block(self._buffer_size)
+        self._read_ahead_thread = None
+
+    def _fill_block(self, block, offset):
+        block.offset = None
+        block.error = None
+        try:
+            block.length = self._read_direct(offset, block.buf)
+            block.offset = offset
+        except Exception as ex:
+            block.error = ex
+
+    def _wait_read_ahead(self):
+        if self._read_ahead_thread:
+            self._read_ahead_thread.join()
+            self._read_ahead_thread = None
+
+    def _start_read_ahead(self):
+        if (self._block.length < self._buffer_size or
+                self._read_ahead_thread):
+            # End of the disk
+            return
+        self._read_ahead_thread = threading.Thread(
+            target=self._fill_block,
+            args=(self._spare_block,
+                  self._block.offset + self._buffer_size))
+        self._read_ahead_thread.daemon = True
+        self._read_ahead_thread.start()
+
+    def _get_block(self, offset):
+        block_offset = offset // self._buffer_size * self._buffer_size
+        if self._block.offset != block_offset:
+            self._wait_read_ahead()
+            if (self._spare_block and
+                    self._spare_block.offset == block_offset):
+                (self._block, self._spare_block) = (self._spare_block,
+                                                    self._block)
+            else:
+                self._fill_block(self._block, block_offset)
+                if self._block.error:
+                    raise self._block.error
+            if self._spare_block:
+                self._start_read_ahead()
+        return self._block
+
+    def view_at(self, offset, size):
+        """Returns up to size bytes, limited to the block of the offset."""
+        block = self._get_block(offset)
+        start = offset - block.offset
+        return block.view[start:max(min(start + size, block.length), start)]
+
+    def _read_direct(self, offset, buf, buf_offset=0, size=None):
+        with self._disk_lock:
+            self._phys_disk.seek(offset)
+            return self._phys_disk.read_into(buf, buf_offset, size)
+
+    def read_at(self, offset, size):
+        """Returns a bytearray with up to size bytes read at the offset.
+
+        Blocks which are not buffered yet are read directly in the returned
+        bytearray.
+        """
+        data = bytearray(size)
+        view = memoryview(data)
+        pos = 0
+        while pos < size:
+            cur_offset = offset + pos
+            direct_size = ((size - pos) // self._buffer_size *
+                           self._buffer_size)
+            if (direct_size and not cur_offset % self._buffer_size and
+                    self._block.offset != cur_offset):
+                bytes_read = self._read_direct(cur_offset, data, pos,
+                                               direct_size)
+                pos += bytes_read
+                if bytes_read < direct_size:
+                    break
+            else:
+                block_view = self.view_at(cur_offset, size - pos)
+                if not len(block_view):
+                    break
+                view[pos:pos + len(block_view)] = block_view
+                pos += len(block_view)
+        if pos < size:
+            return data[:pos]
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence != io.SEEK_SET:
+            raise ValueError('Unsupported whence: %s' % whence)
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, b):
+        view = self.view_at(self._position, len(b))
+        b[:len(view)] = view
+        self._position += len(view)
+        return len(view)
+
+    def close(self):
+        self._wait_read_ahead()
+        super(BufferedDiskReader, self).close()
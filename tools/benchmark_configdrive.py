@@ -0,0 +1,114 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measures the ConfigDriveService discovery latency on POSIX systems.
+
+Synthetic ISO9660 and VFAT config drive images are read by the POSIX config
+drive manager as image files. Each measure includes loading the service,
+getting the instance id and the user data and the cleanup.
+
+e.g.:
+
+    python tools/benchmark_configdrive.py --sizes 1 16 --runs 20
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from cloudbaseinit.metadata.services import configdrive
+from cloudbaseinit.tests.utils import test_iso9660
+from cloudbaseinit.tests.utils import test_vfat
+
+CONF = cfg.CONF
+CONF.import_opt('config_drive_image_paths',
+                'cloudbaseinit.metadata.services.osconfigdrive.posix')
+
+_INSTANCE_ID = '4b32ddf7-7941-4c36-a854-a1f5ac45b318'
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100.0))
+    return values[index]
+
+
+def _discover():
+    service = configdrive.ConfigDriveService()
+    try:
+        if not service.load():
+            raise Exception('Config drive not found')
+        if service.get_instance_id() != _INSTANCE_ID:
+            raise Exception('Unexpected instance id')
+        service.get_user_data()
+    finally:
+        service.cleanup()
+
+
+def _run(name, image_path, runs):
+    CONF.set_override('config_drive_image_paths', [image_path])
+    timings = []
+    for i in range(runs):
+        start = time.time()
+        _discover()
+        timings.append(time.time() - start)
+
+    print('%-24s median: %7.1f ms  p99: %7.1f ms' %
+          (name, _percentile(timings, 50) * 1000,
+           _percentile(timings, 99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 16],
+                        help='User data sizes, in MiB')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    if os.name != 'posix':
+        print('The POSIX config drive manager is required')
+        return 1
+
+    CONF([], project='cloudbase-init')
+    CONF.set_override('config_drive_cdrom', False)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for size in args.sizes:
+            files = {'openstack/latest/meta_data.json':
+                     ('{"uuid": "%s"}' % _INSTANCE_ID).encode(),
+                     'openstack/latest/user_data': b'x' * size * 1024 * 1024,
+                     'openstack/content/0000': b'fake content'}
+
+            image_path = os.path.join(tmp_dir, 'config-drive.iso')
+            with open(image_path, 'wb') as f:
+                f.write(test_iso9660.build_iso_image(files))
+            _run('iso9660 %d MiB' % size, image_path, args.runs)
+
+            image_path = os.path.join(tmp_dir, 'config-drive.img')
+            with open(image_path, 'wb') as f:
+                f.write(test_vfat.build_vfat_image(files,
+                                                   sectors_per_cluster=8))
+            _run('vfat %d MiB' % size, image_path, args.runs)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measures building DHCP requests and parsing DHCP replies.
+
+The following are measured, per packet:
+
+    legacy: the previous implementation, concatenating bytes to build the
+            request and unpacking each option byte to parse the reply
+    packet: DhcpPacket, building a new request bytes object each time
+    pack_into: DhcpPacket, encoding the request in a reused buffer
+
+The replies include an NTP servers option with the given number of
+addresses.
+
+e.g.:
+
+    python tools/benchmark_dhcp.py --ntp-servers 1 32 --runs 20000
+"""
+
+import argparse
+import struct
+import sys
+import timeit
+
+from cloudbaseinit.utils import dhcp
+
+_MAC_ADDRESS = '00:15:5d:64:98:39'
+_REQUESTED_OPTIONS = [dhcp.OPTION_MTU, dhcp.OPTION_NTP_SERVERS]
+_XID = 0x12345678
+
+
+def _legacy_get_dhcp_request_data(id_req, mac_address, requested_options,
+                                  vendor_id):
+    mac_address_b = bytearray.fromhex(mac_address.replace(':', ''))
+    data = b'\x01'
+    data += b'\x01'
+    data += b'\x06'
+    data += b'\x00'
+    data += struct.pack('!L', id_req)
+    data += b'\x00\x00'
+    data += b'\x00\x00'
+    data += b'\x00\x00\x00\x00'
+    data += b'\x00\x00\x00\x00'
+    data += b'\x00\x00\x00\x00'
+    data += b'\x00\x00\x00\x00'
+    data += mac_address_b
+    data += b'\x00' * 10
+    data += b'\x00' * 64
+    data += b'\x00' * 128
+    data += dhcp._DHCP_COOKIE
+    data += b'\x35\x01\x01'
+    vendor_id_b = vendor_id.encode('ascii')
+    data += b'\x3c' + struct.pack('b', len(vendor_id_b)) + vendor_id_b
+    data += b'\x3d\x07\x01' + mac_address_b
+    data += b'\x37' + struct.pack('b', len(requested_options))
+    for option in requested_options:
+        data += struct.pack('b', option)
+    data += b'\xff'
+    return data
+
+
+def _legacy_parse_dhcp_reply(data, id_req):
+    message_type = struct.unpack('b', data[0:1])[0]
+    if message_type != 2:
+        return (False, {})
+    id_reply = struct.unpack('!L', data[4:8])[0]
+    if id_reply != id_req:
+        return (False, {})
+    if data[236:240] != dhcp._DHCP_COOKIE:
+        return (False, {})
+
+    options = {}
+    i = 240
+    data_len = len(data)
+    while i < data_len and data[i:i + 1] != b'\xff':
+        # Unsigned, the signed format used before failed with option
+        # lengths above 127
+        id_option = struct.unpack('B', data[i:i + 1])[0]
+        option_data_len = struct.unpack('B', data[i + 1:i + 2])[0]
+        i += 2
+        options[id_option] = data[i: i + option_data_len]
+        i += option_data_len
+    return (True, options)
+
+
+def _get_reply(ntp_servers):
+    packet = dhcp.DhcpPacket.from_mac_address(
+        _MAC_ADDRESS, op=dhcp.BOOTREPLY, xid=_XID)
+    packet.yiaddr = '10.0.0.5'
+    packet.set_option_int(dhcp.OPTION_MESSAGE_TYPE, dhcp.DHCPOFFER)
+    packet.set_option_addresses(dhcp.OPTION_SERVER_ID, ['10.0.0.1'])
+    packet.set_option_int(dhcp.OPTION_MTU, 1450, size=2)
+    packet.set_option_addresses(
+        dhcp.OPTION_NTP_SERVERS,
+        ['10.1.%d.%d' % (i // 256, i % 256) for i in range(ntp_servers)])
+    return packet.to_bytes()
+
+
+def _measure(name, func, runs):
+    elapsed = min(timeit.repeat(func, number=runs, repeat=3))
+    print('%-32s %8.2f us' % (name, elapsed * 1000000.0 / runs))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ntp-servers', type=int, nargs='+',
+                        default=[1, 32])
+    parser.add_argument('--runs', type=int, default=10000)
+    args = parser.parse_args()
+
+    _measure('build request, legacy',
+             lambda: _legacy_get_dhcp_request_data(
+                 _XID, _MAC_ADDRESS, _REQUESTED_OPTIONS, 'cloudbase-init'),
+             args.runs)
+    _measure('build request, packet',
+             lambda: dhcp._get_dhcp_request_data(
+                 _XID, _MAC_ADDRESS, _REQUESTED_OPTIONS, 'cloudbase-init'),
+             args.runs)
+
+    request = dhcp.DhcpPacket.parse(dhcp._get_dhcp_request_data(
+        _XID, _MAC_ADDRESS, _REQUESTED_OPTIONS, 'cloudbase-init'))
+    buf = bytearray(1024)
+    _measure('build request, pack_into',
+             lambda: request.pack_into(buf), args.runs)
+
+    for ntp_servers in args.ntp_servers:
+        reply = _get_reply(ntp_servers)
+        _measure('parse reply, legacy, %d NTP' % ntp_servers,
+                 lambda: _legacy_parse_dhcp_reply(reply, _XID), args.runs)
+        _measure('parse reply, packet, %d NTP' % ntp_servers,
+                 lambda: dhcp.DhcpPacket.parse(reply).get_options(),
+                 args.runs)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compares copying a config drive ISO with reading it in process.
+
+Synthetic config drive images with user data of increasing size are
+generated. For each image the following are measured:
+
+    copy: the raw disk copy to a temporary ISO file previously done before
+          extracting it with bsdtar, with a seek and a 4 KiB read per block.
+          The bsdtar extraction time is not included
+    extract: extracting the OpenStack metadata with the ISO9660 reader
+    buffered: the same extraction through the buffered physical disk
+              reader, with read-ahead
+
+e.g.:
+
+    python tools/benchmark_iso9660.py --sizes 1 16 64
+"""
+
+import argparse
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+
+from cloudbaseinit.tests.utils import test_iso9660
+from cloudbaseinit.utils import iso9660
+
+# The physical disk module requires the Windows ctypes modules
+with mock.patch.dict('sys.modules', {'ctypes': mock.MagicMock()}):
+    from cloudbaseinit.utils.windows import physical_disk
+
+# Same as the Windows config drive manager
+_CONFIG_DRIVE_PATHS = ['openstack/latest', 'openstack/content']
+
+
+def _copy_iso(image_path, iso_path, iso_size):
+    with open(image_path, 'rb') as disk:
+        with open(iso_path, 'wb') as f:
+            offset = 0
+            while offset < iso_size:
+                disk.seek(offset)
+                buf = disk.read(min(4096, iso_size - offset))
+                f.write(buf)
+                offset += len(buf)
+
+
+def _extract(image_path, target_path):
+    with open(image_path, 'rb') as disk:
+        reader = iso9660.ISO9660Reader(iso9660.FileBlockDevice(disk))
+        for path in _CONFIG_DRIVE_PATHS:
+            reader.extract(path, os.path.join(target_path, *path.split('/')))
+
+
+_Geometry = collections.namedtuple('_Geometry', ['BytesPerSector'])
+
+
+class _FileDisk(object):
+    """Provides the PhysicalDisk methods used by the buffered reader."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def get_geometry(self):
+        return _Geometry(512)
+
+    def seek(self, offset):
+        self._f.seek(offset)
+
+    def read_into(self, buf):
+        return self._f.readinto(buf)
+
+
+def _extract_buffered(image_path, target_path):
+    with open(image_path, 'rb', 0) as disk:
+        disk_reader = physical_disk.BufferedDiskReader(_FileDisk(disk),
+                                                       read_ahead=True)
+        try:
+            reader = iso9660.ISO9660Reader(disk_reader)
+            for path in _CONFIG_DRIVE_PATHS:
+                reader.extract(path,
+                               os.path.join(target_path, *path.split('/')))
+        finally:
+            disk_reader.close()
+
+
+def _measure(func, runs):
+    timings = []
+    for i in range(runs):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 16, 64],
+                        help='User data sizes, in MiB')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for size in args.sizes:
+            user_data = b'x' * size * 1024 * 1024
+            # Config drives contain the user data in the EC2 format too
+            files = {'openstack/latest/meta_data.json': b'{"uuid": "id"}',
+                     'openstack/latest/network_data.json': b'{}',
+                     'openstack/latest/user_data': user_data,
+                     'openstack/content/0000': b'fake content',
+                     'ec2/latest/meta-data.json': b'{}',
+                     'ec2/latest/user-data': user_data}
+            image_path = os.path.join(tmp_dir, 'config-drive.iso')
+            with open(image_path, 'wb') as f:
+                f.write(test_iso9660.build_iso_image(files))
+            iso_size = os.path.getsize(image_path)
+
+            iso_path = os.path.join(tmp_dir, 'copy.iso')
+            copy_time = _measure(
+                lambda: _copy_iso(image_path, iso_path, iso_size), args.runs)
+
+            target_path = os.path.join(tmp_dir, 'target')
+
+            def extract():
+                shutil.rmtree(target_path, True)
+                _extract(image_path, target_path)
+
+            extract_time = _measure(extract, args.runs)
+
+            def extract_buffered():
+                shutil.rmtree(target_path, True)
+                _extract_buffered(image_path, target_path)
+
+            buffered_time = _measure(extract_buffered, args.runs)
+
+            print('image: %7.1f MiB  copy: %8.1f ms  extract: %8.1f ms  '
+                  'buffered: %8.1f ms' %
+                  (iso_size / 1024.0 / 1024, copy_time * 1000,
+                   extract_time * 1000, buffered_time * 1000))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
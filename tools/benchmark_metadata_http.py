@@ -0,0 +1,106 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compares urllib with the pooled metadata HTTP client.
+
+Runs a local stub metadata server and reports requests per second and the
+99th percentile latency for each client, e.g.:
+
+    python tools/benchmark_metadata_http.py --requests 2000 --concurrency 4
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from multiprocessing import pool
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves.urllib import request
+
+from cloudbaseinit.metadata.services import httpclient
+
+_META_DATA = b'{"uuid": "4b32ddf7-7941-4c36-a854-a1f5ac45b318"}'
+
+
+class _StubMetadataHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(_META_DATA)))
+        self.end_headers()
+        self.wfile.write(_META_DATA)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubMetadataServer(socketserver.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100.0))
+    return values[index]
+
+
+def _run(name, urlopen, url, num_requests, concurrency):
+    def fetch(i):
+        start = time.time()
+        urlopen(request.Request(url)).read()
+        return time.time() - start
+
+    thread_pool = pool.ThreadPool(concurrency)
+    start = time.time()
+    try:
+        latencies = thread_pool.map(fetch, range(num_requests))
+    finally:
+        thread_pool.close()
+        thread_pool.join()
+    elapsed = time.time() - start
+
+    print('%-8s %10.1f req/s   p99 %8.3f ms' %
+          (name, num_requests / elapsed, _percentile(latencies, 99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=1)
+    args = parser.parse_args()
+
+    server = _StubMetadataServer(('127.0.0.1', 0), _StubMetadataHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    url = ('http://127.0.0.1:%d/openstack/latest/meta_data.json' %
+           server.server_address[1])
+    try:
+        _run('urllib', request.urlopen, url, args.requests, args.concurrency)
+        _run('pooled', httpclient.urlopen, url, args.requests,
+             args.concurrency)
+    finally:
+        httpclient.close_connection_pools()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
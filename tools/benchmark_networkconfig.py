@@ -0,0 +1,85 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measures parsing Debian network interfaces configs.
+
+The following are measured, per config:
+
+    legacy: the previous regular expression, matching only eth0
+    parser: debiannetwork.parse, returning all the interfaces
+
+The configs have the given number of static interfaces, each with a route.
+
+e.g.:
+
+    python tools/benchmark_networkconfig.py --interfaces 1 16 256
+"""
+
+import argparse
+import re
+import sys
+import timeit
+
+from cloudbaseinit.utils import debiannetwork
+
+_LEGACY_RE = (r'iface eth0 inet static\s+'
+              r'address\s+(?P<address>[^\s]+)\s+'
+              r'netmask\s+(?P<netmask>[^\s]+)\s+'
+              r'broadcast\s+(?P<broadcast>[^\s]+)\s+'
+              r'gateway\s+(?P<gateway>[^\s]+)\s+'
+              r'dns\-nameservers\s+(?P<dnsnameservers>[^\r\n]+)\s+')
+
+_INTERFACE_TEMPLATE = """
+auto eth%(i)d
+iface eth%(i)d inet static
+    address 10.%(a)d.%(b)d.5
+    netmask 255.255.255.0
+    broadcast 10.%(a)d.%(b)d.255
+    gateway 10.%(a)d.%(b)d.1
+    dns-nameservers 8.8.8.8 8.8.4.4
+    mtu 1450
+    up route add -net 172.16.%(b)d.0 netmask 255.255.255.0 gw 10.%(a)d.%(b)d.1
+"""
+
+
+def _get_config(interfaces):
+    content = 'auto lo\niface lo inet loopback\n'
+    for i in range(interfaces):
+        content += _INTERFACE_TEMPLATE % {'i': i, 'a': i // 256,
+                                          'b': i % 256}
+    return content
+
+
+def _measure(name, func, runs):
+    elapsed = min(timeit.repeat(func, number=runs, repeat=3))
+    print('%-32s %10.2f us' % (name, elapsed * 1000000.0 / runs))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interfaces', type=int, nargs='+',
+                        default=[1, 16, 256])
+    parser.add_argument('--runs', type=int, default=100)
+    args = parser.parse_args()
+
+    for interfaces in args.interfaces:
+        content = _get_config(interfaces)
+        _measure('legacy, %d interfaces' % interfaces,
+                 lambda: re.search(_LEGACY_RE, content), args.runs)
+        _measure('parser, %d interfaces' % interfaces,
+                 lambda: debiannetwork.parse(content), args.runs)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
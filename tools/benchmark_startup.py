@@ -0,0 +1,143 @@
+# Copyright 2014 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measures the startup time when all the plugins have been executed.
+
+Each measure runs a new interpreter and reports the median and the 99th
+percentile of the time to exit of:
+
+    python: the interpreter startup, as a reference
+    import: importing cloudbaseinit.init, required by the regular path
+    regular path: shell.main without a startup marker
+    fast path: shell.main with a startup marker for the current instance
+
+The plugins execution status is stored in the file used by PosixUtil, so
+the regular path can be measured on POSIX systems only.
+
+e.g.:
+
+    python tools/benchmark_startup.py --runs 20
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from cloudbaseinit.metadata.services import base
+from cloudbaseinit.plugins import base as plugins_base
+
+CONF = cfg.CONF
+CONF.import_opt('plugins', 'cloudbaseinit.plugins.factory')
+
+_INSTANCE_ID = '4b32ddf7-7941-4c36-a854-a1f5ac45b318'
+
+
+class FakeMetadataService(base.BaseMetadataService):
+    def load(self):
+        super(FakeMetadataService, self).load()
+        return True
+
+    def get_instance_id(self):
+        return _INSTANCE_ID
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100.0))
+    return values[index]
+
+
+def _write_config(path, marker_path, status_path):
+    with open(path, 'w') as f:
+        f.write('[DEFAULT]\n'
+                'metadata_services=benchmark_startup.FakeMetadataService\n'
+                'stop_service_on_exit=false\n'
+                'config_file_path=%s\n' % status_path)
+        if marker_path:
+            f.write('startup_marker_path=%s\n' % marker_path)
+
+
+def _get_main_code(config_path):
+    return ('import sys\n'
+            'from cloudbaseinit import shell\n'
+            'sys.argv = ["cloudbase-init", "--config-file", %r]\n'
+            'shell.main()\n' % config_path)
+
+
+def _run(name, code, runs, env):
+    timings = []
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        timings.append(time.time() - start)
+
+    print('%-12s median: %7.1f ms  p99: %7.1f ms' %
+          (name, _percentile(timings, 50) * 1000,
+           _percentile(timings, 99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        marker_path = os.path.join(tmp_dir, 'marker.json')
+        with open(marker_path, 'w') as f:
+            json.dump({'instance_id': _INSTANCE_ID,
+                       'service': 'benchmark_startup.FakeMetadataService',
+                       'plugins': CONF.plugins}, f)
+
+        # All the plugins have been executed
+        status_path = os.path.join(tmp_dir, 'config.json')
+        with open(status_path, 'w') as f:
+            statuses = dict((class_path.rsplit('.', 1)[1],
+                             plugins_base.PLUGIN_EXECUTION_DONE)
+                            for class_path in CONF.plugins)
+            json.dump({'%s/Plugins' % _INSTANCE_ID: statuses}, f)
+
+        regular_config_path = os.path.join(tmp_dir, 'regular.conf')
+        _write_config(regular_config_path, None, status_path)
+        fast_config_path = os.path.join(tmp_dir, 'fast.conf')
+        _write_config(fast_config_path, marker_path, status_path)
+
+        env = dict(os.environ)
+        python_path = [os.path.dirname(os.path.abspath(__file__))]
+        if env.get('PYTHONPATH'):
+            python_path.append(env['PYTHONPATH'])
+        env['PYTHONPATH'] = os.pathsep.join(python_path)
+
+        _run('python', 'pass', args.runs, env)
+        _run('import', 'import cloudbaseinit.init', args.runs, env)
+        if os.name == 'posix':
+            _run('regular path', _get_main_code(regular_config_path),
+                 args.runs, env)
+        _run('fast path',
+             _get_main_code(fast_config_path) +
+             'assert "cloudbaseinit.init" not in sys.modules\n',
+             args.runs, env)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())